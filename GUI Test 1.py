@@ -1,523 +1,1220 @@
-
-
-
-#*****************CLASSES/ SETUP*****************
-import sys #system params
-import time #used for delays (like time.sleep())
-import serial #used to communicate with the arduino over COM Ports
-import serial.tools.list_ports #lists available serial ports on the computer
-
-#we also need threading:
-#   - threading is used here so the GUI doesnt freeze when reading from the arduino
-#   - this allows conncurrent processes
-import threading
-
-#import widgets for pyQt6
-#   - pyQT6 is the Python version of the C++ Qt 6 GUI framework
-#   - Qt is written in C++, pyQt6 is the python wrapper
-from PyQt6.QtWidgets import (
-    QApplication,   #used for GUI general startup/ stop
-    QMainWindow,    #used to frame the app with a main window
-    QWidget,        #used for widget layout 
-    QVBoxLayout,    #stacks widgets vertically
-    QLabel,         #displays text
-    QComboBox,      #dropdown lists
-    QPushButton,    #button in the GUI that a user can click
-    QLineEdit,      #single line input
-    QTextEdit,      #multiple line output (the terminal in the app)
-    QFrame          #container used to group widgets (style)
-)
-
-#pyqtSignal: signals (events) between threads running and the GUI
-#Qobject: needed for signal emmission (base class for Qt objects)
-from PyQt6.QtCore import pyqtSignal, QObject
-
-
-#globals
-arduino = None
-selected_mode = "Manual Mode" #defaulted mode is manual
-selected_pattern = "L1" #default pattern is L1
-selected_flash_rate = 1 #default flash rate is 1 Hz
-selected_flash_duration = 1 #default duration is 1s
-selected_COMport = "None" #no COM port originally selected
-
-
-#******************CLASS DEFINITIONS*****************
-"""
-in our code, we have 2 classes:
-1) serialclass:
-    -this class is responsible for reading serial data from the arduino,
-     without slowing or stopping the GUI
-    -this class was created as when you read from the serial port, we stop/ wait for
-     data, which causes the GUI to freeze if we were to read from serial directly in
-     the main GUI thread
-    -this lets the GUI be responsive to the user while reading serial data in the
-     background
-    -we use signalling to communicate between threads
-  
-2) systemGUI
-    -the 'systemGUI' class creates a GUI for the system where the user can change
-     system parameters:
-        - COM port selection
-        - Mode selection (manual mode or trigger mode)
-        - Flashing pattern
-        - Flashing frequency and duration
-        - Start button to send packetized system parameters to the arduino
-        - View output from arduino (serial monitor)
-"""
-
-# 'serialclass' class that is used to read serial data from arduino
-#        - note that it inherits from QObject (base class for Qt objects)
-#          we need to use QObject for emiting signals
-# general problem this solves:
-#        - if we want to read serial data from the arduino in the main GUI
-#          thread, them the app would freeze waiting for data
-#        - this is because arduino.readline() waits/ blocks until something
-#          comes through the serial port
-class serialclass(QObject):
-
-    #pyqtSignal is used for communication between threads
-    #   data_received_signal is a signal that has a string when its emmited
-    #   we use this signal to send serial messages to the GUI
-    data_received_signal = pyqtSignal(str)
-
-    #constructor that creates a serialclass object
-    def __init__(self):
-
-        #calls the QObject (parent class) constructor
-        super().__init__()
-
-        # self.running: this sets a flag that controls the loop (starts/ stops it)
-        # in the background thread that is checking for serial data from the arduino. 
-        # This is used in the 'readserialmethod' method (below)
-        # which basically does:
-        #       while self.running
-        #           read from arduino .....
-        # (ensures that we are constantly checking for data from the arduino using a thread)
-        self.running = True
-
-    #METHOD #1: readserialmethod
-    #   this method reads the serial data on the COM port from the arduino
-    #   this runs in a background thread and basically polls the COM port
-    def readserialmethod(self):
-
-        #run until self.running is false (POLL)
-        while self.running:
-
-            #only run id the arduino is connected and the COM port is open
-            if arduino and arduino.is_open:
-                try:
-                    #read a line of text from the arduino into the 'line' variable
-                    #"utf-8" converts the bytes from the arduino to a string and '.strip()' removes newlines
-                    line = arduino.readline().decode("utf-8").strip()
-                    
-                    #if a line of data was read
-                    if line:
-                        # emit the 'data_received' signal to the GUI with the line that was read,
-                        # indicating that it was from the arduino. This signal is connected to the 
-                        # main GUI code with the self.worker.data_received.connect(self.log_message)
-                        # (i.e. we call log_message() whenever we receive data)
-                        self.data_received_signal.emit(f"Arduino: {line}")
-
-                #otherwise failure occured
-                except serial.SerialException:
-                    self.data_received_signal.emit("error occured when reading the serial data!!.")
-                    break
-
-            #add a little delay so we arent constantly polling
-            time.sleep(0.1)
-
-
-# the 'systemGUI' class creates a GUI for the system where the user can change
-# system parameters:
-#   - COM port selection
-#   - Mode selection (manual mode or trigger mode)
-#   - Flashing pattern
-#   - Flashing frequency and duration
-#   - Start button to send packetized system parameters to the arduino
-#   - View output from arduino (serial monitor)
-
-# note that this class inherits from QMainWindow (from PyQt) (main GUI)
-class systemGUI(QMainWindow):
-
-    #constructor method used when a systemGUI method is created
-    def __init__(self):
-        
-        #note that below calls the parent class 'QMainWindow' constructor
-        super().__init__()
-
-
-
-        #**********************SETUP/ LAYOUT**********************
-        
-        #set window title and the size of the window
-        self.setWindowTitle("LED Control System for the Quinn Laboratory")
-        self.setGeometry(300, 100, 500, 600)
-
-        #background colour here is light gray
-        self.setStyleSheet("background-color: #f5f5f5;")
-
-        #layout setup:
-        #QVBoxLayout stacks the widgets from top to bottom
-        vertically_stacked_layout = QVBoxLayout()
-        #container is a QWidget that has everything in it
-        container = QWidget()
-        container.setLayout(vertically_stacked_layout)
-        #below tells pyQt that container is the main area
-        self.setCentralWidget(container)
-
-
-        #*******************COM PORT CONNECTION*******************
-        
-        #create a label called 'COMlabel' for the selection of the COM port
-        self.COMlabel = QLabel("Select the COM port (USB port) that the Arduino is connected to:")
-        #add it to the main layout (verically stacked as we are usuing QVBoxLayout())
-        vertically_stacked_layout.addWidget(self.COMlabel)
-
-        # create a variable called the COMport_dropdownbox that creates a dropdown
-        # box to select the COM port (using the QComboBox widget from PyQt6)
-        self.COMport_dropdownbox = QComboBox()
-        # call the get_available_COM_ports function to get the ports available
-        self.COMport_dropdownbox.addItems(self.get_available_COM_ports())
-        # add the dropdown under the label
-        vertically_stacked_layout.addWidget(self.COMport_dropdownbox)
-       
-        # add a 'connect' button to connect to the serial COM port (below the dropdown)
-        self.connect_button = QPushButton("CONNECT")
-        # call the 'connect_to_COM_port' function to connect to the selected com port
-        self.connect_button.clicked.connect(self.connect_to_COM_port)
-        # add 'connect' button below the dropdown
-        vertically_stacked_layout.addWidget(self.connect_button)
-
-        #*********************SELECT TRIGGERING MODE************************
-        
-        # select the triggering mode (below the COM port selection)
-        self.triggeringmode_label = QLabel("Select the triggering mode:")
-        vertically_stacked_layout.addWidget(self.triggeringmode_label)
-
-        #add two button widgets below the triggering mode label that allow you to choose manual or triggering mode:
-        #1) manual mode: 
-        #       click the start button on the GUI and the system runs:
-        self.manual_triggering_mode = QPushButton("Manual Mode")
-        # call the 'set_triggering_mode' function and pass 'Manual Mode' into it
-        self.manual_triggering_mode.clicked.connect(lambda: self.set_triggering_mode("Manual Mode"))
-        vertically_stacked_layout.addWidget(self.manual_triggering_mode)
-        
-        #2) external trigger mode/ 'Trigger mode':  
-        #       the system runs once the user clicks the start button and 
-        #       a trigger form the camera causes the LED system to start
-        self.external_trigger_mode = QPushButton("Trigger Mode")
-        # call the 'set_triggering_mode' function and pass 'Trigger Mode' into it
-        self.external_trigger_mode.clicked.connect(lambda: self.set_triggering_mode("Trigger Mode"))
-        vertically_stacked_layout.addWidget(self.external_trigger_mode)
-
-
-
-        #*********************SELECT FLASH PATTERN************************
-        # add a label under the triggering mode that allows you to choose the LED flash pattern
-        # we have four different possible patterns 
-        # Note: L1 is LED1 and L2 is LED2 in an LED bank of 2 LED's:
-        #   1) L1
-        #   2) L1 L2
-        #   3) L1 L1 L2
-        #   4) L1 L1 L1 L2
-        
-        self.flashpattern_label = QLabel("Choose LED Flash Pattern:")
-        vertically_stacked_layout.addWidget(self.flashpattern_label)
-
-        #pattern 1 (L1):
-        #create a pushbutton with label for pattern 1
-        self.flashpattern_1 = QPushButton("Pattern 1: L1")
-        #update current pattern selection (lambda function that calls the set flashpattern when button is clicked)
-        self.flashpattern_1.clicked.connect(lambda: self.set_flashpattern("L1"))
-        #add button widget for pattern 1
-        vertically_stacked_layout.addWidget(self.flashpattern_1)
-
-        #pattern 2 (L1 L2):
-        #create a pushbutton with label for pattern 2
-        self.flashpattern_2 = QPushButton("Pattern 2: L1:L2")
-        #update current pattern selection (lambda function that calls the set flashpattern when button is clicked)
-        self.flashpattern_2.clicked.connect(lambda: self.set_flashpattern("L1:L2"))
-        #add button widget for pattern 2
-        vertically_stacked_layout.addWidget(self.flashpattern_2)
-
-        #pattern 3 (L1 L1 L2):
-        self.flashpattern_3 = QPushButton("Pattern 3: L1:L1:L2")
-        #update current pattern selection (lambda function that calls the set flashpattern when button is clicked)
-        self.flashpattern_3.clicked.connect(lambda: self.set_flashpattern("L1:L1:L2"))
-        #add button widget for pattern 3        
-        vertically_stacked_layout.addWidget(self.flashpattern_3)
-
-        #pattern 4 (L1 L1 L1 L2):
-        self.flashpattern_4 = QPushButton("Pattern 4: L1:L1:L1:L2")
-        #update current pattern selection (lambda function that calls the set flashpattern when button is clicked)
-        self.flashpattern_4.clicked.connect(lambda: self.set_flashpattern("L1:L1:L1:L2"))
-        #add button widget for pattern 4
-        vertically_stacked_layout.addWidget(self.flashpattern_4)
-
-
-
-
-        #*********************SELECT FLASH RATE/ DURATION************************
-        
-        #FLASH RATE:
-        #create label under the flash pattern for the flash rate input
-        self.flashrate_label = QLabel("Flash Rate (Hz):")
-        vertically_stacked_layout.addWidget(self.flashrate_label)
-
-        #create a text box input (use QLineEdit() from PyQt) and add it below the flash rate label
-        self.flash_rate_input = QLineEdit()
-        vertically_stacked_layout.addWidget(self.flash_rate_input)
-
-        #FLASH DURATION:
-        #create label under the flash rate for the flash duration input
-        self.duration_label = QLabel("Duration (Seconds):")
-        vertically_stacked_layout.addWidget(self.duration_label)
-
-        #create a text box input (use QLineEdit() from PyQt) and add it below the flash duration label
-        self.duration_input = QLineEdit()
-        vertically_stacked_layout.addWidget(self.duration_input)
-
-
-
-
-
-        #********************PREVIEW THE SETTINGS FROM ABOVE*******************
-        #add a label for presenting the settings that were selected
-        self.preview_label = QLabel("Settings Preview:")
-        vertically_stacked_layout.addWidget(self.preview_label)
-
-        #create a QFrame box to group all of the settings together
-        self.settings_preview_frame = QFrame()
-        #give it a border
-        self.settings_preview_frame.setFrameShape(QFrame.Shape.Box)
-        self.settings_preview_frame.setStyleSheet("padding: 5px;")
-        #use a verticle stack format (QVBoxLayout() as before) inside the QFrame box
-        self.settings_preview_verticle_layout = QVBoxLayout()
-        self.settings_preview_frame.setLayout(self.settings_preview_verticle_layout)
-
-        #Display the currently selected COM port (global variable: selected_COMport)
-        self.preview_COM_port = QLabel(f"COM Port: {selected_COMport}")
-        self.settings_preview_verticle_layout.addWidget(self.preview_COM_port)
-
-        #Display the currently selected flashing mode (global variable: selected_mode)
-        self.preview_mode = QLabel(f"Mode: {selected_mode}")
-        self.settings_preview_verticle_layout.addWidget(self.preview_mode)
-
-        #Display the currently selected LED pattern (global variable: selected_pattern)
-        self.preview_pattern = QLabel(f"Pattern: {selected_pattern}")
-        self.settings_preview_verticle_layout.addWidget(self.preview_pattern)
-
-        #Display the currently selected flash rate (global variable: flash_rate)
-        self.preview_rate = QLabel(f"Flash Rate: {selected_flash_rate} Hz")
-        self.settings_preview_verticle_layout.addWidget(self.preview_rate)
-        
-        #Display the currently selected flash duration (global variable: selected_flash_duration)
-        self.preview_duration = QLabel(f"Duration: {selected_flash_duration} sec")
-        self.settings_preview_verticle_layout.addWidget(self.preview_duration)
-
-        #add the created frame to the GUI
-        vertically_stacked_layout.addWidget(self.settings_preview_frame)
-
-
-
-        #*************************START BUTTON************************
-        #this button deploys the configuration packet to the arduino
-        self.start_button = QPushButton("Start Flashing")
-        #call the 'send_configuration_packet' function to deploy the configuration packet
-        self.start_button.clicked.connect(self.send_configuration_packet)
-        #add the start button to the GUI
-        vertically_stacked_layout.addWidget(self.start_button)
-
-
-
-        #*************************SERIAL MONITOR***********************
-        #add a label for the serial monitor
-        self.serial_monitor_label = QLabel("Serial Monitor:")
-        vertically_stacked_layout.addWidget(self.serial_monitor_label)
-
-        #create a multi-line widget using QTextEdit
-        self.serial_monitor = QTextEdit()
-        #make the serial monitor read-only and add it to the screen
-        self.serial_monitor.setReadOnly(True)
-        vertically_stacked_layout.addWidget(self.serial_monitor)
-
-        
-        #********************SET UP THREADS FOR SERIAL****************
-        #create an instance of the serialclass class that handles the threads
-        self.serialthreadhandler = serialclass()
-        #connect the 'data_received_signal' for this instance to the 'log_message()' method
-        #when this serial thread receives new data from the COM port, it connects the signal
-        #to the log_message function (thread safe)
-        self.serialthreadhandler.data_received_signal.connect(self.add_message_to_serial_monitor)
-
-
-    #function/ method to get the COM ports (method inside GUI class)
-    #arguments: self (belongs to GUI class)
-    #returns: list of strings (like "COM3" or "COM4")
-    def get_available_COM_ports(self):
-        #call pyserial function to scan system for all available serial ports
-        ports = serial.tools.list_ports.comports()
-        #return the list of port name's (port.device) like "COM3" or "COM4"
-        return [port.device for port in ports]
-
-
-    #function/ method to connect to selected COM port
-    #args: self (belongs to GUI class)
-    #returns
-    def connect_to_COM_port(self):
-        #use the globals for the arduino and selected COM port
-        global arduino, selected_COMport
-        #grab the currently selected port from the dropdown in the GUI
-        selected_COMport = self.COMport_dropdownbox.currentText()
-
-        #check if the global arduino object exists (not 'None') 
-        #and the serial connection is currently open
-        if arduino and arduino.is_open:
-            #if both true, close the existing serial connection to the arduino
-            #now we can open a new connection on the selected port
-            arduino.close()
-
-        #Note: try-except handles errors that may occur when attempting to connect to a serial port
-        #try to connect to the arduino
-        try:
-            #create serial connection to arduino (9600 baud rate)
-            #timeout = 1 means that if we dont get data after 1s we stop waiting for connection
-            arduino = serial.Serial(selected_COMport, 9600, timeout=1)
-
-            #give arduino 2s to reset and initialize as we just opened a serial connection
-            time.sleep(2)
-
-            #clear leftover data/ flush buffer
-            arduino.reset_input_buffer()
-
-            #write that connection is successful to the serial monitor on the GUI
-            self.add_message_to_serial_monitor(f"Connected to {selected_COMport}")
-            
-            #create new thread to continously read serial data from the arduino
-            #daemon = true means that the thread stops when the program exits
-            #lets us read the new connection in the background without affecting the GUI
-            threading.Thread(target=self.serialthreadhandler.readserialmethod, daemon=True).start()  # Start thread
-        
-        #we could not connect to the arduino (error):
-        except serial.SerialException:
-            self.add_message_to_serial_monitor("Failed to connect to the microcontroller! Check the connection to the COM port and ensure nothing else is accessing it.")
-
-        #update the settings preview panel on the GUI to display the configuration info
-        self.update_configuration_preview()
-
-
-    #function/method to set the triggering mode
-    #args: self (belongs to GUI class), mode (a string that is either 'Trigger Mode' or 'Manual Mode')
-    def set_triggering_mode(self, mode):
-        #use the global variable
-        global selected_mode
-        selected_mode = mode
-        #update the settings preview panel on the GUI to display the configuration info
-        self.update_configuration_preview()
-
-    #function/method to set the flashing pattern
-    #args: self (belongs to GUI class), pattern (a string: either 'L1', 'L1:L2', 'L1:L1:L2' or 'L1:L1:L1:L2')
-    def set_flashpattern(self, pattern):
-        #use the global variable
-        global selected_pattern
-        selected_pattern = pattern 
-        #update the settings preview panel on the GUI to display the configuration info
-        self.update_configuration_preview()
-
-
-    #function/method to send the configuration packet
-    #args: self (belongs to GUI class)
-    #this sends the configuration data from the GUI in the form of
-    #integers to the arduino through serial communication
-    #Packet format:
-    #    SET {mode - int} {flash rate - int} {flash duration - int} {pattern - int}
-    #    ex: SET 2 4 30 2
-    #    - Mode: 1 (Manual Mode), 2 (Triggering Mode)
-    #    - Flash Rate: Positive Number (> 0)    [Hz]
-    #    - Flash Duration: Positive Number (> 0)    [s]
-    #    - Pattern: "L1" = 1, "L1:L2" = 2, "L1:L1:L2" = 3, "L1:L1:L1:L2" = 4
-    def send_configuration_packet(self):
-
-        #we are using the global variables
-        global selected_flash_rate, selected_flash_duration
-
-        #try to send the configuration data from the GUI
-        #we are using the try-except clause as the user might
-        #enter invalid data like a letter or something for the flash rate, etc.
-        try:
-            #grabs the flash rate from the box and tries to convert it to an integer
-            selected_flash_rate = int(self.flash_rate_input.text())
-            #grabs the flash duration from the box and tries to convert it to an integer
-            selected_flash_duration = int(self.duration_input.text())
-
-            #cannot use non-positive flash rate/ duration values
-            if selected_flash_rate <= 0 or selected_flash_duration <= 0:
-                self.add_message_to_serial_monitor("Enter valid values (that are greater or equal to zero) for the flash rate/ duration!")
-                #exit method
-                return
-
-            #define the pattern index and the corresponding integer ID that is to be sent in the configuration packet
-            pattern_index = {
-                "L1": 1,
-                "L1:L2": 2,
-                "L1:L1:L2": 3,
-                "L1:L1:L1:L2": 4
-            }[selected_pattern]
-
-            #packetize the data to be sent to the arduino
-            #packet has form "SET {mode - int} {flash rate - int} {flash duration - int} {pattern - int}"
-            configuration_packet = f"SET {1 if selected_mode == 'Manual Mode' else 2} {selected_flash_rate} {selected_flash_duration} {pattern_index}\n"
-            
-            #send the packet to the arduino (if the arduino object exists and the serial port is connected)
-            if arduino and arduino.is_open:
-                #transmit the packet
-                #.encode converts the string to bytes
-                arduino.write(configuration_packet.encode())
-                #print to the serial monitor that we successfully sent the packet
-                self.add_message_to_serial_monitor(f"Successfully sent: {configuration_packet.strip()} to the arduino")
-           
-            #otherwise, an error occured
-            else:
-                self.add_message_to_serial_monitor("Error sending configuration data to the arduino!")
-
-        #if an error occurs (the user enters a letter or another invalid input)
-        except ValueError:
-            #add an invalid input message to the serial monitor
-            self.add_message_to_serial_monitor("Invalid Input!")
-        
-        
-        #update the settings preview panel on the GUI to display the configuration info
-        self.update_configuration_preview()
-
-    #function/method to add a new message to the bottom of the serial monitor
-    #args: self (belongs to GUI class), message (a string that will be displayed on the monitor)
-    def add_message_to_serial_monitor(self, message):
-        #append the message to the bottom of the serial monitor
-        self.serial_monitor.append(message)
-
-    #function/method to update the GUI's configuration preview
-    #args: self (belongs to GUI class)
-    #note that this displays the current globals
-    def update_configuration_preview(self):
-        self.preview_COM_port.setText(f"COM Port: {selected_COMport}")
-        self.preview_mode.setText(f"Mode: {selected_mode}")
-        self.preview_pattern.setText(f"Pattern: {selected_pattern}")
-        self.preview_rate.setText(f"Flash Rate: {selected_flash_rate} Hz")
-        self.preview_duration.setText(f"Duration: {selected_flash_duration} sec")
-
-
-
-#****************MAIN*****************
-if __name__ == "__main__":
-
-    #initialize the PyQt app
-    pyQtapp = QApplication(sys.argv)
-
-    #create an instance of the main window class (called 'mainwindow')
-    mainwindow = systemGUI()
-    #make this window visible on the screen
-    mainwindow.show()
-
-    #done
-    sys.exit(pyQtapp.exec())
+
+
+
+#*****************CLASSES/ SETUP*****************
+import sys #system params
+import os #folder for the session recordings
+import collections #deque (ring buffer) for the serial monitor lines waiting to be shown
+import time #used for timing (like time.perf_counter())
+
+#import widgets for pyQt6
+#   - pyQT6 is the Python version of the C++ Qt 6 GUI framework
+#   - Qt is written in C++, pyQt6 is the python wrapper
+from PyQt6.QtWidgets import (
+    QApplication,   #used for GUI general startup/ stop
+    QMainWindow,    #used to frame the app with a main window
+    QWidget,        #used for widget layout 
+    QVBoxLayout,    #stacks widgets vertically
+    QLabel,         #displays text
+    QComboBox,      #dropdown lists
+    QPushButton,    #button in the GUI that a user can click
+    QLineEdit,      #single line input
+    QPlainTextEdit, #multiple line output (the terminal in the app), faster than QTextEdit for logs
+    QFrame,         #container used to group widgets (style)
+    QHBoxLayout,    #puts widgets side by side (the sequence buttons)
+    QProgressBar,   #shows how many trials of a sequence are done/ how far the current run is
+    QCheckBox,      #on/ off option (pre-stage the next trial)
+    QFileDialog     #lets the user pick a sequence file/ where to export the metrics
+)
+
+#pyqtSignal: signals (events) between threads running and the GUI
+#Qobject: needed for signal emmission (base class for Qt objects)
+from PyQt6.QtCore import pyqtSignal, QObject
+#QEvent: used to spot the first time the window is painted (startup timing)
+from PyQt6.QtCore import QEvent
+#QTimer: used to update the serial monitor a fixed number of times per second
+from PyQt6.QtCore import QTimer
+#QFont: fixed width font for the metrics table
+from PyQt6.QtGui import QFont
+
+#ledcontroller: holds the settings and talks to the arduino (no PyQt6 in there, the
+#command line tool ledctl.py uses the same class), the GUI is just a front end for it
+from led_controller import ledcontroller, configurationerror, MODES, PATTERNS, PROTOCOL_BINARY, PROTOCOL_TEXT
+#asyncledcontroller: the same controller, read by an asyncio loop instead of a thread (--asyncio)
+from async_transport import asyncledcontroller
+#STATE_CONNECTED: the arduino is ready and the link speed is negotiated
+from connection_manager import STATE_CONNECTED
+#portwatcher: finds the COM ports in a background thread and notices hotplugged boards
+from port_discovery import portwatcher
+#session recorder: saves every line sent/ received with a timestamp to a log file
+from session_recorder import sessionrecorder
+#latency metrics: SET -> answer times measured by the ledcontroller (p50/ p95/ p99/ max)
+from latency_metrics import format_summary, TRACKED_PREFIXES
+#sequence scheduler: runs a list of trials from a CSV/ YAML file one after the other
+from sequence_scheduler import sequencescheduler, load_sequence, format_report, SEQUENCE_PAUSED
+#device events: the arduino's lines as typed events (the run started/ ended, the configuration
+#it applied ...), the preview shows what the arduino confirmed
+from device_events import eventbatch, configappliedevent, finishedevent, flashstartedevent
+#control server: lets other programs (the acquisition software) configure/ start/ stop the
+#arduino over a localhost socket (--control-server)
+from control_server import controlserver, DEFAULT_PORT
+#session replay: plays a recorded (or made up) session back into the GUI without an arduino (--replay)
+from session_replay import sessionreplayer
+
+
+#serial monitor settings
+SERIAL_MONITOR_MAX_LINES = 5000 #older lines are dropped from the serial monitor after this many
+SERIAL_MONITOR_FRAME_MS = 33 #new lines are added to the serial monitor in one batch every 33ms (~30 times/s)
+
+#session recordings go in the 'sessions' folder next to this file
+SESSION_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sessions")
+#--profile (or LED_GUI_PROFILE=1) writes its summary/ trace to the 'profiles' folder (see gui_profiler.py)
+PROFILE_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles")
+
+#what the profiler times: the slots connected in systemGUI.__init__ (and the methods they call
+#that redraw a lot), the ledcontroller calls the GUI makes (they write to the serial port in the
+#GUI thread) and the serialclass signals whose deliveries it counts
+PROFILED_SLOTS = (
+    "connect_to_COM_port", "disconnect_from_COM_port", "set_triggering_mode", "set_flashpattern",
+    "set_custom_flashpattern", "send_configuration_packet", "stop_flashing", "update_flash_progress",
+    "load_sequence_file", "run_sequence", "pause_or_resume_sequence", "abort_sequence",
+    "toggle_metrics_panel", "update_metrics_panel", "reset_metrics", "export_metrics",
+    "flush_serial_monitor", "set_recording", "add_message_to_serial_monitor", "COM_port_ready",
+    "binary_frame_received", "sequence_progress", "sequence_finished", "line_reached_gui",
+    "device_events_received", "flash_state_changed", "remote_command", "update_COM_port_list",
+    "update_configuration_preview",
+)
+PROFILED_CONTROLLER_CALLS = ("connect", "disconnect", "send_configuration", "stop", "set_recorder")
+PROFILED_SIGNALS = (
+    "data_received_signal", "connection_ready_signal", "ports_changed_signal", "frame_received_signal",
+    "sequence_progress_signal", "sequence_finished_signal", "line_timestamp_signal",
+    "device_events_signal", "remote_command_signal",
+)
+
+#protocol choices in the dropdown (name shown -> protocol used by the ledcontroller)
+PROTOCOL_CHOICES = {
+    "Binary frames (ACK, falls back to text)": PROTOCOL_BINARY,
+    "Text (SET line)": PROTOCOL_TEXT,
+}
+
+#the numbers the arduino reports -> the names shown in the preview (0 = a custom pattern table)
+MODE_NAMES = {number: mode for mode, number in MODES.items()}
+PATTERN_NAMES = {number: pattern for pattern, number in PATTERNS.items()}
+PATTERN_NAMES[0] = "custom"
+
+#globals
+app_start_time = time.perf_counter() #when the program started (used to time startup to first paint)
+#note: the selected COM port/ mode/ pattern/ flash rate/ duration used to be globals here,
+#they now live in the ledcontroller (self.serialthreadhandler.controller)
+
+
+#******************CLASS DEFINITIONS*****************
+"""
+in our code, we have 2 classes:
+1) serialclass:
+    -this class is responsible for reading serial data from the arduino,
+     without slowing or stopping the GUI
+    -this class was created as when you read from the serial port, we stop/ wait for
+     data, which causes the GUI to freeze if we were to read from serial directly in
+     the main GUI thread
+    -this lets the GUI be responsive to the user while reading serial data in the
+     background
+    -we use signalling to communicate between threads
+  
+2) systemGUI
+    -the 'systemGUI' class creates a GUI for the system where the user can change
+     system parameters:
+        - COM port selection
+        - Mode selection (manual mode or trigger mode)
+        - Flashing pattern
+        - Flashing frequency and duration
+        - Start button to send packetized system parameters to the arduino
+        - View output from arduino (serial monitor)
+"""
+
+# 'serialclass' class that is used to read serial data from arduino
+#        - note that it inherits from QObject (base class for Qt objects)
+#          we need to use QObject for emiting signals
+# general problem this solves:
+#        - if we want to read serial data from the arduino in the main GUI
+#          thread, them the app would freeze waiting for data
+#        - this is because arduino.readline() waits/ blocks until something
+#          comes through the serial port
+class serialclass(QObject):
+
+    #pyqtSignal is used for communication between threads
+    #   data_received_signal is a signal that has a string when its emmited
+    #   we use this signal to send serial messages to the GUI
+    data_received_signal = pyqtSignal(str)
+
+    #connection_ready_signal is emmited once the arduino is ready after connecting
+    #   it has the seconds from opening the port to ready, and whether the ready banner was seen
+    connection_ready_signal = pyqtSignal(float, bool)
+
+    #ports_changed_signal is emmited by the port watcher thread when COM ports are plugged in/ removed
+    #   it has two lists: the port names that were added and the port names that were removed
+    ports_changed_signal = pyqtSignal(list, list)
+
+    #frame_received_signal is emmited for every binary protocol frame (ACK/ NAK/ STATUS) from the arduino
+    #   it has the 'protocolframe' object (see binary_protocol.py)
+    frame_received_signal = pyqtSignal(object)
+
+    #sequence_progress_signal is emmited by the sequence scheduler thread when a trial starts/ ends
+    #   it has the number of trials done, the number of trials and the scheduler state ("running", "paused" ...)
+    sequence_progress_signal = pyqtSignal(int, int, str)
+
+    #sequence_finished_signal is emmited once when a sequence ends (finished, aborted or failed)
+    #   it has the report dict from the scheduler (see sequence_scheduler.py)
+    sequence_finished_signal = pyqtSignal(object)
+
+    #line_timestamp_signal is emmited for the lines the latency metrics look at (Received/ DONE ...)
+    #   it has the time.perf_counter_ns() when the reader thread handled the line, so the GUI can
+    #   measure how long the line waited for the GUI thread (object: the number is too big for an int signal)
+    line_timestamp_signal = pyqtSignal(object)
+
+    #device_events_signal is emmited when the first event of a new batch arrives (see device_events.py)
+    #   it has nothing: the GUI takes the whole batch from self.event_batch, so while the GUI
+    #   thread is busy the events pile up in ONE batch instead of queuing one signal each
+    device_events_signal = pyqtSignal()
+
+    #remote_command_signal is emmited by the control server thread after a request changed something
+    #   it has the method ("configure", "start" or "stop") and the message to show
+    remote_command_signal = pyqtSignal(str, str)
+
+    #constructor that creates a serialclass object
+    #args: async_loop (None = read the port in a background thread, or an asyncio loop
+    #      run by Qt (see qt_async_bridge.py) to read it in the GUI thread instead)
+    def __init__(self, async_loop=None):
+
+        #calls the QObject (parent class) constructor
+        super().__init__()
+
+        # self.controller: the ledcontroller holds the settings and talks to the arduino
+        # (see led_controller.py), its connectionmanager owns the COM port and the ONE
+        # background thread that reads from it (see connection_manager.py)
+        #   - every line read from the arduino is passed to 'readserialmethod' (below)
+        #   - status messages (lost connection, reconnecting, ACKs...) go straight to the GUI
+        # the callbacks run in background threads, so they only emit signals
+        # (with an async_loop the asyncledcontroller reads the port in the GUI thread, see
+        # async_transport.py, and Qt calls the slots of the signals straight away)
+        callbacks = dict(
+            on_line=self.readserialmethod,
+            on_message=self.data_received_signal.emit,
+            on_ready=self.connection_ready_signal.emit,
+            on_frame=self.frame_received_signal.emit,
+            on_event=self.eventmethod,
+        )
+        #the events waiting for the GUI thread
+        self.event_batch = eventbatch()
+        if async_loop is None:
+            self.controller = ledcontroller(**callbacks)
+        else:
+            self.controller = asyncledcontroller(loop=async_loop, **callbacks)
+        self.connection = self.controller.connection
+
+    #METHOD #1: readserialmethod
+    #   this method is called by the connectionmanager's background thread for
+    #   every line of text read from the arduino
+    #   note: it runs in the background thread, so we do not touch any widgets here,
+    #         we emit a signal and Qt delivers it to the GUI thread for us
+    def readserialmethod(self, line):
+        read_at = time.perf_counter_ns()
+        # note: the line was already timestamped (time.perf_counter_ns()) and recorded by the
+        # ledcontroller in this same thread before this method was called, so the time in the
+        # session recording does not include the wait for the GUI thread
+        # emit the 'data_received' signal to the GUI with the line that was read,
+        # indicating that it was from the arduino. This signal is connected to the 
+        # main GUI code with the self.worker.data_received.connect(self.log_message)
+        # (i.e. we call log_message() whenever we receive data)
+        self.data_received_signal.emit(f"Arduino: {line}")
+        #only the lines the metrics use, one extra signal per line would double the signal traffic
+        if line.startswith(TRACKED_PREFIXES):
+            self.line_timestamp_signal.emit(read_at)
+
+    #METHOD #2: eventmethod
+    #   called (in the same background thread, right after the ledcontroller parsed the line)
+    #   with the typed event of a line, see device_events.py
+    def eventmethod(self, event):
+        #only the first event of a batch emits the signal
+        if self.event_batch.add(event):
+            self.device_events_signal.emit()
+
+
+# the 'systemGUI' class creates a GUI for the system where the user can change
+# system parameters:
+#   - COM port selection
+#   - Mode selection (manual mode or trigger mode)
+#   - Flashing pattern
+#   - Flashing frequency and duration
+#   - Start button to send packetized system parameters to the arduino
+#   - View output from arduino (serial monitor)
+
+# note that this class inherits from QMainWindow (from PyQt) (main GUI)
+class systemGUI(QMainWindow):
+
+    #constructor method used when a systemGUI method is created
+    #args: serial_monitor_max_lines (how many lines the serial monitor keeps before dropping old ones)
+    #      session_folder (where to record the session, None = do not record until the box is ticked)
+    #      async_loop (None = the reader thread, or the asyncio loop of a qtasynciobridge)
+    #      profiler (None = no profiling, or a started 'guiprofiler' (see gui_profiler.py))
+    def __init__(self, serial_monitor_max_lines=SERIAL_MONITOR_MAX_LINES, session_folder=None, async_loop=None,
+                 profiler=None):
+        
+        #note that below calls the parent class 'QMainWindow' constructor
+        super().__init__()
+
+        #profiling (--profile): the slots are swapped for timed copies before anything below
+        #connects them (without a profiler nothing is wrapped, so it costs nothing)
+        self.profiler = profiler
+        if profiler is not None:
+            profiler.wrap_methods(self, PROFILED_SLOTS)
+
+        #used to measure the time from starting the program to the window first being painted
+        self.first_paint_done = False
+
+
+
+        #**********************SETUP/ LAYOUT**********************
+        
+        #set window title and the size of the window
+        self.setWindowTitle("LED Control System for the Quinn Laboratory")
+        self.setGeometry(300, 100, 500, 600)
+
+        #background colour here is light gray
+        self.setStyleSheet("background-color: #f5f5f5;")
+
+        #layout setup:
+        #QVBoxLayout stacks the widgets from top to bottom
+        vertically_stacked_layout = QVBoxLayout()
+        #container is a QWidget that has everything in it
+        container = QWidget()
+        container.setLayout(vertically_stacked_layout)
+        #below tells pyQt that container is the main area
+        self.setCentralWidget(container)
+
+
+        #*******************COM PORT CONNECTION*******************
+        
+        #create a label called 'COMlabel' for the selection of the COM port
+        self.COMlabel = QLabel("Select the COM port (USB port) that the Arduino is connected to:")
+        #add it to the main layout (verically stacked as we are usuing QVBoxLayout())
+        vertically_stacked_layout.addWidget(self.COMlabel)
+
+        # create a variable called the COMport_dropdownbox that creates a dropdown
+        # box to select the COM port (using the QComboBox widget from PyQt6)
+        # note: the dropdown starts empty, the port watcher (set up at the bottom of
+        # __init__) fills it in the background so the window appears straight away
+        self.COMport_dropdownbox = QComboBox()
+        # add the dropdown under the label
+        vertically_stacked_layout.addWidget(self.COMport_dropdownbox)
+       
+        # add a 'connect' button to connect to the serial COM port (below the dropdown)
+        self.connect_button = QPushButton("CONNECT")
+        # call the 'connect_to_COM_port' function to connect to the selected com port
+        self.connect_button.clicked.connect(self.connect_to_COM_port)
+        # add 'connect' button below the dropdown
+        vertically_stacked_layout.addWidget(self.connect_button)
+
+        # add a 'disconnect' button that closes the COM port (below the connect button)
+        self.disconnect_button = QPushButton("DISCONNECT")
+        # call the 'disconnect_from_COM_port' function to close the connection
+        self.disconnect_button.clicked.connect(self.disconnect_from_COM_port)
+        vertically_stacked_layout.addWidget(self.disconnect_button)
+
+        #*********************SELECT TRIGGERING MODE************************
+        
+        # select the triggering mode (below the COM port selection)
+        self.triggeringmode_label = QLabel("Select the triggering mode:")
+        vertically_stacked_layout.addWidget(self.triggeringmode_label)
+
+        #add two button widgets below the triggering mode label that allow you to choose manual or triggering mode:
+        #1) manual mode: 
+        #       click the start button on the GUI and the system runs:
+        self.manual_triggering_mode = QPushButton("Manual Mode")
+        # call the 'set_triggering_mode' function and pass 'Manual Mode' into it
+        self.manual_triggering_mode.clicked.connect(lambda: self.set_triggering_mode("Manual Mode"))
+        vertically_stacked_layout.addWidget(self.manual_triggering_mode)
+        
+        #2) external trigger mode/ 'Trigger mode':  
+        #       the system runs once the user clicks the start button and 
+        #       a trigger form the camera causes the LED system to start
+        self.external_trigger_mode = QPushButton("Trigger Mode")
+        # call the 'set_triggering_mode' function and pass 'Trigger Mode' into it
+        self.external_trigger_mode.clicked.connect(lambda: self.set_triggering_mode("Trigger Mode"))
+        vertically_stacked_layout.addWidget(self.external_trigger_mode)
+
+
+
+        #*********************SELECT FLASH PATTERN************************
+        # add a label under the triggering mode that allows you to choose the LED flash pattern
+        # we have four different possible patterns 
+        # Note: L1 is LED1 and L2 is LED2 in an LED bank of 2 LED's:
+        #   1) L1
+        #   2) L1 L2
+        #   3) L1 L1 L2
+        #   4) L1 L1 L1 L2
+        
+        self.flashpattern_label = QLabel("Choose LED Flash Pattern:")
+        vertically_stacked_layout.addWidget(self.flashpattern_label)
+
+        #pattern 1 (L1):
+        #create a pushbutton with label for pattern 1
+        self.flashpattern_1 = QPushButton("Pattern 1: L1")
+        #update current pattern selection (lambda function that calls the set flashpattern when button is clicked)
+        self.flashpattern_1.clicked.connect(lambda: self.set_flashpattern("L1"))
+        #add button widget for pattern 1
+        vertically_stacked_layout.addWidget(self.flashpattern_1)
+
+        #pattern 2 (L1 L2):
+        #create a pushbutton with label for pattern 2
+        self.flashpattern_2 = QPushButton("Pattern 2: L1:L2")
+        #update current pattern selection (lambda function that calls the set flashpattern when button is clicked)
+        self.flashpattern_2.clicked.connect(lambda: self.set_flashpattern("L1:L2"))
+        #add button widget for pattern 2
+        vertically_stacked_layout.addWidget(self.flashpattern_2)
+
+        #pattern 3 (L1 L1 L2):
+        self.flashpattern_3 = QPushButton("Pattern 3: L1:L1:L2")
+        #update current pattern selection (lambda function that calls the set flashpattern when button is clicked)
+        self.flashpattern_3.clicked.connect(lambda: self.set_flashpattern("L1:L1:L2"))
+        #add button widget for pattern 3        
+        vertically_stacked_layout.addWidget(self.flashpattern_3)
+
+        #pattern 4 (L1 L1 L1 L2):
+        self.flashpattern_4 = QPushButton("Pattern 4: L1:L1:L1:L2")
+        #update current pattern selection (lambda function that calls the set flashpattern when button is clicked)
+        self.flashpattern_4.clicked.connect(lambda: self.set_flashpattern("L1:L1:L1:L2"))
+        #add button widget for pattern 4
+        vertically_stacked_layout.addWidget(self.flashpattern_4)
+
+        #custom pattern (compiled into a table and uploaded to the arduino, see pattern_compiler.py):
+        #ex: L1+L2@5ms/20ms:OFF@100ms (both LEDs on for 5ms, off for 20ms, then a 100ms pause)
+        #create a text box and a button next to it that uses the typed pattern
+        custom_pattern_layout = QHBoxLayout()
+        self.custom_pattern_input = QLineEdit()
+        self.custom_pattern_input.setPlaceholderText("Custom pattern, ex: L1+L2@5ms/20ms:OFF@100ms")
+        custom_pattern_layout.addWidget(self.custom_pattern_input)
+        self.custom_pattern_button = QPushButton("Use Custom Pattern")
+        #the flash rate box is read first, the length of a step without a time depends on it
+        self.custom_pattern_button.clicked.connect(self.set_custom_flashpattern)
+        custom_pattern_layout.addWidget(self.custom_pattern_button)
+        vertically_stacked_layout.addLayout(custom_pattern_layout)
+
+
+
+
+        #*********************SELECT FLASH RATE/ DURATION************************
+        
+        #FLASH RATE:
+        #create label under the flash pattern for the flash rate input
+        self.flashrate_label = QLabel("Flash Rate (Hz):")
+        vertically_stacked_layout.addWidget(self.flashrate_label)
+
+        #create a text box input (use QLineEdit() from PyQt) and add it below the flash rate label
+        self.flash_rate_input = QLineEdit()
+        vertically_stacked_layout.addWidget(self.flash_rate_input)
+
+        #FLASH DURATION:
+        #create label under the flash rate for the flash duration input
+        self.duration_label = QLabel("Duration (Seconds):")
+        vertically_stacked_layout.addWidget(self.duration_label)
+
+        #create a text box input (use QLineEdit() from PyQt) and add it below the flash duration label
+        self.duration_input = QLineEdit()
+        vertically_stacked_layout.addWidget(self.duration_input)
+
+
+
+
+
+        #********************PREVIEW THE SETTINGS FROM ABOVE*******************
+        #add a label for presenting the settings that were selected
+        self.preview_label = QLabel("Settings Preview:")
+        vertically_stacked_layout.addWidget(self.preview_label)
+
+        #create a QFrame box to group all of the settings together
+        self.settings_preview_frame = QFrame()
+        #give it a border
+        self.settings_preview_frame.setFrameShape(QFrame.Shape.Box)
+        self.settings_preview_frame.setStyleSheet("padding: 5px;")
+        #use a verticle stack format (QVBoxLayout() as before) inside the QFrame box
+        self.settings_preview_verticle_layout = QVBoxLayout()
+        self.settings_preview_frame.setLayout(self.settings_preview_verticle_layout)
+
+        #Display the currently selected COM port
+        #(the text of all the preview labels is filled in by update_configuration_preview())
+        self.preview_COM_port = QLabel()
+        self.settings_preview_verticle_layout.addWidget(self.preview_COM_port)
+
+        #Display the link speed negotiated with the arduino (see connection_manager.py)
+        self.preview_link = QLabel()
+        self.settings_preview_verticle_layout.addWidget(self.preview_link)
+
+        #Display the currently selected flashing mode
+        self.preview_mode = QLabel()
+        self.settings_preview_verticle_layout.addWidget(self.preview_mode)
+
+        #Display the currently selected LED pattern
+        self.preview_pattern = QLabel()
+        self.settings_preview_verticle_layout.addWidget(self.preview_pattern)
+
+        #Display the currently selected flash rate
+        self.preview_rate = QLabel()
+        self.settings_preview_verticle_layout.addWidget(self.preview_rate)
+        
+        #Display the currently selected flash duration
+        self.preview_duration = QLabel()
+        self.settings_preview_verticle_layout.addWidget(self.preview_duration)
+
+        #add the created frame to the GUI
+        vertically_stacked_layout.addWidget(self.settings_preview_frame)
+
+
+
+        #*************************PROTOCOL************************
+        #choose how the configuration is sent to the arduino:
+        #   - binary frames: compact packet with a CRC, the arduino answers with an ACK so we
+        #     know the settings were applied (if it never answers, e.g. old firmware, we resend as text)
+        #   - text: the original "SET 1 4 30 2" line
+        self.protocol_label = QLabel("Protocol:")
+        vertically_stacked_layout.addWidget(self.protocol_label)
+        self.protocol_dropdownbox = QComboBox()
+        self.protocol_dropdownbox.addItems(list(PROTOCOL_CHOICES))
+        vertically_stacked_layout.addWidget(self.protocol_dropdownbox)
+
+
+        #*************************START/ STOP BUTTONS************************
+        #start/ stop buttons side by side
+        start_stop_layout = QHBoxLayout()
+        #this button deploys the configuration packet to the arduino
+        self.start_button = QPushButton("Start Flashing")
+        #call the 'send_configuration_packet' function to deploy the configuration packet
+        self.start_button.clicked.connect(self.send_configuration_packet)
+        #add the start button to the GUI
+        start_stop_layout.addWidget(self.start_button)
+        #this button stops the run that is flashing now (or disarms the trigger)
+        self.stop_button = QPushButton("Stop")
+        self.stop_button.clicked.connect(self.stop_flashing)
+        start_stop_layout.addWidget(self.stop_button)
+        vertically_stacked_layout.addLayout(start_stop_layout)
+
+        #progress bar of the run that is flashing now (seconds flashed/ duration)
+        self.flash_progress_bar = QProgressBar()
+        self.flash_progress_bar.setFormat("Not flashing")
+        self.flash_progress_bar.setValue(0)
+        vertically_stacked_layout.addWidget(self.flash_progress_bar)
+        #the bar is updated 10 times a second, only while the arduino is flashing
+        self.flash_progress_timer = QTimer(self)
+        self.flash_progress_timer.setInterval(100)
+        self.flash_progress_timer.timeout.connect(self.update_flash_progress)
+
+
+
+        #*************************SEQUENCE************************
+        #run a whole list of trials (CSV/ YAML file) without clicking start for each one
+        #the next trial is sent as soon as the arduino says "DONE" (see sequence_scheduler.py)
+        self.sequence_label = QLabel("Sequence: no file loaded")
+        vertically_stacked_layout.addWidget(self.sequence_label)
+
+        #button to pick the sequence file
+        self.load_sequence_button = QPushButton("Load Sequence File...")
+        self.load_sequence_button.clicked.connect(self.load_sequence_file)
+        vertically_stacked_layout.addWidget(self.load_sequence_button)
+
+        #pre-stage: send the next trial while the current one is still flashing
+        self.prestage_checkbox = QCheckBox("Pre-stage the next trial while flashing (no gap between trials)")
+        vertically_stacked_layout.addWidget(self.prestage_checkbox)
+
+        #run/ pause/ abort buttons side by side
+        sequence_button_layout = QHBoxLayout()
+        self.run_sequence_button = QPushButton("Run Sequence")
+        self.run_sequence_button.clicked.connect(self.run_sequence)
+        sequence_button_layout.addWidget(self.run_sequence_button)
+        self.pause_sequence_button = QPushButton("Pause")
+        self.pause_sequence_button.clicked.connect(self.pause_or_resume_sequence)
+        sequence_button_layout.addWidget(self.pause_sequence_button)
+        self.abort_sequence_button = QPushButton("Abort")
+        self.abort_sequence_button.clicked.connect(self.abort_sequence)
+        sequence_button_layout.addWidget(self.abort_sequence_button)
+        vertically_stacked_layout.addLayout(sequence_button_layout)
+
+        #progress bar (trials done/ number of trials)
+        self.sequence_progress_bar = QProgressBar()
+        self.sequence_progress_bar.setFormat("%v/%m trials")
+        vertically_stacked_layout.addWidget(self.sequence_progress_bar)
+
+        #the trials from the loaded file and the scheduler running them (None when not running)
+        self.sequence_trials = []
+        self.sequence_scheduler = None
+        self.update_sequence_buttons()
+
+
+
+        #*************************SERIAL MONITOR***********************
+        #add a label for the serial monitor
+        self.serial_monitor_label = QLabel("Serial Monitor:")
+        vertically_stacked_layout.addWidget(self.serial_monitor_label)
+
+        #create a multi-line widget using QPlainTextEdit
+        #(QPlainTextEdit only lays out the lines that are on screen, QTextEdit lays out everything)
+        self.serial_monitor = QPlainTextEdit()
+        #make the serial monitor read-only and add it to the screen
+        self.serial_monitor.setReadOnly(True)
+        #only keep the newest lines so memory does not keep growing in long sessions
+        self.serial_monitor.setMaximumBlockCount(serial_monitor_max_lines)
+        vertically_stacked_layout.addWidget(self.serial_monitor)
+
+        #record everything sent/ received (with timestamps) to a log file in the sessions folder
+        #(see session_recorder.py, the log can be loaded into numpy arrays for analysis)
+        self.session_folder = session_folder or SESSION_FOLDER
+        self.session_recorder = None
+        self.record_checkbox = QCheckBox(f"Record the session to {self.session_folder}")
+        vertically_stacked_layout.addWidget(self.record_checkbox)
+
+
+
+        #*************************LATENCY METRICS************************
+        #collapsible panel with the SET -> answer latencies (see latency_metrics.py)
+        #the button shows/ hides it, it is hidden at the start
+        self.metrics_button = QPushButton("Show Latency Metrics")
+        self.metrics_button.clicked.connect(self.toggle_metrics_panel)
+        vertically_stacked_layout.addWidget(self.metrics_button)
+
+        self.metrics_frame = QFrame()
+        self.metrics_frame.setFrameShape(QFrame.Shape.Box)
+        metrics_layout = QVBoxLayout()
+        self.metrics_frame.setLayout(metrics_layout)
+        #the table (fixed width font so the columns line up)
+        self.metrics_table = QLabel()
+        self.metrics_table.setFont(QFont("Courier New", 9))
+        metrics_layout.addWidget(self.metrics_table)
+        #reset/ export buttons side by side
+        metrics_button_layout = QHBoxLayout()
+        self.metrics_reset_button = QPushButton("Reset")
+        self.metrics_reset_button.clicked.connect(self.reset_metrics)
+        metrics_button_layout.addWidget(self.metrics_reset_button)
+        self.metrics_export_button = QPushButton("Export CSV...")
+        self.metrics_export_button.clicked.connect(self.export_metrics)
+        metrics_button_layout.addWidget(self.metrics_export_button)
+        metrics_layout.addLayout(metrics_button_layout)
+        self.metrics_frame.setVisible(False)
+        vertically_stacked_layout.addWidget(self.metrics_frame)
+
+        #the table is redrawn twice a second, only while the panel is open
+        self.metrics_timer = QTimer(self)
+        self.metrics_timer.setInterval(500)
+        self.metrics_timer.timeout.connect(self.update_metrics_panel)
+
+        #new messages are not added to the serial monitor one at a time (that caused one
+        #layout pass per line and made the GUI stutter when the arduino sent a burst)
+        #instead they wait in this ring buffer and are added together by the timer below
+        #(maxlen: if more lines than the monitor can show arrive between two frames,
+        #the oldest ones are dropped here instead of being added and then removed)
+        self.serial_monitor_pending = collections.deque(maxlen=serial_monitor_max_lines)
+        #how many lines were dropped from the ring buffer before they were ever shown
+        self.serial_monitor_dropped = 0
+        #how many frames (batches of lines) were added to the serial monitor
+        self.serial_monitor_frames = 0
+        #the frame timer only runs while there are lines waiting, so it uses no CPU when idle
+        self.serial_monitor_timer = QTimer(self)
+        self.serial_monitor_timer.setInterval(SERIAL_MONITOR_FRAME_MS)
+        self.serial_monitor_timer.timeout.connect(self.flush_serial_monitor)
+
+        
+        #********************SET UP THREADS FOR SERIAL****************
+        #create an instance of the serialclass class that handles the threads
+        self.serialthreadhandler = serialclass(async_loop)
+        #the ledcontroller that holds the settings (shortcut)
+        self.controller = self.serialthreadhandler.controller
+        if profiler is not None:
+            profiler.wrap_methods(self.controller, PROFILED_CONTROLLER_CALLS, prefix="controller.", category="serial")
+            profiler.count_signals(self.serialthreadhandler, PROFILED_SIGNALS)
+        #show the default settings in the preview panel
+        self.update_configuration_preview()
+
+        #start recording straight away if a session folder was given
+        #(connected after setChecked so it only reacts to the user from here on)
+        self.record_checkbox.setChecked(session_folder is not None)
+        if session_folder is not None:
+            self.start_recording()
+        self.record_checkbox.toggled.connect(self.set_recording)
+        #connect the 'data_received_signal' for this instance to the 'log_message()' method
+        #when this serial thread receives new data from the COM port, it connects the signal
+        #to the log_message function (thread safe)
+        self.serialthreadhandler.data_received_signal.connect(self.add_message_to_serial_monitor)
+        #when the arduino is ready after connecting, tell the user (and how long it took)
+        self.serialthreadhandler.connection_ready_signal.connect(self.COM_port_ready)
+        #STATUS frames from the arduino (ACK/ NAK are handled by the ledcontroller)
+        self.serialthreadhandler.frame_received_signal.connect(self.binary_frame_received)
+        #sequence progress/ end (from the sequence scheduler thread)
+        self.serialthreadhandler.sequence_progress_signal.connect(self.sequence_progress)
+        self.serialthreadhandler.sequence_finished_signal.connect(self.sequence_finished)
+        #reader thread -> GUI thread delay for the latency metrics
+        self.serialthreadhandler.line_timestamp_signal.connect(self.line_reached_gui)
+        #the arduino's events (a run started/ ended, the configuration it applied ...)
+        self.serialthreadhandler.device_events_signal.connect(self.device_events_received)
+        #requests from other programs (the control server, see start_control_server())
+        self.serialthreadhandler.remote_command_signal.connect(self.remote_command)
+        self.control_server = None
+        #the session being played back into the GUI (None = none, see start_replay())
+        self.session_replayer = None
+
+
+        #********************BACKGROUND COM PORT DISCOVERY****************
+        #the port watcher scans the COM ports in its own thread (straight away and then
+        #every second) and the signal delivers the changes to the GUI thread
+        self.serialthreadhandler.ports_changed_signal.connect(self.update_COM_port_list)
+        self.COMport_watcher = portwatcher(on_change=self.serialthreadhandler.ports_changed_signal.emit)
+        self.COMport_watcher.start()
+
+
+    #function/ method to update the COM port dropdown (method inside GUI class)
+    #arguments: self (belongs to GUI class), added/ removed (lists of port names like "COM3" or "COM4")
+    #only the ports that changed are added/ removed, so the current selection is kept
+    def update_COM_port_list(self, added, removed):
+        for port_name in removed:
+            index = self.COMport_dropdownbox.findText(port_name)
+            if index >= 0:
+                self.COMport_dropdownbox.removeItem(index)
+        self.COMport_dropdownbox.addItems(added)
+
+
+    #function/ method to connect to selected COM port
+    #args: self (belongs to GUI class)
+    #returns
+    def connect_to_COM_port(self):
+        #grab the currently selected port from the dropdown in the GUI
+        selected_COMport = self.COMport_dropdownbox.currentText()
+
+        #connect to the selected port (at 9600 baud, once the arduino is ready the
+        #connectionmanager negotiates a faster link speed, see connection_manager.py)
+        #if we were already connected (to this or another port), the connectionmanager
+        #closes the old port and stops its reader thread first, so there is only
+        #ever ONE thread reading from the arduino
+        #note: the port is opened in the background thread and we do NOT sleep here
+        #(that used to freeze the window for 2s), COM_port_ready() is called once
+        #the arduino has reset and printed "Arduino Ready - Waiting for Configuration..."
+        #if the port can not be opened, the connectionmanager sends the error to the serial monitor
+        self.controller.connect(selected_COMport, background=True)
+        self.add_message_to_serial_monitor(f"Connecting to {selected_COMport}...")
+
+        #update the settings preview panel on the GUI to display the configuration info
+        self.update_configuration_preview()
+
+
+    #function/ method called when the arduino is ready after connecting
+    #args: self (belongs to GUI class), seconds (time from opening the port to ready),
+    #      banner_seen (False if the arduino never printed its ready message)
+    def COM_port_ready(self, seconds, banner_seen):
+        #write that connection is successful to the serial monitor on the GUI
+        if banner_seen:
+            self.add_message_to_serial_monitor(f"Connected to {self.controller.port_name} (ready after {seconds * 1000:.0f} ms)")
+        else:
+            self.add_message_to_serial_monitor(f"Connected to {self.controller.port_name} (no ready message after {seconds * 1000:.0f} ms, assuming ready)")
+
+        #show the negotiated link speed in the settings preview
+        self.update_configuration_preview()
+
+    #function/ method to disconnect from the COM port
+    #args: self (belongs to GUI class)
+    #stops the background reader thread and closes the port
+    def disconnect_from_COM_port(self):
+        self.controller.disconnect()
+        self.add_message_to_serial_monitor("Disconnected")
+        self.update_configuration_preview()
+
+    #function/ method that Qt calls when the window is closed
+    #args: self (belongs to GUI class), event (the close event from Qt)
+    #we close the COM port so the reader thread does not keep running after the window is gone
+    def closeEvent(self, event):
+        if self.sequence_scheduler is not None:
+            self.sequence_scheduler.abort()
+        self.flash_progress_timer.stop()
+        self.COMport_watcher.stop()
+        if self.control_server is not None:
+            self.control_server.stop()
+        if self.session_replayer is not None:
+            self.session_replayer.stop()
+        self.controller.disconnect()
+        self.stop_recording()
+        super().closeEvent(event)
+
+
+    #function/ method that Qt calls for every event sent to the window
+    #args: self (belongs to GUI class), event (the event from Qt)
+    #we only use it to measure how long it took from starting the program to the first paint
+    def event(self, event):
+        if not self.first_paint_done and event.type() == QEvent.Type.Paint:
+            self.first_paint_done = True
+            self.add_message_to_serial_monitor(f"Startup to first paint: {(time.perf_counter() - app_start_time) * 1000:.0f} ms")
+        return super().event(event)
+
+    #function/method to set the triggering mode
+    #args: self (belongs to GUI class), mode (a string that is either 'Trigger Mode' or 'Manual Mode')
+    def set_triggering_mode(self, mode):
+        self.controller.set_mode(mode)
+        #update the settings preview panel on the GUI to display the configuration info
+        self.update_configuration_preview()
+
+    #function/method to set the flashing pattern
+    #args: self (belongs to GUI class), pattern (a string: either 'L1', 'L1:L2', 'L1:L1:L2' or 'L1:L1:L1:L2')
+    def set_flashpattern(self, pattern):
+        self.controller.set_pattern(pattern)
+        #update the settings preview panel on the GUI to display the configuration info
+        self.update_configuration_preview()
+
+    #function/method to use the pattern typed in the custom pattern box
+    #args: self (belongs to GUI class)
+    def set_custom_flashpattern(self):
+        try:
+            #an empty/ invalid flash rate box keeps the last flash rate
+            try:
+                self.controller.set_flash_rate(self.flash_rate_input.text())
+            except configurationerror:
+                pass
+            self.controller.set_pattern(self.custom_pattern_input.text())
+        except configurationerror as error:
+            self.add_message_to_serial_monitor(str(error))
+        #update the settings preview panel on the GUI to display the configuration info
+        self.update_configuration_preview()
+
+
+    #function/method to send the configuration packet
+    #args: self (belongs to GUI class)
+    #this sends the configuration data from the GUI in the form of
+    #integers to the arduino through serial communication
+    #Packet format:
+    #    SET {mode - int} {flash rate - int} {flash duration - int} {pattern - int}
+    #    ex: SET 2 4 30 2
+    #    - Mode: 1 (Manual Mode), 2 (Triggering Mode)
+    #    - Flash Rate: Positive Number (> 0)    [Hz]
+    #    - Flash Duration: Positive Number (> 0)    [s]
+    #    - Pattern: "L1" = 1, "L1:L2" = 2, "L1:L1:L2" = 3, "L1:L1:L1:L2" = 4, custom pattern = 0
+    #      (a custom pattern's table is uploaded in PATTERN frames first)
+    #the checks, the packet/ binary frame and the ACK/ text fallback are done by the ledcontroller
+    def send_configuration_packet(self):
+
+        #try to send the configuration data from the GUI
+        #we are using the try-except clause as the user might
+        #enter invalid data like a letter or something for the flash rate, etc.
+        #(the ledcontroller raises a configurationerror with the message to show)
+        try:
+            #grabs the flash rate/ duration from the boxes (the controller converts them to integers)
+            self.controller.set_flash_rate(self.flash_rate_input.text())
+            self.controller.set_flash_duration(self.duration_input.text())
+            #binary frames or the text packet
+            self.controller.set_protocol(PROTOCOL_CHOICES[self.protocol_dropdownbox.currentText()])
+
+            #send the configuration and print to the serial monitor that it was sent
+            self.add_message_to_serial_monitor(self.controller.send_configuration())
+
+        #if an error occurs (invalid input, not connected ...)
+        except configurationerror as error:
+            #add the error message to the serial monitor
+            self.add_message_to_serial_monitor(str(error))
+        
+        
+        #update the settings preview panel on the GUI to display the configuration info
+        self.update_configuration_preview()
+
+    #function/method for the stop button
+    #args: self (belongs to GUI class)
+    #the arduino stops straight away (it reads serial while it flashes) and says "Flashing stopped"
+    def stop_flashing(self):
+        try:
+            self.controller.set_protocol(PROTOCOL_CHOICES[self.protocol_dropdownbox.currentText()])
+            self.add_message_to_serial_monitor(self.controller.stop())
+        except configurationerror as error:
+            self.add_message_to_serial_monitor(str(error))
+
+    #function/method called (in the GUI thread) when a batch of device events is waiting
+    #args: self (belongs to GUI class)
+    #the ledcontroller already applied them to its device state (self.controller.device),
+    #here we only redraw what they changed, once per batch
+    def device_events_received(self):
+        flashing = None
+        preview_changed = False
+        for event in self.serialthreadhandler.event_batch.take():
+            if type(event) is flashstartedevent:
+                flashing = True
+                preview_changed = True
+            elif type(event) is finishedevent and event.reason != "done":
+                flashing = False
+            elif type(event) is configappliedevent:
+                preview_changed = True
+        #start/ stop the flash progress bar when a run starts/ ends
+        if flashing is not None:
+            self.flash_state_changed(flashing)
+        if preview_changed:
+            self.update_configuration_preview()
+
+    #function/method called when the arduino starts or ends a run
+    #args: self (belongs to GUI class), flashing (True = a run started, False = it ended)
+    def flash_state_changed(self, flashing):
+        if flashing:
+            self.flash_progress_timer.start()
+        else:
+            self.flash_progress_timer.stop()
+        self.update_flash_progress()
+
+    #function/method to redraw the flash progress bar
+    #args: self (belongs to GUI class)
+    def update_flash_progress(self):
+        progress = self.controller.flash_progress()
+        if progress is None:
+            self.flash_progress_timer.stop()
+            self.flash_progress_bar.setValue(0)
+            self.flash_progress_bar.setFormat("Not flashing")
+            return
+        elapsed, length = progress
+        #the bar counts tenths of a second
+        self.flash_progress_bar.setMaximum(max(1, int(length * 10)))
+        self.flash_progress_bar.setValue(int(elapsed * 10))
+        self.flash_progress_bar.setFormat(f"Flashing: {elapsed:.1f} / {length} s")
+
+    #function/method called for binary frames from the arduino that are not answers to our
+    #own frames (like STATUS)
+    #args: self (belongs to GUI class), frame (a 'protocolframe', see binary_protocol.py)
+    def binary_frame_received(self, frame):
+        self.add_message_to_serial_monitor(f"Arduino: {frame.describe()}")
+
+    #function/method to pick and load a sequence file
+    #args: self (belongs to GUI class)
+    def load_sequence_file(self):
+        path, _ = QFileDialog.getOpenFileName(self, "Load Sequence File", "", "Sequence files (*.csv *.yaml *.yml)")
+        #the user clicked cancel
+        if not path:
+            return
+        try:
+            self.sequence_trials = load_sequence(path)
+        except (configurationerror, OSError) as error:
+            self.add_message_to_serial_monitor(f"Could not load {path}: {error}")
+            return
+        self.sequence_label.setText(f"Sequence: {path} ({len(self.sequence_trials)} trials)")
+        self.sequence_progress_bar.setRange(0, len(self.sequence_trials))
+        self.sequence_progress_bar.setValue(0)
+        self.update_sequence_buttons()
+
+    #function/method to start running the loaded sequence
+    #args: self (belongs to GUI class)
+    def run_sequence(self):
+        if not self.sequence_trials or self.sequence_scheduler is not None:
+            return
+        if not self.controller.connection.is_connected():
+            self.add_message_to_serial_monitor("Connect to the arduino before running a sequence!")
+            return
+        #binary frames or the text packet (same as the start button)
+        self.controller.set_protocol(PROTOCOL_CHOICES[self.protocol_dropdownbox.currentText()])
+        #the scheduler runs in its own thread, its callbacks are turned into signals
+        self.sequence_scheduler = sequencescheduler(
+            self.controller, self.sequence_trials,
+            on_progress=self.serialthreadhandler.sequence_progress_signal.emit,
+            on_finished=self.serialthreadhandler.sequence_finished_signal.emit,
+            prestage=self.prestage_checkbox.isChecked(),
+        )
+        self.sequence_scheduler.start()
+        self.update_sequence_buttons()
+
+    #function/method for the pause button (pauses, or resumes if already paused)
+    #args: self (belongs to GUI class)
+    #note: the pause starts after the trial that is flashing now
+    def pause_or_resume_sequence(self):
+        if self.sequence_scheduler is None:
+            return
+        if self.sequence_scheduler.state == SEQUENCE_PAUSED:
+            self.sequence_scheduler.resume()
+        else:
+            self.sequence_scheduler.pause()
+
+    #function/method for the abort button (no more trials are sent)
+    #args: self (belongs to GUI class)
+    def abort_sequence(self):
+        if self.sequence_scheduler is not None:
+            self.sequence_scheduler.abort()
+
+    #function/method called when a trial starts/ ends or the sequence is paused/ resumed
+    #args: self (belongs to GUI class), completed (trials done), total (number of trials), state
+    def sequence_progress(self, completed, total, state):
+        self.sequence_progress_bar.setRange(0, total)
+        self.sequence_progress_bar.setValue(completed)
+        self.pause_sequence_button.setText("Resume" if state == SEQUENCE_PAUSED else "Pause")
+        #the scheduler changes the controller's settings for every trial
+        self.update_configuration_preview()
+
+    #function/method called when the sequence ends
+    #args: self (belongs to GUI class), report (dict from the scheduler)
+    def sequence_finished(self, report):
+        for line in format_report(report).splitlines():
+            self.add_message_to_serial_monitor(line)
+        self.sequence_scheduler = None
+        self.update_sequence_buttons()
+
+    #function/method to enable the sequence buttons that can be used right now
+    #args: self (belongs to GUI class)
+    def update_sequence_buttons(self):
+        running = self.sequence_scheduler is not None
+        self.run_sequence_button.setEnabled(bool(self.sequence_trials) and not running)
+        self.load_sequence_button.setEnabled(not running)
+        self.pause_sequence_button.setEnabled(running)
+        self.pause_sequence_button.setText("Pause")
+        self.abort_sequence_button.setEnabled(running)
+        #the start button would change the settings in the middle of the sequence
+        self.start_button.setEnabled(not running)
+
+    #function/method to start the control server (other programs can then drive the arduino)
+    #args: self (belongs to GUI class), port (TCP port on 127.0.0.1), unix_path (a unix socket instead)
+    #the server has its own thread, so its clients never slow down the window
+    def start_control_server(self, port=DEFAULT_PORT, unix_path=None):
+        server = controlserver(self.controller, port=port, unix_path=unix_path,
+                               on_command=self.serialthreadhandler.remote_command_signal.emit)
+        try:
+            address = server.start()
+        except OSError as error:
+            self.add_message_to_serial_monitor(f"Could not start the control server: {error}")
+            return
+        self.control_server = server
+        self.add_message_to_serial_monitor(f"Control server listening on {address}")
+
+    #function/method called (in the GUI thread) after a control server request changed something
+    #args: self (belongs to GUI class), method ("configure", "start" or "stop"), text (the message)
+    def remote_command(self, method, text):
+        self.add_message_to_serial_monitor(text)
+        if method == "stop":
+            return
+        #show the settings the request used, so "Start Flashing" sends them too
+        self.flash_rate_input.setText(str(self.controller.flash_rate))
+        self.duration_input.setText(str(self.controller.flash_duration))
+        for name, protocol in PROTOCOL_CHOICES.items():
+            if protocol == self.controller.protocol:
+                self.protocol_dropdownbox.setCurrentText(name)
+        self.update_configuration_preview()
+
+    #function/method to play a recorded (or made up) session back into the GUI
+    #args: self (belongs to GUI class), records (see session_replay.py), speed (1 = the recorded
+    #      timing, N = N times faster, None = as fast as possible)
+    #returns: the sessionreplayer (its status() has the lines played so far)
+    #the lines go through the ledcontroller like lines read from the arduino (parser, device
+    #state, metrics, serialclass signals), only the replay thread stands in for the reader thread
+    def start_replay(self, records, speed=1.0):
+        if self.session_replayer is not None:
+            self.session_replayer.stop()
+        self.session_replayer = sessionreplayer(records, on_line=self.controller.line_received,
+                                                on_message=self.controller.message, speed=speed)
+        self.session_replayer.start()
+        self.add_message_to_serial_monitor("Replaying a session " +
+                                           ("as fast as possible" if speed is None else f"at {speed:g}x"))
+        return self.session_replayer
+
+    #function/method to show/ hide the latency metrics panel
+    #args: self (belongs to GUI class)
+    def toggle_metrics_panel(self):
+        visible = not self.metrics_frame.isVisible()
+        self.metrics_frame.setVisible(visible)
+        self.metrics_button.setText("Hide Latency Metrics" if visible else "Show Latency Metrics")
+        if visible:
+            self.update_metrics_panel()
+            self.metrics_timer.start()
+        else:
+            self.metrics_timer.stop()
+
+    #function/method to redraw the metrics table
+    #args: self (belongs to GUI class)
+    def update_metrics_panel(self):
+        self.metrics_table.setText(format_summary(self.controller.latency.summary()))
+
+    #function/method called (in the GUI thread) for the lines the metrics use
+    #args: self (belongs to GUI class), read_at (perf_counter_ns when the reader thread had the line)
+    def line_reached_gui(self, read_at):
+        self.controller.latency.add("reader_to_gui", (time.perf_counter_ns() - read_at) / 1e9)
+
+    #function/method to clear the metrics
+    #args: self (belongs to GUI class)
+    def reset_metrics(self):
+        self.controller.latency.reset()
+        self.update_metrics_panel()
+
+    #function/method to save the metrics (every sample + the summary) to a CSV file
+    #args: self (belongs to GUI class)
+    def export_metrics(self):
+        path, _ = QFileDialog.getSaveFileName(self, "Export Latency Metrics", "latency_metrics.csv", "CSV files (*.csv)")
+        #the user clicked cancel
+        if not path:
+            return
+        try:
+            self.controller.latency.export_csv(path)
+        except OSError as error:
+            self.add_message_to_serial_monitor(f"Could not export the metrics: {error}")
+            return
+        self.add_message_to_serial_monitor(f"Latency metrics exported to {path}")
+
+    #function/method called when the record box is ticked/ unticked
+    #args: self (belongs to GUI class), checked (True = record)
+    def set_recording(self, checked):
+        if checked:
+            self.start_recording()
+        else:
+            self.stop_recording()
+
+    #function/method to start recording the session to a new log file
+    #args: self (belongs to GUI class)
+    def start_recording(self):
+        if self.session_recorder is not None:
+            return
+        recorder = sessionrecorder(self.session_folder)
+        try:
+            path = recorder.start()
+        except OSError as error:
+            self.add_message_to_serial_monitor(f"Could not start recording: {error}")
+            return
+        self.session_recorder = recorder
+        self.controller.set_recorder(recorder)
+        self.add_message_to_serial_monitor(f"Recording the session to {path}")
+
+    #function/method to stop recording (everything still queued is written first)
+    #args: self (belongs to GUI class)
+    def stop_recording(self):
+        if self.session_recorder is None:
+            return
+        self.controller.set_recorder(None)
+        self.session_recorder.stop()
+        status = self.session_recorder.status()
+        self.session_recorder = None
+        self.add_message_to_serial_monitor(f"Recording stopped: {status['written']} records, {status['dropped']} dropped")
+
+    #function/method to add a new message to the bottom of the serial monitor
+    #args: self (belongs to GUI class), message (a string that will be displayed on the monitor)
+    #note: the message is shown on the next frame (within SERIAL_MONITOR_FRAME_MS)
+    def add_message_to_serial_monitor(self, message):
+        #a full ring buffer drops its oldest line when we append, so count it
+        if len(self.serial_monitor_pending) == self.serial_monitor_pending.maxlen:
+            self.serial_monitor_dropped += 1
+        #queue the message for the next frame
+        self.serial_monitor_pending.append(message)
+        #start the frame timer if it is not already running
+        if not self.serial_monitor_timer.isActive():
+            self.serial_monitor_timer.start()
+
+    #function/method to add all the waiting messages to the serial monitor in one go
+    #args: self (belongs to GUI class)
+    #called by the serial monitor frame timer
+    def flush_serial_monitor(self):
+        #nothing arrived since the last frame, stop the timer until the next message
+        if not self.serial_monitor_pending:
+            self.serial_monitor_timer.stop()
+            return
+        #one append (and so one layout pass) for the whole batch
+        self.serial_monitor.appendPlainText("\n".join(self.serial_monitor_pending))
+        self.serial_monitor_pending.clear()
+        self.serial_monitor_frames += 1
+
+    #function/method to update the GUI's configuration preview
+    #args: self (belongs to GUI class)
+    #note that this displays the settings held by the ledcontroller
+    def update_configuration_preview(self):
+        self.preview_COM_port.setText(f"COM Port: {self.controller.port_name}")
+        if self.controller.connection.state == STATE_CONNECTED:
+            self.preview_link.setText(f"Link Speed: {self.controller.connection.link_rate} baud")
+        elif self.controller.connection.is_connected():
+            self.preview_link.setText("Link Speed: negotiating...")
+        else:
+            self.preview_link.setText("Link Speed: - (not connected)")
+        #the selected settings, next to what the arduino confirmed (self.controller.device)
+        device = self.controller.device
+        custom = self.controller.pattern not in PATTERNS
+        self.preview_mode.setText(self.preview_text("Mode", self.controller.mode, MODE_NAMES.get(device.mode)))
+        self.preview_pattern.setText(self.preview_text("Pattern", "custom" if custom else self.controller.pattern,
+                                                       PATTERN_NAMES.get(device.pattern), shown=self.controller.pattern))
+        self.preview_rate.setText(self.preview_text("Flash Rate", self.controller.flash_rate, device.flash_rate, " Hz"))
+        self.preview_duration.setText(self.preview_text("Duration", self.controller.flash_duration, device.flash_duration, " sec"))
+
+    #function/method to build one line of the preview
+    #args: self (belongs to GUI class), name ("Mode" ...), selected (the GUI's setting),
+    #      confirmed (what the arduino reported, None = nothing yet), unit, shown (text to show instead of 'selected')
+    #returns: like "Flash Rate: 4 Hz (confirmed)" or "Flash Rate: 10 Hz (arduino has 4 Hz)"
+    def preview_text(self, name, selected, confirmed, unit="", shown=None):
+        text = f"{name}: {selected if shown is None else shown}{unit}"
+        if confirmed is None:
+            return f"{text} (not confirmed by the arduino)"
+        if confirmed == selected:
+            return f"{text} (confirmed)"
+        return f"{text} (arduino has {confirmed}{unit})"
+
+
+
+#****************MAIN*****************
+if __name__ == "__main__":
+
+    #initialize the PyQt app
+    pyQtapp = QApplication(sys.argv)
+
+    #optional: find out what makes the window stutter
+    #   python "GUI Test 1.py" --profile   (or set LED_GUI_PROFILE=1)
+    #times every slot, watches the GUI thread for stalls and counts the signals, the summary and
+    #a Chrome trace (chrome://tracing, ui.perfetto.dev) go in the 'profiles' folder on exit
+    profiler = None
+    if "--profile" in sys.argv or os.environ.get("LED_GUI_PROFILE", "") not in ("", "0"):
+        from gui_profiler import guiprofiler
+        profiler = guiprofiler()
+        profiler.start()
+
+    #optional: read the arduino with asyncio in the GUI thread instead of a background thread
+    #   python "GUI Test 1.py" --asyncio
+    #(linux/ mac only, see async_transport.py and qt_async_bridge.py)
+    async_bridge = None
+    if "--asyncio" in sys.argv:
+        from qt_async_bridge import qtasynciobridge
+        async_bridge = qtasynciobridge()
+
+    #create an instance of the main window class (called 'mainwindow')
+    #the session is recorded to the 'sessions' folder unless --no-record is given (or a
+    #session is replayed, --replay below)
+    recording = "--no-record" not in sys.argv and "--replay" not in sys.argv
+    mainwindow = systemGUI(session_folder=SESSION_FOLDER if recording else None,
+                           async_loop=None if async_bridge is None else async_bridge.loop, profiler=profiler)
+
+    #optional: try the GUI without an arduino plugged in
+    #   python "GUI Test 1.py" --emulator
+    #starts the python copy of the firmware (arduino_emulator.py) on a pseudo-terminal
+    #and adds its port to the COM port dropdown (linux/ mac only)
+    emulator = None
+    if "--emulator" in sys.argv:
+        from arduino_emulator import arduinoemulator
+        #1600ms is about how long a real uno takes to reset when the port is opened
+        emulator = arduinoemulator(reset_delay_ms=1600)
+        emulator.start()
+        mainwindow.update_COM_port_list([emulator.port_name], [])
+
+    #optional: let other programs drive the arduino (configure/ start/ stop/ status and the
+    #arduino's lines as events, see control_server.py)
+    #   python "GUI Test 1.py" --control-server
+    if "--control-server" in sys.argv:
+        mainwindow.start_control_server()
+
+    #optional: play a recorded session (or a made up one) into the window instead of an arduino
+    #   python "GUI Test 1.py" --replay sessions/session-20250101-120000 [--replay-speed 10|max]
+    #   python "GUI Test 1.py" --replay synthetic:trigger-burst
+    #(see session_replay.py, which also runs it headless and reports the lag/ memory)
+    if "--replay" in sys.argv[:-1]:
+        from session_replay import open_replay_source
+        replay_speed = 1.0
+        if "--replay-speed" in sys.argv[:-1]:
+            replay_speed = sys.argv[sys.argv.index("--replay-speed") + 1]
+            replay_speed = None if replay_speed == "max" else float(replay_speed)
+        mainwindow.start_replay(open_replay_source(sys.argv[sys.argv.index("--replay") + 1]), replay_speed)
+
+    #make this window visible on the screen
+    mainwindow.show()
+
+    #done (the window closed the port, so the asyncio loop has nothing left to read)
+    exit_code = pyQtapp.exec()
+    if async_bridge is not None:
+        async_bridge.close()
+    if emulator is not None:
+        emulator.stop()
+    if profiler is not None:
+        profiler.stop()
+        summary_path, trace_path = profiler.write(PROFILE_FOLDER)
+        with open(summary_path) as summary_file:
+            print(summary_file.read())
+        print(f"profile written to {summary_path} and {trace_path}")
+    sys.exit(exit_code)
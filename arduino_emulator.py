@@ -0,0 +1,868 @@
+
+#*****************ARDUINO EMULATOR*****************
+# this file holds a python copy of controller_code.ino so the GUI, the benchmarks and
+# the tests can run without an arduino plugged in
+#
+# how it works:
+#   - the emulator opens a pseudo-terminal (pty) pair. The 'slave' end has a device name
+#     (emulator.port_name, like /dev/pts/5) that pyserial opens exactly like COM3 or
+#     /dev/ttyACM0, so 'systemGUI' and 'connectionmanager' can not tell the difference
+#   - a background thread runs the same state machine as the firmware's loop():
+#     the byte-by-byte serial receiver (text commands and binary frames), mode 1/ 2,
+#     trigger_enabled/ trigger_consumed, the 200ms button debounce, uploaded pattern tables,
+#     NEXT/ STOP/ STATUS and the non-blocking flash engine (flash_engine.py, the same
+#     model the firmware's update_flash() follows) with its "DONE" message
+#   - like a real board, it 'resets' (and prints its ready banner) every time the port is opened
+#   - press_button() simulates someone pressing the trigger button
+#   - every LED change is recorded in 'led_events' so the timing can be checked
+#   - the link speed: it starts at 9600 baud and answers the "BAUD" handshake like the
+#     firmware. The emulator reads the baud rate the host set on the pty, and while the two
+#     do not match every byte is lost (a real board would read garbage)
+#   - wire_timing=True: every byte takes as long as it would on a real serial link at the
+#     current baud rate (10 bits per byte), for benchmarks of the link speed
+#   - the software trigger: SYNC frames are answered with micros(), a TRIGGER frame starts the
+#     armed trigger at a micros() time and the TRIGGER report says when it really started
+#     (clock_drift_ppm makes the emulated crystal run fast/ slow, like a real board's does)
+#
+# time:
+#   - speed=1 runs in real time, speed=50 runs 50x faster (a 30s run takes 0.6s),
+#     all of the emulator's times (millis(), delays, the debounce) are scaled together
+#   - at speed=1 (and no drift) micros() is exactly (time.perf_counter() - emulator.clock.start)
+#     in microseconds, so a benchmark can tell when an LED really changed on the PC's clock
+#   - speed=None runs in 'instant' virtual time: delays take no real time at all and the
+#     clock only moves forward when the emulator delays or advance() is called
+#
+# using it from pytest (the fixture is at the bottom of this file):
+#     pytest_plugins = ["arduino_emulator"]      <- in conftest.py
+#     def test_run(emulated_arduino):
+#         manager.connect(emulated_arduino.port_name) ...
+#
+# note: this only works on linux/ mac (windows does not have ptys)
+import errno #EIO tells us that nobody has the port open
+import fcntl #non-blocking reads from the pty
+import os #pty file descriptors
+import select #waiting for bytes from the host
+import struct #termios2 (the host's baud rate)
+import sys #sys.modules (is pytest running?)
+import termios #the host's baud rate
+import threading #the emulator runs in its own thread
+import time #real clock
+import tty #raw mode for the pty
+
+from binary_protocol import (
+    decode_frame, decode_pattern_payload, decode_set_payload, decode_trigger_payload, encode_frame, encode_reply,
+    encode_status_payload, micros_difference, protocolerror,
+    FRAME_NAK, FRAME_NEXT, FRAME_PATTERN, FRAME_SET, FRAME_START, FRAME_STOP, FRAME_STATUS, FRAME_SYNC, FRAME_TRIGGER,
+    NAK_PAYLOAD, SOF, ERROR_LENGTH, ERROR_TYPE, ERROR_VALUE, HEADER, MAX_PAYLOAD, MICROS_WRAP, MIN_FRAME_SIZE,
+    PATTERN_CUSTOM, PATTERN_MAX_STEPS, SYNC_PAYLOAD, TRIGGER_REPORT,
+)
+from flash_engine import flashengine, FLASH_DONE
+from pattern_compiler import builtin_table, BUILTIN_PATTERNS, MASK_LED1, MASK_LED2
+
+#the firmware's pins (only used to make the LED events readable)
+LED1_PIN = 10
+LED2_PIN = 9
+
+#firmware timings (milliseconds)
+DEBOUNCE_MS = 200 #the button is ignored for 200ms after a press
+TEXT_TIMEOUT_MS = 1000 #a text command without '\n' is used after this much silence
+FRAME_TIMEOUT_MS = 50 #a frame is dropped if its next byte takes longer than this
+TEXT_MAX_LENGTH = 63 #longer text commands are cut off
+TRIGGER_MAX_AHEAD_MS = 60000 #a TRIGGER further ahead than this is refused
+#how long digitalWrite() takes on an arduino uno (microseconds), so a 0ms delay still moves time forward
+DIGITAL_WRITE_US = 4
+
+#the banner the firmware prints at the end of setup()
+READY_BANNER = "Arduino Ready - Waiting for Configuration..."
+
+#how long (real seconds) the emulator waits between checks for the host opening the port
+HOST_POLL_SECONDS = 0.005
+#the emulator sleeps until this long (emulated us) before a scheduled trigger and spins from
+#there, like the firmware does (waking up from a sleep can be late by a few hundred us)
+TRIGGER_SPIN_US = 2000
+
+#the link speeds of the firmware (see controller_code.ino)
+DEFAULT_BAUD = 9600
+SUPPORTED_BAUDS = (1000000, 500000, 250000, 115200, 57600, 38400, 19200)
+BAUD_CONFIRM_MS = 1000
+#a byte on the wire: start bit, 8 data bits, stop bit
+BITS_PER_BYTE = 10
+
+#linux: pyserial sets rates like 250000 with TCSETS2 (struct termios2), TCGETS2 reads them back
+TCGETS2 = 0x802C542A
+TERMIOS2 = struct.Struct("IIIIB19sII")
+
+
+#function to store a number in an uno's 'int' (signed 16 bits), like the firmware's
+#"int new_rate = payload[1] | (payload[2] << 8)" and sscanf("%d"): 40000 becomes -25536
+def arduino_int(value):
+    return (value + 32768) % 65536 - 32768
+
+
+#function to read the baud rate the host set on the pty (None if we can't tell)
+def pty_baudrate(fd):
+    try:
+        return TERMIOS2.unpack(fcntl.ioctl(fd, TCGETS2, bytes(TERMIOS2.size)))[-1]
+    except OSError:
+        pass
+    #mac: only the standard rates
+    try:
+        speed = termios.tcgetattr(fd)[5]
+    except termios.error:
+        return None
+    for rate in (DEFAULT_BAUD,) + SUPPORTED_BAUDS:
+        if getattr(termios, f"B{rate}", None) == speed:
+            return rate
+    return None
+
+
+#*****************CLOCKS*****************
+
+# 'scaledclock' class: real time, optionally sped up by 'speed'
+#   - drift_ppm: how much faster (+) or slower (-) than 'speed' the clock runs, in parts per
+#     million (an uno's resonator is off by up to ~1000ppm)
+class scaledclock:
+
+    #constructor that creates a scaledclock object
+    def __init__(self, speed=1.0, drift_ppm=0):
+        self.speed = speed
+        #emulated microseconds per real microsecond
+        self.rate = speed * (1 + drift_ppm / 1e6)
+        self.start = time.perf_counter()
+        #time passes on its own (the emulator has to really wait for the next LED step)
+        self.instant = False
+
+    #emulated microseconds since the clock was created (like micros() on the arduino)
+    def micros(self):
+        return int((time.perf_counter() - self.start) * 1e6 * self.rate)
+
+    #waits 'us' emulated microseconds (like delayMicroseconds())
+    def sleep_us(self, us):
+        if us > 0:
+            time.sleep(us / 1e6 / self.rate)
+
+    #time used by an instruction (digitalWrite() etc.), real time takes care of itself
+    def spend_us(self, us):
+        pass
+
+    #how many real seconds 'us' emulated microseconds are
+    def real_seconds(self, us):
+        return us / 1e6 / self.rate
+
+
+# 'virtualclock' class: instant virtual time, only moves when the emulator delays
+class virtualclock:
+
+    #constructor that creates a virtualclock object
+    def __init__(self):
+        self.now_us = 0
+        self.lock = threading.Lock()
+        #waiting for the next LED step takes no real time
+        self.instant = True
+
+    def micros(self):
+        return self.now_us
+
+    def sleep_us(self, us):
+        with self.lock:
+            self.now_us += max(0, int(us))
+
+    def spend_us(self, us):
+        self.sleep_us(us)
+
+    #moves the clock forward (e.g. so the button debounce time passes)
+    def advance(self, ms):
+        self.sleep_us(ms * 1000)
+
+    #waiting for the host is done in a short real time, virtual time does not move while idle
+    def real_seconds(self, us):
+        return min(0.05, us / 1e6)
+
+
+#*****************THE EMULATOR*****************
+
+# 'arduinoemulator' class: a python copy of controller_code.ino on a pty
+#   - speed: 1 = real time, N = N times faster, None = instant virtual time
+#   - reset_delay_ms: emulated time from the port being opened to the ready banner
+#     (a real uno with its bootloader takes about 1600ms)
+#   - supported_bauds: the rates the "BAUD" handshake accepts (None = firmware from before
+#     the handshake, it ignores "BAUD")
+#   - unreliable_bauds: rates the link 'can not keep up with' (every byte is lost), to try
+#     the fallback
+#   - wire_timing: True = bytes take as long as on a real serial link (see the top of the file)
+#   - clock_drift_ppm: how far off the emulated crystal is (only with a speed, not instant time)
+class arduinoemulator:
+
+    #constructor that creates an arduinoemulator object
+    def __init__(self, speed=1.0, reset_delay_ms=0, supported_bauds=SUPPORTED_BAUDS, unreliable_bauds=(),
+                 wire_timing=False, clock_drift_ppm=0):
+        self.clock = virtualclock() if speed is None else scaledclock(speed, clock_drift_ppm)
+        self.reset_delay_ms = reset_delay_ms
+        self.supported_bauds = supported_bauds
+        self.unreliable_bauds = unreliable_bauds
+        self.wire_timing = wire_timing
+        #bytes lost because the host's baud rate did not match ours
+        self.lost_bytes = 0
+
+        self.master_fd = None
+        self.port_name = None
+        #a pipe used to wake the emulator thread up (button presses, stop()), made by start()
+        self.wake_r = self.wake_w = None
+        self.stop_event = threading.Event()
+        self.thread = None
+
+        #bytes received from the host that the 'firmware' has not read yet
+        self.rx = bytearray()
+        #True while the host has the port open
+        self.host_connected = False
+
+        #the button is 'held down' until this emulated time (microseconds)
+        self.button_down_until_us = -1
+        #lock for the button/ the logs (they are used from the test thread too)
+        self.lock = threading.Lock()
+
+        #everything the 'firmware' printed (text lines) and every LED change
+        #led_events: list of (micros, led1 on, led2 on)
+        self.lines_sent = []
+        self.led_events = []
+        self.led1 = False
+        self.led2 = False
+        #how many times the board was reset (port opened)
+        self.boot_count = 0
+
+        self.reset_state()
+
+    #the firmware's global variables (and their values after a reset)
+    def reset_state(self):
+        self.mode = 1
+        self.flash_rate = 1
+        self.flash_duration = 1
+        self.flash_pattern = 1
+        self.flashing = False
+        self.button_was_pressed = False
+        self.trigger_enabled = False
+        self.trigger_consumed = False
+        self.last_press_time = 0
+        #the uploaded pattern table (usable once all 'custom_length' steps arrived)
+        self.custom_table = []
+        self.custom_length = 0
+        #the flash engine and the configuration queued with NEXT (None = nothing queued)
+        self.engine = flashengine()
+        self.next_configuration = None
+        #the software trigger: the armed trigger starts at trigger_at_us (a TRIGGER frame),
+        #with the table loaded when the frame arrived
+        self.trigger_scheduled = False
+        self.trigger_at_us = 0
+        self.trigger_sequence = 0
+        self.scheduled_table = None
+        #the serial receiver: the frame/ text command collected so far
+        self.frame_buffer = bytearray()
+        self.frame_last_byte_ms = 0
+        self.text_buffer = bytearray()
+        self.text_receiving = False
+        self.text_last_byte_ms = 0
+        #the link speed (every reset goes back to 9600)
+        self.baudrate = DEFAULT_BAUD
+        self.baud_confirm_pending = False
+        self.baud_switched_ms = 0
+
+
+    #*****************CONTROL FROM THE TEST/ BENCHMARK*****************
+
+    #METHOD #1: start
+    #   opens the pty and starts the emulator thread
+    #   returns: the port name to give to pyserial/ the GUI
+    def start(self):
+        master_fd, slave_fd = os.openpty()
+        tty.setraw(master_fd)
+        tty.setraw(slave_fd)
+        self.port_name = os.ttyname(slave_fd)
+        #we only keep the master end, the host opens the slave by name
+        os.close(slave_fd)
+        flags = fcntl.fcntl(master_fd, fcntl.F_GETFL)
+        fcntl.fcntl(master_fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+        self.master_fd = master_fd
+        #(the write end is non-blocking: if the thread is not reading, a full pipe is enough to wake it)
+        self.wake_r, self.wake_w = os.pipe()
+        flags = fcntl.fcntl(self.wake_w, fcntl.F_GETFL)
+        fcntl.fcntl(self.wake_w, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, name="arduino-emulator", daemon=True)
+        self.thread.start()
+        return self.port_name
+
+    #METHOD #2: stop
+    #   stops the emulator thread and closes the pty and the wake up pipe
+    def stop(self):
+        self.stop_event.set()
+        self.wake()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if self.master_fd is not None:
+            os.close(self.master_fd)
+            self.master_fd = None
+        if self.wake_r is not None:
+            os.close(self.wake_r)
+            os.close(self.wake_w)
+            self.wake_r = self.wake_w = None
+
+    #METHOD #3: press_button
+    #   simulates pressing the trigger button for 'hold_ms' emulated milliseconds
+    #   note: like the firmware, a press in the first 200ms after the board starts is ignored
+    #         (the debounce compares against last_press_time, which starts at 0)
+    def press_button(self, hold_ms=50):
+        with self.lock:
+            self.button_down_until_us = self.clock.micros() + hold_ms * 1000
+        self.wake()
+
+    #METHOD #4: advance
+    #   moves virtual time forward (only for speed=None)
+    def advance(self, ms):
+        self.clock.advance(ms)
+        self.wake()
+
+    #METHOD #5: millis
+    #   the emulator's millis()
+    def millis(self):
+        return self.clock.micros() // 1000
+
+    #wakes up the emulator thread if it is waiting for input (nothing to wake before start()/ after stop())
+    def wake(self):
+        if self.wake_w is None:
+            return
+        try:
+            os.write(self.wake_w, b"!")
+        except OSError:
+            pass
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+    #*****************ARDUINO FUNCTIONS*****************
+
+    #Serial.print/ println: writes bytes to the host
+    def serial_write(self, data):
+        if not self.link_ok():
+            self.lost_bytes += len(data)
+            return
+        if self.wire_timing:
+            self.clock.sleep_us(self.wire_time_us(len(data)))
+        view = memoryview(data)
+        while view:
+            try:
+                written = os.write(self.master_fd, view)
+            except BlockingIOError:
+                select.select([], [self.master_fd], [], 0.1)
+                continue
+            except OSError:
+                #the host closed the port, the bytes are lost (like on a real board)
+                return
+            view = view[written:]
+
+    def println(self, text):
+        with self.lock:
+            self.lines_sent.append(text)
+        self.serial_write(f"{text}\r\n".encode())
+
+    #True if the host's port runs at our baud rate (and the link can keep up with it)
+    def link_ok(self):
+        if self.baudrate in self.unreliable_bauds:
+            return False
+        host_baudrate = pty_baudrate(self.master_fd)
+        return host_baudrate is None or host_baudrate == self.baudrate
+
+    #how long 'count' bytes take on the wire at the current baud rate (us)
+    def wire_time_us(self, count):
+        return count * BITS_PER_BYTE * 1000000 // self.baudrate
+
+    #digitalWrite for the two LEDs, records every change
+    def digital_write(self, pin, high):
+        self.clock.spend_us(DIGITAL_WRITE_US)
+        led1, led2 = self.led1, self.led2
+        if pin == LED1_PIN:
+            led1 = high
+        else:
+            led2 = high
+        if (led1, led2) != (self.led1, self.led2):
+            self.led1, self.led2 = led1, led2
+            with self.lock:
+                self.led_events.append((self.clock.micros(), led1, led2))
+
+    #digitalRead(BUTTON_PIN) == LOW (the button pulls the pin low when pressed)
+    def button_is_down(self):
+        with self.lock:
+            return self.clock.micros() < self.button_down_until_us
+
+    def delay(self, ms):
+        self.clock.sleep_us(ms * 1000)
+
+    #reads whatever the host has sent into self.rx (the arduino's receive buffer)
+    #returns False if the host does not have the port open
+    def poll_serial(self):
+        try:
+            chunk = os.read(self.master_fd, 4096)
+        except BlockingIOError:
+            return True
+        except OSError as error:
+            if error.errno == errno.EIO:
+                return False
+            raise
+        if not self.link_ok():
+            self.lost_bytes += len(chunk)
+            return True
+        #the last byte arrives once all of them crossed the wire
+        if self.wire_timing:
+            self.clock.sleep_us(self.wire_time_us(len(chunk)))
+        self.rx += chunk
+        return True
+
+
+    #*****************THE FIRMWARE*****************
+
+    #setup(): runs when the board resets (the host opened the port)
+    def setup(self):
+        self.boot_count += 1
+        self.reset_state()
+        self.led1 = self.led2 = False
+        self.rx.clear()
+        self.delay(self.reset_delay_ms)
+        self.println(READY_BANNER)
+
+    #one pass of loop() (it never waits)
+    def loop(self):
+        #a scheduled software trigger is checked first, nothing else in loop() can delay it
+        if self.trigger_scheduled and self.clock.micros() >= self.trigger_at_us:
+            self.start_scheduled_flash()
+
+        current_time = self.millis()
+
+        if self.mode == 2 and self.trigger_enabled and not self.trigger_consumed and self.button_is_down():
+            if not self.button_was_pressed and current_time - self.last_press_time > DEBOUNCE_MS:
+                self.println("BUTTON PRESSED - TRIGGERING LED")
+                self.flashing = True
+                self.trigger_consumed = True
+                self.trigger_scheduled = False
+                self.button_was_pressed = True
+                self.last_press_time = current_time
+        else:
+            self.button_was_pressed = False
+
+        self.receive_serial()
+        self.check_link_baud()
+
+        if not self.flashing:
+            self.digital_write(LED1_PIN, False)
+            self.digital_write(LED2_PIN, False)
+        elif not self.engine.running:
+            self.start_flash()
+        else:
+            self.update_flash()
+
+    #writes both LEDs from a table mask (write_leds() in the firmware)
+    def write_leds(self, mask):
+        self.digital_write(LED1_PIN, bool(mask & MASK_LED1))
+        self.digital_write(LED2_PIN, bool(mask & MASK_LED2))
+
+    #stores a configuration and starts it (manual mode) or arms the trigger (trigger mode)
+    #a run that is still flashing is stopped first
+    def apply_configuration(self, mode, flash_rate, flash_duration, pattern):
+        if self.engine.running:
+            self.stop_flash()
+        self.mode = mode
+        self.flash_rate = flash_rate
+        self.flash_duration = flash_duration
+        self.flash_pattern = pattern
+        self.trigger_enabled = mode == 2
+        self.trigger_consumed = False
+        self.trigger_scheduled = False
+        self.flashing = mode == 1
+        self.next_configuration = None
+
+    #NEXT: starts the configuration now if idle, otherwise when the current run is over
+    #returns True if it was queued
+    def queue_configuration(self, *values):
+        if not self.flashing and not (self.trigger_enabled and not self.trigger_consumed):
+            self.apply_configuration(*values)
+            return False
+        self.next_configuration = values
+        return True
+
+    #STOP: stops flashing, disarms the trigger and forgets a queued configuration
+    def stop_all(self):
+        self.next_configuration = None
+        if self.engine.running:
+            self.stop_flash()
+        self.flashing = False
+        self.trigger_enabled = False
+        self.trigger_scheduled = False
+
+    def print_configuration(self):
+        self.println(f"Mode: {self.mode}")
+        self.println(f"Flash Rate: {self.flash_rate}")
+        self.println(f"Duration: {self.flash_duration}")
+        self.println(f"Pattern: {self.flash_pattern}")
+        if self.mode == 1:
+            self.println("Manual Mode: Flashing started")
+        else:
+            self.println("Trigger Mode: Waiting for button press...")
+
+    #switches the serial port to 'baud' (the bytes half way through a command are lost)
+    def set_link_baud(self, baud):
+        self.baudrate = baud
+        self.rx.clear()
+        self.frame_buffer.clear()
+        self.text_buffer.clear()
+        self.text_receiving = False
+
+    #"BAUD r1 r2 ...": switch to the first offered rate we support
+    def offer_link_baud(self, rates):
+        chosen = None
+        for word in rates.split():
+            try:
+                rate = int(word)
+            except ValueError:
+                break
+            if rate in self.supported_bauds:
+                chosen = rate
+                break
+        if chosen is None:
+            self.println("BAUD NO")
+            return
+        self.println(f"BAUD OK {chosen}")
+        self.set_link_baud(chosen)
+        self.baud_confirm_pending = True
+        self.baud_switched_ms = self.millis()
+
+    #no "BAUD CONFIRM" at the new rate in time: go back to 9600
+    def check_link_baud(self):
+        if self.baud_confirm_pending and self.millis() - self.baud_switched_ms > BAUD_CONFIRM_MS:
+            self.baud_confirm_pending = False
+            self.set_link_baud(DEFAULT_BAUD)
+
+    #the text commands: SET/ NEXT {mode} {rate} {duration} {pattern}, STOP, STATUS,
+    #BAUD {rates...}, BAUD CONFIRM
+    def handle_text_command(self, command):
+        self.println(f"Received: {command}")
+        is_set = command.startswith("SET")
+        is_next = command.startswith("NEXT")
+        if is_set or is_next:
+            try:
+                values = [arduino_int(int(value)) for value in command[3 if is_set else 4:].split()[:4]]
+            except ValueError:
+                values = []
+            if len(values) != 4:
+                self.println("Error parsing command!")
+                return
+            if is_next and self.queue_configuration(*values):
+                self.println("Queued: starts after the current run")
+                return
+            if is_set:
+                self.apply_configuration(*values)
+            self.print_configuration()
+        elif command.startswith("STOP"):
+            was_armed = self.trigger_enabled and not self.trigger_consumed and not self.flashing
+            self.stop_all()
+            if was_armed:
+                self.println("Trigger Mode: Disarmed")
+        elif command.startswith("STATUS"):
+            if self.flashing:
+                self.println(f"Status: flashing {self.engine.elapsed_ms(self.clock.micros())} of {self.engine.length_ms} ms")
+            elif self.trigger_enabled and not self.trigger_consumed:
+                self.println("Status: waiting for button press")
+            else:
+                self.println("Status: idle")
+        elif self.supported_bauds is None:
+            #firmware from before the handshake: "BAUD" is not a command
+            return
+        elif command.startswith("BAUD CONFIRM"):
+            self.baud_confirm_pending = False
+            self.println(f"BAUD CONFIRMED {self.baudrate}")
+        elif command.startswith("BAUD"):
+            self.offer_link_baud(command[4:])
+
+    #answers the frame in self.frame_buffer (all of it has arrived)
+    def handle_frame(self):
+        #the time the frame arrived (for SYNC)
+        arrived_us = self.clock.micros()
+        _, _, frame_type, sequence, _ = HEADER.unpack_from(self.frame_buffer)
+        #check the CRC and the version (the error code is the NAK reason)
+        try:
+            frame = decode_frame(bytes(self.frame_buffer))
+        except protocolerror as error:
+            self.send_nak(frame_type, sequence, error.args[1])
+            return
+
+        if frame_type in (FRAME_SET, FRAME_NEXT):
+            try:
+                values = decode_set_payload(frame.payload)
+            except protocolerror:
+                self.send_nak(frame_type, sequence, ERROR_LENGTH)
+                return
+            #(rate/ duration arrive as 16 bits but go into an int, above 32767 they are negative)
+            mode, flash_rate, flash_duration, pattern = values = (
+                values[0], arduino_int(values[1]), arduino_int(values[2]), values[3])
+            if (mode not in (1, 2) or flash_rate <= 0 or flash_duration <= 0
+                    or not (pattern in BUILTIN_PATTERNS or (pattern == PATTERN_CUSTOM and self.custom_pattern_ready()))):
+                self.send_nak(frame_type, sequence, ERROR_VALUE)
+                return
+            if frame_type == FRAME_SET:
+                self.apply_configuration(*values)
+            else:
+                self.queue_configuration(*values)
+            self.serial_write(encode_reply(frame))
+        elif frame_type == FRAME_START:
+            self.apply_configuration(self.mode, self.flash_rate, self.flash_duration, self.flash_pattern)
+            self.serial_write(encode_reply(frame))
+        elif frame_type == FRAME_STOP:
+            self.stop_all()
+            self.serial_write(encode_reply(frame))
+        elif frame_type == FRAME_STATUS:
+            payload = encode_status_payload(self.flashing, self.trigger_enabled, self.trigger_consumed,
+                                            self.mode, self.flash_rate, self.flash_duration, self.flash_pattern,
+                                            elapsed_ms=self.engine.elapsed_ms(self.clock.micros()),
+                                            queued=self.next_configuration is not None,
+                                            trigger_scheduled=self.trigger_scheduled)
+            self.serial_write(encode_frame(FRAME_STATUS, sequence, payload))
+        elif frame_type == FRAME_SYNC:
+            self.serial_write(encode_frame(FRAME_SYNC, sequence, SYNC_PAYLOAD.pack(arrived_us % MICROS_WRAP)))
+        elif frame_type == FRAME_TRIGGER:
+            try:
+                at_us = decode_trigger_payload(frame.payload)
+            except protocolerror:
+                self.send_nak(frame_type, sequence, ERROR_LENGTH)
+                return
+            #(the firmware's (long)(at_us - arrived_us), our micros() does not wrap)
+            ahead_us = micros_difference(at_us, arrived_us % MICROS_WRAP)
+            if (not self.trigger_enabled or self.trigger_consumed or self.flashing
+                    or ahead_us > TRIGGER_MAX_AHEAD_MS * 1000):
+                self.send_nak(frame_type, sequence, ERROR_VALUE)
+                return
+            self.trigger_at_us = arrived_us + ahead_us
+            self.trigger_sequence = sequence
+            self.trigger_scheduled = True
+            self.scheduled_table = self.pattern_table()
+            self.serial_write(encode_reply(frame))
+        elif frame_type == FRAME_PATTERN:
+            #the table can not change under a run that is flashing it (or is about to)
+            if self.engine.running and self.flash_pattern == PATTERN_CUSTOM:
+                self.stop_flash()
+            if self.flash_pattern == PATTERN_CUSTOM:
+                self.trigger_scheduled = False
+            error = self.receive_pattern(frame.payload)
+            if error:
+                self.send_nak(frame_type, sequence, error)
+                return
+            self.serial_write(encode_reply(frame))
+        else:
+            self.send_nak(frame_type, sequence, ERROR_TYPE)
+
+    #reads every byte that has arrived (receive_serial() in the firmware)
+    def receive_serial(self):
+        while self.rx:
+            data = self.rx.pop(0)
+            if self.frame_buffer:
+                self.receive_frame_byte(data)
+            elif not self.text_receiving and data == SOF:
+                self.frame_buffer.append(data)
+                self.frame_last_byte_ms = self.millis()
+            elif data == ord("\n"):
+                self.finish_text_command()
+            else:
+                self.text_receiving = True
+                self.text_last_byte_ms = self.millis()
+                if len(self.text_buffer) < TEXT_MAX_LENGTH:
+                    self.text_buffer.append(data)
+
+        #a frame that stopped half way is dropped (NAK if we know which frame it was)
+        if self.frame_buffer and self.millis() - self.frame_last_byte_ms > FRAME_TIMEOUT_MS:
+            if len(self.frame_buffer) >= HEADER.size:
+                self.send_nak(self.frame_buffer[2], self.frame_buffer[3], ERROR_LENGTH)
+            self.frame_buffer.clear()
+        #a text command without '\n' is used anyway
+        if self.text_receiving and self.millis() - self.text_last_byte_ms > TEXT_TIMEOUT_MS:
+            self.finish_text_command()
+
+    def receive_frame_byte(self, data):
+        self.frame_buffer.append(data)
+        self.frame_last_byte_ms = self.millis()
+        if len(self.frame_buffer) < HEADER.size:
+            return
+        length = self.frame_buffer[4]
+        if length > MAX_PAYLOAD:
+            self.send_nak(self.frame_buffer[2], self.frame_buffer[3], ERROR_LENGTH)
+            self.frame_buffer.clear()
+        elif len(self.frame_buffer) == length + MIN_FRAME_SIZE:
+            self.handle_frame()
+            self.frame_buffer.clear()
+
+    def finish_text_command(self):
+        command = self.text_buffer.decode("utf-8", errors="replace")
+        self.text_buffer.clear()
+        self.text_receiving = False
+        self.handle_text_command(command)
+
+    #one PATTERN frame, returns 0 or the NAK error code (like receive_pattern() in the firmware)
+    def receive_pattern(self, payload):
+        try:
+            first, total, steps = decode_pattern_payload(payload)
+        except protocolerror:
+            return ERROR_LENGTH
+        if total == 0 or total > PATTERN_MAX_STEPS or first + len(steps) > total:
+            return ERROR_VALUE
+        #the first frame starts a new table, the others must follow on from the last one
+        if first == 0:
+            self.custom_length = total
+            self.custom_table = []
+        elif first != len(self.custom_table) or total != self.custom_length:
+            return ERROR_VALUE
+        for mask, microseconds in steps:
+            if mask > MASK_LED1 | MASK_LED2 or microseconds == 0:
+                self.custom_length = 0
+                return ERROR_VALUE
+            self.custom_table.append((mask, microseconds))
+        return 0
+
+    def custom_pattern_ready(self):
+        return self.custom_length > 0 and len(self.custom_table) == self.custom_length
+
+    #the table for flash_pattern (load_pattern_table() in the firmware), None = nothing to flash
+    def pattern_table(self):
+        if self.flash_pattern == PATTERN_CUSTOM:
+            return list(self.custom_table) if self.custom_pattern_ready() else None
+        if self.flash_pattern not in BUILTIN_PATTERNS or self.flash_rate <= 0:
+            return None
+        return builtin_table(self.flash_pattern, self.flash_rate)
+
+    def send_nak(self, frame_type, sequence, error):
+        self.serial_write(encode_frame(FRAME_NAK, sequence, NAK_PAYLOAD.pack(frame_type, error)))
+
+    def print_flash_summary(self):
+        self.println(f"Flashing Pattern {self.flash_pattern} at {self.flash_rate} Hz for {self.flash_duration} seconds.")
+
+    #start_flash() in the firmware
+    def start_flash(self):
+        table = self.pattern_table()
+        self.print_flash_summary()
+        self.engine.start(table, self.flash_duration, self.clock.micros())
+
+    #start_scheduled_flash() in the firmware: the first step straight away, the steps timed from
+    #trigger_at_us, then the TRIGGER report (scheduled, started) and the summary line
+    def start_scheduled_flash(self):
+        self.trigger_scheduled = False
+        self.flashing = True
+        self.trigger_consumed = True
+        self.engine.start(self.scheduled_table, self.flash_duration, self.trigger_at_us)
+        started_us = self.clock.micros()
+        self.update_flash()
+        report = TRIGGER_REPORT.pack(self.trigger_at_us % MICROS_WRAP, started_us % MICROS_WRAP)
+        self.serial_write(encode_frame(FRAME_TRIGGER, self.trigger_sequence, report))
+        self.print_flash_summary()
+
+    #update_flash() in the firmware: the next LED step if it is due, or the end of the run
+    def update_flash(self):
+        mask = self.engine.update(self.clock.micros())
+        if mask == FLASH_DONE:
+            self.write_leds(0)
+            self.flashing = False
+            self.println("Flashing finished")
+            self.println("DONE")
+            #a configuration sent with NEXT starts straight away
+            if self.next_configuration is not None:
+                self.apply_configuration(*self.next_configuration)
+                self.print_configuration()
+        elif mask is not None:
+            self.write_leds(mask)
+
+    #ends the run early (STOP, a new configuration or a new pattern table)
+    def stop_flash(self):
+        self.engine.stop()
+        self.write_leds(0)
+        self.flashing = False
+        self.println("Flashing stopped")
+
+    #the emulated time (us) the firmware next has something to do, None = only new bytes/ a button press
+    def next_wake_us(self):
+        times = []
+        if self.flashing and not self.engine.running:
+            times.append(self.clock.micros())
+        if self.engine.running:
+            times.append(self.engine.next_event_us())
+        if self.trigger_scheduled:
+            times.append(self.trigger_at_us)
+        if self.frame_buffer:
+            times.append((self.frame_last_byte_ms + FRAME_TIMEOUT_MS + 1) * 1000)
+        if self.text_receiving:
+            times.append((self.text_last_byte_ms + TEXT_TIMEOUT_MS + 1) * 1000)
+        if self.baud_confirm_pending:
+            times.append((self.baud_switched_ms + BAUD_CONFIRM_MS + 1) * 1000)
+        #(instant time: a held button must not stop the clock, it moves on to the release)
+        if self.button_is_down():
+            times.append(self.button_down_until_us)
+            #pressed too soon after the last press: check again once the debounce is over
+            if not self.button_was_pressed:
+                times.append((self.last_press_time + DEBOUNCE_MS + 1) * 1000)
+        return min(times) if times else None
+
+    #the emulator thread: wait for the host to open the port, 'reset', then run loop() forever
+    def run(self):
+        while not self.stop_event.is_set():
+            #nobody has the port open: wait (the board is unpowered/ being reset)
+            if not self.poll_serial():
+                self.host_connected = False
+                self.stop_event.wait(HOST_POLL_SECONDS)
+                continue
+            if not self.host_connected:
+                self.host_connected = True
+                self.setup()
+                continue
+
+            self.loop()
+
+            #a real arduino spins in loop(), the emulator sleeps until there is something to do:
+            #new bytes, a button press or (wake_at) the next LED step/ the end of a run/ a timeout/
+            #the button being released
+            if self.rx:
+                continue
+            wake_at = self.next_wake_us()
+            if wake_at is None:
+                timeout = HOST_POLL_SECONDS * 20
+            elif self.clock.instant and self.engine.running:
+                #instant time: flashing takes no real time, only check for new bytes
+                timeout = 0
+            else:
+                #(a scheduled trigger: wake up TRIGGER_SPIN_US early and spin from there)
+                if self.trigger_scheduled and not self.clock.instant:
+                    wake_at = min(wake_at, self.trigger_at_us - TRIGGER_SPIN_US)
+                timeout = max(0.0, self.clock.real_seconds(wake_at - self.clock.micros()))
+            ready, _, _ = select.select([self.master_fd, self.wake_r], [], [], timeout)
+            if self.wake_r in ready:
+                os.read(self.wake_r, 4096)
+            #instant time: nothing arrived, so jump to the time the firmware was waiting for
+            if not ready and wake_at is not None and self.clock.instant:
+                self.clock.sleep_us(wake_at - self.clock.micros())
+
+
+#*****************PYTEST FIXTURE*****************
+# add   pytest_plugins = ["arduino_emulator"]   to conftest.py to use it
+#   - the fixture gives a started emulator in instant virtual time and stops it afterwards
+#   - use   @pytest.mark.parametrize("emulated_arduino", [50], indirect=True)   to pick a speed
+#   - only defined when pytest is already running (importing pytest takes ~150ms, which
+#     would slow down every 'ledctl.py run --emulator' and 'GUI Test 1.py --emulator')
+pytest = sys.modules.get("pytest")
+
+if pytest is not None:
+
+    @pytest.fixture
+    def emulated_arduino(request):
+        speed = getattr(request, "param", None)
+        emulator = arduinoemulator(speed=speed)
+        emulator.start()
+        yield emulator
+        emulator.stop()
@@ -0,0 +1,362 @@
+
+#*****************ASYNCIO TRANSPORT*****************
+# this file holds an asyncio version of the connection to the arduino, as an alternative
+# to the connectionmanager's reader thread (connection_manager.py)
+#
+# why:
+#   - with the reader thread every line is read in one thread and handled in another
+#     (a Qt signal for the GUI, a threading.Condition for wait_for()), and waiting for an
+#     answer with a timeout means blocking a thread
+#   - here the port is read by the event loop itself (loop.add_reader() on the port's file
+#     descriptor), so the lines are handled in the thread that runs the loop (the GUI thread
+#     when the loop runs on Qt, see qt_async_bridge.py) and scripts can simply write:
+#         controller = asyncledcontroller()
+#         controller.connect("/dev/ttyACM0")
+#         await controller.wait_until_ready()
+#         await controller.send({"mode": "Manual Mode", "flash_rate": 4, "flash_duration": 30})
+#         await controller.wait_for("DONE", timeout=60)
+#   - several ports can be awaited together (asyncio.gather()) without a thread per port
+#
+# what is the same: the asyncledcontroller IS a ledcontroller (settings, packets, ACK
+# tracking, the text fallback, latency metrics, session recording), only the connection
+# and the waiting are different. The link speed is negotiated like the connectionmanager
+# does it (see the top of connection_manager.py), written as one coroutine
+#
+# what is different:
+#   - a lost port is reported and the state goes back to disconnected, there is no
+#     automatic reconnect (use the threaded connectionmanager for that)
+#   - linux/ mac only: add_reader() needs a file descriptor for the port, which pyserial
+#     only has on posix (windows keeps using the reader thread)
+#
+# note: this file does not use PyQt6
+import asyncio #the event loop, futures and timeouts
+import time #perf_counter for the connect-to-ready timing
+
+import serial #pyserial, opens the port (non-blocking, the loop tells us when bytes arrive)
+
+from connection_manager import (
+    BAUD_CONFIRM_TIMEOUT, BAUD_SWITCH_DELAY, CONFIRM_TIMEOUT, DEFAULT_BAUDRATE, LINK_RATES, NEGOTIATE_TIMEOUT,
+    READY_BANNER, READY_TIMEOUT, STATE_CONNECTED, STATE_CONNECTING, STATE_DISCONNECTED,
+)
+from latency_metrics import CONFIRM_PREFIXES
+from led_controller import ledcontroller, configurationerror, ACK_TIMEOUT
+from rig_registry import REJECT_PREFIXES
+from serial_line_reader import seriallinereader
+
+#how long send() waits for the confirmation (long enough for the text fallback) (seconds)
+SEND_CONFIRM_TIMEOUT = ACK_TIMEOUT + 1.0
+
+
+# 'asyncconnection' class: the connection to the arduino, read by an asyncio event loop
+# it has the same callbacks and methods as the connectionmanager (so the ledcontroller
+# can use it as its 'connection'), but it has no thread:
+#   - loop: the event loop that reads the port (None = the current one)
+#   - on_line/ on_message/ on_state/ on_frame/ on_ready: like the connectionmanager's,
+#     called in the thread that runs the loop
+class asyncconnection:
+
+    #constructor that creates an asyncconnection object
+    def __init__(self, loop=None, on_line=None, on_message=None, on_state=None, on_ready=None, on_frame=None,
+                 baudrate=DEFAULT_BAUDRATE, serial_factory=serial.Serial, ready_timeout=READY_TIMEOUT,
+                 max_baudrate=LINK_RATES[0]):
+        self.loop = loop or asyncio.get_event_loop()
+        self.on_line = on_line
+        self.on_message = on_message
+        self.on_state = on_state
+        self.on_ready = on_ready
+        self.on_frame = on_frame
+        self.baudrate = baudrate
+        self.serial_factory = serial_factory
+        self.ready_timeout = ready_timeout
+        self.max_baudrate = max_baudrate
+
+        #the open serial port (None when disconnected), its file descriptor and line reader
+        self.port = None
+        self.port_name = None
+        self.fd = None
+        self.reader = None
+        self.state = STATE_DISCONNECTED
+        self.link_rate = baudrate
+        self.open_count = 0
+
+        #the coroutine that waits for the banner and negotiates the link speed
+        self.ready_task = None
+        #set once the arduino is ready (banner seen or ready_timeout passed, link speed set)
+        self.ready_event = asyncio.Event()
+        self.opened_at = 0.0
+        self.ready_seconds = None
+        #the line the ready_task is waiting for: (prefixes, future) or None
+        self.expected = None
+
+    #METHOD #1: connect
+    #   opens 'port_name' and starts reading it with the event loop
+    #   (if we are already connected, the old port is closed first)
+    #   raises serial.SerialException if the port can not be opened
+    #   note: opening a port does not block, use wait_until_ready() to wait for the arduino
+    def connect(self, port_name):
+        self.shutdown_port()
+        self.port_name = port_name
+        #timeout=0: read() returns whatever has arrived, the loop only calls us when there is something
+        port = self.serial_factory(port_name, self.baudrate, timeout=0)
+        port.reset_input_buffer()
+        self.port = port
+        self.fd = port.fileno()
+        self.reader = seriallinereader(port, on_frame=self.on_frame)
+        self.open_count += 1
+        self.opened_at = time.perf_counter()
+        self.ready_seconds = None
+        self.link_rate = self.baudrate
+        self.ready_event.clear()
+        self.set_state(STATE_CONNECTING)
+        #wait for the banner BEFORE the first byte can be read, so it can not be missed
+        banner = self.expect(READY_BANNER)
+        self.loop.add_reader(self.fd, self.data_ready)
+        self.ready_task = self.loop.create_task(self.arduino_startup(banner))
+
+    #METHOD #1b: connect_in_background
+    #   same as connect(), but errors go to on_message (like the connectionmanager's)
+    def connect_in_background(self, port_name):
+        try:
+            self.connect(port_name)
+        except (serial.SerialException, OSError) as error:
+            self.message(f"Failed to connect to {port_name}! Check the connection to the COM port "
+                         f"and ensure nothing else is accessing it. ({error})")
+            self.set_state(STATE_DISCONNECTED)
+
+    #METHOD #1c: wait_until_ready
+    #   returns True once the arduino is ready, False if 'timeout' seconds passed first
+    async def wait_until_ready(self, timeout=None):
+        try:
+            await asyncio.wait_for(self.ready_event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    #METHOD #2: disconnect
+    #   stops reading and closes the port (safe to call twice)
+    def disconnect(self):
+        self.shutdown_port()
+        self.set_state(STATE_DISCONNECTED)
+
+    #METHOD #3: write
+    #   returns True if the data was written, False if we are not connected
+    def write(self, data):
+        port = self.port
+        if port is None or not port.is_open:
+            return False
+        try:
+            port.write(data)
+        except serial.SerialException:
+            return False
+        return True
+
+    #METHOD #4: is_connected
+    def is_connected(self):
+        return self.state in (STATE_CONNECTING, STATE_CONNECTED)
+
+    #METHOD #5: reader_thread_count
+    #   always 0, the event loop reads the port
+    def reader_thread_count(self):
+        return 0
+
+    #METHOD #6: status
+    def status(self):
+        return {
+            "state": self.state,
+            "port": self.port_name,
+            "reader_threads": 0,
+            "open_count": self.open_count,
+            "ready_seconds": self.ready_seconds,
+            "link_rate": self.link_rate,
+        }
+
+
+    #*****************INTERNAL HELPERS*****************
+
+    #called by the event loop when the port has bytes for us
+    def data_ready(self):
+        try:
+            lines = self.reader.read_lines()
+        except (serial.SerialException, OSError, TypeError, AttributeError):
+            self.message(f"Lost connection to {self.port_name}")
+            self.disconnect()
+            return
+        for line in lines:
+            if self.on_line:
+                self.on_line(line)
+            expected = self.expected
+            if expected is not None and line.startswith(expected[0]) and not expected[1].done():
+                expected[1].set_result(line)
+
+    #returns a future for the next line that starts with 'prefixes' (a string or a tuple)
+    def expect(self, prefixes):
+        future = self.loop.create_future()
+        self.expected = (prefixes, future)
+        return future
+
+    #waits for a future from expect(), returns the line or None after 'timeout' seconds
+    async def answer(self, future, timeout):
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            self.expected = None
+
+    #after opening the port: wait for the banner, negotiate the link speed, then we are ready
+    async def arduino_startup(self, banner):
+        banner_seen = await self.answer(banner, self.ready_timeout) is not None
+        rates = tuple(rate for rate in LINK_RATES if self.baudrate < rate <= self.max_baudrate)
+        if rates:
+            self.message(await self.negotiate_link_rate(rates))
+        self.ready_seconds = time.perf_counter() - self.opened_at
+        self.set_state(STATE_CONNECTED)
+        self.ready_event.set()
+        if self.on_ready:
+            self.on_ready(self.ready_seconds, banner_seen)
+
+    #the link speed handshake (the same steps as the connectionmanager's)
+    #returns: the message for the user
+    async def negotiate_link_rate(self, rates):
+        while rates:
+            answer = self.expect(("BAUD OK", "BAUD NO"))
+            self.write(f"BAUD {' '.join(str(rate) for rate in rates)}\n".encode())
+            line = await self.answer(answer, NEGOTIATE_TIMEOUT)
+            if line is None:
+                return f"No answer to BAUD (older firmware?), staying at {self.link_rate} baud"
+            try:
+                rate = int(line.split()[2]) if line.startswith("BAUD OK") else None
+            except (IndexError, ValueError):
+                rate = None
+            if rate is None:
+                return f"The arduino does not support a faster link, staying at {self.link_rate} baud"
+
+            self.set_link_rate(rate)
+            switched_at = time.perf_counter()
+            await asyncio.sleep(BAUD_SWITCH_DELAY)
+            confirmed = self.expect(f"BAUD CONFIRMED {rate}")
+            self.write(b"BAUD CONFIRM\n")
+            if await self.answer(confirmed, CONFIRM_TIMEOUT) is not None:
+                return f"Link speed: {rate} baud"
+
+            #the new rate does not work: go back, wait for the arduino to do the same, try slower
+            self.set_link_rate(self.baudrate)
+            self.message(f"{rate} baud did not work, going back to {self.baudrate} baud")
+            rates = tuple(slower for slower in rates if slower < rate)
+            await asyncio.sleep(max(0.0, switched_at + BAUD_CONFIRM_TIMEOUT + 0.1 - time.perf_counter()))
+        return f"Link speed: {self.link_rate} baud"
+
+    #changes the baud rate of the open port
+    def set_link_rate(self, rate):
+        self.port.baudrate = rate
+        self.link_rate = rate
+
+    #stops reading, cancels the startup coroutine and closes the port
+    def shutdown_port(self):
+        if self.ready_task is not None:
+            self.ready_task.cancel()
+            self.ready_task = None
+        self.expected = None
+        self.ready_event.clear()
+        port, self.port = self.port, None
+        if port is None:
+            return
+        self.loop.remove_reader(self.fd)
+        self.fd = None
+        try:
+            port.close()
+        except (serial.SerialException, OSError):
+            pass
+
+    def set_state(self, state):
+        if state != self.state:
+            self.state = state
+            if self.on_state:
+                self.on_state(state)
+
+    def message(self, text):
+        if self.on_message:
+            self.on_message(text)
+
+
+# 'asyncledcontroller' class: a ledcontroller whose connection is read by an event loop
+#   - everything of the ledcontroller works the same (set_mode(), send_configuration() ...)
+#   - send(), wait_for() and wait_until_ready() are coroutines (await them)
+#   - loop: the event loop (None = the current one, see qt_async_bridge.py for the GUI)
+class asyncledcontroller(ledcontroller):
+
+    #constructor that creates an asyncledcontroller object
+    def __init__(self, loop=None, on_line=None, on_message=None, on_ready=None, on_frame=None, on_event=None,
+                 serial_factory=serial.Serial):
+        super().__init__(on_line=on_line, on_message=on_message, on_ready=on_ready, on_frame=on_frame,
+                         on_event=on_event, serial_factory=serial_factory)
+        self.loop = loop or asyncio.get_event_loop()
+        self.connection = asyncconnection(
+            loop=self.loop,
+            on_line=self.line_received,
+            on_message=self.message,
+            on_ready=self.connection_ready,
+            on_frame=self.frame_received,
+            serial_factory=serial_factory,
+        )
+        #the coroutines waiting in wait_for(): list of (prefix, first line index, future)
+        self.line_waiters = []
+
+    #METHOD #A1: send
+    #   changes the settings given in 'configuration' (a dict with any of "mode", "pattern",
+    #   "flash_rate", "flash_duration"), sends them and waits for the arduino to confirm
+    #   waits for the answer to the SET/ NEXT itself (CONFIRM_PREFIXES, latency_metrics.py) or a
+    #   refusal (REJECT_PREFIXES, rig_registry.py), not the "ACK PATTERN" sent before it
+    #   returns: the answer ("ACK SET #3", "NAK SET #3 (...)", "Received: SET 1 4 30 2" ...), None if none came in time
+    #   raises: configurationerror (invalid settings/ not connected)
+    async def send(self, configuration=None, protocol=None, queued=False, timeout=SEND_CONFIRM_TIMEOUT):
+        configuration = configuration or {}
+        #the rate first: a custom pattern is compiled for the new rate
+        setters = (("mode", self.set_mode), ("flash_rate", self.set_flash_rate),
+                   ("flash_duration", self.set_flash_duration), ("pattern", self.set_pattern))
+        for key, setter in setters:
+            if key in configuration:
+                setter(configuration[key])
+        unknown = set(configuration) - {key for key, _ in setters}
+        if unknown:
+            raise configurationerror(f"Unknown setting(s): {', '.join(sorted(unknown))}")
+        self.message(self.send_configuration(protocol=protocol, queued=queued))
+        return await self.wait_for(CONFIRM_PREFIXES + REJECT_PREFIXES, timeout=timeout)
+
+    #METHOD #A2: wait_for
+    #   like ledcontroller.wait_for(), but awaited instead of blocking a thread
+    #   args: prefix (a string, or a tuple of them), timeout (seconds, None = forever),
+    #         after (line index to start from, None = the last send)
+    #   returns: the line, or None on a timeout
+    async def wait_for(self, prefix, timeout=None, after=None):
+        start = self.last_send_index if after is None else after
+        #the line may already be in the history
+        first_index = self.received_count - len(self.received_lines)
+        for offset, line in enumerate(self.received_lines):
+            if first_index + offset >= start and line.startswith(prefix):
+                return line
+        waiter = (prefix, self.loop.create_future())
+        self.line_waiters.append(waiter)
+        try:
+            return await asyncio.wait_for(waiter[1], timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            if waiter in self.line_waiters:
+                self.line_waiters.remove(waiter)
+
+    #METHOD #A3: wait_until_ready
+    async def wait_until_ready(self, timeout=READY_TIMEOUT + 1):
+        return await self.connection.wait_until_ready(timeout)
+
+    #every line (and ACK/ NAK) also wakes up the coroutines waiting for it
+    def add_received_line(self, line):
+        super().add_received_line(line)
+        for prefix, future in list(self.line_waiters):
+            if not future.done() and line.startswith(prefix):
+                future.set_result(line)
+
+    #the ACK timeout runs on the event loop instead of a timer thread
+    #(call_soon_threadsafe: the sequence scheduler sends from its own thread)
+    def start_ack_timer(self):
+        self.loop.call_soon_threadsafe(self.loop.call_later, ACK_TIMEOUT, self.check_for_missing_acks)
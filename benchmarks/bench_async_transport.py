@@ -0,0 +1,213 @@
+
+#*****************BENCHMARK: ASYNCIO TRANSPORT VS THE READER THREAD*****************
+# compares the asyncio transport (async_transport.py, the port is read by the event loop)
+# with the threaded design (connection_manager.py, one reader thread + a Qt signal or a
+# threading.Condition to get each line to whoever is waiting for it):
+#   1) headless: STATUS -> "Status: ..." round trips, waited for with the blocking
+#      ledcontroller.wait_for() vs 'await asyncledcontroller.wait_for()'
+#   2) through Qt: the same round trips with the line delivered to a slot in the GUI
+#      thread (the reader thread emits a signal vs the asyncio loop run by Qt through
+#      qt_async_bridge.py, which calls the slot straight away)
+# for each: the round trip, the time from the line being read to the slot/ waiter having
+# it (the 'hop' between threads), and the context switches per round trip (all threads of
+# this process except the emulator's, read from /proc)
+#
+# the emulator runs in instant virtual time, so the numbers are the PC's own overhead
+#
+# run with:   python benchmarks/bench_async_transport.py   (linux only: /proc, epoll)
+import asyncio #the asyncio transport
+import os #/proc, QT_QPA_PLATFORM
+import statistics #median
+import sys #argv for the QApplication
+import time #perf_counter_ns
+
+import pty_pair #noqa: F401  (adds the project folder to the import path)
+
+from arduino_emulator import arduinoemulator
+from async_transport import asyncledcontroller
+from latency_metrics import percentile
+from led_controller import ledcontroller, PROTOCOL_TEXT
+
+ROUND_TRIPS = 500
+
+
+#function to count the context switches of this process' threads (voluntary + forced)
+#args: skip (native thread ids not to count, the emulator runs in this process too)
+def context_switches(skip):
+    total = 0
+    for thread_id in os.listdir("/proc/self/task"):
+        if int(thread_id) in skip:
+            continue
+        try:
+            with open(f"/proc/self/task/{thread_id}/status") as file:
+                for line in file:
+                    if line.startswith(("voluntary_ctxt_switches", "nonvoluntary_ctxt_switches")):
+                        total += int(line.split()[1])
+        except FileNotFoundError:
+            continue
+    return total
+
+
+# 'collector' keeps the round trips/ hops of one run and prints them
+class collector:
+
+    def __init__(self, emulator):
+        self.skip = {emulator.thread.native_id}
+        self.round_trips = []
+        self.hops = []
+        self.read_at = 0
+        self.switches = 0
+
+    #the controller's on_line: runs where the line was read (reader thread/ event loop)
+    def line_read(self, line):
+        if line.startswith("Status:"):
+            self.read_at = time.perf_counter_ns()
+
+    #the waiter/ slot has the line
+    def line_handled(self):
+        self.hops.append((time.perf_counter_ns() - self.read_at) / 1000)
+
+    def start(self):
+        self.switches = context_switches(self.skip)
+
+    def stop(self):
+        self.switches = context_switches(self.skip) - self.switches
+
+    def report(self, name):
+        round_trips = sorted(self.round_trips)
+        hops = sorted(self.hops)
+        print(f"  {name:<34} round trip p50 {percentile(round_trips, 0.5):>6.0f}us "
+              f"p99 {percentile(round_trips, 0.99):>6.0f}us | hop p50 {statistics.median(hops):>5.0f}us | "
+              f"{self.switches / len(round_trips):>5.1f} context switches per round trip")
+
+
+def threaded_headless():
+    with arduinoemulator(speed=None) as emulator:
+        results = collector(emulator)
+        controller = ledcontroller(on_line=results.line_read)
+        controller.connect(emulator.port_name)
+        controller.wait_until_ready()
+        results.start()
+        for _ in range(ROUND_TRIPS):
+            after = controller.received_count
+            sent_at = time.perf_counter_ns()
+            controller.request_status(protocol=PROTOCOL_TEXT)
+            if controller.wait_for("Status:", timeout=2, after=after) is None:
+                raise TimeoutError("no STATUS answer")
+            results.line_handled()
+            results.round_trips.append((time.perf_counter_ns() - sent_at) / 1000)
+        results.stop()
+        controller.disconnect()
+    return results
+
+
+#args: slot_handles (True if a slot takes the line, so the hop ends there and not in the waiter)
+async def async_round_trips(controller, results, slot_handles=False):
+    results.start()
+    for _ in range(ROUND_TRIPS):
+        after = controller.received_count
+        sent_at = time.perf_counter_ns()
+        controller.request_status(protocol=PROTOCOL_TEXT)
+        if await controller.wait_for("Status:", timeout=2, after=after) is None:
+            raise TimeoutError("no STATUS answer")
+        if not slot_handles:
+            results.line_handled()
+        results.round_trips.append((time.perf_counter_ns() - sent_at) / 1000)
+    results.stop()
+
+
+def asyncio_headless():
+    async def main():
+        with arduinoemulator(speed=None) as emulator:
+            results = collector(emulator)
+            controller = asyncledcontroller(on_line=results.line_read)
+            controller.connect(emulator.port_name)
+            await controller.wait_until_ready()
+            await async_round_trips(controller, results)
+            controller.disconnect()
+        return results
+    return asyncio.run(main())
+
+
+def through_qt():
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt6.QtCore import QEventLoop, QObject, pyqtSignal
+    from PyQt6.QtWidgets import QApplication
+    from qt_async_bridge import qtasynciobridge
+
+    app = QApplication(sys.argv[:1])
+
+    #like the GUI's serialclass: the controller's on_line emits a signal, the slot runs in the GUI thread
+    class receiver(QObject):
+        line_signal = pyqtSignal(str)
+
+    #threaded: the reader thread emits, Qt queues the line for the GUI thread
+    with arduinoemulator(speed=None) as emulator:
+        threaded = collector(emulator)
+        waiting = QEventLoop()
+        signals = receiver()
+
+        def threaded_slot(line):
+            if line.startswith("Status:"):
+                threaded.line_handled()
+                waiting.quit()
+
+        def threaded_line(line):
+            threaded.line_read(line)
+            signals.line_signal.emit(line)
+
+        signals.line_signal.connect(threaded_slot)
+        controller = ledcontroller(on_line=threaded_line)
+        controller.connect(emulator.port_name)
+        controller.wait_until_ready()
+        threaded.start()
+        for _ in range(ROUND_TRIPS):
+            sent_at = time.perf_counter_ns()
+            controller.request_status(protocol=PROTOCOL_TEXT)
+            waiting.exec()
+            threaded.round_trips.append((time.perf_counter_ns() - sent_at) / 1000)
+        threaded.stop()
+        controller.disconnect()
+
+    #asyncio on Qt: the loop reads the port in the GUI thread and the signal is a direct call
+    bridge = qtasynciobridge()
+    with arduinoemulator(speed=None) as emulator:
+        bridged = collector(emulator)
+        signals = receiver()
+
+        def bridged_slot(line):
+            if line.startswith("Status:"):
+                bridged.line_handled()
+
+        def bridged_line(line):
+            bridged.line_read(line)
+            signals.line_signal.emit(line)
+
+        signals.line_signal.connect(bridged_slot)
+
+        async def main():
+            controller = asyncledcontroller(loop=bridge.loop, on_line=bridged_line)
+            controller.connect(emulator.port_name)
+            await controller.wait_until_ready()
+            await async_round_trips(controller, bridged, slot_handles=True)
+            controller.disconnect()
+
+        waiting = QEventLoop()
+        task = bridge.loop.create_task(main())
+        task.add_done_callback(lambda _: waiting.quit())
+        waiting.exec()
+        task.result()
+    bridge.close()
+    app.quit()
+    return threaded, bridged
+
+
+if __name__ == "__main__":
+    print(f"{ROUND_TRIPS} STATUS round trips against the emulator (pty, instant virtual time):")
+    print("headless:")
+    threaded_headless().report("reader thread + Condition wait_for")
+    asyncio_headless().report("asyncio add_reader + await wait_for")
+    print("through Qt (line delivered to a slot in the GUI thread):")
+    threaded, bridged = through_qt()
+    threaded.report("reader thread + queued Qt signal")
+    bridged.report("asyncio on the Qt loop (bridge)")
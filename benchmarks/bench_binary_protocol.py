@@ -0,0 +1,111 @@
+
+#*****************BENCHMARK: BINARY FRAMES VS TEXT SET PACKETS*****************
+# compares bytes on the wire and the time until the configuration is confirmed for the
+# text "SET ..." packet and the binary SET frame, against a loopback stand-in for the
+# arduino running on a pty pair (it answers exactly like controller_code.ino)
+# (the round trip checks of the codec are in tests/test_binary_protocol.py)
+#
+# run with:   python benchmarks/bench_binary_protocol.py
+import os #pty file descriptors
+import select #the stand-in waits for commands with a timeout so it can be stopped
+import statistics #median
+import threading #the stand-in arduino runs in its own thread
+import time #perf_counter
+
+from pty_pair import open_pty_pair, write_all
+
+from binary_protocol import (
+    framedecoder, decode_frame, encode_reply, encode_set_frame, FRAME_ACK,
+)
+from connection_manager import connectionmanager, DEFAULT_BAUDRATE
+
+#bits per byte on the wire at 8N1 (start bit + 8 data bits + stop bit)
+BITS_PER_BYTE = 10
+BAUDRATE = 9600
+
+
+#*****************LOOPBACK STAND-IN FOR THE ARDUINO*****************
+
+#the text the firmware prints after a text SET packet (see controller_code.ino)
+def text_echo(command):
+    _, mode, rate, duration, pattern = command.split()
+    lines = [f"Received: {command}", f"Mode: {mode}", f"Flash Rate: {rate}",
+             f"Duration: {duration}", f"Pattern: {pattern}",
+             "Manual Mode: Flashing started" if mode == "1" else "Trigger Mode: Waiting for button press..."]
+    return "".join(line + "\r\n" for line in lines).encode()
+
+
+#the stand-in: reads commands from the pty and answers like the firmware
+def stand_in_arduino(master_fd, running):
+    decoder = framedecoder()
+    text = b""
+    while running.is_set():
+        if not select.select([master_fd], [], [], 0.1)[0]:
+            continue
+        chunk = os.read(master_fd, 4096)
+        chunk, frames = decoder.feed(chunk)
+        for frame in frames:
+            write_all(master_fd, encode_reply(frame))
+        text += chunk
+        while b"\n" in text:
+            command, text = text.split(b"\n", 1)
+            command = command.decode().strip()
+            if command.startswith("SET"):
+                write_all(master_fd, text_echo(command))
+
+
+#sends 'runs' configurations one way and measures the time until each is confirmed
+#returns: list of seconds
+def measure(protocol, runs=200):
+    master_fd, slave_name = open_pty_pair()
+    running = threading.Event()
+    running.set()
+    stand_in = threading.Thread(target=stand_in_arduino, args=(master_fd, running), daemon=True)
+    stand_in.start()
+
+    confirmed = threading.Event()
+    #text: confirmed by the last echo line, binary: confirmed by the ACK frame
+    def on_line(line):
+        if line.startswith("Manual Mode"):
+            confirmed.set()
+    def on_frame(frame):
+        if frame.frame_type == FRAME_ACK:
+            confirmed.set()
+
+    manager = connectionmanager(on_line=on_line, on_frame=on_frame, max_baudrate=DEFAULT_BAUDRATE)
+    manager.connect(slave_name)
+    times = []
+    for number in range(runs):
+        confirmed.clear()
+        if protocol == "text":
+            packet = b"SET 1 4 30 2\n"
+        else:
+            packet = encode_set_frame(number, 1, 4, 30, 2)
+        start = time.perf_counter()
+        manager.write(packet)
+        confirmed.wait(timeout=5)
+        times.append(time.perf_counter() - start)
+
+    running.clear()
+    stand_in.join()
+    manager.disconnect()
+    os.close(master_fd)
+    return times
+
+
+if __name__ == "__main__":
+    text_request = b"SET 1 4 30 2\n"
+    text_reply = text_echo("SET 1 4 30 2")
+    binary_request = encode_set_frame(1, 1, 4, 30, 2)
+    binary_reply = encode_reply(decode_frame(binary_request))
+
+    print(f"bytes on the wire for one configuration (and time at {BAUDRATE} baud):")
+    for name, request, reply in (("text", text_request, text_reply), ("binary", binary_request, binary_reply)):
+        total = len(request) + len(reply)
+        print(f"  {name:<7} request {len(request):3d} B + reply {len(reply):3d} B = {total:3d} B "
+              f"-> {total * BITS_PER_BYTE / BAUDRATE * 1000:6.1f} ms")
+
+    print("send -> confirmation latency on a pty loopback (no baud rate limit, median of 200):")
+    for protocol in ("text", "binary"):
+        times = measure(protocol)
+        print(f"  {protocol:<7} {statistics.median(times) * 1e6:8.1f} us")
@@ -0,0 +1,65 @@
+
+#*****************BENCHMARK: COLD START OF THE CLI VS THE GUI*****************
+# measures (wall clock, from starting a fresh python process) how long it takes to:
+#   1) import the controller library (led_controller.py) vs import the GUI (PyQt6)
+#   2) CLI: get a configuration sent to the arduino (ledctl.py run --emulator ...)
+#      vs GUI: get the window painted (and the user still has to click CONNECT/ START)
+#
+# the CLI uses the python emulator (arduino_emulator.py) on a pty, so no arduino is needed
+#
+# run with:   python benchmarks/bench_cold_start.py
+import os #paths/ environment
+import statistics #median
+import subprocess #every measurement is a fresh python process
+import sys #python executable
+import time #perf_counter
+
+from pty_pair import PROJECT_FOLDER
+
+from bench_connect_startup import STARTUP_CHILD
+
+RUNS = 5
+
+#the GUI file has spaces in its name, so it is loaded like this
+IMPORT_GUI_CHILD = r"""
+import importlib.util, os, sys
+spec = importlib.util.spec_from_file_location("gui", os.path.join(sys.argv[1], "GUI Test 1.py"))
+spec.loader.exec_module(importlib.util.module_from_spec(spec))
+"""
+
+
+#runs a command 'RUNS' times and returns the wall clock milliseconds of each run
+#if 'marker' is given, the time is taken when a line starting with it is printed
+#(the process is then left to finish on its own)
+def wall_clock(command, marker=None):
+    environment = dict(os.environ, QT_QPA_PLATFORM="offscreen")
+    results = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        process = subprocess.Popen(command, cwd=PROJECT_FOLDER, env=environment,
+                                   stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        stopped = None
+        for line in process.stdout:
+            if marker is not None and stopped is None and line.startswith(marker):
+                stopped = time.perf_counter()
+        process.wait()
+        if process.returncode != 0:
+            raise RuntimeError(f"{command} exited with {process.returncode}")
+        results.append(((stopped or time.perf_counter()) - start) * 1000)
+    return results
+
+
+def report(name, milliseconds):
+    print(f"  {name:<46} median {statistics.median(milliseconds):7.0f} ms   "
+          f"(min {min(milliseconds):.0f}, max {max(milliseconds):.0f})")
+
+
+if __name__ == "__main__":
+    print(f"cold start, wall clock from starting python ({RUNS} runs each):")
+    report("python with nothing imported", wall_clock([sys.executable, "-c", "pass"]))
+    report("import led_controller (no PyQt6)", wall_clock([sys.executable, "-c", "import led_controller"]))
+    report("import the GUI (PyQt6)", wall_clock([sys.executable, "-c", IMPORT_GUI_CHILD, PROJECT_FOLDER]))
+    report("CLI: configuration sent to the emulator",
+           wall_clock([sys.executable, "ledctl.py", "run", "--emulator", "--rate", "4", "--duration", "1"],
+                      marker="Successfully sent"))
+    report("GUI: window painted (not connected yet)", wall_clock([sys.executable, "-c", STARTUP_CHILD, PROJECT_FOLDER]))
@@ -0,0 +1,96 @@
+
+#*****************BENCHMARK: STARTUP AND CONNECT TIMING*****************
+# measures the two places where the GUI used to freeze:
+#   1) startup to first paint: the time from starting python to the window being painted
+#      (the COM port scan now runs in the background, so it is not part of this anymore)
+#   2) connect to ready: the time from clicking CONNECT to the arduino being ready,
+#      and how long the GUI thread is blocked by the click (it used to sleep 2s)
+#
+# a pty pair pretends to be the arduino: it prints the ready banner RESET_DELAY seconds
+# after the port is opened, like a real board after its bootloader finishes
+#
+# run with:   python benchmarks/bench_connect_startup.py
+import os #pty file descriptors
+import statistics #median
+import subprocess #each startup is measured in a fresh python process
+import sys #python executable
+import threading #the fake arduino prints its banner from a timer thread
+import time #perf_counter
+
+from pty_pair import open_pty_pair, write_all, PROJECT_FOLDER
+
+import serial.tools.list_ports #so we can time the old synchronous port scan
+
+from connection_manager import connectionmanager, DEFAULT_BAUDRATE, READY_BANNER
+
+#how long the fake arduino takes to 'reset' before printing the banner (seconds)
+RESET_DELAY = 0.5
+#the old code always slept this long after opening the port
+OLD_FIXED_SLEEP = 2.0
+
+#the code run in a fresh python process for each startup measurement
+#prints the milliseconds from the start of the process to the first paint
+STARTUP_CHILD = r"""
+import importlib.util, os, sys, time
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+spec = importlib.util.spec_from_file_location("gui", os.path.join(sys.argv[1], "GUI Test 1.py"))
+gui = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(gui)
+app = gui.QApplication(sys.argv[:1])
+window = gui.systemGUI()
+window.show()
+deadline = time.perf_counter() + 10
+while not window.first_paint_done and time.perf_counter() < deadline:
+    app.processEvents()
+print((time.perf_counter() - gui.app_start_time) * 1000)
+window.close()
+"""
+
+
+#measures startup to first paint in 'runs' fresh processes
+#returns: list of milliseconds
+def measure_startup(runs=5):
+    results = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", STARTUP_CHILD, PROJECT_FOLDER],
+                                capture_output=True, text=True, check=True).stdout
+        results.append(float(output.strip().splitlines()[-1]))
+    return results
+
+
+#measures one connect against a fake arduino
+#returns: (ms the calling thread was blocked, ms from connect to ready)
+def measure_connect():
+    master_fd, slave_name = open_pty_pair()
+    #(the fake arduino only prints its banner, it does not answer the link speed handshake)
+    manager = connectionmanager(max_baudrate=DEFAULT_BAUDRATE)
+
+    start = time.perf_counter()
+    manager.connect_in_background(slave_name)
+    blocked = time.perf_counter() - start
+    #the 'arduino' finishes resetting and prints its banner
+    threading.Timer(RESET_DELAY, write_all, args=(master_fd, (READY_BANNER + "\r\n").encode())).start()
+    manager.wait_until_ready(timeout=10)
+    ready = time.perf_counter() - start
+
+    manager.disconnect()
+    os.close(master_fd)
+    return blocked * 1000, ready * 1000
+
+
+if __name__ == "__main__":
+    start = time.perf_counter()
+    port_count = len(serial.tools.list_ports.comports())
+    scan_ms = (time.perf_counter() - start) * 1000
+    print(f"synchronous COM port scan (no longer on the startup path): {scan_ms:.1f} ms for {port_count} ports")
+
+    startup = measure_startup()
+    print(f"startup to first paint: median {statistics.median(startup):.0f} ms "
+          f"(min {min(startup):.0f}, max {max(startup):.0f}) over {len(startup)} runs")
+
+    connects = [measure_connect() for _ in range(5)]
+    blocked = [value[0] for value in connects]
+    ready = [value[1] for value in connects]
+    print(f"connect (arduino reset takes {RESET_DELAY * 1000:.0f} ms):")
+    print(f"  old: GUI blocked {OLD_FIXED_SLEEP * 1000:.0f} ms, ready after {OLD_FIXED_SLEEP * 1000:.0f} ms (fixed sleep)")
+    print(f"  new: GUI blocked {statistics.median(blocked):.2f} ms, ready after {statistics.median(ready):.0f} ms (median)")
@@ -0,0 +1,189 @@
+
+#*****************BENCHMARK: CONTROL SERVER*****************
+# measures the control server (control_server.py) against the emulator:
+#   1) request -> wire: a "start" request arriving at the server -> the SET written to the
+#      port (measured by the server), and the client's whole round trip
+#   2) ping round trip with 1, 16 and 64 clients calling at the same time (all requests go
+#      through the one command queue), and the requests per second
+#   3) events: a line read from the arduino -> the subscribed client has it
+#   4) the GUI thread while 64 clients (in another process) hammer the server embedded in
+#      the window: how late a 10ms QTimer fires, compared to no clients at all
+#
+# the emulator runs in instant virtual time, so the numbers are the PC's own overhead
+#
+# run with:   python benchmarks/bench_control_server.py   (linux/ mac: ptys)
+import os #QT_QPA_PLATFORM, the client process' import path
+import subprocess #the clients of test 4
+import sys #the python that runs the clients
+import threading #one thread per client
+import time #perf_counter_ns
+
+import pty_pair #noqa: F401  (adds the project folder to the import path)
+
+from arduino_emulator import arduinoemulator
+from control_server import controlclient, controlserver
+from latency_metrics import percentile
+from led_controller import ledcontroller, PROTOCOL_TEXT
+
+STARTS = 200
+CALLS_PER_CLIENT = 200
+CLIENT_COUNTS = (1, 16, 64)
+GUI_SECONDS = 3
+
+#started with 'python -c': 64 clients calling "status" until stdin is closed
+HAMMER_CLIENTS = """
+import sys, threading
+from control_server import controlclient
+clients = [controlclient(port=int(sys.argv[1])) for _ in range(64)]
+stop = threading.Event()
+def hammer(client):
+    while not stop.is_set():
+        client.call("status")
+threads = [threading.Thread(target=hammer, args=(client,)) for client in clients]
+for thread in threads:
+    thread.start()
+print("running", flush=True)
+sys.stdin.read()
+stop.set()
+for thread in threads:
+    thread.join()
+"""
+
+
+def show(name, microseconds):
+    values = sorted(microseconds)
+    print(f"  {name:<40} p50 {percentile(values, 0.5):>7.0f}us  p99 {percentile(values, 0.99):>7.0f}us  "
+          f"max {values[-1]:>7.0f}us")
+
+
+def request_to_wire(port):
+    client = controlclient(port=port)
+    client.call("configure", mode="Manual Mode", flash_rate=100, flash_duration=30)
+    wire, round_trips = [], []
+    for _ in range(STARTS):
+        called_at = time.perf_counter_ns()
+        result = client.call("start")
+        round_trips.append((time.perf_counter_ns() - called_at) / 1000)
+        wire.append(result["request_to_wire_us"])
+    client.call("stop")
+    client.close()
+    print(f"{STARTS} start requests:")
+    show("request arrived -> SET written (server)", wire)
+    show("client call -> reply (round trip)", round_trips)
+
+
+def concurrent_clients(port):
+    print(f"ping round trips, {CALLS_PER_CLIENT} calls per client, all clients at once:")
+    for count in CLIENT_COUNTS:
+        clients = [controlclient(port=port) for _ in range(count)]
+        round_trips = [[] for _ in clients]
+
+        def calls(client, results):
+            for _ in range(CALLS_PER_CLIENT):
+                called_at = time.perf_counter_ns()
+                client.call("ping")
+                results.append((time.perf_counter_ns() - called_at) / 1000)
+
+        threads = [threading.Thread(target=calls, args=(client, results)) for client, results in zip(clients, round_trips)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        seconds = time.perf_counter() - started
+        for client in clients:
+            client.close()
+        show(f"{count:>3} client(s), {count * CALLS_PER_CLIENT / seconds:>6.0f} requests/s", sum(round_trips, []))
+
+
+#args: controller (the server's, asked for a text STATUS so the arduino prints a line)
+def event_latency(port, controller):
+    delays = []
+    arrived = threading.Event()
+
+    def event(message):
+        if message["line"].startswith("Status:"):
+            delays.append((time.perf_counter_ns() - message["t_ns"]) / 1000)
+            arrived.set()
+
+    client = controlclient(port=port, on_event=event)
+    client.call("subscribe")
+    for _ in range(STARTS):
+        arrived.clear()
+        controller.request_status(protocol=PROTOCOL_TEXT)
+        if not arrived.wait(2):
+            raise TimeoutError("no Status event")
+    client.close()
+    print("events:")
+    show("line read -> subscriber has it", delays)
+
+
+def gui_responsiveness(emulator):
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    import importlib.util
+    from PyQt6.QtCore import QEventLoop, QTimer
+    from PyQt6.QtWidgets import QApplication
+
+    spec = importlib.util.spec_from_file_location("gui", os.path.join(pty_pair.PROJECT_FOLDER, "GUI Test 1.py"))
+    gui = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(gui)
+    app = QApplication(sys.argv[:1])
+    window = gui.systemGUI(session_folder=None)
+    window.start_control_server(port=0)
+    port = int(window.control_server.address.rpartition(":")[2])
+    window.controller.connect(emulator.port_name)
+    window.controller.wait_until_ready()
+
+    #how late a 10ms timer fires, for 'seconds'
+    def timer_lateness(seconds=GUI_SECONDS):
+        lateness = []
+        last = [time.perf_counter_ns()]
+
+        def tick():
+            now = time.perf_counter_ns()
+            lateness.append((now - last[0]) / 1000 - 10000)
+            last[0] = now
+
+        timer = QTimer()
+        timer.setInterval(10)
+        timer.timeout.connect(tick)
+        waiting = QEventLoop()
+        QTimer.singleShot(int(seconds * 1000), waiting.quit)
+        timer.start()
+        waiting.exec()
+        timer.stop()
+        return lateness
+
+    #(the first paint/ layout of the window, not counted)
+    timer_lateness(0.5)
+    quiet = timer_lateness()
+    environment = dict(os.environ, PYTHONPATH=pty_pair.PROJECT_FOLDER)
+    process = subprocess.Popen([sys.executable, "-c", HAMMER_CLIENTS, str(port)],
+                               stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, env=environment)
+    process.stdout.readline()
+    busy = timer_lateness()
+    process.stdin.close()
+    process.wait()
+    requests = window.control_server.request_to_reply.count
+    window.close()
+    app.quit()
+    print(f"GUI thread, 10ms QTimer lateness ({requests} requests served while busy):")
+    show("no clients", quiet)
+    show("64 clients calling status non-stop", busy)
+
+
+if __name__ == "__main__":
+    with arduinoemulator(speed=None) as emulator:
+        controller = ledcontroller()
+        controller.connect(emulator.port_name)
+        controller.wait_until_ready()
+        #port=0: any free port
+        server = controlserver(controller, port=0)
+        port = int(server.start().rpartition(":")[2])
+        request_to_wire(port)
+        concurrent_clients(port)
+        event_latency(port, controller)
+        server.stop()
+        controller.disconnect()
+    with arduinoemulator(speed=None) as emulator:
+        gui_responsiveness(emulator)
@@ -0,0 +1,206 @@
+
+#*****************BENCHMARK: DEVICE EVENT PARSER*****************
+# 1) checks (asserts) that every line the firmware prints becomes the right event, and that
+#    the "Mode:"/ "Flash Rate:"/ "Duration:"/ "Pattern:" lines become ONE configappliedevent
+# 2) the cost per line of deviceparser.parse() (device_events.py) on a realistic mix of lines
+#    (a run of configurations, DONEs, STATUS answers ...), compared with:
+#       - the same parser trying every prefix in order (no dispatch table)
+#       - the line.startswith() checks the GUI/ ledcontroller used to do on every line
+#    plus the cost of devicestate.apply()
+# 3) the Qt signals for a burst of events: one signal per event vs one per batch
+#    (eventbatch), delivered to the GUI thread while it is busy
+#
+# run with:   python benchmarks/bench_device_events.py
+import os #QT_QPA_PLATFORM
+import sys #argv for the QApplication
+import threading #the 'reader thread' of test 3
+import time #perf_counter_ns
+
+import pty_pair #noqa: F401  (adds the project folder to the import path)
+
+from device_events import (
+    armedevent, configappliedevent, deviceparser, devicestate, eventbatch, finishedevent, flashstartedevent,
+    lineevent, parseerrorevent, readyevent, receivedevent, triggeredevent,
+)
+
+REPEATS = 20000
+BURST = 20000
+
+#what the firmware prints for one text SET in manual mode, one in trigger mode, a STATUS
+#and a STOP (controller_code.ino)
+LINE_MIX = [
+    "Received: SET 1 4 30 2", "Mode: 1", "Flash Rate: 4", "Duration: 30", "Pattern: 2",
+    "Manual Mode: Flashing started", "Flashing Pattern 2 at 4 Hz for 30 seconds.",
+    "Received: STATUS", "Status: flashing 1200 of 30000 ms",
+    "Flashing finished", "DONE",
+    "Received: SET 2 10 5 1", "Mode: 2", "Flash Rate: 10", "Duration: 5", "Pattern: 1",
+    "Trigger Mode: Waiting for button press...", "BUTTON PRESSED - TRIGGERING LED",
+    "Flashing Pattern 1 at 10 Hz for 5 seconds.", "Received: STOP", "Flashing stopped",
+]
+
+
+#*****************1) CHECKS*****************
+
+def check_events():
+    parser = deviceparser()
+    expected = {
+        "Arduino Ready - Waiting for Configuration...": readyevent,
+        "Received: SET 1 4 30 2": receivedevent,
+        "Trigger Mode: Waiting for button press...": armedevent,
+        "Trigger Mode: Disarmed": armedevent,
+        "BUTTON PRESSED - TRIGGERING LED": triggeredevent,
+        "Flashing Pattern 2 at 4 Hz for 30 seconds.": flashstartedevent,
+        "Flashing finished": finishedevent,
+        "Flashing stopped": finishedevent,
+        "DONE": finishedevent,
+        "Error parsing command!": parseerrorevent,
+        "Status: idle": lineevent,
+        "BAUD OK 1000000": lineevent,
+        "Queued: starts after the current run": lineevent,
+        "": lineevent,
+    }
+    for line, event_type in expected.items():
+        assert type(parser.parse(line)) is event_type, line
+
+    #the four configuration lines are one event
+    events = [parser.parse(line) for line in LINE_MIX[:5]]
+    assert events[1:4] == [None, None, None]
+    applied = events[4]
+    assert type(applied) is configappliedevent
+    assert (applied.mode, applied.flash_rate, applied.flash_duration, applied.pattern) == (1, 4, 30, 2)
+    assert type(parser.parse("Pattern: 2")) is parseerrorevent
+    assert type(parser.parse("Flash Rate: four")) is parseerrorevent
+
+    #the state after the whole mix
+    state = devicestate()
+    for line in LINE_MIX:
+        event = parser.parse(line)
+        if event is not None:
+            state.apply(event)
+    assert state.configuration() == (2, 10, 5, 1)
+    assert state.triggers == 1 and state.runs_finished == 1 and not state.flashing and not state.armed
+    print("checks: every line -> the right event, configuration lines -> one event: OK")
+
+
+#*****************2) COST PER LINE*****************
+
+# the parser without its dispatch table (tries every prefix in order)
+class linearparser(deviceparser):
+
+    def __init__(self):
+        super().__init__()
+        self.prefixes = [(prefix, getattr(self, method)) for prefix, method in self.PREFIXES]
+
+    def parse(self, line, t_ns=0):
+        for prefix, method in self.prefixes:
+            if line.startswith(prefix):
+                return method(line, t_ns, prefix)
+        return lineevent(line, t_ns)
+
+
+#what every line went through before: the metrics check, the flash state check and the
+#ledcontroller's track_flash() (three startswith() calls, no event)
+def legacy_checks(line):
+    tracked = line.startswith(("Received:", "ACK", "Trigger Mode: Waiting", "BUTTON PRESSED", "Flashing Pattern", "DONE"))
+    if line.startswith("Flashing"):
+        tracked = line.startswith("Flashing Pattern")
+    if line.startswith("Flashing Pattern"):
+        tracked = line.split()
+    return tracked
+
+
+#returns the ns per line of function(line) over REPEATS passes of LINE_MIX
+def per_line(function):
+    lines = LINE_MIX * REPEATS
+    started = time.perf_counter_ns()
+    for line in lines:
+        function(line)
+    return (time.perf_counter_ns() - started) / len(lines)
+
+
+def measure_parsers():
+    dispatch = deviceparser()
+    linear = linearparser()
+    state = devicestate()
+
+    def parse_and_apply(line):
+        event = dispatch.parse(line)
+        if event is not None:
+            state.apply(event)
+
+    print(f"cost per line ({len(LINE_MIX)} kinds of lines x {REPEATS}):")
+    for name, function in (
+        ("deviceparser.parse() (dispatch table)", dispatch.parse),
+        ("every prefix in order (no table)", linear.parse),
+        ("parse() + devicestate.apply()", parse_and_apply),
+        ("old startswith() checks (no events)", legacy_checks),
+    ):
+        print(f"  {name:<40} {per_line(function):>6.0f} ns")
+
+
+#*****************3) SIGNALS PER BURST*****************
+
+def measure_batching():
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt6.QtCore import QCoreApplication, QEventLoop, QObject, QTimer, pyqtSignal
+
+    app = QCoreApplication(sys.argv[:1])
+
+    class receiver(QObject):
+        event_signal = pyqtSignal(object)
+        batch_signal = pyqtSignal()
+
+    events = [deviceparser().parse(line) for line in LINE_MIX]
+    events = [event for event in events if event is not None]
+
+    #args: batched (True = eventbatch + one signal per batch)
+    #returns: (signals delivered, ms until the GUI thread had every event)
+    def run(batched):
+        signals = receiver()
+        batch = eventbatch()
+        handled = [0, 0]
+        waiting = QEventLoop()
+
+        def one_event(event):
+            handled[0] += 1
+            handled[1] += 1
+            if handled[1] == BURST:
+                waiting.quit()
+
+        def one_batch():
+            handled[0] += 1
+            handled[1] += len(batch.take())
+            if handled[1] == BURST:
+                waiting.quit()
+
+        signals.event_signal.connect(one_event)
+        signals.batch_signal.connect(one_batch)
+
+        def reader():
+            for number in range(BURST):
+                event = events[number % len(events)]
+                if not batched:
+                    signals.event_signal.emit(event)
+                elif batch.add(event):
+                    signals.batch_signal.emit()
+
+        started = time.perf_counter_ns()
+        #the GUI thread is busy for 20ms while the burst arrives (like a redraw)
+        QTimer.singleShot(0, lambda: time.sleep(0.02))
+        thread = threading.Thread(target=reader)
+        thread.start()
+        waiting.exec()
+        thread.join()
+        return handled[0], (time.perf_counter_ns() - started) / 1e6
+
+    print(f"a burst of {BURST} events from a background thread to the GUI thread:")
+    for name, batched in (("one signal per event", False), ("eventbatch, one signal per batch", True)):
+        delivered, milliseconds = run(batched)
+        print(f"  {name:<40} {delivered:>6} signals, all handled after {milliseconds:>6.1f} ms")
+    app.quit()
+
+
+if __name__ == "__main__":
+    check_events()
+    measure_parsers()
+    measure_batching()
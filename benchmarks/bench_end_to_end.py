@@ -0,0 +1,99 @@
+
+#*****************BENCHMARK: END TO END AGAINST THE EMULATOR*****************
+# runs the whole host side (connectionmanager -> pty -> arduino_emulator.py) with no hardware:
+#   1) latency from writing a SET packet to the emulator confirming it
+#      ("Manual Mode: Flashing started" for text, ACK for binary) and to "DONE"
+#   2) throughput: complete SET -> DONE runs per second in instant virtual time
+#   3) trigger mode: a simulated button press -> "BUTTON PRESSED" latency
+#
+# the emulator runs in instant virtual time (speed=None), so a "30 second" run takes
+# no real time and only the host/ pty overhead is measured
+#
+# run with:   python benchmarks/bench_end_to_end.py
+import queue #lines from the reader thread
+import statistics #median/ percentiles
+import time #perf_counter
+
+import pty_pair #noqa: F401  (adds the project folder to the import path)
+
+from arduino_emulator import arduinoemulator
+from binary_protocol import encode_set_frame, FRAME_ACK
+from connection_manager import connectionmanager
+
+RUNS = 300
+
+
+# 'linewaiter' class: queues everything the emulator sends (with its arrival time) so we
+# can wait for a line even if it arrived before we started waiting
+class linewaiter:
+
+    def __init__(self):
+        self.arrivals = queue.Queue()
+
+    def on_line(self, line):
+        self.arrivals.put((time.perf_counter(), line))
+
+    def on_frame(self, frame):
+        if frame.frame_type == FRAME_ACK:
+            self.arrivals.put((time.perf_counter(), "ACK"))
+
+    #returns the arrival time of the next line starting with 'prefix' (earlier lines are skipped)
+    def wait(self, prefix):
+        while True:
+            try:
+                arrived_at, line = self.arrivals.get(timeout=5)
+            except queue.Empty:
+                raise TimeoutError(f"no '{prefix}' from the emulator") from None
+            if line.startswith(prefix):
+                return arrived_at
+
+
+#prints median/ p95/ max of a list of seconds
+def report(name, seconds):
+    us = sorted(value * 1e6 for value in seconds)
+    print(f"  {name:<34} median {statistics.median(us):8.1f} us   p95 {us[int(len(us) * 0.95)]:8.1f} us   max {us[-1]:8.1f} us")
+
+
+if __name__ == "__main__":
+    with arduinoemulator(speed=None) as emulator:
+        waiter = linewaiter()
+        manager = connectionmanager(on_line=waiter.on_line, on_frame=waiter.on_frame)
+        manager.connect(emulator.port_name)
+        manager.wait_until_ready(timeout=5)
+
+        confirm_text, confirm_binary, done = [], [], []
+        start_all = time.perf_counter()
+        for number in range(RUNS):
+            #text SET -> "Manual Mode: Flashing started" -> ... -> "DONE"
+            start = time.perf_counter()
+            manager.write(b"SET 1 4 30 2\n")
+            confirm_text.append(waiter.wait("Manual Mode") - start)
+            done.append(waiter.wait("DONE") - start)
+
+            #binary SET -> ACK (then wait for DONE so the next run starts clean)
+            start = time.perf_counter()
+            manager.write(encode_set_frame(number, 1, 4, 30, 2))
+            confirm_binary.append(waiter.wait("ACK") - start)
+            waiter.wait("DONE")
+        elapsed = time.perf_counter() - start_all
+
+        print(f"end to end against the emulator ({RUNS} runs each, instant virtual time):")
+        report("text SET -> confirmation", confirm_text)
+        report("binary SET -> ACK", confirm_binary)
+        report("text SET -> DONE (30 s run)", done)
+        print(f"  throughput: {2 * RUNS / elapsed:.0f} complete SET -> DONE runs per second")
+
+        #trigger mode: arm, then press the button
+        presses = []
+        for _ in range(50):
+            manager.write(b"SET 2 10 1 1\n")
+            waiter.wait("Trigger Mode")
+            #let the 200ms debounce pass in virtual time
+            emulator.advance(250)
+            start = time.perf_counter()
+            emulator.press_button()
+            presses.append(waiter.wait("BUTTON PRESSED") - start)
+            waiter.wait("DONE")
+        report("button press -> BUTTON PRESSED", presses)
+
+        manager.disconnect()
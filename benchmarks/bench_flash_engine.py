@@ -0,0 +1,123 @@
+
+#*****************BENCHMARK: NON-BLOCKING FLASH ENGINE (STOP/ STATUS WHILE FLASHING)*****************
+# measures what the non-blocking flash engine (flash_engine.py, update_flash() in the firmware)
+# changed compared to the old blocking delay() loop:
+#   1) end of the run: when the LEDs go off compared to the requested duration (simulated
+#      arduino uno). The old loop only checked the duration once per pattern cycle, so a
+#      run overran by up to one whole cycle
+#   2) STOP while flashing: time from sending STOP to the arduino's answer and to the LEDs
+#      going off (emulator in real time). The old firmware did not read serial while it
+#      flashed, so a STOP (or anything else) waited for the end of the run
+#   3) STATUS while flashing: round trip of the STATUS frame with the elapsed time
+#
+# run with:   python benchmarks/bench_flash_engine.py
+import statistics #median
+import time #perf_counter
+
+import pty_pair #noqa: F401  (adds the project folder to the import path)
+
+from arduino_emulator import arduinoemulator
+from bench_pattern_timing import legacy_changes
+from binary_protocol import encode_frame, FRAME_STOP, MIN_FRAME_SIZE
+from flash_engine import flashengine, simulate, FLASH_DONE, UNO_LOOP_US, UNO_MICROS_RESOLUTION_US
+from led_controller import ledcontroller, PROTOCOL_BINARY, PROTOCOL_TEXT
+from pattern_compiler import builtin_table
+
+DURATION = 5 #seconds
+RATES = (1, 3, 7, 60, 500)
+STOPS = 20
+BAUDRATE = 9600
+BITS_PER_BYTE = 10
+
+
+#runs the flash engine like the firmware's loop() on an arduino uno until the end of the run
+#returns: the time (us) the run ended (LEDs off, "DONE")
+def engine_end(table, flash_duration):
+    engine = flashengine()
+    engine.start(table, flash_duration, 0)
+    now = 0
+    while engine.update(now - now % UNO_MICROS_RESOLUTION_US) != FLASH_DONE:
+        now = max(now + UNO_LOOP_US, engine.next_event_us())
+    return now
+
+
+def end_of_run():
+    print(f"end of a {DURATION}s run, simulated arduino uno: when the run ends (\"DONE\") compared")
+    print("with the requested duration, and how many LED flashes start after the duration:")
+    print(f"{'rate':>6} {'pattern':>8} | {'old delay() loop':>26} | {'flash engine':>22}")
+    for rate in RATES:
+        for pattern_number in (1, 4):
+            table = builtin_table(pattern_number, rate)
+            old_changes = legacy_changes(pattern_number, rate, DURATION)
+            old_late = sum(1 for time_us, mask in old_changes if mask and time_us > DURATION * 1000000)
+            new_late = sum(1 for time_us, mask in simulate(table, DURATION) if mask and time_us > DURATION * 1000000)
+            old_end = old_changes[-1][0] - DURATION * 1000000
+            new_end = engine_end(table, DURATION) - DURATION * 1000000
+            print(f"{rate:>4}Hz {pattern_number:>8} | {old_end / 1000:>+10.1f}ms {old_late:>2} late flashes | "
+                  f"{new_end:>+8}us {new_late:>2} late flashes")
+
+
+#sends STOP 'STOPS' times during a run, returns (answer times, LEDs off times) in seconds
+def stop_latency(controller, emulator, protocol):
+    answers = []
+    leds_off = []
+    controller.set_protocol(protocol)
+    for _ in range(STOPS):
+        controller.send_configuration()
+        if controller.wait_for("Flashing Pattern", timeout=5) is None:
+            raise TimeoutError("the emulator did not start flashing")
+        time.sleep(0.05)
+        after = controller.received_count
+        sent_at = time.perf_counter()
+        controller.stop()
+        if controller.wait_for("Flashing stopped", timeout=5, after=after) is None:
+            raise TimeoutError("no 'Flashing stopped' from the emulator")
+        answers.append(time.perf_counter() - sent_at)
+        #the emulator's clock is real time here, so its LED events can be compared with perf_counter()
+        off_us = emulator.led_events[-1][0]
+        leds_off.append(off_us / 1e6 - (sent_at - emulator.clock.start))
+    return answers, leds_off
+
+
+def status_round_trip(controller):
+    controller.set_protocol(PROTOCOL_BINARY)
+    controller.send_configuration()
+    controller.wait_for("Flashing Pattern", timeout=5)
+    times = []
+    for _ in range(STOPS):
+        sent_at = time.perf_counter()
+        status = controller.request_status(timeout=1)
+        if status is None:
+            raise TimeoutError("no STATUS reply from the emulator")
+        times.append(time.perf_counter() - sent_at)
+    controller.stop()
+    return times, status
+
+
+if __name__ == "__main__":
+    end_of_run()
+
+    with arduinoemulator(speed=1) as emulator:
+        controller = ledcontroller()
+        controller.set_flash_rate(100)
+        controller.set_flash_duration(30)
+        controller.set_pattern("L1:L2")
+        controller.connect(emulator.port_name)
+        controller.wait_until_ready()
+        print(f"\nSTOP during a 30s run at 100 Hz ({STOPS} times, emulator in real time):")
+        for protocol in (PROTOCOL_TEXT, PROTOCOL_BINARY):
+            answers, leds_off = stop_latency(controller, emulator, protocol)
+            print(f"  {protocol:<7} 'Flashing stopped' after median {statistics.median(answers) * 1000:.2f} ms "
+                  f"(max {max(answers) * 1000:.2f} ms), LEDs off after median {statistics.median(leds_off) * 1000:.2f} ms")
+        print("  old firmware: the STOP waited in the receive buffer until the 30s run was over")
+
+        times, status = status_round_trip(controller)
+        print(f"\nSTATUS while flashing: median round trip {statistics.median(times) * 1000:.2f} ms, "
+              f"last reply: {status['elapsed_ms']} of {status['flash_duration'] * 1000} ms flashed")
+        controller.disconnect()
+
+    #what STOP costs on the real link
+    stop_bytes = len(encode_frame(FRAME_STOP, 1)) + MIN_FRAME_SIZE + 1
+    print(f"\non a real arduino at {BAUDRATE} baud, STOP + ACK also need "
+          f"{stop_bytes * BITS_PER_BYTE / BAUDRATE * 1000:.1f} ms on the wire (binary), "
+          f"{len(b'STOP') + 1} bytes = {5 * BITS_PER_BYTE / BAUDRATE * 1000:.1f} ms for the text command")
@@ -0,0 +1,60 @@
+
+#*****************BENCHMARK: GUI PROFILER*****************
+# what profiling (gui_profiler.py) costs:
+#   1) one slot call: not wrapped vs wrapped (timed, added to the stats and the trace)
+#   2) the GUI (headless) with a burst of triggers replayed as fast as possible
+#      (session_replay.py), without and with the profiler: the event loop lag and how long the
+#      replay took
+#
+# run with:   python benchmarks/bench_gui_profiler.py
+import os #QT_QPA_PLATFORM
+import shutil #removes the profile written by test 2
+import tempfile #where it goes
+import time #perf_counter_ns
+
+import pty_pair #noqa: F401  (adds the project folder to the import path)
+
+CALLS = 200000
+
+
+def call_overhead():
+    from gui_profiler import guiprofiler
+
+    class window:
+        def slot(self, checked):
+            return checked
+
+    plain = window()
+    profiled = window()
+    profiler = guiprofiler()
+    profiler.wrap_methods(profiled, ("slot",))
+    print(f"one slot call ({CALLS} calls):")
+    for name, target in (("not wrapped", plain), ("wrapped (profiling on)", profiled)):
+        slot = target.slot
+        started = time.perf_counter_ns()
+        for _ in range(CALLS):
+            slot(False)
+        print(f"  {name:<30} {(time.perf_counter_ns() - started) / CALLS:>6.0f} ns")
+
+
+def replay_with_and_without():
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    import session_replay
+    from latency_metrics import percentile
+
+    print("2000 triggers replayed into the GUI as fast as possible:")
+    folder = tempfile.mkdtemp()
+    try:
+        for name, profile in (("no profiler", False), ("profiler", True)):
+            report = session_replay.run_gui_replay(session_replay.trigger_burst(2000), None, profile=profile,
+                                                   profile_folder=folder)
+            lag = report["lag_ms"]
+            print(f"  {name:<14} replayed in {report['replay_seconds'] * 1000:>5.0f} ms, event loop lag "
+                  f"p50 {percentile(lag, 0.5):>5.1f} ms  max {lag[-1]:>5.1f} ms")
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == "__main__":
+    call_overhead()
+    replay_with_and_without()
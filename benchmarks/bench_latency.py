@@ -0,0 +1,113 @@
+
+#*****************BENCHMARK: COMMAND LATENCY AND TRIGGER JITTER*****************
+# fills the latency metrics (latency_metrics.py) by running configurations against the emulator:
+#   1) headless (ledcontroller only): text and binary SETs in manual mode, then trigger mode
+#      with simulated button presses
+#   2) the same manual runs through the GUI (offscreen), which adds the "reader -> GUI"
+#      metric: how long a line waits for the GUI thread
+#   3) the cost of the tracker itself per line (it runs in the reader thread)
+#
+# the emulator runs in instant virtual time and the pty has no baud rate limit, so the
+# "SET -> confirmed" numbers are the PC's own overhead. The time the same bytes need on
+# the real 9600 baud link is printed next to them for comparison
+#
+# run with:   python benchmarks/bench_latency.py
+import importlib.util #the GUI file has spaces in its name
+import os #paths/ environment
+import sys #argv for the QApplication
+import time #perf_counter_ns
+
+from pty_pair import PROJECT_FOLDER
+
+from arduino_emulator import arduinoemulator
+from binary_protocol import decode_frame, encode_reply, encode_set_frame
+from latency_metrics import latencytracker, format_summary
+from led_controller import ledcontroller, PROTOCOL_BINARY, PROTOCOL_TEXT
+
+RUNS = 200
+BAUDRATE = 9600
+BITS_PER_BYTE = 10
+
+
+#sends 'RUNS' manual configurations (waiting for DONE each time) and some trigger runs
+def run_headless(controller, emulator):
+    for protocol in (PROTOCOL_TEXT, PROTOCOL_BINARY):
+        controller.set_protocol(protocol)
+        controller.set_mode("Manual Mode")
+        for _ in range(RUNS // 2):
+            controller.send_configuration()
+            if controller.wait_for("DONE", timeout=5) is None:
+                raise TimeoutError("no DONE from the emulator")
+    #trigger mode (binary, the ACK means the arduino is armed)
+    controller.set_mode("Trigger Mode")
+    for _ in range(50):
+        controller.send_configuration()
+        controller.wait_for("ACK", timeout=5)
+        #let the 200ms debounce pass in virtual time, then press the button
+        emulator.advance(250)
+        emulator.press_button()
+        if controller.wait_for("DONE", timeout=5) is None:
+            raise TimeoutError("no DONE from the emulator")
+
+
+#the same manual runs through the GUI, returns the GUI's summary
+def run_through_gui():
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    spec = importlib.util.spec_from_file_location("gui", os.path.join(PROJECT_FOLDER, "GUI Test 1.py"))
+    gui = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(gui)
+    app = gui.QApplication(sys.argv[:1])
+    window = gui.systemGUI()
+    window.show()
+    with arduinoemulator(speed=None) as emulator:
+        controller = window.controller
+        controller.connect(emulator.port_name)
+        controller.wait_until_ready()
+        controller.set_protocol(PROTOCOL_TEXT)
+        for _ in range(RUNS // 2):
+            controller.send_configuration()
+            #keep the GUI thread running its event loop while we wait
+            while controller.wait_for("DONE", timeout=0) is None:
+                app.processEvents()
+        app.processEvents()
+        summary = controller.latency.summary()
+        window.close()
+    return summary
+
+
+if __name__ == "__main__":
+    with arduinoemulator(speed=None) as emulator:
+        controller = ledcontroller()
+        controller.set_flash_rate(4)
+        controller.set_flash_duration(30)
+        controller.set_pattern("L1:L2")
+        controller.connect(emulator.port_name)
+        controller.wait_until_ready()
+        run_headless(controller, emulator)
+        controller.disconnect()
+    print(f"headless, against the emulator ({RUNS} manual runs, 50 trigger runs):")
+    print(format_summary(controller.latency.summary()))
+
+    print(f"\nthrough the GUI thread ({RUNS // 2} manual runs, offscreen):")
+    print(format_summary(run_through_gui()))
+
+    #what the same bytes cost on the real link
+    text_bytes = len(b"SET 1 4 30 2\n") + len(b"Received: SET 1 4 30 2\r\n")
+    frame = encode_set_frame(1, 1, 4, 30, 2)
+    binary_bytes = len(frame) + len(encode_reply(decode_frame(frame)))
+    print(f"\non a real arduino at {BAUDRATE} baud, SET -> confirmed also needs "
+          f"{text_bytes * BITS_PER_BYTE / BAUDRATE * 1000:.1f} ms on the wire (text), "
+          f"{binary_bytes * BITS_PER_BYTE / BAUDRATE * 1000:.1f} ms (binary frame + ACK)")
+
+    #cost of the tracker per line in the reader thread
+    tracker = latencytracker()
+    lines = ["Received: SET 1 4 30 2", "Mode: 1", "Flash Rate: 4", "Duration: 30", "Pattern: 2",
+             "Manual Mode: Flashing started", "Flashing Pattern 2 at 4 Hz for 30 seconds.",
+             "Flashing finished", "DONE"]
+    start = time.perf_counter_ns()
+    for _ in range(20000):
+        tracker.sent("Manual Mode", time.perf_counter_ns())
+        for line in lines:
+            tracker.line(line, time.perf_counter_ns())
+    per_line = (time.perf_counter_ns() - start) / (20000 * len(lines))
+    print(f"tracker cost in the reader thread: {per_line:.0f} ns per line")
@@ -0,0 +1,120 @@
+
+#*****************BENCHMARK: LINK SPEED NEGOTIATION (9600 BAUD VS FASTER RATES)*****************
+# measures what negotiating a faster link speed (see the top of connection_manager.py) buys:
+#   1) connect -> ready, including the "BAUD" handshake
+#   2) SET -> flashing: a text SET until "Flashing Pattern ..." (the arduino echoes the
+#      command and prints the whole configuration first, about 150 bytes)
+#   3) binary SET -> ACK
+#   4) throughput: a burst of STATUS commands, bytes/s of the answers
+#   5) the fallbacks: a link that can not keep up with the fast rates, firmware that says
+#      "BAUD NO" and firmware from before the handshake (no answer at all)
+#
+# the emulator runs with wire_timing=True, so every byte takes as long as it would on a
+# real serial link at the negotiated rate (10 bits per byte), the pty itself has no limit
+#
+# run with:   python benchmarks/bench_link_speed.py
+import statistics #median
+import time #perf_counter
+
+import pty_pair #noqa: F401  (adds the project folder to the import path)
+
+from arduino_emulator import arduinoemulator
+from connection_manager import DEFAULT_BAUDRATE, LINK_RATES
+from led_controller import ledcontroller, PROTOCOL_BINARY, PROTOCOL_TEXT
+
+MAX_BAUDRATES = (DEFAULT_BAUDRATE,) + tuple(sorted(LINK_RATES))
+RUNS = 20
+BURST = 50
+
+
+#connects a ledcontroller that negotiates up to 'max_baudrate'
+#returns: (controller, seconds from connect to ready)
+def connect(emulator, max_baudrate):
+    controller = ledcontroller()
+    controller.set_max_baudrate(max_baudrate)
+    controller.set_flash_rate(100)
+    controller.set_flash_duration(30)
+    controller.set_pattern("L1:L2")
+    started = time.perf_counter()
+    controller.connect(emulator.port_name)
+    if not controller.wait_until_ready(10):
+        raise TimeoutError("the emulator never became ready")
+    return controller, time.perf_counter() - started
+
+
+#text SET -> "Flashing Pattern" and binary SET -> ACK, 'RUNS' times each (seconds)
+def set_latencies(controller):
+    results = {}
+    for protocol, answer in ((PROTOCOL_TEXT, "Flashing Pattern"), (PROTOCOL_BINARY, "ACK")):
+        controller.set_protocol(protocol)
+        times = []
+        for _ in range(RUNS):
+            after = controller.received_count
+            sent_at = time.perf_counter()
+            controller.send_configuration()
+            if controller.wait_for(answer, timeout=5, after=after) is None:
+                raise TimeoutError(f"no '{answer}' from the emulator")
+            times.append(time.perf_counter() - sent_at)
+            after = controller.received_count
+            controller.stop()
+            controller.wait_for("Flashing stopped", timeout=5, after=after)
+        results[protocol] = times
+    return results
+
+
+#sends BURST text STATUS commands in one go, returns the answers in bytes/s
+def status_throughput(controller):
+    after = controller.received_count
+    started = time.perf_counter()
+    controller.connection.write(b"STATUS\n" * BURST)
+    answers = 0
+    while answers < BURST:
+        line = controller.wait_for("Status:", timeout=5, after=after)
+        if line is None:
+            raise TimeoutError("STATUS answers went missing")
+        answers += 1
+        after = controller.received_count
+    seconds = time.perf_counter() - started
+    answer_bytes = BURST * (len("Received: STATUS\r\n") + len("Status: idle\r\n"))
+    return answer_bytes / seconds
+
+
+def compare_rates():
+    print(f"{'max rate':>10} {'link rate':>10} | {'ready':>8} | {'text SET->flashing':>19} | "
+          f"{'binary SET->ACK':>16} | {'throughput':>12}")
+    for max_baudrate in MAX_BAUDRATES:
+        with arduinoemulator(speed=1, wire_timing=True) as emulator:
+            controller, ready = connect(emulator, max_baudrate)
+            latencies = set_latencies(controller)
+            throughput = status_throughput(controller)
+            link_rate = controller.connection.link_rate
+            controller.disconnect()
+        print(f"{max_baudrate:>10} {link_rate:>10} | {ready * 1000:>6.0f}ms | "
+              f"{statistics.median(latencies[PROTOCOL_TEXT]) * 1000:>17.1f}ms | "
+              f"{statistics.median(latencies[PROTOCOL_BINARY]) * 1000:>14.1f}ms | "
+              f"{throughput:>8.0f} B/s")
+
+
+def fallbacks():
+    cases = (
+        ("1M/ 500k unreliable", {"unreliable_bauds": (1000000, 500000)}),
+        ("firmware says BAUD NO", {"supported_bauds": ()}),
+        ("firmware without BAUD", {"supported_bauds": None}),
+    )
+    print("\nfallbacks (negotiating up to 1000000 baud):")
+    for name, options in cases:
+        with arduinoemulator(speed=1, wire_timing=True, **options) as emulator:
+            controller, ready = connect(emulator, LINK_RATES[0])
+            link_rate = controller.connection.link_rate
+            #the link must still work after the fallback
+            after = controller.received_count
+            controller.request_status(protocol=PROTOCOL_TEXT)
+            works = controller.wait_for("Status:", timeout=2, after=after) is not None
+            controller.disconnect()
+        print(f"  {name:<22} ready after {ready * 1000:>5.0f}ms at {link_rate:>7} baud, "
+              f"link {'works' if works else 'DOES NOT WORK'}")
+
+
+if __name__ == "__main__":
+    compare_rates()
+    fallbacks()
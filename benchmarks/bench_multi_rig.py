@@ -0,0 +1,119 @@
+
+#*****************BENCHMARK: MANY RIGS FROM ONE APPLICATION*****************
+# drives 16 and 32 emulated arduinos (each on its own pty) through rig_registry.py and measures:
+#   1) connect_all(): every port opened and ready (they reset/ negotiate at the same time)
+#   2) send skew: first to last SET written, for
+#        - rigregistry.broadcast() (all frames built first, then one tight write loop)
+#        - calling send_configuration() on one rig after the other (the naive way)
+#   3) confirmation skew: first to last ACK read back
+#   4) reader threads: must be one per port
+#   5) a short run on every rig: DONE must come back from all of them
+#
+# the emulators run in a separate python process (like real arduinos, they do not share
+# the GIL with the application), in instant virtual time
+#
+# note: on a machine with one CPU the skew is mostly the operating system switching to the
+# reader threads (a pty wakes its reader up on every write), run it on a multi-core PC for
+# numbers close to real hardware
+#
+# run with:   python benchmarks/bench_multi_rig.py   (linux/ mac: ptys)
+import os #the emulator process' import path
+import statistics #median
+import subprocess #the emulator process
+import sys #the python that runs the emulators
+import time #perf_counter
+
+import pty_pair #noqa: F401  (adds the project folder to the import path)
+
+from rig_registry import rigregistry
+
+RIG_COUNTS = (16, 32)
+BROADCASTS = 20
+SETTINGS = {"mode": "Manual Mode", "flash_rate": 10, "flash_duration": 30, "pattern": "L1:L2"}
+
+#started with 'python -c': prints one port name per emulator, runs until stdin is closed
+EMULATOR_HOST = """
+import sys
+from arduino_emulator import arduinoemulator
+emulators = [arduinoemulator(speed=None) for _ in range(int(sys.argv[1]))]
+for emulator in emulators:
+    print(emulator.start(), flush=True)
+sys.stdin.read()
+for emulator in emulators:
+    emulator.stop()
+"""
+
+
+#function to start 'count' emulators in another process
+#returns: (the process, the port names)
+def start_emulators(count):
+    environment = dict(os.environ, PYTHONPATH=pty_pair.PROJECT_FOLDER)
+    process = subprocess.Popen([sys.executable, "-c", EMULATOR_HOST, str(count)],
+                               stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, env=environment)
+    return process, [process.stdout.readline().strip() for _ in range(count)]
+
+
+#BROADCASTS broadcasts, returns (send skews, confirmation skews) in us
+def prepared_skews(registry):
+    send, confirm = [], []
+    for _ in range(BROADCASTS):
+        report = registry.broadcast(confirm_timeout=2)
+        if report["failed"] or report["confirm_skew_us"] is None:
+            raise TimeoutError(f"broadcast failed: {report['failed'] or 'confirmations missing'}")
+        send.append(report["skew_us"])
+        confirm.append(report["confirm_skew_us"])
+        time.sleep(0.05)
+    return send, confirm
+
+
+#the same with send_configuration() on one rig after the other, returns the send skews in us
+def naive_skews(registry):
+    skews = []
+    for _ in range(BROADCASTS):
+        sent_at = []
+        for each in registry.select():
+            sent_at.append(time.perf_counter_ns())
+            each.controller.send_configuration()
+        skews.append((sent_at[-1] - sent_at[0]) / 1000)
+        registry.wait_for_all("ACK", timeout=2)
+        time.sleep(0.05)
+    return skews
+
+
+def run(count):
+    process, ports = start_emulators(count)
+    registry = rigregistry()
+    try:
+        for number, port_name in enumerate(ports, start=1):
+            registry.add_rig(f"rig{number}", port_name)
+        started = time.perf_counter()
+        results = registry.connect_all(timeout=10)
+        connect_ms = (time.perf_counter() - started) * 1000
+        if not all(result is True for result in results.values()):
+            raise TimeoutError("not every emulator became ready")
+        readers = sum(each.controller.connection.reader_thread_count() for each in registry.select())
+
+        registry.configure(SETTINGS)
+        send, confirm = prepared_skews(registry)
+        naive = naive_skews(registry)
+
+        #a short run: DONE from every rig
+        registry.configure({"flash_duration": 1})
+        registry.broadcast()
+        done = registry.wait_for_all("DONE", timeout=10)
+        done_count = sum(line is not None for line in done.values())
+    finally:
+        registry.disconnect_all()
+        process.stdin.close()
+        process.wait()
+
+    print(f"{count} rigs: all ready in {connect_ms:.0f}ms, {readers} reader threads, DONE from {done_count}/{count}")
+    print(f"  send skew    broadcast()           median {statistics.median(send):>7.0f}us  max {max(send):>7.0f}us")
+    print(f"  send skew    send_configuration()  median {statistics.median(naive):>7.0f}us  max {max(naive):>7.0f}us")
+    print(f"  confirm skew broadcast()           median {statistics.median(confirm):>7.0f}us  max {max(confirm):>7.0f}us")
+
+
+if __name__ == "__main__":
+    print(f"{BROADCASTS} broadcasts per test, {os.cpu_count()} CPU(s)")
+    for count in RIG_COUNTS:
+        run(count)
@@ -0,0 +1,106 @@
+
+#*****************BENCHMARK: PATTERN TIMING, delay() STEPS VS COMPILED TABLES*****************
+# compares the timing of the old flash loop (every step is delay(1000 / (rate * 2)) whole
+# milliseconds) with the compiled pattern tables replayed on micros() (pattern_compiler.py):
+#   1) simulated arduino uno (flash_engine.simulate(): micros() in 4us steps, 4us per
+#      digitalWrite, 12us per pass of loop()): how far the LED changes are from the exact
+#      times, and how far off the last change of a 30s run is
+#   2) the emulator (arduino_emulator.py) flashing a custom pattern uploaded by the
+#      ledcontroller: its LED changes must be exactly the ones the simulator predicts
+#   3) what uploading a table costs on the real 9600 baud link (it is only done once)
+#
+# run with:   python benchmarks/bench_pattern_timing.py
+import pty_pair #noqa: F401  (adds the project folder to the import path)
+
+from arduino_emulator import arduinoemulator, DIGITAL_WRITE_US
+from binary_protocol import encode_frame, encode_pattern_payloads, FRAME_PATTERN, MIN_FRAME_SIZE, PATTERN_MAX_STEPS
+from led_controller import ledcontroller
+from flash_engine import ideal_changes, simulate, timing_error, UNO_DIGITAL_WRITE_US
+from pattern_compiler import builtin_table, compile_pattern, MASK_LED1, MASK_LED2
+
+DURATION = 30 #seconds
+RATES = (1, 3, 7, 60, 333, 500, 600, 1000)
+BAUDRATE = 9600
+BITS_PER_BYTE = 10
+
+
+#a copy of the OLD firmware's flash loop (delay() based, duration checked once per cycle)
+#returns: LED changes like flash_engine.simulate()
+def legacy_changes(pattern_number, flash_rate, flash_duration):
+    delay_us = (1000 // (flash_rate * 2)) * 1000
+    #one cycle of each pattern: the LED mask written before each delay()
+    cycle = [mask for mask, _ in builtin_table(pattern_number, flash_rate)]
+    now = 0
+    mask_now = 0
+    changes = []
+    while now // 1000 < flash_duration * 1000:
+        for mask in cycle:
+            #pattern 1/ 3/ 4 write one LED per step, pattern 2 writes both
+            now += UNO_DIGITAL_WRITE_US * (2 if pattern_number == 2 else 1)
+            if mask != mask_now:
+                mask_now = mask
+                changes.append((now, mask))
+            now += delay_us
+        if delay_us == 0 and now > flash_duration * 1000000:
+            break
+    changes.append((now + UNO_DIGITAL_WRITE_US, 0))
+    return changes
+
+
+def compare_simulated():
+    print(f"simulated arduino uno, pattern 3 (L1:L1:L2) for {DURATION}s, error of the LED changes:")
+    print(f"{'rate':>6} | {'old: step':>10}{'mean':>10}{'last':>12} | {'table: step':>12}{'mean':>8}{'last':>8}")
+    for rate in RATES:
+        table = builtin_table(3, rate)
+        ideal = ideal_changes(table, DURATION)
+        old = timing_error(legacy_changes(3, rate, DURATION), ideal)
+        new = timing_error(simulate(table, DURATION), ideal)
+        old_step = 1000 // (rate * 2)
+        old_text = (f"{old_step:>8}ms{old['mean'] / 1000:>8.1f}ms{old['last'] / 1000:>+10.1f}ms"
+                    if old_step else f"{'0ms':>10}{'(LEDs never flash)':>22}")
+        print(f"{rate:>4}Hz | {old_text} | {table[0][1]:>10}us{new['mean']:>6.1f}us{new['last']:>+6}us")
+
+
+def compare_emulator():
+    pattern = "L1@3ms/7ms:L1+L2@1.5ms:OFF@25ms:L2@250us/0.75ms"
+    rate = 4
+    duration = 2
+    table = compile_pattern(pattern, rate)
+    with arduinoemulator(speed=None) as emulator:
+        controller = ledcontroller()
+        controller.set_flash_rate(rate)
+        controller.set_flash_duration(duration)
+        controller.set_pattern(pattern)
+        controller.connect(emulator.port_name)
+        controller.wait_until_ready()
+        print(f"\nemulator: {controller.send_configuration()}")
+        if controller.wait_for("DONE", timeout=10) is None:
+            raise TimeoutError("no DONE from the emulator")
+        controller.disconnect()
+        events = list(emulator.led_events)
+    #the emulator's micros() counts in 1us steps, the flash loop starts at its first write
+    start = events[0][0] - DIGITAL_WRITE_US * (1 if events[0][1] else 2)
+    changes = [(time_us - start, (MASK_LED1 if led1 else 0) | (MASK_LED2 if led2 else 0))
+               for time_us, led1, led2 in events]
+    #(the emulator sleeps until the next step instead of spinning, like a loop() pass of 1us)
+    expected = simulate(table, duration, loop_us=1, micros_resolution_us=1, digital_write_us=DIGITAL_WRITE_US)
+    print(f"  '{pattern}' at {rate} Hz for {duration}s: {len(changes)} LED changes, "
+          f"{'the same as the simulator' if changes == expected else 'DIFFERENT from the simulator'}")
+    result = timing_error(changes, ideal_changes(table, duration))
+    print(f"  error against the exact times: mean {result['mean']:.1f}us, max {result['max']}us")
+
+
+def upload_cost():
+    table = [(MASK_LED1, 1000), (0, 1000)] * (PATTERN_MAX_STEPS // 2)
+    payloads = encode_pattern_payloads(table)
+    sent = sum(len(encode_frame(FRAME_PATTERN, 0, payload)) for payload in payloads)
+    acks = len(payloads) * (MIN_FRAME_SIZE + 1)
+    print(f"\nuploading a full table ({PATTERN_MAX_STEPS} steps): {len(payloads)} frames, {sent} bytes + "
+          f"{acks} bytes of ACKs = {(sent + acks) * BITS_PER_BYTE / BAUDRATE * 1000:.0f} ms at {BAUDRATE} baud "
+          f"(once, the arduino keeps the table until it resets)")
+
+
+if __name__ == "__main__":
+    compare_simulated()
+    compare_emulator()
+    upload_cost()
@@ -0,0 +1,59 @@
+
+#*****************BENCHMARK: IDLE TIME BETWEEN TRIALS IN A SEQUENCE*****************
+# runs a sequence of 30 second trials through the sequence scheduler against the emulator
+# (in instant virtual time, so only the host/ pty turnaround is measured) and reports the
+# idle time between trials ("DONE" -> the arduino's first answer to the next trial):
+#   - streamed: the next trial is sent when "DONE" arrives (text and binary)
+#   - prestaged: the next trial is already queued on the arduino (NEXT, text and binary)
+# before the scheduler, the idle time was however long the operator took to notice
+# "DONE", type the next values and click "Start Flashing" (seconds per trial)
+#
+# on a real arduino a streamed trial also waits for the packet to cross the 9600 baud
+# link, that time is printed too (the pty has no baud rate limit)
+#
+# run with:   python benchmarks/bench_sequence.py
+import statistics #median
+
+import pty_pair #noqa: F401  (adds the project folder to the import path)
+
+from arduino_emulator import arduinoemulator
+from binary_protocol import encode_set_frame
+from led_controller import ledcontroller, PROTOCOL_BINARY, PROTOCOL_TEXT
+from sequence_scheduler import sequencescheduler, trial
+
+TRIALS = 100
+BAUDRATE = 9600
+BITS_PER_BYTE = 10
+
+
+#runs the sequence once, returns the scheduler's report
+def run_sequence(protocol, prestage):
+    trials = [trial("Manual Mode", 4 + number % 5, 30, "L1:L2") for number in range(TRIALS)]
+    with arduinoemulator(speed=None) as emulator:
+        controller = ledcontroller()
+        controller.set_protocol(protocol)
+        controller.connect(emulator.port_name)
+        controller.wait_until_ready()
+        scheduler = sequencescheduler(controller, trials, prestage=prestage)
+        scheduler.start()
+        report = scheduler.wait(60)
+        controller.disconnect()
+    if report is None or report["completed"] != TRIALS:
+        raise RuntimeError(f"the sequence did not finish: {report}")
+    return report
+
+
+if __name__ == "__main__":
+    print(f"idle time between trials ({TRIALS} trials of 30 s, instant virtual time):")
+    for name, protocol, prestage in (("streamed, text", PROTOCOL_TEXT, False),
+                                     ("streamed, binary", PROTOCOL_BINARY, False),
+                                     ("prestaged, text", PROTOCOL_TEXT, True),
+                                     ("prestaged, binary", PROTOCOL_BINARY, True)):
+        gaps = [gap * 1e6 for gap in run_sequence(protocol, prestage)["idle_gaps"]]
+        print(f"  {name:<18} median {statistics.median(gaps):8.1f} us   max {max(gaps):8.1f} us   "
+              f"total {sum(gaps) / 1000:7.1f} ms")
+
+    #what the packet alone costs on the real link for a streamed trial
+    for name, size in (("text", len(b"SET 1 4 30 2\n")), ("binary", len(encode_set_frame(1, 1, 4, 30, 2)))):
+        print(f"  + on a real arduino, a streamed {name} packet takes {size * BITS_PER_BYTE / BAUDRATE * 1000:.1f} ms "
+              f"to cross the {BAUDRATE} baud link (prestaged: already there)")
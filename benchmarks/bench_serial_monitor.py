@@ -0,0 +1,96 @@
+
+#*****************BENCHMARK: SERIAL MONITOR RENDERING*****************
+# pushes a lot of lines through 'data_received_signal' (from a background thread,
+# like the real reader thread does) and measures:
+#   - how long it takes until every line has been handled by the GUI
+#   - the longest time the Qt event loop was blocked (measured with a 5ms heartbeat timer)
+#   - the peak memory (RSS) of the process
+#
+# two modes are compared, each in a fresh python process so the memory numbers are fair:
+#   legacy: QTextEdit.append() once per line, no limit (how the GUI used to work)
+#   new:    ring buffer + batched flush on a frame timer + QPlainTextEdit with a line limit
+#
+# run with:   python benchmarks/bench_serial_monitor.py [lines]
+import os #environment for the child processes
+import subprocess #each mode runs in its own process
+import sys #python executable, arguments
+
+from pty_pair import PROJECT_FOLDER
+
+#how many lines to push through the signal (can be changed on the command line)
+DEFAULT_LINES = 100000
+
+#the code run in the child process
+#args: project folder, mode ("legacy" or "new"), number of lines
+CHILD = r"""
+import importlib.util, os, resource, sys, threading, time
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+folder, mode, line_count = sys.argv[1], sys.argv[2], int(sys.argv[3])
+spec = importlib.util.spec_from_file_location("gui", os.path.join(folder, "GUI Test 1.py"))
+gui = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(gui)
+from PyQt6.QtCore import QTimer
+from PyQt6.QtWidgets import QTextEdit
+
+app = gui.QApplication(sys.argv[:1])
+window = gui.systemGUI()
+window.show()
+signal = window.serialthreadhandler.data_received_signal
+
+handled = [0]
+if mode == "legacy":
+    #put the old unbounded QTextEdit back and append once per line
+    legacy = QTextEdit()
+    legacy.setReadOnly(True)
+    window.centralWidget().layout().replaceWidget(window.serial_monitor, legacy)
+    window.serial_monitor.hide()
+    signal.disconnect()
+    def on_line(message):
+        legacy.append(message)
+        handled[0] += 1
+    signal.connect(on_line)
+else:
+    #count the lines as they arrive, the GUI's own slot does the buffering/ rendering
+    signal.connect(lambda message: handled.__setitem__(0, handled[0] + 1))
+
+#heartbeat: the biggest gap between two 5ms ticks is the longest event loop stall
+longest_gap = [0.0]
+last_tick = [time.perf_counter()]
+def tick():
+    now = time.perf_counter()
+    longest_gap[0] = max(longest_gap[0], now - last_tick[0])
+    last_tick[0] = now
+heartbeat = QTimer()
+heartbeat.timeout.connect(tick)
+heartbeat.start(5)
+
+def produce():
+    for number in range(line_count):
+        signal.emit(f"Arduino: LINE {number} BUTTON PRESSED - TRIGGERING LED")
+
+for _ in range(20):
+    app.processEvents()
+rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+start = time.perf_counter()
+last_tick[0] = start
+producer = threading.Thread(target=produce)
+producer.start()
+while handled[0] < line_count or (mode == "new" and window.serial_monitor_pending):
+    app.processEvents()
+elapsed = time.perf_counter() - start
+producer.join()
+rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(f"{elapsed:.3f} {longest_gap[0] * 1000:.1f} {rss_before / 1024:.1f} {rss_after / 1024:.1f}")
+"""
+
+
+if __name__ == "__main__":
+    line_count = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_LINES
+    environment = dict(os.environ, QT_QPA_PLATFORM="offscreen")
+    print(f"{line_count} lines through data_received_signal:")
+    for mode in ("legacy", "new"):
+        output = subprocess.run([sys.executable, "-c", CHILD, PROJECT_FOLDER, mode, str(line_count)],
+                                capture_output=True, text=True, check=True, env=environment).stdout
+        elapsed, longest_stall, rss_before, rss_after = (float(value) for value in output.split()[-4:])
+        print(f"  {mode:<7} done in {elapsed:7.2f} s   longest event loop stall {longest_stall:8.1f} ms   "
+              f"peak RSS {rss_after:7.1f} MB (+{rss_after - rss_before:.1f} MB)")
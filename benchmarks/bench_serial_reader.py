@@ -0,0 +1,115 @@
+
+#*****************BENCHMARK: SERIAL READER*****************
+# compares the old reader loop (readline() + time.sleep(0.1)) against the new
+# event-driven 'seriallinereader' (serial_line_reader.py)
+#
+# a pty pair stands in for the arduino (see pty_pair.py), so no hardware is needed
+#
+# we measure:
+#   1) line latency: time from writing a line on the 'arduino' side to the reader
+#      getting it. Lines are sent in groups of 7 every 0.5s, just like the echo the
+#      arduino prints after a SET packet ("Received:", "Mode:", "Flash Rate:", ...)
+#   2) throughput: lines per second when the 'arduino' sends a burst of lines
+#
+# run with:   python benchmarks/bench_serial_reader.py
+import os #closing the pty
+import statistics #mean/ percentiles
+import threading #the fake arduino writes from its own thread
+import time #perf_counter_ns for timestamps
+
+from pty_pair import open_pty_pair, write_all
+
+import serial #pyserial opens the slave end of the pty like a COM port
+
+from serial_line_reader import seriallinereader, READ_TIMEOUT
+
+
+#the old loop from 'GUI Test 1.py' before it was replaced (kept here so we can compare)
+#calls on_line(line) for every line read
+def legacy_reader_loop(port, on_line, running):
+    while running.is_set():
+        line = port.readline().decode("utf-8").strip()
+        if line:
+            on_line(line)
+        time.sleep(0.1)
+
+
+#the new loop that 'serialclass.readserialmethod' uses now
+def new_reader_loop(port, on_line, running):
+    reader = seriallinereader(port)
+    while running.is_set():
+        for line in reader.read_lines():
+            on_line(line)
+
+
+#function that runs one reader loop against a fake arduino
+#args:
+#   reader_loop: legacy_reader_loop or new_reader_loop
+#   line_count: how many lines the fake arduino sends
+#   gap: seconds between groups of lines (0 = send them all in one burst)
+#   group: how many lines are written together before each gap
+#returns: (list of latencies in ns, total seconds from first write to last line read)
+def run_once(reader_loop, line_count, gap, group=1):
+    master_fd, slave_name = open_pty_pair()
+    port = serial.Serial(slave_name, 9600, timeout=READ_TIMEOUT)
+
+    sent_at = [0] * line_count
+    latencies = []
+    all_received = threading.Event()
+
+    #called by the reader for every line, the line is "LINE <number>"
+    def on_line(line):
+        number = int(line.split()[1])
+        latencies.append(time.perf_counter_ns() - sent_at[number])
+        if len(latencies) == line_count:
+            all_received.set()
+
+    running = threading.Event()
+    running.set()
+    reader_thread = threading.Thread(target=reader_loop, args=(port, on_line, running), daemon=True)
+    reader_thread.start()
+
+    start = time.perf_counter()
+    if gap:
+        for first in range(0, line_count, group):
+            numbers = range(first, min(first + group, line_count))
+            now = time.perf_counter_ns()
+            for number in numbers:
+                sent_at[number] = now
+            write_all(master_fd, b"".join(f"LINE {number}\r\n".encode() for number in numbers))
+            time.sleep(gap)
+    else:
+        #burst: every line gets the same 'sent' timestamp, written in one go
+        now = time.perf_counter_ns()
+        for number in range(line_count):
+            sent_at[number] = now
+        write_all(master_fd, b"".join(f"LINE {number}\r\n".encode() for number in range(line_count)))
+
+    all_received.wait(timeout=120)
+    elapsed = time.perf_counter() - start
+
+    running.clear()
+    reader_thread.join()
+    port.close()
+    os.close(master_fd)
+    return latencies, elapsed
+
+
+#prints latency statistics in milliseconds
+def report_latency(name, latencies):
+    ms = sorted(value / 1e6 for value in latencies)
+    p95 = ms[min(len(ms) - 1, int(len(ms) * 0.95))]
+    print(f"  {name:<8} mean {statistics.mean(ms):8.2f} ms   p95 {p95:8.2f} ms   max {ms[-1]:8.2f} ms")
+
+
+if __name__ == "__main__":
+    print("line latency (5 groups of 7 lines, 0.5 s apart):")
+    for name, loop in (("legacy", legacy_reader_loop), ("new", new_reader_loop)):
+        latencies, _ = run_once(loop, 35, 0.5, group=7)
+        report_latency(name, latencies)
+
+    print("throughput (burst of lines):")
+    #the old loop only manages ~10 lines/s, so we give it fewer lines to keep the run short
+    for name, loop, count in (("legacy", legacy_reader_loop, 30), ("new", new_reader_loop, 20000)):
+        latencies, elapsed = run_once(loop, count, 0)
+        print(f"  {name:<8} {len(latencies)} lines in {elapsed:6.2f} s = {len(latencies) / elapsed:10.0f} lines/s")
@@ -0,0 +1,78 @@
+
+#*****************BENCHMARK: SESSION RECORDER*****************
+# 1) cost of record() for the thread that calls it (the serial reader thread), and how fast
+#    the writer thread gets the records to disk
+# 2) the same lines written the simple way (open the file, write the line, flush + fsync
+#    for every line), to show what the bounded queue/ batching saves
+# 3) memory: the queue is bounded, so a burst far bigger than the queue only drops records
+#    (and counts them) instead of growing memory
+# 4) loading a long session back into NumPy arrays (1 million records is about a full day
+#    of an arduino printing 10 lines per second)
+#
+# run with:   python benchmarks/bench_session_recorder.py
+import os #fsync/ file sizes
+import shutil #removing the temporary folder
+import tempfile #the logs are written to a temporary folder
+import time #perf_counter
+import tracemalloc #peak memory
+
+import pty_pair #noqa: F401  (adds the project folder to the import path)
+
+from session_recorder import sessionrecorder, load_session, RECORD_RECEIVED
+
+LINES = 1000000
+FSYNC_LINES = 2000
+LINE = "Flashing Pattern 2 at 4 Hz for 30 seconds."
+
+
+if __name__ == "__main__":
+    folder = tempfile.mkdtemp()
+    try:
+        #1) record() cost and writer throughput (the queue is big enough for everything here)
+        recorder = sessionrecorder(folder, name="bench", queue_size=LINES + 1, max_file_bytes=16 * 1024 * 1024)
+        recorder.start()
+        start = time.perf_counter()
+        for _ in range(LINES):
+            recorder.record(RECORD_RECEIVED, LINE)
+        queued = time.perf_counter() - start
+        recorder.stop()
+        written = time.perf_counter() - start
+        status = recorder.status()
+        print(f"recorded {status['written']} lines into {len(status['files'])} rotated files "
+              f"({status['bytes'] / 1e6:.1f} MB, {status['dropped']} dropped):")
+        print(f"  record() in the calling thread: {queued / LINES * 1e9:6.0f} ns per line")
+        print(f"  on disk (writer thread, fsync at the end only): {LINES / written:,.0f} lines/s")
+
+        #2) one write + flush + fsync per line
+        path = os.path.join(folder, "fsync_per_line.txt")
+        start = time.perf_counter()
+        with open(path, "a") as file:
+            for _ in range(FSYNC_LINES):
+                file.write(f"{time.perf_counter_ns()} {LINE}\n")
+                file.flush()
+                os.fsync(file.fileno())
+        elapsed = time.perf_counter() - start
+        print(f"  simple way (flush + fsync every line): {elapsed / FSYNC_LINES * 1e6:6.0f} us per line "
+              f"in the calling thread ({FSYNC_LINES / elapsed:,.0f} lines/s)")
+
+        #3) a burst much bigger than the default queue, with the memory traced
+        tracemalloc.start()
+        recorder = sessionrecorder(folder, name="burst")
+        recorder.start()
+        for _ in range(LINES):
+            recorder.record(RECORD_RECEIVED, LINE)
+        recorder.stop()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        status = recorder.status()
+        print(f"burst of {LINES} lines with the default queue: peak memory {peak / 1e6:.1f} MB, "
+              f"{status['written']} written, {status['dropped']} dropped (counted)")
+
+        #4) loading the 1 million line session back
+        start = time.perf_counter()
+        session = load_session(os.path.join(folder, "bench"))
+        elapsed = time.perf_counter() - start
+        print(f"load_session: {len(session['timestamp_ns'])} records in {elapsed:.2f} s "
+              f"({len(session['timestamp_ns']) / elapsed:,.0f} records/s)")
+    finally:
+        shutil.rmtree(folder)
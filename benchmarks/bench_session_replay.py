@@ -0,0 +1,46 @@
+
+#*****************BENCHMARK: SESSION REPLAY*****************
+# 1) how well the replayer (session_replay.py) keeps the recorded timing: every line is due
+#    at (its recorded time - the first one)/ speed, the error is when it was really played
+# 2) the GUI (headless, offscreen) with the synthetic sources replayed at 1x, 10x and as fast
+#    as possible: event loop lag, dropped/ coalesced updates and memory
+#
+# run with:   python benchmarks/bench_session_replay.py
+import time #perf_counter_ns
+
+import pty_pair #noqa: F401  (adds the project folder to the import path)
+
+from latency_metrics import percentile
+from session_replay import done_cycles, format_replay_report, run_gui_replay, sessionreplayer, trigger_burst
+
+#(source name, the records, speeds to replay them at)
+GUI_RUNS = (
+    ("trigger-burst (2000 triggers, 2ms apart)", lambda: trigger_burst(2000), (1.0, 10.0, None)),
+    ("done-cycles (an hour of 1s runs)", lambda: done_cycles(3600), (None,)),
+)
+
+
+def timing_error():
+    records = list(done_cycles(count=10, run_seconds=0.05, gap_ms=5))
+    print(f"timing error of the replayer alone ({len(records)} lines, p50/ p99/ max of played - due):")
+    for speed in (1.0, 10.0):
+        played = []
+        replayer = sessionreplayer(records, on_line=lambda line: played.append(time.perf_counter_ns()), speed=speed)
+        replayer.start()
+        replayer.wait()
+        errors = sorted((at - replayer.started_ns - (record[0] - records[0][0]) / speed) / 1000
+                        for at, record in zip(played, records))
+        print(f"  {speed:>4g}x  {percentile(errors, 0.5):>7.0f}us {percentile(errors, 0.99):>7.0f}us "
+              f"{errors[-1]:>7.0f}us  (negative = early, records due within 0.2ms are not waited for)")
+
+
+def gui_replays():
+    for name, records, speeds in GUI_RUNS:
+        for speed in speeds:
+            print(f"{name}:")
+            print(format_replay_report(run_gui_replay(records(), speed)))
+
+
+if __name__ == "__main__":
+    timing_error()
+    gui_replays()
@@ -0,0 +1,115 @@
+
+#*****************BENCHMARK: SOFTWARE TRIGGER*****************
+# how close to the asked-for time the software trigger (ledcontroller.schedule_trigger())
+# starts a run, against the emulator at speed 1: its micros() is perf_counter() - clock.start,
+# so the time the first LED really came on is known on the PC's clock
+#   1) the clock sync alone (SYNC round trip, jitter, the bound from the round trip) and then
+#      RUNS triggers, each one TRIGGER_AHEAD_MS ahead, on a pty at full speed and on a 115200
+#      baud link with wire timing. The errors (p50/ p99/ max of |error|, mean signed):
+#        late:      started - scheduled on the arduino's clock (how long loop() took to get there)
+#        estimate:  started on the PC's clock from the clock estimate - when the LED came on
+#        true:      when the LED came on - the time asked for (what a camera would see)
+#      (on the emulator 'late' is now and then a few ms: its python thread waits for the GIL/
+#      the OS, the firmware spins in loop() and is late by one pass, ~12-20us on an uno)
+#   2) a crystal that is DRIFT_PPM fast: one sync vs two syncs DRIFT_SPAN_S apart (the rate is
+#      fitted), trigger DRIFT_AHEAD_S after the last sync
+#
+# run with:   python benchmarks/bench_software_trigger.py
+import time #perf_counter_ns/ sleep
+
+import pty_pair #noqa: F401  (adds the project folder to the import path)
+
+from arduino_emulator import arduinoemulator
+from clock_sync import error_summary
+from led_controller import ledcontroller
+
+RUNS = 10
+TRIGGER_AHEAD_MS = 100
+#(name, fastest link rate, wire timing)
+LINKS = (
+    ("pty (no wire time)", 1000000, False),
+    ("115200 baud, wire timing", 115200, True),
+)
+DRIFT_PPM = 800
+DRIFT_SPAN_S = 1.5
+DRIFT_AHEAD_S = 1.0
+
+
+#connects a controller to a new emulator and arms trigger mode (10 Hz for 1 s)
+def connect(emulator, max_baudrate):
+    controller = ledcontroller()
+    controller.set_max_baudrate(max_baudrate)
+    controller.connect(emulator.start())
+    controller.wait_until_ready()
+    #(the link speed handshake finishes after the banner)
+    time.sleep(0.3)
+    controller.set_mode("Trigger Mode")
+    controller.set_flash_rate(10)
+    controller.set_flash_duration(1)
+    return controller
+
+
+#arms the trigger, schedules it 'ahead_s' from now and waits for the run to finish
+#returns: (report, PC time ns the first LED really came on)
+def triggered_run(controller, emulator, ahead_s):
+    controller.send_configuration()
+    controller.wait_for("ACK SET", timeout=2)
+    first_event = len(emulator.led_events)
+    requested_ns = time.perf_counter_ns() + int(ahead_s * 1e9)
+    controller.schedule_trigger(at_ns=requested_ns)
+    report = controller.wait_for_trigger(timeout=ahead_s + 2)
+    controller.wait_for("DONE", timeout=3)
+    micros = next(event[0] for event in emulator.led_events[first_event:] if event[1] or event[2])
+    return report, emulator.clock.start * 1e9 + micros * 1000 / emulator.clock.rate
+
+
+def format_errors(name, errors):
+    summary = error_summary(errors)
+    return (f"    {name:<10} p50 {summary['p50']:>7.1f}us  p99 {summary['p99']:>7.1f}us  "
+            f"max {summary['max']:>7.1f}us  mean {summary['mean']:>+8.1f}us")
+
+
+def trigger_errors():
+    for name, max_baudrate, wire_timing in LINKS:
+        emulator = arduinoemulator(wire_timing=wire_timing)
+        controller = connect(emulator, max_baudrate)
+        try:
+            estimate = controller.sync_clock()
+            print(f"{name} ({controller.connection.link_rate} baud): sync round trip {estimate['round_trip_us']:.0f}us, "
+                  f"jitter {estimate['jitter_us']:.1f}us, bound {estimate['bound_us']:.1f}us")
+            late, estimated, true = [], [], []
+            for _ in range(RUNS):
+                report, on_ns = triggered_run(controller, emulator, TRIGGER_AHEAD_MS / 1000)
+                late.append(report["late_us"])
+                estimated.append((report["started_ns"] - on_ns) / 1000)
+                true.append((on_ns - report["requested_ns"]) / 1000)
+            print(f"  {RUNS} triggers {TRIGGER_AHEAD_MS}ms ahead:")
+            print(format_errors("late", late))
+            print(format_errors("estimate", estimated))
+            print(format_errors("true", true))
+        finally:
+            controller.disconnect()
+            emulator.stop()
+
+
+def drift():
+    print(f"a crystal {DRIFT_PPM}ppm fast, trigger {DRIFT_AHEAD_S:g}s after the last sync:")
+    for name, syncs in (("one sync", 1), (f"two syncs {DRIFT_SPAN_S:g}s apart", 2)):
+        emulator = arduinoemulator(clock_drift_ppm=DRIFT_PPM)
+        controller = connect(emulator, 1000000)
+        try:
+            for number in range(syncs):
+                if number:
+                    time.sleep(DRIFT_SPAN_S)
+                estimate = controller.sync_clock()
+            report, on_ns = triggered_run(controller, emulator, DRIFT_AHEAD_S)
+            print(f"  {name:<22} fitted drift {estimate['drift_ppm']:>6.0f}ppm, "
+                  f"true error {(on_ns - report['requested_ns']) / 1000:>+7.1f}us")
+        finally:
+            controller.disconnect()
+            emulator.stop()
+
+
+if __name__ == "__main__":
+    trigger_errors()
+    drift()
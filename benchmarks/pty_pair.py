@@ -0,0 +1,37 @@
+
+#*****************PTY PAIR HELPER FOR THE BENCHMARKS*****************
+# the benchmarks need something that looks like a COM port without an arduino
+# plugged in. On linux/ mac a pseudo-terminal (pty) does exactly that:
+#   - the 'master' end is a file descriptor we write to (pretending to be the arduino)
+#   - the 'slave' end has a device name (like /dev/pts/5) that pyserial can open
+#     exactly like it would open COM3 or /dev/ttyACM0
+import os #file descriptors
+import sys #so the benchmarks can import the modules in the folder above
+import tty #puts the pty into raw mode (no echo, no line editing)
+
+#let every benchmark import the project modules (serial_line_reader.py etc.)
+PROJECT_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_FOLDER not in sys.path:
+    sys.path.insert(0, PROJECT_FOLDER)
+
+
+#function to open a pty pair
+#returns: (master file descriptor, slave device name)
+def open_pty_pair():
+    master_fd, slave_fd = os.openpty()
+    #raw mode: bytes go through untouched (no echo back to us, no '\n' -> '\r\n')
+    tty.setraw(master_fd)
+    tty.setraw(slave_fd)
+    slave_name = os.ttyname(slave_fd)
+    #pyserial opens the slave by name, so we can close our copy of the slave fd
+    #(the pty stays alive as long as the master is open)
+    os.close(slave_fd)
+    return master_fd, slave_name
+
+
+#function to write all of 'data' to a file descriptor (os.write may write only part of it)
+def write_all(fd, data):
+    view = memoryview(data)
+    while view:
+        written = os.write(fd, view)
+        view = view[written:]
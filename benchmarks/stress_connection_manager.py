@@ -0,0 +1,76 @@
+
+#*****************STRESS TEST: CONNECTION MANAGER*****************
+# connects and disconnects the 'connectionmanager' (connection_manager.py) over and
+# over on pty pairs and checks that no reader threads are leaked
+#
+# checks:
+#   1) after every connect there is exactly 1 reader thread, after every disconnect 0
+#   2) switching between two ports never leaves the old thread running
+#   3) lines sent after a reconnect all arrive exactly once (no thread steals them)
+#   4) when the 'arduino' disappears the manager goes to 'reconnecting' and can
+#      still be shut down cleanly
+#
+# run with:   python benchmarks/stress_connection_manager.py [cycles]
+import os #closing the pty
+import sys #command line arguments
+import threading #counting threads
+import time #timing the cycles
+
+from pty_pair import open_pty_pair, write_all
+
+from connection_manager import connectionmanager, DEFAULT_BAUDRATE, STATE_RECONNECTING
+
+
+#waits up to 'timeout' seconds for check() to return True
+def wait_until(check, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if check():
+            return True
+        time.sleep(0.001)
+    return check()
+
+
+if __name__ == "__main__":
+    cycles = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+
+    received = []
+    manager = connectionmanager(on_line=received.append, reconnect_delays=(0.05,), max_baudrate=DEFAULT_BAUDRATE)
+    master_a, name_a = open_pty_pair()
+    master_b, name_b = open_pty_pair()
+    threads_before = threading.active_count()
+
+    #1) + 2) connect/ disconnect cycles, switching port every other cycle
+    start = time.perf_counter()
+    for cycle in range(cycles):
+        manager.connect(name_a if cycle % 2 == 0 else name_b)
+        assert manager.reader_thread_count() == 1, manager.status()
+        #a second connect without a disconnect is a 'port switch'
+        manager.connect(name_b if cycle % 2 == 0 else name_a)
+        assert manager.reader_thread_count() == 1, manager.status()
+        manager.disconnect()
+        assert manager.reader_thread_count() == 0, manager.status()
+        assert threading.active_count() == threads_before, threading.enumerate()
+    elapsed = time.perf_counter() - start
+    print(f"{cycles} connect/ switch/ disconnect cycles in {elapsed:.2f} s "
+          f"({elapsed / cycles * 1000:.2f} ms per cycle), no leaked threads")
+
+    #3) every line arrives exactly once
+    manager.connect(name_a)
+    received.clear()
+    write_all(master_a, b"".join(f"LINE {number}\r\n".encode() for number in range(1000)))
+    assert wait_until(lambda: len(received) >= 1000)
+    time.sleep(0.1)
+    assert received == [f"LINE {number}" for number in range(1000)], "lines lost or duplicated"
+    print("1000 lines received exactly once, in order")
+
+    #4) the 'arduino' goes away (pty closed), the manager should try to reconnect
+    os.close(master_a)
+    assert wait_until(lambda: manager.state == STATE_RECONNECTING), manager.status()
+    assert manager.reader_thread_count() == 1
+    manager.disconnect()
+    assert manager.reader_thread_count() == 0
+    assert threading.active_count() == threads_before
+    print("lost device -> reconnecting -> clean shutdown")
+
+    os.close(master_b)
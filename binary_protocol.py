@@ -0,0 +1,466 @@
+
+#*****************BINARY FRAME PROTOCOL*****************
+# this file holds the python side of the compact binary protocol between the GUI
+# and the arduino (the arduino side is in controller_code.ino)
+#
+# why:
+#   - the text packet "SET 1 4 30 2\n" works, but the arduino answers with ~150 bytes of
+#     text ("Received: ...", "Mode: ...", ...) and never says clearly "I applied it",
+#     so the GUI could not tell if a configuration actually reached the arduino
+#   - a binary frame has a sequence number and a CRC, and the arduino answers every
+#     frame with an 8 byte ACK (applied) or NAK (rejected, with a reason)
+#   - the text protocol still works, the GUI falls back to it for old firmware
+#
+# frame layout (all multi-byte numbers are little endian, like the arduino's memory):
+#
+#   byte 0      SOF       always 0xA5 (never appears in the arduino's text output)
+#   byte 1      version   PROTOCOL_VERSION
+#   byte 2      type      FRAME_SET, FRAME_START, ...
+#   byte 3      sequence  0-255, the ACK/NAK carries the same number back
+#   byte 4      length    number of payload bytes (0 - MAX_PAYLOAD)
+#   byte 5...   payload
+#   last 2      CRC       CRC-16/CCITT (poly 0x1021, start 0xFFFF) of bytes 1 to the end of the payload
+#
+# payloads:
+#   SET      mode (u8), flash rate Hz (u16), duration s (u16), pattern (u8)
+#            the rate/ duration go into an 'int' on the uno, so 1 - MAX_SET_VALUE (32767) only
+#            pattern 1-4 are built into the firmware, PATTERN_CUSTOM (0) replays the uploaded table
+#            a SET while the arduino is flashing stops that run and starts the new one
+#   NEXT     the same payload as SET, but it waits for the current run (or armed trigger) to
+#            finish and starts right after its DONE (applied straight away if the arduino is idle)
+#   PATTERN  first step (u8), total steps (u8), then up to PATTERN_STEPS_PER_FRAME steps of
+#            LED mask (u8) + microseconds (u32), see pattern_compiler.py
+#            a table longer than one frame is sent in order, the first frame (first step 0)
+#            starts a new table and SET with pattern 0 is only accepted once all of it arrived
+#   START    (empty) run the last configuration again
+#   STOP     (empty) stop flashing/ disarm the trigger/ forget a queued NEXT
+#   STATUS   host -> arduino: (empty), arduino -> host: flags (u8), mode (u8),
+#            flash rate (u16), duration (u16), pattern (u8), elapsed ms of the current run (u32)
+#            (firmware from before NEXT sends the first 7 bytes only)
+#   SYNC     host -> arduino: (empty), arduino -> host: its micros() when the frame arrived (u32)
+#            (the PC times the round trip to work out the arduino's clock, see clock_sync.py)
+#   TRIGGER  host -> arduino: the arduino's micros() to start the armed trigger at (u32),
+#            answered by an ACK (or a NAK ERROR_VALUE if the trigger is not armed), then once
+#            the run has started arduino -> host: scheduled micros (u32), started micros (u32)
+#   ACK      type of the frame being acknowledged (u8)
+#   NAK      type of the frame being rejected (u8), error code (u8)
+import binascii #crc_hqx is a fast (C) CRC-16/CCITT
+import struct #packing numbers into bytes
+
+#start of frame marker
+SOF = 0xA5
+#the version of the frame format (bump this if the layout changes)
+PROTOCOL_VERSION = 1
+
+#frame types
+FRAME_SET = 0x01
+FRAME_START = 0x02
+FRAME_STOP = 0x03
+FRAME_STATUS = 0x04
+FRAME_PATTERN = 0x05
+FRAME_NEXT = 0x06
+FRAME_SYNC = 0x07
+FRAME_TRIGGER = 0x08
+FRAME_ACK = 0x80
+FRAME_NAK = 0x81
+
+#names for printing frames in the serial monitor
+FRAME_NAMES = {
+    FRAME_SET: "SET",
+    FRAME_START: "START",
+    FRAME_STOP: "STOP",
+    FRAME_STATUS: "STATUS",
+    FRAME_PATTERN: "PATTERN",
+    FRAME_NEXT: "NEXT",
+    FRAME_SYNC: "SYNC",
+    FRAME_TRIGGER: "TRIGGER",
+    FRAME_ACK: "ACK",
+    FRAME_NAK: "NAK",
+}
+
+#NAK error codes
+ERROR_CRC = 1 #the CRC did not match
+ERROR_LENGTH = 2 #wrong payload length for this frame type
+ERROR_VALUE = 3 #a value was out of range (e.g. pattern 7)
+ERROR_TYPE = 4 #unknown frame type
+ERROR_VERSION = 5 #the frame was made for a different protocol version
+
+ERROR_NAMES = {
+    ERROR_CRC: "bad CRC",
+    ERROR_LENGTH: "bad length",
+    ERROR_VALUE: "value out of range",
+    ERROR_TYPE: "unknown frame type",
+    ERROR_VERSION: "unsupported protocol version",
+}
+
+#header is SOF, version, type, sequence, length
+HEADER = struct.Struct("<BBBBB")
+CRC = struct.Struct("<H")
+#the biggest payload the arduino accepts (it keeps the whole frame in RAM)
+MAX_PAYLOAD = 32
+#header + payload + crc
+MIN_FRAME_SIZE = HEADER.size + CRC.size
+MAX_FRAME_SIZE = MIN_FRAME_SIZE + MAX_PAYLOAD
+
+#payload layouts
+SET_PAYLOAD = struct.Struct("<BHHB")
+#the biggest flash rate/ duration: the frame has 16 bits for them, but the arduino keeps them
+#in an 'int' (signed 16 bits on an uno), so anything above 32767 turns negative on the board
+MAX_SET_VALUE = 32767
+STATUS_PAYLOAD = struct.Struct("<BBHHB")
+STATUS_ELAPSED = struct.Struct("<I") #after STATUS_PAYLOAD
+NAK_PAYLOAD = struct.Struct("<BB")
+PATTERN_HEADER = struct.Struct("<BB")
+PATTERN_STEP = struct.Struct("<BI")
+SYNC_PAYLOAD = struct.Struct("<I")
+TRIGGER_PAYLOAD = struct.Struct("<I")
+TRIGGER_REPORT = struct.Struct("<II")
+
+#the pattern number that means "the uploaded table"
+PATTERN_CUSTOM = 0
+#how many table steps the arduino holds, and how many fit in one frame
+PATTERN_MAX_STEPS = 32
+PATTERN_STEPS_PER_FRAME = (MAX_PAYLOAD - PATTERN_HEADER.size) // PATTERN_STEP.size
+
+#bits in the STATUS flags byte
+STATUS_FLASHING = 0x01
+STATUS_TRIGGER_ENABLED = 0x02
+STATUS_TRIGGER_CONSUMED = 0x04
+STATUS_QUEUED = 0x08 #a NEXT configuration is waiting
+STATUS_TRIGGER_SCHEDULED = 0x10 #a TRIGGER is waiting for its time
+
+#micros() on the arduino is 32 bits, it wraps around every 71.6 minutes
+MICROS_WRAP = 1 << 32
+
+
+# 'protocolerror' is raised when a frame can not be decoded
+class protocolerror(ValueError):
+    pass
+
+
+# 'protocolframe' class holds one decoded frame
+#   - frame_type: FRAME_SET, FRAME_ACK, ...
+#   - sequence: 0-255
+#   - payload: the payload bytes (a memoryview into the received data, so no copy is made)
+class protocolframe:
+    __slots__ = ("frame_type", "sequence", "payload")
+
+    #constructor that creates a protocolframe object
+    def __init__(self, frame_type, sequence, payload=b""):
+        self.frame_type = frame_type
+        self.sequence = sequence
+        self.payload = payload
+
+    #the frame's name (like "ACK") for printing
+    def name(self):
+        return FRAME_NAMES.get(self.frame_type, f"0x{self.frame_type:02X}")
+
+    #a short description like "ACK SET #12" or "NAK SET #12 (bad CRC)" for the serial monitor
+    def describe(self):
+        text = f"{self.name()} #{self.sequence}"
+        if self.frame_type == FRAME_ACK and len(self.payload) >= 1:
+            text = f"ACK {FRAME_NAMES.get(self.payload[0], self.payload[0])} #{self.sequence}"
+        elif self.frame_type == FRAME_NAK and len(self.payload) >= NAK_PAYLOAD.size:
+            acked_type, error = NAK_PAYLOAD.unpack_from(self.payload)
+            text = (f"NAK {FRAME_NAMES.get(acked_type, acked_type)} #{self.sequence} "
+                    f"({ERROR_NAMES.get(error, error)})")
+        elif self.frame_type == FRAME_STATUS and len(self.payload) in (STATUS_PAYLOAD.size,
+                                                                       STATUS_PAYLOAD.size + STATUS_ELAPSED.size):
+            status = decode_status_payload(self.payload)
+            text = (f"STATUS #{self.sequence} flashing={status['flashing']} mode={status['mode']} "
+                    f"rate={status['flash_rate']} duration={status['flash_duration']} pattern={status['pattern']} "
+                    f"elapsed={status['elapsed_ms']}ms queued={status['queued']}")
+        elif self.frame_type == FRAME_SYNC and len(self.payload) == SYNC_PAYLOAD.size:
+            text = f"SYNC #{self.sequence} micros={decode_sync_payload(self.payload)}"
+        elif self.frame_type == FRAME_TRIGGER and len(self.payload) == TRIGGER_REPORT.size:
+            scheduled_us, started_us = decode_trigger_report(self.payload)
+            text = (f"TRIGGER #{self.sequence} scheduled={scheduled_us}us started={started_us}us "
+                    f"({micros_difference(started_us, scheduled_us):+d}us)")
+        return text
+
+    def __repr__(self):
+        return f"protocolframe({self.describe()}, payload={bytes(self.payload)!r})"
+
+
+#*****************ENCODING*****************
+
+#function to build a frame
+#args: frame_type, sequence (0-255), payload (bytes, at most MAX_PAYLOAD long)
+#returns: the frame as bytes, ready to write to the serial port
+def encode_frame(frame_type, sequence, payload=b""):
+    if len(payload) > MAX_PAYLOAD:
+        raise protocolerror(f"payload is {len(payload)} bytes, the limit is {MAX_PAYLOAD}")
+    frame = bytearray(HEADER.pack(SOF, PROTOCOL_VERSION, frame_type, sequence & 0xFF, len(payload)))
+    frame += payload
+    #the CRC covers everything after the SOF byte
+    frame += CRC.pack(binascii.crc_hqx(memoryview(frame)[1:], 0xFFFF))
+    return bytes(frame)
+
+
+#function to build the payload of a SET frame
+#args: mode (1 manual, 2 trigger), flash_rate (Hz), flash_duration (s), pattern (1-4, or PATTERN_CUSTOM)
+def encode_set_payload(mode, flash_rate, flash_duration, pattern):
+    if flash_rate > MAX_SET_VALUE or flash_duration > MAX_SET_VALUE:
+        raise protocolerror(f"SET value out of range: the flash rate/ duration can be at most {MAX_SET_VALUE}")
+    try:
+        return SET_PAYLOAD.pack(mode, flash_rate, flash_duration, pattern)
+    except struct.error as error:
+        raise protocolerror(f"SET value out of range: {error}") from None
+
+
+#function to build a SET frame in one go
+def encode_set_frame(sequence, mode, flash_rate, flash_duration, pattern):
+    return encode_frame(FRAME_SET, sequence, encode_set_payload(mode, flash_rate, flash_duration, pattern))
+
+
+#function to split a pattern table into PATTERN frame payloads
+#args: table (list of (LED mask, microseconds), from pattern_compiler.compile_pattern())
+#returns: list of payloads, send them in order (each one in its own frame)
+def encode_pattern_payloads(table):
+    if not 0 < len(table) <= PATTERN_MAX_STEPS:
+        raise protocolerror(f"a pattern table has 1 to {PATTERN_MAX_STEPS} steps, not {len(table)}")
+    payloads = []
+    for first in range(0, len(table), PATTERN_STEPS_PER_FRAME):
+        payload = bytearray(PATTERN_HEADER.pack(first, len(table)))
+        try:
+            for mask, microseconds in table[first:first + PATTERN_STEPS_PER_FRAME]:
+                payload += PATTERN_STEP.pack(mask, microseconds)
+        except struct.error as error:
+            raise protocolerror(f"pattern step out of range: {error}") from None
+        payloads.append(bytes(payload))
+    return payloads
+
+
+#function to build the payload of a TRIGGER frame
+#args: start_us (the arduino's micros() to start at, wrapped to 32 bits like the arduino's clock)
+def encode_trigger_payload(start_us):
+    return TRIGGER_PAYLOAD.pack(int(start_us) % MICROS_WRAP)
+
+
+#function to build an ACK (or a NAK if 'error' is given) for a received frame (used by device stand-ins)
+def encode_reply(received, error=None):
+    if error is None:
+        return encode_frame(FRAME_ACK, received.sequence, bytes((received.frame_type,)))
+    return encode_frame(FRAME_NAK, received.sequence, NAK_PAYLOAD.pack(received.frame_type, error))
+
+
+#*****************DECODING*****************
+
+#function to decode exactly one frame (no copy is made, 'payload' is a view into 'data')
+#args: data (bytes/ bytearray/ memoryview holding one whole frame)
+#returns: protocolframe
+#raises: protocolerror if the frame is damaged (error code in .args[1])
+def decode_frame(data):
+    view = memoryview(data)
+    if len(view) < MIN_FRAME_SIZE:
+        raise protocolerror("frame too short", ERROR_LENGTH)
+    sof, version, frame_type, sequence, length = HEADER.unpack_from(view)
+    if sof != SOF:
+        raise protocolerror("missing start of frame", ERROR_LENGTH)
+    if len(view) != MIN_FRAME_SIZE + length:
+        raise protocolerror("frame length does not match its header", ERROR_LENGTH)
+    (received_crc,) = CRC.unpack_from(view, HEADER.size + length)
+    if binascii.crc_hqx(view[1:HEADER.size + length], 0xFFFF) != received_crc:
+        raise protocolerror("CRC mismatch", ERROR_CRC)
+    if version != PROTOCOL_VERSION:
+        raise protocolerror(f"protocol version {version} is not supported", ERROR_VERSION)
+    return protocolframe(frame_type, sequence, view[HEADER.size:HEADER.size + length])
+
+
+#function to read the values out of a SET payload
+#returns: (mode, flash_rate, flash_duration, pattern)
+def decode_set_payload(payload):
+    if len(payload) != SET_PAYLOAD.size:
+        raise protocolerror("SET payload has the wrong length", ERROR_LENGTH)
+    return SET_PAYLOAD.unpack_from(payload)
+
+
+#function to read a PATTERN payload
+#returns: (first step, total steps, list of (LED mask, microseconds))
+def decode_pattern_payload(payload):
+    if len(payload) < PATTERN_HEADER.size or (len(payload) - PATTERN_HEADER.size) % PATTERN_STEP.size:
+        raise protocolerror("PATTERN payload has the wrong length", ERROR_LENGTH)
+    first, total = PATTERN_HEADER.unpack_from(payload)
+    steps = [PATTERN_STEP.unpack_from(payload, offset)
+             for offset in range(PATTERN_HEADER.size, len(payload), PATTERN_STEP.size)]
+    return first, total, steps
+
+
+#function to read the values out of a STATUS reply
+#returns: dictionary of the arduino's state
+def decode_status_payload(payload):
+    if len(payload) not in (STATUS_PAYLOAD.size, STATUS_PAYLOAD.size + STATUS_ELAPSED.size):
+        raise protocolerror("STATUS payload has the wrong length", ERROR_LENGTH)
+    flags, mode, flash_rate, flash_duration, pattern = STATUS_PAYLOAD.unpack_from(payload)
+    #old firmware does not send the elapsed time
+    elapsed_ms = STATUS_ELAPSED.unpack_from(payload, STATUS_PAYLOAD.size)[0] if len(payload) > STATUS_PAYLOAD.size else 0
+    return {
+        "flashing": bool(flags & STATUS_FLASHING),
+        "trigger_enabled": bool(flags & STATUS_TRIGGER_ENABLED),
+        "trigger_consumed": bool(flags & STATUS_TRIGGER_CONSUMED),
+        "queued": bool(flags & STATUS_QUEUED),
+        "trigger_scheduled": bool(flags & STATUS_TRIGGER_SCHEDULED),
+        "mode": mode,
+        "flash_rate": flash_rate,
+        "flash_duration": flash_duration,
+        "pattern": pattern,
+        "elapsed_ms": elapsed_ms,
+    }
+
+
+#function to build a STATUS reply payload (used by device stand-ins)
+def encode_status_payload(flashing, trigger_enabled, trigger_consumed, mode, flash_rate, flash_duration, pattern,
+                          elapsed_ms=0, queued=False, trigger_scheduled=False):
+    flags = ((STATUS_FLASHING if flashing else 0)
+             | (STATUS_TRIGGER_ENABLED if trigger_enabled else 0)
+             | (STATUS_TRIGGER_CONSUMED if trigger_consumed else 0)
+             | (STATUS_QUEUED if queued else 0)
+             | (STATUS_TRIGGER_SCHEDULED if trigger_scheduled else 0))
+    return (STATUS_PAYLOAD.pack(flags, mode, flash_rate, flash_duration, pattern)
+            + STATUS_ELAPSED.pack(elapsed_ms))
+
+
+#function to read the arduino's micros() out of a SYNC reply
+def decode_sync_payload(payload):
+    if len(payload) != SYNC_PAYLOAD.size:
+        raise protocolerror("SYNC payload has the wrong length", ERROR_LENGTH)
+    return SYNC_PAYLOAD.unpack_from(payload)[0]
+
+
+#function to read the start time out of a TRIGGER frame sent to the arduino
+def decode_trigger_payload(payload):
+    if len(payload) != TRIGGER_PAYLOAD.size:
+        raise protocolerror("TRIGGER payload has the wrong length", ERROR_LENGTH)
+    return TRIGGER_PAYLOAD.unpack_from(payload)[0]
+
+
+#function to read the TRIGGER report the arduino sends once the run has started
+#returns: (scheduled micros, started micros)
+def decode_trigger_report(payload):
+    if len(payload) != TRIGGER_REPORT.size:
+        raise protocolerror("TRIGGER report has the wrong length", ERROR_LENGTH)
+    return TRIGGER_REPORT.unpack_from(payload)
+
+
+#function to subtract two of the arduino's micros() times (later - earlier, in microseconds)
+#like the firmware's (long)(a - b), so it is right across the wrap-around
+def micros_difference(later_us, earlier_us):
+    return (later_us - earlier_us + MICROS_WRAP // 2) % MICROS_WRAP - MICROS_WRAP // 2
+
+
+# 'framedecoder' class that pulls frames out of a byte stream that also has text in it
+#   - the arduino prints normal text lines ("DONE", ...) AND sends binary frames on the
+#     same serial port, so every byte that is not part of a frame is handed back as text
+#   - frames can be split across reads, the unfinished part is kept until the rest arrives
+#   - a damaged frame (bad CRC) is skipped by dropping its SOF byte and looking for the next one
+class framedecoder:
+
+    #constructor that creates a framedecoder object
+    def __init__(self):
+        #bytes of a frame that has started but not finished yet
+        self.buffer = bytearray()
+        #how many damaged frames were skipped
+        self.error_count = 0
+
+    #METHOD #1: feed
+    #   args: chunk (bytes read from the serial port)
+    #   returns: (text bytes that were not part of a frame, list of protocolframe)
+    def feed(self, chunk):
+        #fast path: no frame in progress and no SOF in this chunk -> it is all text
+        if not self.buffer and SOF not in chunk:
+            return chunk, []
+
+        self.buffer += chunk
+        text = bytearray()
+        frames = []
+        while self.buffer:
+            start = self.buffer.find(SOF)
+            if start < 0:
+                text += self.buffer
+                self.buffer.clear()
+                break
+            if start:
+                text += self.buffer[:start]
+                del self.buffer[:start]
+
+            #wait for the rest of the header
+            if len(self.buffer) < HEADER.size:
+                break
+            length = self.buffer[4]
+            if length > MAX_PAYLOAD:
+                #can not be a real frame, the 0xA5 was noise
+                self.error_count += 1
+                del self.buffer[:1]
+                continue
+            size = MIN_FRAME_SIZE + length
+            #wait for the rest of the frame
+            if len(self.buffer) < size:
+                break
+
+            #copy the frame out once (the buffer is about to change), then decode it in place
+            with memoryview(self.buffer) as view:
+                data = bytes(view[:size])
+            try:
+                frames.append(decode_frame(data))
+                del self.buffer[:size]
+            except protocolerror as error:
+                self.error_count += 1
+                #a frame from a newer protocol version is still a whole frame, skip all of it,
+                #otherwise only the SOF byte is skipped and we look for the next frame
+                del self.buffer[:size if error.args[1] == ERROR_VERSION else 1]
+        return bytes(text), frames
+
+    #METHOD #2: reset
+    #   forgets any half-received frame
+    def reset(self):
+        self.buffer.clear()
+
+
+# 'commandtracker' class that keeps track of frames sent to the arduino that are
+# still waiting for their ACK/ NAK
+#   - next_sequence() gives the sequence number for a new frame
+#   - sent() remembers when a frame was sent
+#   - resolve() matches an ACK/ NAK to the frame it answers
+#   - expired() returns frames that never got an answer (old firmware, unplugged cable...)
+class commandtracker:
+
+    #constructor that creates a commandtracker object
+    def __init__(self):
+        self.sequence = 0
+        #sequence number -> (frame type, perf_counter() time it was sent)
+        self.pending = {}
+
+    #METHOD #1: next_sequence
+    #   returns the next sequence number (0-255, wraps around)
+    def next_sequence(self):
+        self.sequence = (self.sequence + 1) & 0xFF
+        return self.sequence
+
+    #METHOD #2: sent
+    #   remembers that a frame was sent at time 'sent_at' (time.perf_counter())
+    def sent(self, frame_type, sequence, sent_at):
+        self.pending[sequence] = (frame_type, sent_at)
+
+    #METHOD #3: resolve
+    #   args: reply (an ACK or NAK protocolframe), received_at (time.perf_counter())
+    #   returns: (frame type that was answered, round trip seconds) or None if the
+    #            reply does not match anything we are waiting for
+    def resolve(self, reply, received_at):
+        if reply.frame_type not in (FRAME_ACK, FRAME_NAK):
+            return None
+        entry = self.pending.pop(reply.sequence, None)
+        if entry is None:
+            return None
+        frame_type, sent_at = entry
+        return frame_type, received_at - sent_at
+
+    #METHOD #4: expired
+    #   args: now (time.perf_counter()), timeout (seconds)
+    #   returns: list of (sequence, frame type) that have waited longer than 'timeout'
+    #            (they are forgotten, a late ACK for them is ignored)
+    def expired(self, now, timeout):
+        late = [(sequence, frame_type) for sequence, (frame_type, sent_at) in self.pending.items()
+                if now - sent_at > timeout]
+        for sequence, _ in late:
+            del self.pending[sequence]
+        return late
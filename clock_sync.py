@@ -0,0 +1,164 @@
+#*****************CLOCK SYNC*****************
+# this file works out the arduino's clock (micros()) on the PC, so a run can be started at
+# a time on the PC's clock (the software trigger, see ledcontroller.schedule_trigger())
+#
+# why:
+#   - in trigger mode the only way to start a run used to be the button, which the firmware
+#     polls in loop() and debounces with a fixed 200ms window, so nobody knew how long after
+#     the camera's signal the LEDs really came on
+#   - the PC knows when the camera takes its frames, so it can tell the arduino "start at
+#     micros() = X" (a TRIGGER frame), but only if it knows which micros() is 'now'
+#
+# how it works (like NTP/ Cristian's algorithm):
+#   - the PC sends a SYNC frame at sent_ns and the reply arrives at received_ns (both
+#     time.perf_counter_ns()), the reply holds the arduino's micros() when the SYNC arrived
+#   - the bytes spend a known time on the wire (10 bits a byte at the baud rate), the rest of
+#     the round trip (USB, the OS, the reader thread) is assumed to be the same both ways, so
+#     the arduino read its clock at sent_ns + request wire time + half of what is left
+#   - a round trip that took long (the OS was busy) is less certain, so only the samples with
+#     a round trip close to the shortest one of the same sync (new_batch()) are used: every
+#     sync adds samples to the fit, even when the PC is busier than it was for an older one
+#   - a crystal is never exactly 16MHz (an uno's resonator can be ~1000ppm off = 1ms a second),
+#     so once the samples cover DRIFT_MIN_SPAN the rate is fitted too (least squares), not
+#     just the offset
+#   - micros() is 32 bits and wraps around every 71.6 minutes, the samples are 'unwrapped'
+#     to the nearest time to the ones before
+#
+# note: this file does not use PyQt6
+import collections #the newest samples
+
+from binary_protocol import MICROS_WRAP
+from latency_metrics import percentile
+
+#a byte on the wire: start bit, 8 data bits, stop bit
+BITS_PER_BYTE = 10
+#how many samples are kept (the oldest are forgotten, the crystal's rate changes with temperature)
+SYNC_HISTORY = 64
+#samples with a round trip up to this many times the shortest one are used
+ROUND_TRIP_FILTER = 1.5
+#the samples must cover this long (ns) before the rate is fitted, until then it is taken as exact
+DRIFT_MIN_SPAN_NS = 1000000000
+
+
+#function to work out how long 'count' bytes take on the wire at 'baudrate' (ns)
+def wire_time_ns(count, baudrate):
+    return count * BITS_PER_BYTE * 1000000000 // baudrate
+
+
+#function to turn a 32 bit micros() time into the one closest to 'near' (an unwrapped time)
+def unwrap_micros(device_us, near):
+    return device_us + round((near - device_us) / MICROS_WRAP) * MICROS_WRAP
+
+
+#function to get the statistics of a list of timing errors (us, + = late)
+#returns: dict with count, p50, p99 and max of the absolute errors, and the mean (signed),
+#         or None if there are no errors
+def error_summary(errors_us):
+    if not errors_us:
+        return None
+    absolute = sorted(abs(error) for error in errors_us)
+    return {
+        "count": len(errors_us),
+        "p50": percentile(absolute, 0.5),
+        "p99": percentile(absolute, 0.99),
+        "max": absolute[-1],
+        "mean": sum(errors_us) / len(errors_us),
+    }
+
+
+# 'clocksync' class that keeps the SYNC samples and the PC -> arduino clock estimate
+#   - add_sample(): one SYNC round trip
+#   - estimate(): fits the clock to the samples (call it after adding them)
+#   - to_device_us()/ to_host_ns(): converts times with the last estimate
+class clocksync:
+
+    #constructor that creates a clocksync object
+    def __init__(self, history=SYNC_HISTORY):
+        #(PC time ns the arduino read its clock, micros() unwrapped, round trip ns, round trip ns
+        # not spent on the wire, the sync (batch) it was taken in)
+        self.samples = collections.deque(maxlen=history)
+        self.batch = 0
+        self.reset()
+
+    #METHOD #1: reset
+    #   forgets every sample (call it when the arduino resets, its micros() starts again at 0)
+    def reset(self):
+        self.samples.clear()
+        #the estimate: micros() = device_mean + (PC ns - host_mean) * rate / 1000
+        self.host_mean = None
+        self.device_mean = None
+        self.rate = 1.0
+        #perf_counter_ns() of the newest sample (None = never synced)
+        self.synced_at = None
+
+    #METHOD #1b: new_batch
+    #   call it before the samples of a new sync (their round trips are compared to each other)
+    def new_batch(self):
+        self.batch += 1
+
+    #METHOD #2: add_sample
+    #   args: sent_ns/ received_ns (perf_counter_ns() before writing the SYNC/ when the reply was
+    #         read), device_us (the micros() in the reply), request_wire_ns/ reply_wire_ns (how
+    #         long the two frames take on the wire, see wire_time_ns())
+    def add_sample(self, sent_ns, received_ns, device_us, request_wire_ns=0, reply_wire_ns=0):
+        if self.samples:
+            device_us = unwrap_micros(device_us, self.samples[-1][1])
+        round_trip = received_ns - sent_ns
+        #quicker than the wire: not a real serial link (a board with USB built in, the emulator)
+        if round_trip < request_wire_ns + reply_wire_ns:
+            request_wire_ns = reply_wire_ns = 0
+        #the part that is not on the wire, assumed to be the same both ways
+        not_on_wire = round_trip - request_wire_ns - reply_wire_ns
+        host_ns = sent_ns + request_wire_ns + not_on_wire / 2
+        self.samples.append((host_ns, device_us, round_trip, not_on_wire, self.batch))
+        self.synced_at = received_ns
+
+    #METHOD #3: estimate
+    #   fits the clock to the samples with a short round trip (for the sync they were taken in)
+    #   returns: dict with the number of samples (and how many were used), the shortest round
+    #            trip (us), the fitted rate (ppm fast + / slow -), the residual jitter (us) and
+    #            'bound_us' (how far off the offset can be if the two directions were not equal),
+    #            or None if there are no samples
+    def estimate(self):
+        if not self.samples:
+            return None
+        #the shortest round trip of each sync
+        shortest = {}
+        for sample in self.samples:
+            shortest[sample[4]] = min(sample[2], shortest.get(sample[4], sample[2]))
+        used = [sample for sample in self.samples if sample[2] <= shortest[sample[4]] * ROUND_TRIP_FILTER]
+        host_mean = sum(sample[0] for sample in used) / len(used)
+        device_mean = sum(sample[1] for sample in used) / len(used)
+        rate = 1.0
+        span = max(sample[0] for sample in used) - min(sample[0] for sample in used)
+        if len(used) >= 2 and span >= DRIFT_MIN_SPAN_NS:
+            #least squares: us of the arduino per ns of the PC, * 1000 = us per us
+            spread = sum((sample[0] - host_mean) ** 2 for sample in used)
+            rate = sum((sample[0] - host_mean) * (sample[1] - device_mean) for sample in used) / spread * 1000
+        self.host_mean, self.device_mean, self.rate = host_mean, device_mean, rate
+        residuals = [sample[1] - self.to_device_us(sample[0]) for sample in used]
+        return {
+            "samples": len(self.samples),
+            "used": len(used),
+            "round_trip_us": min(shortest.values()) / 1000,
+            "drift_ppm": (rate - 1) * 1e6,
+            "jitter_us": (sum(residual ** 2 for residual in residuals) / len(residuals)) ** 0.5,
+            "bound_us": min(sample[3] for sample in used) / 2000,
+        }
+
+    #METHOD #4: to_device_us
+    #   returns: the arduino's micros() (unwrapped, a float) at PC time 'host_ns'
+    def to_device_us(self, host_ns):
+        return self.device_mean + (host_ns - self.host_mean) * self.rate / 1000
+
+    #METHOD #5: to_host_ns
+    #   args: device_us (a 32 bit micros() from the arduino)
+    #   returns: the PC time (perf_counter_ns(), a float) the arduino's clock showed 'device_us'
+    def to_host_ns(self, device_us):
+        device_us = unwrap_micros(device_us, self.device_mean)
+        return self.host_mean + (device_us - self.device_mean) * 1000 / self.rate
+
+    #METHOD #6: is_synced
+    #   returns: True if there is an estimate from a sample newer than 'max_age_ns' before 'now_ns'
+    def is_synced(self, now_ns, max_age_ns):
+        return self.host_mean is not None and now_ns - self.synced_at <= max_age_ns
@@ -0,0 +1,6 @@
+
+#*****************PYTEST SETUP*****************
+# run the tests from the project folder with:   python -m pytest
+#   - the 'emulated_arduino' fixture (a started arduinoemulator) comes from arduino_emulator.py
+#   - this file being in the project folder also lets the tests import the project modules
+pytest_plugins = ["arduino_emulator"]
@@ -0,0 +1,438 @@
+
+#*****************CONNECTION MANAGER*****************
+# this file holds the 'connectionmanager' class which owns the connection to the arduino
+#
+# the problem this solves:
+#   - before, every click on CONNECT started ANOTHER background thread, and all of
+#     them read from the same global 'arduino' object. After a few reconnects we had
+#     several threads fighting over the port and lines got split between them
+#
+# how it works now:
+#   - the manager owns the serial port and EXACTLY ONE reader thread
+#   - connect() stops (and waits for) the old thread before opening the new port
+#   - disconnect() stops and joins the thread and closes the port
+#   - if the port dies while reading (SerialException, e.g. the USB cable was pulled)
+#     the reader thread keeps trying to reopen it, waiting a bit longer each time (backoff)
+#   - the GUI (or a script) is told about lines/ messages/ state changes through callbacks
+#     (a callback that raises is reported with on_message, the reader thread keeps going)
+#   - opening the port can happen in the reader thread too (connect_in_background()),
+#     so the GUI thread never has to wait for the port to open
+#   - opening the port resets the arduino, so instead of sleeping a fixed 2s we wait
+#     for the firmware's "Arduino Ready" banner (or READY_TIMEOUT, whichever comes first)
+#   - then the link speed is negotiated (the board always starts at 9600 baud):
+#       PC -> "BAUD 1000000 500000 250000 115200"     (the rates up to max_baudrate)
+#       arduino -> "BAUD OK 1000000", both sides switch
+#       PC -> "BAUD CONFIRM" at the new rate, arduino -> "BAUD CONFIRMED 1000000"
+#     if the confirmation never comes (the USB adapter/ cable can not keep up), both sides
+#     go back to 9600 (the arduino after BAUD_CONFIRM_TIMEOUT) and the next slower rates are
+#     offered. Old firmware never answers "BAUD", so we stay at 9600 after NEGOTIATE_TIMEOUT
+#     (the verbose answer to a text SET is about 150 bytes: 156ms at 9600 baud, 13ms at 115200)
+#
+# note: this file does not use PyQt6, the GUI turns the callbacks into Qt signals
+import threading #the one background reader thread
+import time #perf_counter for the connect-to-ready timing
+
+import serial #pyserial, used to talk to the arduino over the COM port
+
+from serial_line_reader import seriallinereader, READ_TIMEOUT
+
+#the connection states the manager can be in
+STATE_DISCONNECTED = "disconnected"
+STATE_CONNECTING = "connecting" #port is open, waiting for the arduino to finish resetting
+STATE_CONNECTED = "connected" #the arduino is ready for configuration packets
+STATE_RECONNECTING = "reconnecting"
+
+#default baud rate (must match Serial.begin() in controller_code.ino)
+DEFAULT_BAUDRATE = 9600
+
+#the faster link rates offered to the arduino once it is ready, fastest first
+#(1M/ 500k/ 250k are exact on a 16MHz uno, 115200 is 2.1% off but works with its USB chip)
+LINK_RATES = (1000000, 500000, 250000, 115200)
+#how long to wait for "BAUD OK"/ "BAUD NO" (old firmware never answers) (seconds)
+NEGOTIATE_TIMEOUT = 0.5
+#how long to wait for "BAUD CONFIRMED" at the new rate (seconds)
+CONFIRM_TIMEOUT = 0.3
+#how long the firmware waits for "BAUD CONFIRM" before going back to 9600 (BAUD_CONFIRM_MS)
+BAUD_CONFIRM_TIMEOUT = 1.0
+#the firmware switches once "BAUD OK" has left it, give it a moment before we talk at the new rate
+BAUD_SWITCH_DELAY = 0.005
+
+#the steps of the link speed negotiation
+NEGOTIATE_OFFER = "offer" #"BAUD ..." sent, waiting for "BAUD OK"/ "BAUD NO"
+NEGOTIATE_CONFIRM = "confirm" #switched, "BAUD CONFIRM" sent, waiting for "BAUD CONFIRMED"
+NEGOTIATE_REVERT = "revert" #no confirmation, waiting for the arduino to go back to 9600
+
+#how long to wait before each reconnect attempt (seconds), the last value is repeated
+RECONNECT_DELAYS = (0.5, 1.0, 2.0, 4.0, 8.0)
+
+#the line the firmware prints at the end of setup() (see controller_code.ino)
+READY_BANNER = "Arduino Ready - Waiting for Configuration..."
+#how long to wait for the banner before assuming the arduino is ready anyway (seconds)
+#(some boards do not reset when the port is opened, so they never print it)
+READY_TIMEOUT = 5.0
+
+
+# 'connectionmanager' class that owns the serial port and the reader thread
+#   - on_line(line): called (from the reader thread) for every line from the arduino
+#   - on_message(text): called for status messages like "Lost connection ..."
+#   - on_state(state): called when the state changes (STATE_* above)
+#   - on_frame(frame): called for every binary protocol frame from the arduino (ACK/ NAK/
+#     STATUS, see binary_protocol.py), None if only the text protocol is used
+#   - on_ready(seconds, banner_seen): called once the arduino is ready after (re)connecting,
+#     'seconds' is the time from opening the port to ready, 'banner_seen' is False
+#     if we gave up waiting for READY_BANNER
+#   - serial_factory: function that opens the port (serial.Serial by default,
+#     the benchmarks/ emulator can pass something else)
+#   - max_baudrate: the fastest link rate to negotiate (baudrate or less = no negotiation)
+class connectionmanager:
+
+    #constructor that creates a connectionmanager object
+    def __init__(self, on_line=None, on_message=None, on_state=None, on_ready=None, on_frame=None,
+                 baudrate=DEFAULT_BAUDRATE, serial_factory=serial.Serial,
+                 reconnect_delays=RECONNECT_DELAYS, ready_timeout=READY_TIMEOUT, max_baudrate=LINK_RATES[0]):
+        self.on_line = on_line
+        self.on_message = on_message
+        self.on_state = on_state
+        self.on_ready = on_ready
+        self.on_frame = on_frame
+        self.ready_timeout = ready_timeout
+        self.baudrate = baudrate
+        self.max_baudrate = max_baudrate
+        self.serial_factory = serial_factory
+        self.reconnect_delays = reconnect_delays
+
+        #the open serial port (None when disconnected) and the name it was opened with
+        self.port = None
+        self.port_name = None
+        self.state = STATE_DISCONNECTED
+
+        #the one reader thread and the event used to ask it to stop
+        self.reader_thread = None
+        self.stop_event = threading.Event()
+
+        #connect()/ disconnect() can be called from different threads (GUI, scripts),
+        #this lock makes sure only one of them changes the connection at a time
+        self.connection_lock = threading.Lock()
+        #this lock makes sure two threads never write to the port at the same time
+        self.write_lock = threading.Lock()
+
+        #how many times the port was (re)opened, useful for tests/ benchmarks
+        self.open_count = 0
+
+        #set once the arduino is ready (banner seen or READY_TIMEOUT passed)
+        self.ready_event = threading.Event()
+        #perf_counter() time the port was last opened, and how long it took to be ready
+        self.opened_at = 0.0
+        self.ready_seconds = None
+
+        #the baud rate the link runs at now, and the negotiation (see the top of the file)
+        self.link_rate = baudrate
+        self.negotiation_step = None
+        self.negotiation_deadline = 0.0
+        self.offered_rates = ()
+        self.banner_seen = False
+        self.switched_at = 0.0
+
+    #METHOD #1: connect
+    #   opens 'port_name' and starts the reader thread
+    #   if we are already connected (to any port) the old connection is shut down first
+    #   raises serial.SerialException if the port can not be opened
+    #   note: this returns as soon as the port is open, use wait_until_ready() to wait
+    #         for the arduino to finish resetting
+    def connect(self, port_name):
+        with self.connection_lock:
+            self.shutdown_reader()
+            self.port_name = port_name
+            self.open_port()
+            self.start_reader(open_first=False)
+
+    #METHOD #1b: connect_in_background
+    #   same as connect() but the port is opened by the reader thread, so this returns
+    #   straight away (used by the GUI so the window never freezes)
+    #   if the port can not be opened, on_message is called and the state goes back to disconnected
+    def connect_in_background(self, port_name):
+        with self.connection_lock:
+            self.shutdown_reader()
+            self.port_name = port_name
+            self.start_reader(open_first=True)
+
+    #METHOD #1c: wait_until_ready
+    #   waits until the arduino is ready for configuration packets (for scripts)
+    #   returns True if it is ready, False if 'timeout' seconds passed first
+    def wait_until_ready(self, timeout=None):
+        return self.ready_event.wait(timeout)
+
+    #METHOD #2: disconnect
+    #   stops and joins the reader thread and closes the port (safe to call twice)
+    def disconnect(self):
+        with self.connection_lock:
+            self.shutdown_reader()
+            self.set_state(STATE_DISCONNECTED)
+
+    #METHOD #3: write
+    #   sends bytes to the arduino
+    #   returns True if the data was written, False if we are not connected
+    def write(self, data):
+        with self.write_lock:
+            port = self.port
+            if port is None or not port.is_open:
+                return False
+            try:
+                port.write(data)
+            except serial.SerialException:
+                return False
+            return True
+
+    #METHOD #4: is_connected
+    #   returns True if the port is open and being read (the arduino may still be resetting)
+    def is_connected(self):
+        return self.state in (STATE_CONNECTING, STATE_CONNECTED)
+
+    #METHOD #5: reader_thread_count
+    #   returns how many reader threads this manager has running (should only ever be 0 or 1)
+    def reader_thread_count(self):
+        return 1 if self.reader_thread is not None and self.reader_thread.is_alive() else 0
+
+    #METHOD #6: status
+    #   returns a dictionary describing the connection (for tests and the GUI)
+    def status(self):
+        return {
+            "state": self.state,
+            "port": self.port_name,
+            "reader_threads": self.reader_thread_count(),
+            "open_count": self.open_count,
+            "ready_seconds": self.ready_seconds,
+            "link_rate": self.link_rate,
+        }
+
+
+    #*****************INTERNAL HELPERS*****************
+
+    #opens the port (the caller must hold connection_lock or be the reader thread)
+    def open_port(self):
+        port = self.serial_factory(self.port_name, self.baudrate, timeout=READ_TIMEOUT)
+        #clear leftover data/ flush buffer
+        port.reset_input_buffer()
+        self.port = port
+        self.open_count += 1
+        self.opened_at = time.perf_counter()
+        self.ready_seconds = None
+        self.ready_event.clear()
+        #a new port (and a reset arduino) always starts at the default rate
+        self.link_rate = self.baudrate
+        self.negotiation_step = None
+        self.set_state(STATE_CONNECTING)
+
+    #marks the arduino as ready and reports how long it took
+    def mark_ready(self, banner_seen):
+        self.ready_seconds = time.perf_counter() - self.opened_at
+        self.set_state(STATE_CONNECTED)
+        #on_ready first: whoever waits in wait_until_ready() sends to a controller that has
+        #already forgotten the board from before the reset
+        if self.on_ready:
+            self.notify(self.on_ready, self.ready_seconds, banner_seen)
+        self.ready_event.set()
+
+    #the arduino finished resetting: offer it a faster link rate, or it is ready now
+    def arduino_reset_done(self, banner_seen):
+        self.banner_seen = banner_seen
+        rates = tuple(rate for rate in LINK_RATES if self.baudrate < rate <= self.max_baudrate)
+        if rates:
+            self.offer_link_rates(rates)
+        else:
+            self.mark_ready(banner_seen)
+
+    #sends "BAUD r1 r2 ..." (at the default rate)
+    def offer_link_rates(self, rates):
+        self.offered_rates = rates
+        self.negotiation_step = NEGOTIATE_OFFER
+        self.negotiation_deadline = time.perf_counter() + NEGOTIATE_TIMEOUT
+        self.write(f"BAUD {' '.join(str(rate) for rate in rates)}\n".encode())
+
+    #a line from the arduino while negotiating
+    def negotiation_line(self, line):
+        if self.negotiation_step == NEGOTIATE_OFFER and line.startswith("BAUD OK"):
+            try:
+                rate = int(line.split()[2])
+            except (IndexError, ValueError):
+                return
+            self.set_link_rate(rate)
+            time.sleep(BAUD_SWITCH_DELAY)
+            self.negotiation_step = NEGOTIATE_CONFIRM
+            self.negotiation_deadline = time.perf_counter() + CONFIRM_TIMEOUT
+            self.write(b"BAUD CONFIRM\n")
+        elif self.negotiation_step == NEGOTIATE_OFFER and line.startswith("BAUD NO"):
+            self.finish_negotiation(f"The arduino does not support a faster link, staying at {self.link_rate} baud")
+        elif self.negotiation_step == NEGOTIATE_CONFIRM and line.startswith(f"BAUD CONFIRMED {self.link_rate}"):
+            self.finish_negotiation(f"Link speed: {self.link_rate} baud")
+
+    #called after every read while negotiating: handles the timeouts
+    def check_negotiation(self):
+        now = time.perf_counter()
+        if now < self.negotiation_deadline:
+            return
+        if self.negotiation_step == NEGOTIATE_OFFER:
+            self.finish_negotiation(f"No answer to BAUD (older firmware?), staying at {self.link_rate} baud")
+        elif self.negotiation_step == NEGOTIATE_CONFIRM:
+            #the new rate does not work: go back and wait for the arduino to do the same
+            failed = self.link_rate
+            self.set_link_rate(self.baudrate)
+            self.message(f"{failed} baud did not work, going back to {self.baudrate} baud")
+            self.offered_rates = tuple(rate for rate in self.offered_rates if rate < failed)
+            self.negotiation_step = NEGOTIATE_REVERT
+            self.negotiation_deadline = self.switched_at + BAUD_CONFIRM_TIMEOUT + 0.1
+        elif self.negotiation_step == NEGOTIATE_REVERT:
+            if self.offered_rates:
+                self.offer_link_rates(self.offered_rates)
+            else:
+                self.finish_negotiation(f"Link speed: {self.link_rate} baud")
+
+    #the link speed is settled: the arduino is ready for configuration packets
+    def finish_negotiation(self, text):
+        self.negotiation_step = None
+        self.message(text)
+        self.mark_ready(self.banner_seen)
+
+    #changes the baud rate of the open port
+    def set_link_rate(self, rate):
+        with self.write_lock:
+            self.port.baudrate = rate
+        self.link_rate = rate
+        self.switched_at = time.perf_counter()
+
+    #closes the port if it is open (errors are ignored, the port may already be gone)
+    def close_port(self):
+        port, self.port = self.port, None
+        if port is not None:
+            try:
+                port.close()
+            except (serial.SerialException, OSError):
+                pass
+
+    #starts the one reader thread
+    #args: open_first (True if the thread should open the port itself)
+    def start_reader(self, open_first):
+        self.stop_event = threading.Event()
+        self.reader_thread = threading.Thread(
+            target=self.reader_loop, args=(self.stop_event, open_first), name="serial-reader", daemon=True)
+        self.reader_thread.start()
+
+    #asks the reader thread to stop, waits for it to finish and closes the port
+    def shutdown_reader(self):
+        self.stop_event.set()
+        thread = self.reader_thread
+        if thread is not None:
+            #wake the thread up if it is blocked in read() instead of waiting for READ_TIMEOUT
+            cancel_read = getattr(self.port, "cancel_read", None)
+            if cancel_read is not None:
+                try:
+                    cancel_read()
+                except (serial.SerialException, OSError):
+                    pass
+            thread.join()
+            self.reader_thread = None
+        self.close_port()
+        self.ready_event.clear()
+
+    #changes the state and tells whoever is listening
+    def set_state(self, state):
+        if state != self.state:
+            self.state = state
+            if self.on_state:
+                self.on_state(state)
+
+    #sends a status message to whoever is listening
+    def message(self, text):
+        if self.on_message:
+            self.on_message(text)
+
+    #the body of the reader thread
+    #args:
+    #   stop_event: the event for THIS thread, so an old thread never reads a new port
+    #   open_first: True if this thread has to open the port first (connect_in_background())
+    def reader_loop(self, stop_event, open_first):
+        if open_first:
+            try:
+                with self.write_lock:
+                    self.open_port()
+            except (serial.SerialException, OSError) as error:
+                self.message(f"Failed to connect to {self.port_name}! Check the connection to the COM port "
+                             f"and ensure nothing else is accessing it. ({error})")
+                self.set_state(STATE_DISCONNECTED)
+                return
+
+        reader = self.new_reader()
+        while not stop_event.is_set():
+            #only the port itself is inside this try, a listener's bug is not a lost port
+            try:
+                lines = reader.read_lines()
+            except (serial.SerialException, OSError, TypeError, AttributeError):
+                #TypeError/ AttributeError: pyserial raises these if the port is closed under it
+                if stop_event.is_set():
+                    break
+                self.message("error occured when reading the serial data!!.")
+                if not self.reconnect(stop_event):
+                    break
+                reader = self.new_reader()
+                continue
+
+            for line in lines:
+                self.line_read(line)
+
+            if self.state == STATE_CONNECTING:
+                if self.negotiation_step is not None:
+                    self.check_negotiation()
+                #no banner in time: assume the arduino is ready anyway (e.g. it did not reset)
+                elif time.perf_counter() - self.opened_at > self.ready_timeout:
+                    self.arduino_reset_done(False)
+
+    #a reader for the open port (the frames go through frame_read())
+    def new_reader(self):
+        return seriallinereader(self.port, on_frame=self.frame_read if self.on_frame else None)
+
+    #calls a listener from the reader thread: one that raises is reported and the thread
+    #keeps reading (a bug in the GUI/ a rig/ the scheduler is not a lost port)
+    def notify(self, listener, *args):
+        try:
+            listener(*args)
+        except Exception as error:
+            self.message(f"Error in {getattr(listener, '__name__', 'a listener')}() "
+                         f"(the connection is fine): {type(error).__name__}: {error}")
+
+    #one line from the arduino (reader thread): the listener, then the banner/ link speed handshake
+    def line_read(self, line):
+        if self.on_line:
+            self.notify(self.on_line, line)
+        if self.state != STATE_CONNECTING:
+            return
+        #the arduino printed its banner, it is ready (once the link speed is set)
+        if self.negotiation_step is None and line.startswith(READY_BANNER):
+            self.arduino_reset_done(True)
+        elif self.negotiation_step is not None:
+            self.negotiation_line(line)
+
+    #one binary frame from the arduino (reader thread)
+    def frame_read(self, frame):
+        self.notify(self.on_frame, frame)
+
+    #tries to reopen the port with a growing delay between attempts
+    #returns True when the port is open again, False if we were asked to stop
+    def reconnect(self, stop_event):
+        with self.write_lock:
+            self.close_port()
+        self.set_state(STATE_RECONNECTING)
+        attempt = 0
+        while not stop_event.is_set():
+            delay = self.reconnect_delays[min(attempt, len(self.reconnect_delays) - 1)]
+            self.message(f"Lost connection to {self.port_name}, retrying in {delay:g} s")
+            if stop_event.wait(delay):
+                break
+            attempt += 1
+            try:
+                with self.write_lock:
+                    self.open_port()
+                self.message(f"Reconnected to {self.port_name}")
+                return True
+            except (serial.SerialException, OSError):
+                continue
+        return False
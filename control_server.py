@@ -0,0 +1,489 @@
+
+#*****************CONTROL SERVER*****************
+# this file holds the 'controlserver' class: a small server on this PC (localhost only) that
+# lets other programs (like the camera/ acquisition software) drive the LED system, and the
+# 'controlclient' class those programs can use to talk to it
+#
+# why:
+#   - the acquisition software can not click "Start Flashing", and the only hardware hook
+#     is the trigger button on the arduino's BUTTON_PIN
+#   - the server runs inside the GUI (python "GUI Test 1.py" --control-server) or without
+#     it (python ledctl.py serve --port COM3), so the same requests work with or without
+#     someone watching the window
+#
+# the protocol: one JSON object per line (UTF-8), over TCP (127.0.0.1:DEFAULT_PORT) or a
+# unix socket:
+#   request:  {"id": 1, "method": "start", "params": {"flash_rate": 4, "flash_duration": 30}}
+#   reply:    {"id": 1, "result": {...}}   or   {"id": 1, "error": "the message"}
+#   event:    {"event": "line", "line": "ACK SET #3", "t_ns": 123456789}   (subscribers only)
+# the methods:
+#   - ping: answers "pong" (to measure the round trip)
+#   - configure: any of mode, flash_rate, flash_duration, pattern, protocol (like
+#     rigregistry.configure(), nothing changes if a value is invalid), returns the settings
+#   - start: sends the configuration (the configure params can be given here too, queued=true
+#     sends NEXT), returns the message, the binary frame's sequence number and how long it
+#     took from the request arriving to the SET being written ("request_to_wire_us")
+#   - stop: ends the run/ disarms the trigger
+#   - sync: works out the arduino's clock (SYNC round trips), returns the estimate
+#   - trigger: starts the armed trigger (after a trigger mode start) at "at_ns" (the client's
+#     time.perf_counter_ns(), e.g. a camera frame) or "delay_ms" from now instead of the
+#     button, the report arrives as a "TRIGGER #n ..." line event and in status
+#     (see ledcontroller.schedule_trigger())
+#   - status: the settings, the connection, the run progress, the last trigger report and
+#     the server's metrics
+#   - subscribe/ unsubscribe: every line from the arduino (and every ACK/ NAK) is sent to
+#     the subscribed clients as an event, "t_ns" is time.perf_counter_ns() when it was read
+#     (the same clock as the client's on linux/ windows)
+#
+# how it works:
+#   - the server has its own thread running an asyncio loop, which handles every client
+#     (no thread per client, and nothing ever runs in the GUI thread)
+#   - the requests of all clients go into ONE command queue, and one task runs them one at
+#     a time, so the clients never use the serial port at the same time
+#   - each request runs in the ONE worker thread of 'executor' (sync/ trigger can wait up to
+#     SYNC_ROUNDS x SYNC_TIMEOUT for the arduino), so the loop keeps reading the other
+#     clients' requests and sending the events in the meantime. subscribe/ unsubscribe stay
+#     in the server thread (the subscribers are only used there)
+#   - a request that fails in any way is answered with the error, the next one still runs
+#   - a start request is sent with prepare_configuration()/ write_prepared()/
+#     finish_prepared() (see led_controller.py), so the time to the wire is measured
+#     right at the write
+#   - a client that stops reading its events is disconnected once MAX_CLIENT_BUFFER bytes
+#     are waiting for it (instead of the server buffering forever)
+#
+# example (in the acquisition software):
+#     client = controlclient(on_event=print)
+#     client.call("subscribe")
+#     client.call("start", mode="Manual Mode", flash_rate=4, flash_duration=30)
+#
+# note: this file does not use PyQt6
+import asyncio #the server's event loop
+import concurrent.futures #the worker thread that runs the requests
+import itertools #request ids
+import json #the protocol
+import os #removing the unix socket file
+import socket #the client
+import threading #the server thread, the client's reader thread
+import time #perf_counter_ns
+
+from latency_metrics import rollingstats
+from led_controller import ledcontroller, configurationerror, TRIGGER_DELAY
+from rig_registry import SETTINGS
+
+#where the server listens by default (localhost only, other PCs can not connect)
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 47800
+
+#the longest request line (bytes), a longer one closes the client
+MAX_REQUEST_BYTES = 64 * 1024
+#how many requests can wait in the command queue, more are answered with an error
+MAX_QUEUED_COMMANDS = 1000
+#events waiting to be sent to one client (bytes) before it is disconnected
+MAX_CLIENT_BUFFER = 1024 * 1024
+#how long start() waits for the server to be listening (seconds)
+START_TIMEOUT = 5.0
+#how long controlclient.call() waits for the reply by default (seconds)
+CALL_TIMEOUT = 5.0
+
+
+# 'controlerror' is raised by controlclient.call() when the server answers with an error
+# (or does not answer)
+class controlerror(RuntimeError):
+    pass
+
+
+# 'controlserver' class that serves the requests of local programs
+#   - controller: the ledcontroller (or asyncledcontroller) all the clients share
+#   - host/ port: where to listen (TCP), or unix_path: a unix socket file (linux/ mac)
+#   - on_command(method, text): called (from the server's worker thread) after a request changed
+#     something (configure/ start/ stop), so the GUI can show it
+class controlserver:
+
+    #constructor that creates a controlserver object
+    def __init__(self, controller, host=DEFAULT_HOST, port=DEFAULT_PORT, unix_path=None, on_command=None):
+        self.controller = controller
+        self.host = host
+        self.port = port
+        self.unix_path = unix_path
+        self.on_command = on_command
+
+        #the server thread and its event loop (None until start())
+        self.thread = None
+        self.loop = None
+        self.server = None
+        self.queue = None
+        self.executor = None
+        #the connected clients and the ones subscribed to the events (their stream writers)
+        self.clients = set()
+        self.subscribers = set()
+        #request arrived -> SET written, and request arrived -> reply written (seconds)
+        self.request_to_wire = rollingstats()
+        self.request_to_reply = rollingstats()
+        self.address = None
+        self.started = threading.Event()
+        self.start_error = None
+
+    #METHOD #1: start
+    #   starts the server thread and waits until it is listening
+    #   returns: the address ("127.0.0.1:47800" or the unix socket path)
+    #   raises: OSError if it can not listen (the port is in use ...)
+    def start(self):
+        self.started.clear()
+        self.start_error = None
+        self.thread = threading.Thread(target=self.run, name="control server", daemon=True)
+        self.thread.start()
+        if not self.started.wait(START_TIMEOUT):
+            raise OSError("The control server did not start")
+        if self.start_error is not None:
+            self.thread.join()
+            raise self.start_error
+        self.controller.add_line_listener(self.line_heard)
+        return self.address
+
+    #METHOD #2: stop
+    #   disconnects every client and stops the server thread (safe to call twice)
+    def stop(self):
+        self.controller.remove_line_listener(self.line_heard)
+        loop = self.loop
+        if loop is None:
+            return
+        try:
+            loop.call_soon_threadsafe(loop.stop)
+        except RuntimeError:
+            #the loop is already closed
+            pass
+        self.thread.join()
+        self.loop = None
+
+    #METHOD #3: client_count
+    def client_count(self):
+        return len(self.clients)
+
+
+    #*****************SERVER THREAD*****************
+
+    #the server thread: runs the event loop until stop()
+    def run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self.listen())
+        except OSError as error:
+            self.start_error = error
+            self.started.set()
+            self.loop.close()
+            self.loop = None
+            return
+        self.started.set()
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="control command")
+        worker = self.loop.create_task(self.run_commands())
+        try:
+            self.loop.run_forever()
+        finally:
+            worker.cancel()
+            #(waits for a request that is still running, so stop() returns once it is done)
+            self.executor.shutdown()
+            self.executor = None
+            self.server.close()
+            for writer in list(self.clients):
+                writer.close()
+            self.clients.clear()
+            self.subscribers.clear()
+            #let the client tasks see their closed connections and finish (they are not
+            #cancelled, asyncio reports a cancelled client task as an error)
+            tasks = asyncio.all_tasks(self.loop)
+            self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            self.loop.close()
+            if self.unix_path is not None and os.path.exists(self.unix_path):
+                os.remove(self.unix_path)
+
+    #opens the listening socket
+    async def listen(self):
+        self.queue = asyncio.Queue(MAX_QUEUED_COMMANDS)
+        if self.unix_path is not None:
+            self.server = await asyncio.start_unix_server(self.serve_client, self.unix_path, limit=MAX_REQUEST_BYTES)
+            self.address = self.unix_path
+        else:
+            self.server = await asyncio.start_server(self.serve_client, self.host, self.port, limit=MAX_REQUEST_BYTES)
+            host, port = self.server.sockets[0].getsockname()[:2]
+            self.address = f"{host}:{port}"
+
+    #one task per client: reads its requests and puts them in the command queue
+    async def serve_client(self, reader, writer):
+        self.clients.add(writer)
+        try:
+            while True:
+                try:
+                    data = await reader.readline()
+                except (ValueError, ConnectionError):
+                    #the line was longer than MAX_REQUEST_BYTES/ the client went away
+                    break
+                if not data:
+                    break
+                received_at = time.perf_counter_ns()
+                try:
+                    request = json.loads(data)
+                    if not isinstance(request, dict):
+                        raise ValueError("a request is a JSON object")
+                except ValueError as error:
+                    self.reply(writer, None, error=f"Invalid request: {error}")
+                    continue
+                try:
+                    self.queue.put_nowait((writer, request, received_at))
+                except asyncio.QueueFull:
+                    self.reply(writer, request.get("id"), error="The control server is busy, try again")
+        finally:
+            self.forget(writer)
+            writer.close()
+
+    #the ONE task that runs the requests, in the order they arrived
+    async def run_commands(self):
+        while True:
+            writer, request, received_at = await self.queue.get()
+            if writer not in self.clients:
+                #the client left while its request was waiting
+                continue
+            method = request.get("method")
+            try:
+                if method in ("subscribe", "unsubscribe"):
+                    result = self.subscribe(writer, method == "subscribe")
+                else:
+                    result = await self.loop.run_in_executor(self.executor, self.handle, request, received_at)
+            except (ValueError, TypeError) as error:
+                #configurationerror is a ValueError
+                self.reply(writer, request.get("id"), error=str(error), received_at=received_at)
+                continue
+            except Exception as error:
+                #anything else (the port went away ...) is still only this request's error
+                self.reply(writer, request.get("id"), error=f"{type(error).__name__}: {error}",
+                           received_at=received_at)
+                continue
+            self.reply(writer, request.get("id"), result=result, received_at=received_at)
+
+    #writes a reply to a client
+    def reply(self, writer, request_id, result=None, error=None, received_at=None):
+        message = {"id": request_id}
+        if error is None:
+            message["result"] = result
+        else:
+            message["error"] = error
+        self.send_to(writer, json.dumps(message).encode() + b"\n")
+        if received_at is not None:
+            self.request_to_reply.add((time.perf_counter_ns() - received_at) / 1e9)
+
+    #writes to a client, disconnects it if it has too much waiting
+    def send_to(self, writer, data):
+        if writer.is_closing():
+            return
+        writer.write(data)
+        if writer.transport.get_write_buffer_size() > MAX_CLIENT_BUFFER:
+            self.forget(writer)
+            writer.transport.abort()
+
+    def forget(self, writer):
+        self.clients.discard(writer)
+        self.subscribers.discard(writer)
+
+    #every line from the arduino (called from the reader thread, or from the asyncio loop
+    #of the asyncledcontroller), passed to the server thread for the subscribers
+    def line_heard(self, line):
+        read_at = time.perf_counter_ns()
+        loop = self.loop
+        if loop is not None and self.subscribers:
+            try:
+                loop.call_soon_threadsafe(self.publish, {"event": "line", "line": line, "t_ns": read_at})
+            except RuntimeError:
+                #the server stopped in the meantime
+                pass
+
+    #sends an event to every subscribed client
+    def publish(self, event):
+        data = json.dumps(event).encode() + b"\n"
+        for writer in list(self.subscribers):
+            self.send_to(writer, data)
+
+
+    #*****************THE METHODS*****************
+
+    #runs one request (in the worker thread), returns its result
+    #raises: configurationerror (the message goes back to the client)
+    def handle(self, request, received_at):
+        method = request.get("method")
+        params = request.get("params") or {}
+        if not isinstance(params, dict):
+            raise configurationerror("params must be a JSON object")
+        if method == "ping":
+            return "pong"
+        if method == "configure":
+            self.configure(params)
+            self.command("configure", f"Remote configure: {self.describe_settings()}")
+            return self.settings()
+        if method == "start":
+            return self.start_flashing(params, received_at)
+        if method == "stop":
+            message = self.controller.stop(params.get("protocol"))
+            self.command("stop", f"Remote: {message}")
+            return {"message": message}
+        if method == "sync":
+            return self.controller.sync_clock()
+        if method == "trigger":
+            return self.trigger(params)
+        if method == "status":
+            return self.status()
+        raise configurationerror(f"Unknown method '{method}'")
+
+    #'subscribe'/ 'unsubscribe' (in the server thread)
+    def subscribe(self, writer, subscribed):
+        if subscribed:
+            self.subscribers.add(writer)
+        else:
+            self.subscribers.discard(writer)
+        return {"subscribed": subscribed}
+
+    #changes the settings (all of them or none, see rigregistry.configure())
+    def configure(self, params):
+        settings = {key: params[key] for key, _ in SETTINGS if key in params}
+        #check the values on a spare controller first, so a bad value changes nothing
+        checker = ledcontroller()
+        checker.set_flash_rate(self.controller.flash_rate)
+        for key, method in SETTINGS:
+            if key in settings:
+                getattr(checker, method)(settings[key])
+        for key, method in SETTINGS:
+            if key in settings:
+                getattr(self.controller, method)(settings[key])
+
+    #'start': configure (if settings are given) and send the configuration
+    def start_flashing(self, params, received_at):
+        if any(key in params for key, _ in SETTINGS):
+            self.configure(params)
+        controller = self.controller
+        prepared = controller.prepare_configuration(protocol=params.get("protocol"), queued=bool(params.get("queued")))
+        sent_at = controller.write_prepared(prepared)
+        message = controller.finish_prepared(prepared)
+        wire = (sent_at - received_at) / 1e9
+        self.request_to_wire.add(wire)
+        self.command("start", f"Remote: {message}")
+        return {"message": message, "sequence": prepared["sequence"], "sent_at_ns": sent_at,
+                "request_to_wire_us": wire * 1e6}
+
+    #'trigger': schedules the software trigger
+    def trigger(self, params):
+        at_ns = params.get("at_ns")
+        if at_ns is not None and not isinstance(at_ns, int):
+            raise configurationerror("at_ns must be a time.perf_counter_ns() value")
+        delay_ms = params.get("delay_ms", TRIGGER_DELAY * 1000)
+        if not isinstance(delay_ms, (int, float)) or delay_ms < 0:
+            raise configurationerror("delay_ms must be a number of milliseconds")
+        message = self.controller.schedule_trigger(at_ns=at_ns, delay=delay_ms / 1000)
+        self.command("trigger", f"Remote: {message}")
+        return {"message": message}
+
+    #'status'
+    def status(self):
+        controller = self.controller
+        connection = controller.connection
+        progress = controller.flash_progress()
+        return {
+            "settings": self.settings(),
+            "port": controller.port_name,
+            "state": connection.state,
+            "link_rate": getattr(connection, "link_rate", None),
+            "flashing": None if progress is None else {"elapsed": progress[0], "length": progress[1]},
+            "trigger": controller.trigger_report,
+            "clients": self.client_count(),
+            "queued_commands": self.queue.qsize(),
+            "request_to_wire": self.request_to_wire.summary(),
+            "request_to_reply": self.request_to_reply.summary(),
+        }
+
+    def settings(self):
+        return {key: getattr(self.controller, key) for key, _ in SETTINGS}
+
+    def describe_settings(self):
+        settings = self.settings()
+        return (f"{settings['mode']}, {settings['pattern']}, {settings['flash_rate']} Hz, "
+                f"{settings['flash_duration']} s, {settings['protocol']}")
+
+    #tells on_command what a request did
+    def command(self, method, text):
+        if self.on_command:
+            self.on_command(method, text)
+
+
+# 'controlclient' class for the programs that use the server (a blocking client with a
+# reader thread, so it works in any program without asyncio)
+#   - host/ port or unix_path: where the server is
+#   - on_event(event): called from the client's reader thread for every event (a dict)
+class controlclient:
+
+    #constructor that creates a controlclient object and connects it
+    #raises: OSError if the server is not there
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, unix_path=None, on_event=None):
+        self.on_event = on_event
+        if unix_path is not None:
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.socket.connect(unix_path)
+        else:
+            self.socket = socket.create_connection((host, port))
+            #send each request straight away instead of waiting to fill a packet
+            self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.ids = itertools.count(1)
+        #request id -> [threading.Event, the reply]
+        self.waiting = {}
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.read_replies, name="control client", daemon=True)
+        self.thread.start()
+
+    #METHOD #1: call
+    #   sends a request and waits for its reply
+    #   returns: the result
+    #   raises: controlerror (the server's error message, or no reply within 'timeout' seconds)
+    def call(self, method, timeout=CALL_TIMEOUT, **params):
+        request_id = next(self.ids)
+        done = threading.Event()
+        with self.lock:
+            self.waiting[request_id] = [done, None]
+        self.socket.sendall(json.dumps({"id": request_id, "method": method, "params": params}).encode() + b"\n")
+        if not done.wait(timeout):
+            with self.lock:
+                self.waiting.pop(request_id, None)
+            raise controlerror(f"No reply to '{method}' from the control server")
+        with self.lock:
+            reply = self.waiting.pop(request_id)[1]
+        if reply is None:
+            raise controlerror("The control server closed the connection")
+        if "error" in reply:
+            raise controlerror(reply["error"])
+        return reply["result"]
+
+    #METHOD #2: close
+    def close(self):
+        try:
+            self.socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.socket.close()
+        self.thread.join()
+
+    #the reader thread: replies wake up call(), events go to on_event
+    def read_replies(self):
+        with self.socket.makefile("rb") as lines:
+            try:
+                for data in lines:
+                    message = json.loads(data)
+                    if "event" in message:
+                        if self.on_event:
+                            self.on_event(message)
+                        continue
+                    with self.lock:
+                        entry = self.waiting.get(message.get("id"))
+                        if entry is not None:
+                            entry[1] = message
+                            entry[0].set()
+            except (OSError, ValueError):
+                pass
+        #the connection is gone, wake up every call() still waiting
+        with self.lock:
+            for done, _ in self.waiting.values():
+                done.set()
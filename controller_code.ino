@@ -1,144 +1,652 @@
-#define LED1_PIN 10   // First LED
-#define LED2_PIN 9    // Second LED
-#define BUTTON_PIN 2  // Push button input
-
-int mode = 1;  
-int flash_rate = 1;
-int flash_duration = 1;
-int flash_pattern = 1;  
-bool flashing = false;
-bool button_was_pressed = false;
-bool trigger_enabled = false;  
-bool trigger_consumed = false; 
-unsigned long last_press_time = 0;
-
-void setup() {
-  Serial.begin(9600);
-  pinMode(LED1_PIN, OUTPUT);
-  pinMode(LED2_PIN, OUTPUT);
-  pinMode(BUTTON_PIN, INPUT_PULLUP); 
-  digitalWrite(LED1_PIN, LOW);
-  digitalWrite(LED2_PIN, LOW);
-  Serial.println("Arduino Ready - Waiting for Configuration...");
-}
-
-void loop() {
-  unsigned long current_time = millis();  
-
-  if (mode == 2 && trigger_enabled && !trigger_consumed && digitalRead(BUTTON_PIN) == LOW) {
-    if (!button_was_pressed && (current_time - last_press_time > 200)) {  
-      Serial.println("BUTTON PRESSED - TRIGGERING LED");
-      flashing = true;
-      trigger_consumed = true;  
-      button_was_pressed = true;
-      last_press_time = current_time;
-    }
-  } else {
-    button_was_pressed = false;
-  }
-
-  if (Serial.available()) {
-    String command = Serial.readStringUntil('\n'); 
-    Serial.print("Received: ");
-    Serial.println(command);
-
-    if (command.startsWith("SET")) {
-      int temp_mode, temp_flash_rate, temp_duration, temp_pattern;
-      int parsed = sscanf(command.c_str(), "SET %d %d %d %d", &temp_mode, &temp_flash_rate, &temp_duration, &temp_pattern);
-
-      if (parsed == 4) {  
-        mode = temp_mode;
-        flash_rate = temp_flash_rate;
-        flash_duration = temp_duration;
-        flash_pattern = temp_pattern;
-        trigger_enabled = (mode == 2);  
-        trigger_consumed = false;  
-
-        Serial.print("Mode: ");
-        Serial.println(mode);
-        Serial.print("Flash Rate: ");
-        Serial.println(flash_rate);
-        Serial.print("Duration: ");
-        Serial.println(flash_duration);
-        Serial.print("Pattern: ");
-        Serial.println(flash_pattern);
-
-        if (mode == 1) {
-          flashing = true;  
-          Serial.println("Manual Mode: Flashing started");
-        } else {
-          Serial.println("Trigger Mode: Waiting for button press...");
-        }
-      } else {
-        Serial.println("Error parsing command!");
-      }
-    }
-  }
-
-  if (!flashing) {
-    digitalWrite(LED1_PIN, LOW);
-    digitalWrite(LED2_PIN, LOW);
-  }
-
-  if (flashing) {
-    unsigned long start_time = millis();
-    int delay_time = 1000 / (flash_rate * 2);
-
-    // **Summary message before flashing begins**
-    Serial.print("Flashing Pattern ");
-    Serial.print(flash_pattern);
-    Serial.print(" at ");
-    Serial.print(flash_rate);
-    Serial.print(" Hz for ");
-    Serial.print(flash_duration);
-    Serial.println(" seconds.");
-
-    while (millis() - start_time < (flash_duration * 1000)) {
-      if (flash_pattern == 1) {  
-        digitalWrite(LED1_PIN, HIGH);
-        delay(delay_time);
-        digitalWrite(LED1_PIN, LOW);
-        delay(delay_time);
-
-      } else if (flash_pattern == 2) {  
-        digitalWrite(LED1_PIN, HIGH);
-        digitalWrite(LED2_PIN, LOW);
-        delay(delay_time);
-
-        digitalWrite(LED1_PIN, LOW);
-        digitalWrite(LED2_PIN, HIGH);
-        delay(delay_time);
-
-      } else if (flash_pattern == 3) {  
-        for (int i = 0; i < 2; i++) {  
-          digitalWrite(LED1_PIN, HIGH);
-          delay(delay_time);
-          digitalWrite(LED1_PIN, LOW);
-          delay(delay_time);
-        }
-        digitalWrite(LED2_PIN, HIGH);
-        delay(delay_time);
-        digitalWrite(LED2_PIN, LOW);
-        delay(delay_time);
-
-      } else if (flash_pattern == 4) {  
-        for (int i = 0; i < 3; i++) {  
-          digitalWrite(LED1_PIN, HIGH);
-          delay(delay_time);
-          digitalWrite(LED1_PIN, LOW);
-          delay(delay_time);
-        }
-        digitalWrite(LED2_PIN, HIGH);
-        delay(delay_time);
-        digitalWrite(LED2_PIN, LOW);
-        delay(delay_time);
-      }
-    }
-
-    digitalWrite(LED1_PIN, LOW);
-    digitalWrite(LED2_PIN, LOW);
-    flashing = false;
-    Serial.println("Flashing finished");
-    Serial.println("DONE");
-  }
-}
+#define LED1_PIN 10   // First LED
+#define LED2_PIN 9    // Second LED
+#define BUTTON_PIN 2  // Push button input
+
+int mode = 1;  
+int flash_rate = 1;
+int flash_duration = 1;
+int flash_pattern = 1;  
+bool flashing = false;
+bool button_was_pressed = false;
+bool trigger_enabled = false;  
+bool trigger_consumed = false; 
+unsigned long last_press_time = 0;
+
+// ---------------- flash engine (flash_engine.py is a python copy of it) ----------------
+// loop() never waits: every pass reads the serial bytes that arrived, checks the button and
+// calls update_flash(), which switches to the next pattern step when its time has come and
+// ends the run when the duration is over, so STOP/ STATUS/ SET work while flashing
+bool flash_started = false;  // the engine is running the current configuration
+bool have_table = false;     // false: unknown pattern, the LEDs stay off until the time is up
+unsigned long flash_start_ms = 0;
+unsigned long flash_length_ms = 0;
+unsigned long next_step_us = 0;
+uint8_t flash_step = 0;
+
+// a configuration sent with NEXT: it starts when the current run (or armed trigger) is over
+bool next_queued = false;
+int next_mode, next_rate, next_duration, next_pattern;
+
+// a software trigger (TRIGGER frame): the armed trigger starts at trigger_at_us (micros())
+// instead of on the button, the PC works out our clock with SYNC frames (see clock_sync.py)
+#define TRIGGER_MAX_AHEAD_MS 60000UL  // further ahead than this is refused (micros() wraps after 71 minutes)
+bool trigger_scheduled = false;
+unsigned long trigger_at_us = 0;
+uint8_t trigger_seq = 0;
+
+// ---------------- binary frame protocol (see binary_protocol.py) ----------------
+// [0xA5][version][type][seq][length][payload...][crc low][crc high]
+// the CRC is CRC-16/CCITT (poly 0x1021, start 0xFFFF) over version..payload
+// text commands ("SET 1 4 30 2") still work, frames are recognised by the 0xA5 byte
+#define FRAME_SOF 0xA5
+#define FRAME_VERSION 1
+#define FRAME_SET 0x01
+#define FRAME_START 0x02
+#define FRAME_STOP 0x03
+#define FRAME_STATUS 0x04
+#define FRAME_PATTERN 0x05
+#define FRAME_NEXT 0x06
+#define FRAME_SYNC 0x07
+#define FRAME_TRIGGER 0x08
+#define FRAME_ACK 0x80
+#define FRAME_NAK 0x81
+#define FRAME_ERROR_CRC 1
+#define FRAME_ERROR_LENGTH 2
+#define FRAME_ERROR_VALUE 3
+#define FRAME_ERROR_TYPE 4
+#define FRAME_ERROR_VERSION 5
+#define FRAME_MAX_PAYLOAD 32
+#define FRAME_TIMEOUT_MS 50   // a frame is dropped if its next byte takes longer than this
+#define TEXT_TIMEOUT_MS 1000  // a text command without '\n' is used after this much silence
+#define TEXT_MAX_LENGTH 63    // longer text commands are cut off
+
+// the bytes are collected as they arrive (nothing waits for the rest of a command)
+uint8_t frame_buffer[FRAME_MAX_PAYLOAD + 7];
+uint8_t frame_received = 0;  // bytes of the frame in frame_buffer (0 = not in a frame)
+unsigned long frame_last_byte_ms = 0;
+char text_buffer[TEXT_MAX_LENGTH + 1];
+uint8_t text_length = 0;
+bool text_receiving = false;
+unsigned long text_last_byte_ms = 0;
+
+// ---------------- link speed (see connection_manager.py) ----------------
+// the board always starts at 9600 baud. The PC offers faster rates with "BAUD r1 r2 ...",
+// we answer "BAUD OK r" with the first one we support and switch to it. The PC then has to
+// send "BAUD CONFIRM" at the new rate within BAUD_CONFIRM_MS, otherwise (the USB adapter or
+// the cable can not keep up) we go back to 9600 so the PC can still reach us
+#define DEFAULT_BAUD 9600
+#define BAUD_CONFIRM_MS 1000
+// 1M/ 500k/ 250k are exact on a 16MHz board, 115200 and below are within 2.1%
+const unsigned long supported_bauds[] = {1000000, 500000, 250000, 115200, 57600, 38400, 19200};
+#define SUPPORTED_BAUD_COUNT 7
+unsigned long link_baud = DEFAULT_BAUD;
+bool baud_confirm_pending = false;
+unsigned long baud_switched_ms = 0;
+
+// ---------------- pattern tables (see pattern_compiler.py) ----------------
+// every pattern is a table of steps: which LEDs are on (bit 0 = LED1, bit 1 = LED2) and for
+// how many microseconds. Patterns 1-4 are built here from the flash rate, pattern 0 is a
+// table uploaded by the PC with PATTERN frames
+#define PATTERN_CUSTOM 0
+#define PATTERN_MAX_STEPS 32
+#define PATTERN_STEP_SIZE 5  // mask (1 byte) + microseconds (4 bytes)
+
+// the built-in patterns, one entry per half period of the flash rate
+const uint8_t builtin_masks[4][8] = {
+  {1, 0},                    // 1: L1
+  {1, 2},                    // 2: L1:L2 (the LEDs take turns, no gap)
+  {1, 0, 1, 0, 2, 0},        // 3: L1:L1:L2
+  {1, 0, 1, 0, 1, 0, 2, 0},  // 4: L1:L1:L1:L2
+};
+const uint8_t builtin_lengths[4] = {2, 2, 6, 8};
+unsigned long builtin_us[8];
+
+// the uploaded table (usable once custom_received == custom_length)
+uint8_t custom_masks[PATTERN_MAX_STEPS];
+unsigned long custom_us[PATTERN_MAX_STEPS];
+uint8_t custom_length = 0;
+uint8_t custom_received = 0;
+
+// the table being flashed
+const uint8_t *active_masks = builtin_masks[0];
+const unsigned long *active_us = builtin_us;
+uint8_t active_length = 0;
+
+uint16_t crc16_update(uint16_t crc, uint8_t data) {
+  crc ^= (uint16_t)data << 8;
+  for (uint8_t i = 0; i < 8; i++) {
+    crc = (crc & 0x8000) ? (crc << 1) ^ 0x1021 : (crc << 1);
+  }
+  return crc;
+}
+
+void send_frame(uint8_t type, uint8_t seq, const uint8_t *payload, uint8_t length) {
+  uint8_t header[5] = {FRAME_SOF, FRAME_VERSION, type, seq, length};
+  uint16_t crc = 0xFFFF;
+  for (uint8_t i = 1; i < 5; i++) crc = crc16_update(crc, header[i]);
+  for (uint8_t i = 0; i < length; i++) crc = crc16_update(crc, payload[i]);
+  Serial.write(header, 5);
+  Serial.write(payload, length);
+  Serial.write((uint8_t)(crc & 0xFF));
+  Serial.write((uint8_t)(crc >> 8));
+}
+
+void send_ack(uint8_t type, uint8_t seq) {
+  send_frame(FRAME_ACK, seq, &type, 1);
+}
+
+void send_nak(uint8_t type, uint8_t seq, uint8_t error) {
+  uint8_t payload[2] = {type, error};
+  send_frame(FRAME_NAK, seq, payload, 2);
+}
+
+unsigned long flash_elapsed_ms() {
+  if (!flash_started) return 0;
+  unsigned long elapsed = millis() - flash_start_ms;
+  return elapsed < flash_length_ms ? elapsed : flash_length_ms;
+}
+
+// puts a micros() time into 4 bytes (little endian)
+void put_u32(uint8_t *bytes, unsigned long value) {
+  bytes[0] = (uint8_t)(value & 0xFF);
+  bytes[1] = (uint8_t)(value >> 8);
+  bytes[2] = (uint8_t)(value >> 16);
+  bytes[3] = (uint8_t)(value >> 24);
+}
+
+void send_status(uint8_t seq) {
+  uint8_t flags = (flashing ? 0x01 : 0) | (trigger_enabled ? 0x02 : 0) | (trigger_consumed ? 0x04 : 0) |
+                  (next_queued ? 0x08 : 0) | (trigger_scheduled ? 0x10 : 0);
+  unsigned long elapsed = flash_elapsed_ms();
+  uint8_t payload[11] = {
+    flags, (uint8_t)mode,
+    (uint8_t)(flash_rate & 0xFF), (uint8_t)(flash_rate >> 8),
+    (uint8_t)(flash_duration & 0xFF), (uint8_t)(flash_duration >> 8),
+    (uint8_t)flash_pattern,
+    (uint8_t)(elapsed & 0xFF), (uint8_t)(elapsed >> 8), (uint8_t)(elapsed >> 16), (uint8_t)(elapsed >> 24)
+  };
+  send_frame(FRAME_STATUS, seq, payload, 11);
+}
+
+bool custom_pattern_ready() {
+  return custom_length > 0 && custom_received == custom_length;
+}
+
+bool valid_configuration(int new_mode, int new_rate, int new_duration, int new_pattern) {
+  return (new_mode == 1 || new_mode == 2) && new_rate > 0 && new_duration > 0 &&
+         ((new_pattern >= 1 && new_pattern <= 4) || (new_pattern == PATTERN_CUSTOM && custom_pattern_ready()));
+}
+
+// picks the table for flash_pattern, returns false if there is nothing to flash
+// the built-in steps are timed from when each one should start (k * half period), rounded
+// down to a microsecond, so e.g. 3 Hz gives 166666/ 166667us steps instead of 166ms
+bool load_pattern_table() {
+  if (flash_pattern == PATTERN_CUSTOM) {
+    active_masks = custom_masks;
+    active_us = custom_us;
+    active_length = custom_pattern_ready() ? custom_length : 0;
+    return active_length > 0;
+  }
+  if (flash_pattern < 1 || flash_pattern > 4 || flash_rate <= 0) {
+    active_length = 0;
+    return false;
+  }
+  active_masks = builtin_masks[flash_pattern - 1];
+  active_length = builtin_lengths[flash_pattern - 1];
+  for (uint8_t k = 0; k < active_length; k++) {
+    builtin_us[k] = ((k + 1) * 500000UL) / flash_rate - (k * 500000UL) / flash_rate;
+  }
+  active_us = builtin_us;
+  return true;
+}
+
+void write_leds(uint8_t mask) {
+  digitalWrite(LED1_PIN, (mask & 0x01) ? HIGH : LOW);
+  digitalWrite(LED2_PIN, (mask & 0x02) ? HIGH : LOW);
+}
+
+// one PATTERN frame: [first step][total steps][mask, us (4 bytes)]...
+// returns 0 or the NAK error code
+uint8_t receive_pattern(const uint8_t *payload, uint8_t length) {
+  if (length < 2 || (length - 2) % PATTERN_STEP_SIZE != 0) return FRAME_ERROR_LENGTH;
+  uint8_t first = payload[0];
+  uint8_t total = payload[1];
+  uint8_t count = (length - 2) / PATTERN_STEP_SIZE;
+  if (total == 0 || total > PATTERN_MAX_STEPS || first + count > total) return FRAME_ERROR_VALUE;
+  // the first frame starts a new table, the others must follow on from the last one
+  if (first == 0) {
+    custom_length = total;
+    custom_received = 0;
+  } else if (first != custom_received || total != custom_length) {
+    return FRAME_ERROR_VALUE;
+  }
+  for (uint8_t i = 0; i < count; i++) {
+    const uint8_t *step = payload + 2 + i * PATTERN_STEP_SIZE;
+    unsigned long us = (unsigned long)step[1] | ((unsigned long)step[2] << 8) |
+                       ((unsigned long)step[3] << 16) | ((unsigned long)step[4] << 24);
+    if (step[0] > 3 || us == 0) {
+      custom_length = 0;  // a broken table can not be used
+      return FRAME_ERROR_VALUE;
+    }
+    custom_masks[first + i] = step[0];
+    custom_us[first + i] = us;
+  }
+  custom_received = first + count;
+  return 0;
+}
+
+// ends the run early (STOP, a new configuration or a new pattern table)
+void stop_flash() {
+  write_leds(0);
+  flashing = false;
+  flash_started = false;
+  Serial.println("Flashing stopped");
+}
+
+// stores a configuration and starts it (manual mode) or arms the trigger (trigger mode)
+// a run that is still flashing is stopped first
+void apply_configuration(int new_mode, int new_rate, int new_duration, int new_pattern) {
+  if (flash_started) stop_flash();
+  mode = new_mode;
+  flash_rate = new_rate;
+  flash_duration = new_duration;
+  flash_pattern = new_pattern;
+  trigger_enabled = (mode == 2);
+  trigger_consumed = false;
+  trigger_scheduled = false;
+  flashing = (mode == 1);
+  next_queued = false;
+}
+
+// true when nothing is flashing and no trigger is waiting for the button
+bool engine_idle() {
+  return !flashing && !(trigger_enabled && !trigger_consumed);
+}
+
+// NEXT: starts the configuration now if idle, otherwise when the current run is over
+// returns true if it was queued
+bool queue_configuration(int new_mode, int new_rate, int new_duration, int new_pattern) {
+  if (engine_idle()) {
+    apply_configuration(new_mode, new_rate, new_duration, new_pattern);
+    return false;
+  }
+  next_mode = new_mode;
+  next_rate = new_rate;
+  next_duration = new_duration;
+  next_pattern = new_pattern;
+  next_queued = true;
+  return true;
+}
+
+// STOP: stops flashing, disarms the trigger and forgets a queued configuration
+void stop_all() {
+  next_queued = false;
+  if (flash_started) stop_flash();
+  flashing = false;
+  trigger_enabled = false;
+  trigger_scheduled = false;
+}
+
+// the answer to a text SET (and the start of a queued configuration)
+void print_configuration() {
+  Serial.print("Mode: ");
+  Serial.println(mode);
+  Serial.print("Flash Rate: ");
+  Serial.println(flash_rate);
+  Serial.print("Duration: ");
+  Serial.println(flash_duration);
+  Serial.print("Pattern: ");
+  Serial.println(flash_pattern);
+
+  if (mode == 1) {
+    Serial.println("Manual Mode: Flashing started");
+  } else {
+    Serial.println("Trigger Mode: Waiting for button press...");
+  }
+}
+
+void print_flash_summary() {
+  Serial.print("Flashing Pattern ");
+  Serial.print(flash_pattern);
+  Serial.print(" at ");
+  Serial.print(flash_rate);
+  Serial.print(" Hz for ");
+  Serial.print(flash_duration);
+  Serial.println(" seconds.");
+}
+
+void start_flash() {
+  flash_started = true;
+  flash_start_ms = millis();
+  flash_length_ms = (unsigned long)flash_duration * 1000UL;
+  have_table = load_pattern_table();
+
+  // **Summary message before flashing begins**
+  print_flash_summary();
+
+  flash_step = 0;
+  next_step_us = micros();
+}
+
+// the software trigger's time has come: like the button, but the first step is written
+// straight away and the steps are timed from trigger_at_us (not from when loop() got here)
+// the table was loaded when the TRIGGER frame arrived, and the messages (~5us a character)
+// are sent after the LEDs are on, so nothing slow happens between the check and the LEDs
+void start_scheduled_flash() {
+  trigger_scheduled = false;
+  flashing = true;
+  trigger_consumed = true;
+  flash_started = true;
+  flash_start_ms = millis();
+  flash_length_ms = (unsigned long)flash_duration * 1000UL;
+  flash_step = 0;
+  next_step_us = trigger_at_us;
+  unsigned long started_us = micros();
+  update_flash();
+
+  // tell the PC when it really started (scheduled, started)
+  uint8_t payload[8];
+  put_u32(payload, trigger_at_us);
+  put_u32(payload + 4, started_us);
+  send_frame(FRAME_TRIGGER, trigger_seq, payload, 8);
+  print_flash_summary();
+}
+
+// one pass of the flash engine, called from every loop()
+// every step is due a fixed time after the one before it (not after the LEDs were written),
+// so the time spent in loop() does not add up over a long run
+void update_flash() {
+  if (millis() - flash_start_ms >= flash_length_ms) {
+    write_leds(0);
+    flashing = false;
+    flash_started = false;
+    Serial.println("Flashing finished");
+    Serial.println("DONE");
+    // a configuration sent with NEXT starts straight away
+    if (next_queued) {
+      apply_configuration(next_mode, next_rate, next_duration, next_pattern);
+      print_configuration();
+    }
+    return;
+  }
+  if (!have_table) return;
+  if ((long)(micros() - next_step_us) >= 0) {
+    write_leds(active_masks[flash_step]);
+    next_step_us += active_us[flash_step];
+    flash_step++;
+    if (flash_step >= active_length) flash_step = 0;
+  }
+}
+
+// switches the serial port to 'baud' (the bytes half way through a command are lost)
+void set_link_baud(unsigned long baud) {
+  Serial.flush();  // wait for our answer to leave at the old rate
+  Serial.end();
+  Serial.begin(baud);
+  link_baud = baud;
+  frame_received = 0;
+  text_length = 0;
+  text_receiving = false;
+}
+
+// "BAUD r1 r2 ...": switch to the first offered rate we support
+void offer_link_baud(const char *rates) {
+  unsigned long chosen = 0;
+  char *end;
+  while (chosen == 0) {
+    unsigned long rate = strtoul(rates, &end, 10);
+    if (end == rates) break;
+    rates = end;
+    for (uint8_t i = 0; i < SUPPORTED_BAUD_COUNT; i++) {
+      if (supported_bauds[i] == rate) chosen = rate;
+    }
+  }
+  if (chosen == 0) {
+    Serial.println("BAUD NO");
+    return;
+  }
+  Serial.print("BAUD OK ");
+  Serial.println(chosen);
+  set_link_baud(chosen);
+  baud_confirm_pending = true;
+  baud_switched_ms = millis();
+}
+
+// no "BAUD CONFIRM" at the new rate in time: go back to 9600
+void check_link_baud() {
+  if (baud_confirm_pending && millis() - baud_switched_ms > BAUD_CONFIRM_MS) {
+    baud_confirm_pending = false;
+    set_link_baud(DEFAULT_BAUD);
+  }
+}
+
+// the text commands: SET/ NEXT {mode} {flash rate} {duration} {pattern}, STOP, STATUS,
+// BAUD {rates...}, BAUD CONFIRM
+void handle_text_command(const char *command) {
+  Serial.print("Received: ");
+  Serial.println(command);
+
+  bool is_set = strncmp(command, "SET", 3) == 0;
+  bool is_next = strncmp(command, "NEXT", 4) == 0;
+  if (is_set || is_next) {
+    int temp_mode, temp_flash_rate, temp_duration, temp_pattern;
+    int parsed = sscanf(command + (is_set ? 3 : 4), "%d %d %d %d", &temp_mode, &temp_flash_rate, &temp_duration, &temp_pattern);
+
+    if (parsed == 4) {
+      if (is_next && queue_configuration(temp_mode, temp_flash_rate, temp_duration, temp_pattern)) {
+        Serial.println("Queued: starts after the current run");
+        return;
+      }
+      if (is_set) apply_configuration(temp_mode, temp_flash_rate, temp_duration, temp_pattern);
+      print_configuration();
+    } else {
+      Serial.println("Error parsing command!");
+    }
+  } else if (strncmp(command, "STOP", 4) == 0) {
+    bool was_armed = trigger_enabled && !trigger_consumed && !flashing;
+    stop_all();
+    if (was_armed) Serial.println("Trigger Mode: Disarmed");
+  } else if (strncmp(command, "STATUS", 6) == 0) {
+    Serial.print("Status: ");
+    if (flashing) {
+      Serial.print("flashing ");
+      Serial.print(flash_elapsed_ms());
+      Serial.print(" of ");
+      Serial.print(flash_length_ms);
+      Serial.println(" ms");
+    } else if (trigger_enabled && !trigger_consumed) {
+      Serial.println("waiting for button press");
+    } else {
+      Serial.println("idle");
+    }
+  } else if (strncmp(command, "BAUD CONFIRM", 12) == 0) {
+    baud_confirm_pending = false;
+    Serial.print("BAUD CONFIRMED ");
+    Serial.println(link_baud);
+  } else if (strncmp(command, "BAUD", 4) == 0) {
+    offer_link_baud(command + 4);
+  }
+}
+
+// answers the frame in frame_buffer (all of it has arrived)
+void handle_frame() {
+  // the time the frame arrived (for SYNC), before the CRC is worked out
+  unsigned long arrived_us = micros();
+  uint8_t version = frame_buffer[1];
+  uint8_t type = frame_buffer[2];
+  uint8_t seq = frame_buffer[3];
+  uint8_t length = frame_buffer[4];
+
+  uint16_t crc = 0xFFFF;
+  for (uint8_t i = 1; i < 5 + length; i++) crc = crc16_update(crc, frame_buffer[i]);
+  uint16_t received_crc = frame_buffer[5 + length] | ((uint16_t)frame_buffer[6 + length] << 8);
+  if (crc != received_crc) {
+    send_nak(type, seq, FRAME_ERROR_CRC);
+    return;
+  }
+  if (version != FRAME_VERSION) {
+    send_nak(type, seq, FRAME_ERROR_VERSION);
+    return;
+  }
+
+  uint8_t *payload = frame_buffer + 5;
+  if (type == FRAME_SET || type == FRAME_NEXT) {
+    if (length != 6) {
+      send_nak(type, seq, FRAME_ERROR_LENGTH);
+      return;
+    }
+    int new_mode = payload[0];
+    int new_rate = payload[1] | (payload[2] << 8);
+    int new_duration = payload[3] | (payload[4] << 8);
+    int new_pattern = payload[5];
+    if (!valid_configuration(new_mode, new_rate, new_duration, new_pattern)) {
+      send_nak(type, seq, FRAME_ERROR_VALUE);
+      return;
+    }
+    if (type == FRAME_SET) {
+      apply_configuration(new_mode, new_rate, new_duration, new_pattern);
+    } else {
+      queue_configuration(new_mode, new_rate, new_duration, new_pattern);
+    }
+    send_ack(type, seq);
+  } else if (type == FRAME_START) {
+    apply_configuration(mode, flash_rate, flash_duration, flash_pattern);
+    send_ack(type, seq);
+  } else if (type == FRAME_STOP) {
+    stop_all();
+    send_ack(type, seq);
+  } else if (type == FRAME_STATUS) {
+    send_status(seq);
+  } else if (type == FRAME_SYNC) {
+    uint8_t reply[4];
+    put_u32(reply, arrived_us);
+    send_frame(FRAME_SYNC, seq, reply, 4);
+  } else if (type == FRAME_TRIGGER) {
+    if (length != 4) {
+      send_nak(type, seq, FRAME_ERROR_LENGTH);
+      return;
+    }
+    unsigned long at_us = (unsigned long)payload[0] | ((unsigned long)payload[1] << 8) |
+                          ((unsigned long)payload[2] << 16) | ((unsigned long)payload[3] << 24);
+    // only an armed trigger (trigger mode, not pressed yet) can be started, a time that has
+    // already passed starts it straight away (the report says how late)
+    if (!trigger_enabled || trigger_consumed || flashing ||
+        (long)(at_us - arrived_us) > (long)(TRIGGER_MAX_AHEAD_MS * 1000UL)) {
+      send_nak(type, seq, FRAME_ERROR_VALUE);
+      return;
+    }
+    trigger_at_us = at_us;
+    trigger_seq = seq;
+    trigger_scheduled = true;
+    // the divisions for the built-in table take a few hundred us, so they are done now
+    have_table = load_pattern_table();
+    send_ack(type, seq);
+  } else if (type == FRAME_PATTERN) {
+    // the table can not change under a run that is flashing it (or is about to)
+    if (flash_started && flash_pattern == PATTERN_CUSTOM) stop_flash();
+    if (flash_pattern == PATTERN_CUSTOM) trigger_scheduled = false;
+    uint8_t error = receive_pattern(payload, length);
+    if (error) {
+      send_nak(type, seq, error);
+      return;
+    }
+    send_ack(type, seq);
+  } else {
+    send_nak(type, seq, FRAME_ERROR_TYPE);
+  }
+}
+
+// one byte of a frame (the 0xA5 byte is already in frame_buffer[0])
+void receive_frame_byte(uint8_t data) {
+  frame_buffer[frame_received++] = data;
+  frame_last_byte_ms = millis();
+  if (frame_received < 5) return;
+  uint8_t length = frame_buffer[4];
+  if (length > FRAME_MAX_PAYLOAD) {
+    send_nak(frame_buffer[2], frame_buffer[3], FRAME_ERROR_LENGTH);
+    frame_received = 0;
+  } else if (frame_received == length + 7) {
+    handle_frame();
+    frame_received = 0;
+  }
+}
+
+// reads every byte that has arrived (text commands end with '\n', frames start with 0xA5)
+void receive_serial() {
+  while (Serial.available()) {
+    uint8_t data = Serial.read();
+    if (frame_received > 0) {
+      receive_frame_byte(data);
+    } else if (!text_receiving && data == FRAME_SOF) {
+      frame_buffer[0] = data;
+      frame_received = 1;
+      frame_last_byte_ms = millis();
+    } else if (data == '\n') {
+      text_buffer[text_length] = '\0';
+      handle_text_command(text_buffer);
+      text_length = 0;
+      text_receiving = false;
+    } else {
+      text_receiving = true;
+      text_last_byte_ms = millis();
+      if (text_length < TEXT_MAX_LENGTH) text_buffer[text_length++] = data;
+    }
+  }
+
+  // a frame that stopped half way is dropped (NAK if we know which frame it was)
+  if (frame_received > 0 && millis() - frame_last_byte_ms > FRAME_TIMEOUT_MS) {
+    if (frame_received >= 5) send_nak(frame_buffer[2], frame_buffer[3], FRAME_ERROR_LENGTH);
+    frame_received = 0;
+  }
+  // a text command without '\n' is used anyway (like Serial.readStringUntil() did)
+  if (text_receiving && millis() - text_last_byte_ms > TEXT_TIMEOUT_MS) {
+    text_buffer[text_length] = '\0';
+    handle_text_command(text_buffer);
+    text_length = 0;
+    text_receiving = false;
+  }
+}
+
+void setup() {
+  Serial.begin(DEFAULT_BAUD);
+  pinMode(LED1_PIN, OUTPUT);
+  pinMode(LED2_PIN, OUTPUT);
+  pinMode(BUTTON_PIN, INPUT_PULLUP); 
+  digitalWrite(LED1_PIN, LOW);
+  digitalWrite(LED2_PIN, LOW);
+  Serial.println("Arduino Ready - Waiting for Configuration...");
+}
+
+void loop() {
+  // a scheduled software trigger is checked first, nothing else in loop() can delay it
+  if (trigger_scheduled && (long)(micros() - trigger_at_us) >= 0) {
+    start_scheduled_flash();
+  }
+
+  unsigned long current_time = millis();  
+
+  if (mode == 2 && trigger_enabled && !trigger_consumed && digitalRead(BUTTON_PIN) == LOW) {
+    if (!button_was_pressed && (current_time - last_press_time > 200)) {  
+      Serial.println("BUTTON PRESSED - TRIGGERING LED");
+      flashing = true;
+      trigger_consumed = true;  
+      trigger_scheduled = false;
+      button_was_pressed = true;
+      last_press_time = current_time;
+    }
+  } else {
+    button_was_pressed = false;
+  }
+
+  receive_serial();
+  check_link_baud();
+
+  if (!flashing) {
+    digitalWrite(LED1_PIN, LOW);
+    digitalWrite(LED2_PIN, LOW);
+  } else if (!flash_started) {
+    start_flash();
+  } else {
+    update_flash();
+  }
+}
@@ -0,0 +1,379 @@
+
+#*****************DEVICE EVENTS*****************
+# this file turns the lines the arduino prints into typed 'events', and keeps a model of
+# what the arduino has actually confirmed
+#
+# why:
+#   - everything the arduino printed used to be a string ("Arduino: Flash Rate: 4") that was
+#     only added to the serial monitor, and the settings preview showed what the GUI thinks
+#     it sent, not what the firmware applied
+#   - code that wanted to know "has it started flashing?" had to repeat line.startswith()
+#     checks (the GUI, the ledcontroller, the sequence scheduler ...)
+#
+# the events (every one has 'line' and 't_ns' = time.perf_counter_ns() when it was read):
+#   readyevent                  "Arduino Ready - Waiting for Configuration..."
+#   receivedevent (command)     "Received: SET 1 4 30 2" (the firmware's echo of a text command)
+#   configappliedevent          the four lines "Mode: 1", "Flash Rate: 4", "Duration: 30",
+#     (mode, flash_rate,        "Pattern: 2" of a text SET (one event once "Pattern:" arrives),
+#      flash_duration, pattern,  or the ACK of a binary SET/ NEXT (source="ack", made by the
+#      source)                   ledcontroller from the values it sent)
+#   armedevent (armed)          "Trigger Mode: Waiting for button press..." / "Trigger Mode: Disarmed"
+#   triggeredevent              "BUTTON PRESSED - TRIGGERING LED"
+#   triggerreportevent          the TRIGGER report of a software trigger (a binary frame, made by
+#     (scheduled_us, started_us, the ledcontroller): the arduino's micros() it was scheduled for/
+#      late_us)                  started at, and started - scheduled
+#   flashstartedevent           "Flashing Pattern 2 at 4 Hz for 30 seconds."
+#     (pattern, flash_rate, flash_duration)
+#   finishedevent (reason)      "Flashing finished" ("finished"), "Flashing stopped" ("stopped"), "DONE" ("done")
+#   parseerrorevent (reason)    "Error parsing command!", or a line we could not read the numbers of
+#   lineevent                   any other line (Status, BAUD, Queued ...)
+# the numbers are the firmware's (mode 1/ 2, pattern 0-4, see led_controller.py MODES/ PATTERNS)
+#
+# how it is fast:
+#   - the events use __slots__ (no dict per event)
+#   - the parser does not try every prefix: the first KEY_LENGTH characters of the line pick
+#     the (one or two) prefixes it can be from a dict built once (the 'dispatch table')
+#   - eventbatch collects the events of the reader thread so the GUI gets them in one signal
+#     per batch instead of one per line
+#
+# note: this file does not use PyQt6
+import threading #the event batch is filled by the reader thread and taken by the GUI thread
+
+#how many characters of a line pick its entry in the dispatch table (the shortest prefix is "DONE")
+KEY_LENGTH = 4
+
+
+#*****************THE EVENTS*****************
+
+# 'deviceevent' class: a line from the arduino that is not one of the events below
+class deviceevent:
+    __slots__ = ("line", "t_ns")
+
+    def __init__(self, line, t_ns=0):
+        self.line = line
+        self.t_ns = t_ns
+
+    #like receivedevent(command='SET 1 4 30 2', line='Received: SET 1 4 30 2')
+    def __repr__(self):
+        fields = "".join(f"{name}={getattr(self, name)!r}, " for name in type(self).__slots__ if name != "t_ns")
+        return f"{type(self).__name__}({fields}line={self.line!r})"
+
+
+# any other line
+class lineevent(deviceevent):
+    __slots__ = ()
+
+
+class readyevent(deviceevent):
+    __slots__ = ()
+
+
+class receivedevent(deviceevent):
+    __slots__ = ("command",)
+
+    def __init__(self, line, t_ns, command):
+        self.line = line
+        self.t_ns = t_ns
+        self.command = command
+
+
+class configappliedevent(deviceevent):
+    __slots__ = ("mode", "flash_rate", "flash_duration", "pattern", "source")
+
+    def __init__(self, line, t_ns, mode, flash_rate, flash_duration, pattern, source="text"):
+        self.line = line
+        self.t_ns = t_ns
+        self.mode = mode
+        self.flash_rate = flash_rate
+        self.flash_duration = flash_duration
+        self.pattern = pattern
+        self.source = source
+
+
+class armedevent(deviceevent):
+    __slots__ = ("armed",)
+
+    def __init__(self, line, t_ns, armed):
+        self.line = line
+        self.t_ns = t_ns
+        self.armed = armed
+
+
+class triggeredevent(deviceevent):
+    __slots__ = ()
+
+
+class triggerreportevent(deviceevent):
+    __slots__ = ("scheduled_us", "started_us", "late_us")
+
+    def __init__(self, line, t_ns, scheduled_us, started_us, late_us):
+        self.line = line
+        self.t_ns = t_ns
+        self.scheduled_us = scheduled_us
+        self.started_us = started_us
+        self.late_us = late_us
+
+
+class flashstartedevent(deviceevent):
+    __slots__ = ("pattern", "flash_rate", "flash_duration")
+
+    def __init__(self, line, t_ns, pattern, flash_rate, flash_duration):
+        self.line = line
+        self.t_ns = t_ns
+        self.pattern = pattern
+        self.flash_rate = flash_rate
+        self.flash_duration = flash_duration
+
+
+class finishedevent(deviceevent):
+    __slots__ = ("reason",)
+
+    def __init__(self, line, t_ns, reason):
+        self.line = line
+        self.t_ns = t_ns
+        self.reason = reason
+
+
+class parseerrorevent(deviceevent):
+    __slots__ = ("reason",)
+
+    def __init__(self, line, t_ns, reason):
+        self.line = line
+        self.t_ns = t_ns
+        self.reason = reason
+
+
+#*****************THE PARSER*****************
+
+# 'deviceparser' class that turns lines into events
+#   - parse(line, t_ns): returns the event, or None for the "Mode:"/ "Flash Rate:"/
+#     "Duration:" lines (they are part of the configappliedevent that "Pattern:" completes)
+# note: one parser per arduino, it remembers the configuration lines seen so far
+class deviceparser:
+
+    #(prefix, method) for every line the parser knows
+    PREFIXES = (
+        ("Arduino Ready", "ready"),
+        ("Received: ", "received"),
+        ("Mode: ", "configuration_value"),
+        ("Flash Rate: ", "configuration_value"),
+        ("Duration: ", "configuration_value"),
+        ("Pattern: ", "configuration_pattern"),
+        ("Trigger Mode: Waiting", "armed"),
+        ("Trigger Mode: Disarmed", "disarmed"),
+        ("BUTTON PRESSED", "triggered"),
+        ("Flashing Pattern ", "flash_started"),
+        ("Flashing finished", "finished"),
+        ("Flashing stopped", "finished"),
+        ("DONE", "finished"),
+        ("Error parsing command!", "parse_error"),
+    )
+
+    #the configuration lines and the field they fill
+    CONFIGURATION_FIELDS = {"Mode: ": "mode", "Flash Rate: ": "flash_rate", "Duration: ": "flash_duration"}
+    #the reason of each finishedevent
+    FINISH_REASONS = {"Flashing finished": "finished", "Flashing stopped": "stopped", "DONE": "done"}
+
+    #constructor that creates a deviceparser object (and builds its dispatch table)
+    def __init__(self):
+        #line[:KEY_LENGTH] -> tuple of (prefix, bound method), checked in order
+        self.table = {}
+        for prefix, method in self.PREFIXES:
+            key = prefix[:KEY_LENGTH]
+            self.table[key] = self.table.get(key, ()) + ((prefix, getattr(self, method)),)
+        #the configuration lines seen since the last "Received:" (field -> number)
+        self.partial = {}
+
+    #METHOD #1: parse
+    def parse(self, line, t_ns=0):
+        for prefix, method in self.table.get(line[:KEY_LENGTH], ()):
+            if line.startswith(prefix):
+                return method(line, t_ns, prefix)
+        return lineevent(line, t_ns)
+
+    #METHOD #2: reset
+    #   forgets the configuration lines seen so far (call it when the port is reopened)
+    def reset(self):
+        self.partial = {}
+
+
+    #*****************ONE METHOD PER KIND OF LINE*****************
+    #args: line, t_ns, prefix (the prefix that matched)
+
+    def ready(self, line, t_ns, prefix):
+        self.partial = {}
+        return readyevent(line, t_ns)
+
+    def received(self, line, t_ns, prefix):
+        #a new command, its configuration lines come next
+        self.partial = {}
+        return receivedevent(line, t_ns, line[len(prefix):])
+
+    def configuration_value(self, line, t_ns, prefix):
+        try:
+            self.partial[self.CONFIGURATION_FIELDS[prefix]] = int(line[len(prefix):])
+        except ValueError:
+            return parseerrorevent(line, t_ns, f"'{line[len(prefix):]}' is not a number")
+        return None
+
+    def configuration_pattern(self, line, t_ns, prefix):
+        partial, self.partial = self.partial, {}
+        try:
+            pattern = int(line[len(prefix):])
+        except ValueError:
+            return parseerrorevent(line, t_ns, f"'{line[len(prefix):]}' is not a number")
+        if len(partial) != len(self.CONFIGURATION_FIELDS):
+            return parseerrorevent(line, t_ns, "Pattern without the Mode/ Flash Rate/ Duration lines before it")
+        return configappliedevent(line, t_ns, partial["mode"], partial["flash_rate"], partial["flash_duration"], pattern)
+
+    def armed(self, line, t_ns, prefix):
+        return armedevent(line, t_ns, True)
+
+    def disarmed(self, line, t_ns, prefix):
+        return armedevent(line, t_ns, False)
+
+    def triggered(self, line, t_ns, prefix):
+        return triggeredevent(line, t_ns)
+
+    #"Flashing Pattern 2 at 4 Hz for 30 seconds."
+    def flash_started(self, line, t_ns, prefix):
+        words = line.split()
+        try:
+            return flashstartedevent(line, t_ns, int(words[2]), int(words[4]), int(words[7]))
+        except (ValueError, IndexError):
+            return parseerrorevent(line, t_ns, "unexpected 'Flashing Pattern' line")
+
+    def finished(self, line, t_ns, prefix):
+        return finishedevent(line, t_ns, self.FINISH_REASONS[prefix])
+
+    def parse_error(self, line, t_ns, prefix):
+        return parseerrorevent(line, t_ns, "the arduino could not parse the command")
+
+
+#*****************THE DEVICE STATE*****************
+
+# 'devicestate' class: what the arduino has confirmed, updated from the events
+#   - mode, flash_rate, flash_duration, pattern: the last configuration the arduino applied
+#     (None until one is confirmed), confirmed_at: its event's t_ns
+#   - ready, armed (trigger mode waiting for the button), flashing
+#   - runs_finished, triggers, parse_errors: counters, last_error: the last parseerrorevent
+class devicestate:
+
+    #constructor that creates a devicestate object
+    def __init__(self):
+        self.reset()
+        #type of event -> method (so apply() is one dict lookup)
+        self.handlers = {
+            readyevent: self.apply_ready,
+            configappliedevent: self.apply_config_applied,
+            armedevent: self.apply_armed,
+            triggeredevent: self.apply_triggered,
+            triggerreportevent: self.apply_triggered,
+            flashstartedevent: self.apply_flash_started,
+            finishedevent: self.apply_finished,
+            parseerrorevent: self.apply_parse_error,
+        }
+
+    #METHOD #1: reset
+    #   forgets everything (call it when the port is reopened, the arduino resets)
+    def reset(self):
+        self.ready = False
+        self.mode = None
+        self.flash_rate = None
+        self.flash_duration = None
+        self.pattern = None
+        self.confirmed_at = None
+        self.armed = False
+        self.flashing = False
+        self.runs_finished = 0
+        self.triggers = 0
+        self.parse_errors = 0
+        self.last_error = None
+
+    #METHOD #2: apply
+    #   updates the state from one event, returns True if the event changed anything
+    def apply(self, event):
+        handler = self.handlers.get(type(event))
+        if handler is None:
+            return False
+        handler(event)
+        return True
+
+    #METHOD #3: configuration
+    #   returns: (mode, flash rate, duration, pattern) the arduino confirmed, or None
+    #            (the mode is None if only a "Flashing Pattern" line confirmed the rest)
+    def configuration(self):
+        if self.confirmed_at is None:
+            return None
+        return self.mode, self.flash_rate, self.flash_duration, self.pattern
+
+
+    #*****************ONE METHOD PER EVENT*****************
+
+    def apply_ready(self, event):
+        self.reset()
+        self.ready = True
+
+    def apply_config_applied(self, event):
+        self.mode = event.mode
+        self.flash_rate = event.flash_rate
+        self.flash_duration = event.flash_duration
+        self.pattern = event.pattern
+        self.confirmed_at = event.t_ns
+
+    def apply_armed(self, event):
+        self.armed = event.armed
+
+    def apply_triggered(self, event):
+        self.armed = False
+        self.triggers += 1
+
+    #the line the run starts with also confirms the pattern/ rate/ duration (a binary SET
+    #has no "Mode:" lines, and a queued configuration only says it here)
+    def apply_flash_started(self, event):
+        self.flashing = True
+        self.armed = False
+        self.pattern = event.pattern
+        self.flash_rate = event.flash_rate
+        self.flash_duration = event.flash_duration
+        self.confirmed_at = event.t_ns
+
+    def apply_finished(self, event):
+        if event.reason == "done":
+            self.runs_finished += 1
+        self.flashing = False
+
+    def apply_parse_error(self, event):
+        self.parse_errors += 1
+        self.last_error = event
+
+
+#*****************BATCHES*****************
+
+# 'eventbatch' class: the events of one thread, taken all at once by another
+#   - add(event): returns True if the batch was empty (so the caller tells the other thread,
+#     once per batch, e.g. with a Qt signal)
+#   - take(): returns the events so far (oldest first) and starts a new batch
+class eventbatch:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.events = []
+        #how many events were added, in how many batches (added - batches = events that did
+        #not need a signal of their own)
+        self.added = 0
+        self.batches = 0
+
+    def add(self, event):
+        with self.lock:
+            self.events.append(event)
+            self.added += 1
+            if len(self.events) == 1:
+                self.batches += 1
+                return True
+            return False
+
+    def take(self):
+        with self.lock:
+            events, self.events = self.events, []
+        return events
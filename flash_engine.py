@@ -0,0 +1,179 @@
+#*****************FLASH ENGINE (REFERENCE MODEL)*****************
+# this file holds a python copy of the firmware's flash state machine (start_flash()/
+# update_flash()/ stop_flash() in controller_code.ino), so its timing can be checked on a PC
+#
+# why:
+#   - the firmware used to flash in a blocking delay() loop: for the whole run it ignored
+#     the serial port and the button, a run could not be stopped and it ended up to one
+#     whole pattern cycle late
+#   - now loop() never waits: every pass it reads whatever serial bytes arrived, checks the
+#     button and calls update_flash(), which switches to the next table step once its time
+#     (micros()) has come and ends the run as soon as the duration (millis()) is over
+#
+# the 'flashengine' class below does exactly what update_flash() does, without a clock of
+# its own (the caller passes the time in). The emulator (arduino_emulator.py) runs it,
+# and simulate() runs it on a simulated arduino uno to measure the timing error
+#
+# note: the micros()/ millis() wrap-around (70 minutes/ 50 days) is not modelled, python
+# numbers do not wrap and the firmware's unsigned subtraction handles it
+from pattern_compiler import MASK_LED1, MASK_LED2
+
+#update() returns this when the run is over (the LEDs must be switched off)
+FLASH_DONE = -1
+
+#an arduino uno: micros() counts in steps of 4us, a digitalWrite() takes about 4us and
+#one pass of loop() with nothing to do (button, Serial.available(), millis()) about 12us
+UNO_MICROS_RESOLUTION_US = 4
+UNO_DIGITAL_WRITE_US = 4
+UNO_LOOP_US = 12
+
+
+# 'flashengine' class: the firmware's flash state machine
+#   - start(table, flash_duration, now_us): start flashing 'table' (None = nothing to flash,
+#     the LEDs stay off until the duration is over)
+#   - update(now_us): one pass of update_flash(), returns the LED mask to write now,
+#     None (nothing to do) or FLASH_DONE
+#   - stop(): stop straight away (STOP, or a new configuration while flashing)
+class flashengine:
+
+    #constructor that creates a flashengine object
+    def __init__(self):
+        self.running = False
+        self.table = None
+        self.step = 0
+        self.next_step_us = 0
+        self.start_ms = 0
+        self.length_ms = 0
+
+    #METHOD #1: start
+    def start(self, table, flash_duration, now_us):
+        self.running = True
+        self.table = table or None
+        self.step = 0
+        self.start_ms = now_us // 1000
+        self.length_ms = flash_duration * 1000
+        self.next_step_us = now_us
+
+    #METHOD #2: update
+    def update(self, now_us):
+        if not self.running:
+            return None
+        if now_us // 1000 - self.start_ms >= self.length_ms:
+            self.running = False
+            return FLASH_DONE
+        if self.table is None or now_us < self.next_step_us:
+            return None
+        mask, microseconds = self.table[self.step]
+        #the next step is due a fixed time after this one was due (not after it was written)
+        self.next_step_us += microseconds
+        self.step = (self.step + 1) % len(self.table)
+        return mask
+
+    #METHOD #3: stop
+    def stop(self):
+        self.running = False
+
+    #METHOD #4: elapsed_ms
+    #   how long the current run has been going (what STATUS reports)
+    def elapsed_ms(self, now_us):
+        return min(now_us // 1000 - self.start_ms, self.length_ms) if self.running else 0
+
+    #METHOD #5: next_event_us
+    #   the time update() next has something to do (None if not running), so an emulator
+    #   can sleep until then instead of spinning like the arduino does
+    def next_event_us(self):
+        if not self.running:
+            return None
+        end_us = (self.start_ms + self.length_ms) * 1000
+        return end_us if self.table is None else min(self.next_step_us, end_us)
+
+
+#*****************SIMULATOR*****************
+
+#function to run a table through the flash engine on a simulated arduino:
+#loop() passes take loop_us, micros() counts in micros_resolution_us steps and every LED
+#change is a digitalWrite() (LED1 then LED2) that takes digital_write_us
+#args: table (from pattern_compiler.compile_pattern()), flash_duration (s)
+#returns: list of (time us, mask) for every change of the LEDs (the last one is 'off')
+def simulate(table, flash_duration, loop_us=UNO_LOOP_US, micros_resolution_us=UNO_MICROS_RESOLUTION_US,
+             digital_write_us=UNO_DIGITAL_WRITE_US):
+    now = 0
+    mask_now = 0
+    changes = []
+
+    def micros(time_us):
+        return time_us - time_us % micros_resolution_us
+
+    #writes both LEDs (like write_leds() in the firmware), a LED changes when its write finishes
+    def write_leds(mask):
+        nonlocal now, mask_now
+        for bit in (MASK_LED1, MASK_LED2):
+            now += digital_write_us
+            new_mask = (mask_now & ~bit) | (mask & bit)
+            if new_mask != mask_now:
+                mask_now = new_mask
+                changes.append((now, new_mask))
+
+    engine = flashengine()
+    engine.start(table, flash_duration, micros(now))
+    while True:
+        mask = engine.update(micros(now))
+        if mask == FLASH_DONE:
+            write_leds(0)
+            return changes
+        if mask is not None:
+            write_leds(mask)
+        #the next pass of loop(), skipping the passes that would find nothing to do
+        now += loop_us
+        due = engine.next_event_us()
+        if micros(now) < due:
+            now += (due - now) // loop_us * loop_us
+            while micros(now) < due:
+                now += loop_us
+
+
+#function to list the exact times (us) the LED changes of a table should happen at
+#returns: list of (time us, mask) like simulate() returns, but without any timing error
+def ideal_changes(table, flash_duration):
+    end_us = flash_duration * 1000000
+    changes = []
+    mask_now = 0
+    now = 0
+    step = 0
+    while now < end_us:
+        mask, microseconds = table[step]
+        if mask != mask_now:
+            changes.append((now, mask))
+            mask_now = mask
+        now += microseconds
+        step = (step + 1) % len(table)
+    if mask_now:
+        changes.append((end_us, 0))
+    return changes
+
+
+#function to compare LED changes with the ideal ones (both lists from the functions above)
+#a board switches the two LEDs one after the other, so the in-between states (like both off
+#for 4us when going from L1 to L2) are skipped and each ideal change is matched to the
+#first change that reaches the same mask
+#returns: dict with the number of matched changes, the mean/ max error (us), the error of the
+#         last change and how many ideal changes never happened
+def timing_error(changes, ideal):
+    errors = []
+    position = 0
+    for time_us, mask in ideal:
+        while position < len(changes) and changes[position][1] != mask:
+            position += 1
+        if position == len(changes):
+            break
+        errors.append(changes[position][0] - time_us)
+        position += 1
+    if not errors:
+        return {"changes": 0, "mean": 0.0, "max": 0, "last": 0, "missing": len(ideal)}
+    return {
+        "changes": len(errors),
+        "mean": sum(abs(error) for error in errors) / len(errors),
+        "max": max(abs(error) for error in errors),
+        "last": errors[-1],
+        "missing": len(ideal) - len(errors),
+    }
@@ -0,0 +1,312 @@
+#*****************GUI PROFILER*****************
+# this file finds out what makes the GUI stutter (opt-in: python "GUI Test 1.py" --profile,
+# or set LED_GUI_PROFILE=1)
+#
+# the problem this solves:
+#   - when the window stutters we could not tell which part is responsible: the serial
+#     monitor, update_configuration_preview() (five QLabels rewritten on every click), or a
+#     serial call that blocks the GUI thread (connect/ send_configuration ...)
+#
+# how it works:
+#   - wrap_methods() replaces the GUI's slots (and the ledcontroller calls the GUI makes) on
+#     the object with a timed copy BEFORE they are connected, so every call is timed (a slot
+#     called from another slot is timed too, and shows up inside it in the trace)
+#   - count_signals() connects a counter to the serialclass signals: the deliveries to the GUI
+#     thread per second (the peak second is kept)
+#   - the heartbeat: a QTimer in the GUI thread fires every HEARTBEAT_MS, how late it fires is
+#     the event loop lag. a watchdog thread checks the heartbeat, if the GUI thread has not run
+#     it for STALL_MS it saves the GUI thread's stack (what it is stuck in) for the stall
+#   - write() saves a summary (.txt, also printed) and a trace (.json, the Chrome trace format:
+#     open it in chrome://tracing or https://ui.perfetto.dev)
+#
+# the cost: ~2us per timed call (see benchmarks/bench_gui_profiler.py), nothing at all when
+# profiling is off (nothing is wrapped)
+#
+# note: this file uses PyQt6 (the heartbeat timer), the GUI only imports it with --profile
+import collections #deque (the trace), Counter (the signal deliveries)
+import functools #partial (one counter function for every signal)
+import inspect #how many arguments a slot takes
+import json #the trace file
+import os #the profile folder, the process id in the trace
+import sys #_current_frames (the GUI thread's stack during a stall)
+import threading #the watchdog thread
+import time #perf_counter_ns
+import traceback #formatting the stack
+
+from PyQt6.QtCore import QTimer
+
+from latency_metrics import percentile, rollingstats
+
+HEARTBEAT_MS = 10 #how often the heartbeat timer fires in the GUI thread
+STALL_MS = 100 #the GUI thread not running the heartbeat for this long is a stall
+WATCHDOG_MS = 20 #how often the watchdog thread looks at the heartbeat
+MAX_TRACE_EVENTS = 1000000 #the trace keeps the newest ones (~100MB of JSON at most)
+SLOT_SAMPLES = 10000 #calls kept per slot for the percentiles
+STACK_FRAMES = 12 #innermost frames saved for a stall
+STALLS_SHOWN = 3 #stalls (longest first) whose stack is in the summary
+
+
+# 'guiprofiler' class that times the GUI's slots and watches the GUI thread
+#   - create and start() it in the GUI thread (the QApplication must exist)
+#   - wrap_methods()/ count_signals() before the slots are connected (see systemGUI.__init__)
+#   - stop() and write() when the window has closed
+class guiprofiler:
+
+    #constructor that creates a guiprofiler object
+    def __init__(self):
+        self.gui_thread = threading.get_ident()
+        self.lock = threading.Lock()
+        self.started_ns = time.perf_counter_ns()
+        self.stopped_ns = None
+
+        #every timed call: (name, category, thread id, start ns, duration ns, args)
+        self.trace = collections.deque(maxlen=MAX_TRACE_EVENTS)
+        self.trace_count = 0
+        #per slot: [calls, total ns] and the newest durations (seconds) for the percentiles
+        self.slot_totals = {}
+        self.slot_samples = {}
+
+        #signal deliveries: the total, the count at the last rate sample and the peak per second
+        self.signals = collections.Counter()
+        self.signals_at_last_rate = collections.Counter()
+        self.signal_peaks = collections.Counter()
+        self.last_rate_ns = self.started_ns
+
+        #the heartbeat/ watchdog
+        self.heartbeat = None
+        self.last_beat_ns = self.started_ns
+        self.lag = rollingstats(SLOT_SAMPLES)
+        self.stall_stack = None #saved by the watchdog, taken by the heartbeat when the stall ends
+        self.stalls = [] #(start ns, duration ns, stack)
+        self.watchdog = None
+        self.stop_event = threading.Event()
+
+    #METHOD #1: wrap
+    #   args: name (shown in the summary/ trace), function, category ("slot", "controller" ...)
+    #   returns: a function that calls 'function' and times it
+    #   note: Qt passes every argument of the signal (like clicked's 'checked'), a slot that
+    #         takes fewer only gets the first ones (what Qt does for a slot that is not wrapped)
+    def wrap(self, name, function, category="slot"):
+        try:
+            parameters = inspect.signature(function).parameters.values()
+        except (TypeError, ValueError):
+            parameters = None
+        taken = None
+        if parameters is not None and not any(parameter.kind == parameter.VAR_POSITIONAL for parameter in parameters):
+            taken = sum(parameter.kind in (parameter.POSITIONAL_ONLY, parameter.POSITIONAL_OR_KEYWORD)
+                        for parameter in parameters)
+        add_call = self.add_call
+
+        @functools.wraps(function)
+        def timed(*args, **keywords):
+            if taken is not None:
+                args = args[:taken]
+            started = time.perf_counter_ns()
+            try:
+                return function(*args, **keywords)
+            finally:
+                add_call(name, category, started, time.perf_counter_ns() - started)
+        return timed
+
+    #METHOD #2: wrap_methods
+    #   replaces target.<name> with a timed copy for every name
+    #   args: target (the object), names, prefix (put in front of the names in the summary)
+    def wrap_methods(self, target, names, prefix="", category="slot"):
+        for name in names:
+            setattr(target, name, self.wrap(prefix + name, getattr(target, name), category))
+
+    #METHOD #3: count_signals
+    #   counts every delivery of the signals (connect in the GUI thread: the counter runs
+    #   there, so a signal from another thread is counted when the GUI thread gets it)
+    #   args: source (the QObject with the signals), names
+    def count_signals(self, source, names):
+        for name in names:
+            getattr(source, name).connect(functools.partial(self.signal_delivered, name))
+
+    #METHOD #4: start
+    #   starts the heartbeat timer (GUI thread) and the watchdog thread
+    def start(self):
+        self.last_beat_ns = time.perf_counter_ns()
+        self.heartbeat = QTimer()
+        self.heartbeat.setInterval(HEARTBEAT_MS)
+        self.heartbeat.timeout.connect(self.beat)
+        self.heartbeat.start()
+        self.stop_event.clear()
+        self.watchdog = threading.Thread(target=self.watchdog_loop, name="gui-watchdog", daemon=True)
+        self.watchdog.start()
+
+    #METHOD #5: stop
+    def stop(self):
+        if self.heartbeat is not None:
+            self.heartbeat.stop()
+            self.heartbeat = None
+        if self.watchdog is not None:
+            self.stop_event.set()
+            self.watchdog.join()
+            self.watchdog = None
+        self.stopped_ns = time.perf_counter_ns()
+        #the deliveries since the last full second
+        self.sample_signal_rates(self.stopped_ns)
+
+    #METHOD #6: summary
+    #   returns: dict with the seconds profiled, the slots (name -> calls/ total/ mean/ p99/ max
+    #   in ms, slowest total first), the signals (name -> total/ mean per second/ peak per
+    #   second), the lag summary (seconds, see rollingstats) and the stalls (longest first)
+    def summary(self):
+        end = self.stopped_ns or time.perf_counter_ns()
+        seconds = (end - self.started_ns) / 1e9
+        with self.lock:
+            slots = {}
+            for name, (calls, total_ns) in self.slot_totals.items():
+                values = sorted(self.slot_samples[name])
+                slots[name] = {
+                    "calls": calls,
+                    "total_ms": total_ns / 1e6,
+                    "mean_ms": total_ns / 1e6 / calls,
+                    "p99_ms": percentile(values, 0.99) * 1000,
+                    "max_ms": values[-1] * 1000,
+                }
+            signals = {name: {"total": count, "per_second": count / seconds if seconds else 0.0,
+                              "peak_per_second": self.signal_peaks[name]}
+                       for name, count in self.signals.items()}
+            stalls = sorted(self.stalls, key=lambda stall: -stall[1])
+        return {
+            "seconds": seconds,
+            "slots": dict(sorted(slots.items(), key=lambda item: -item[1]["total_ms"])),
+            "signals": signals,
+            "lag": self.lag.summary(),
+            "stalls": [{"at_s": (start - self.started_ns) / 1e9, "ms": duration / 1e6, "stack": stack}
+                       for start, duration, stack in stalls],
+            "trace_events": self.trace_count,
+            "trace_dropped": self.trace_count - len(self.trace),
+        }
+
+    #METHOD #7: write
+    #   writes <folder>/profile-<date>-<time>.txt (the summary) and .json (the trace)
+    #   returns: (summary path, trace path)
+    def write(self, folder):
+        os.makedirs(folder, exist_ok=True)
+        base = os.path.join(folder, time.strftime("profile-%Y%m%d-%H%M%S"))
+        with open(base + ".txt", "w") as file:
+            file.write(format_profile(self.summary()) + "\n")
+        with open(base + ".json", "w") as file:
+            json.dump({"traceEvents": self.trace_events(), "displayTimeUnit": "ms"}, file)
+        return base + ".txt", base + ".json"
+
+
+    #*****************RECORDING (any thread)*****************
+
+    def add_call(self, name, category, started_ns, duration_ns):
+        with self.lock:
+            totals = self.slot_totals.get(name)
+            if totals is None:
+                totals = self.slot_totals[name] = [0, 0]
+                self.slot_samples[name] = collections.deque(maxlen=SLOT_SAMPLES)
+            totals[0] += 1
+            totals[1] += duration_ns
+            self.slot_samples[name].append(duration_ns / 1e9)
+            self.trace.append((name, category, threading.get_ident(), started_ns, duration_ns, None))
+            self.trace_count += 1
+
+    def signal_delivered(self, name, *_):
+        self.signals[name] += 1
+
+
+    #*****************HEARTBEAT (GUI thread)/ WATCHDOG (its own thread)*****************
+
+    def beat(self):
+        now = time.perf_counter_ns()
+        gap = now - self.last_beat_ns
+        self.lag.add(max(0, gap / 1e9 - HEARTBEAT_MS / 1000))
+        if gap > STALL_MS * 1000000:
+            with self.lock:
+                stack, self.stall_stack = self.stall_stack, None
+            self.stalls.append((self.last_beat_ns, gap, stack))
+            with self.lock:
+                self.trace.append(("GUI thread stall", "stall", self.gui_thread, self.last_beat_ns, gap, {"stack": stack}))
+                self.trace_count += 1
+        self.last_beat_ns = now
+        if now - self.last_rate_ns >= 1000000000:
+            self.sample_signal_rates(now)
+
+    #signal deliveries per second since the last sample (and a counter track in the trace)
+    def sample_signal_rates(self, now):
+        seconds = (now - self.last_rate_ns) / 1e9
+        if seconds <= 0:
+            return
+        rates = {}
+        for name, count in self.signals.items():
+            rates[name] = round((count - self.signals_at_last_rate[name]) / seconds)
+            self.signal_peaks[name] = max(self.signal_peaks[name], rates[name])
+        self.signals_at_last_rate = collections.Counter(self.signals)
+        self.last_rate_ns = now
+        with self.lock:
+            self.trace.append(("signals/s", "counter", self.gui_thread, now, None, rates))
+            self.trace_count += 1
+
+    def watchdog_loop(self):
+        saved_for = None
+        while not self.stop_event.wait(WATCHDOG_MS / 1000):
+            last_beat = self.last_beat_ns
+            #one stack per stall (the first look after STALL_MS: what the GUI thread is stuck in)
+            if time.perf_counter_ns() - last_beat > STALL_MS * 1000000 and saved_for != last_beat:
+                saved_for = last_beat
+                frame = sys._current_frames().get(self.gui_thread)
+                if frame is not None:
+                    stack = "".join(traceback.format_stack(frame)[-STACK_FRAMES:])
+                    with self.lock:
+                        self.stall_stack = stack
+
+    #the trace in the Chrome trace event format (times in microseconds)
+    def trace_events(self):
+        process = os.getpid()
+        thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+        thread_names[self.gui_thread] = "GUI thread"
+        with self.lock:
+            trace = list(self.trace)
+        events = []
+        threads = set()
+        for name, category, thread, started_ns, duration_ns, args in trace:
+            timestamp = (started_ns - self.started_ns) / 1000
+            if duration_ns is None:
+                events.append({"name": name, "cat": category, "ph": "C", "ts": timestamp, "pid": process,
+                               "tid": thread, "args": args})
+                continue
+            event = {"name": name, "cat": category, "ph": "X", "ts": timestamp, "dur": duration_ns / 1000,
+                     "pid": process, "tid": thread}
+            if args:
+                event["args"] = args
+            events.append(event)
+            threads.add(thread)
+        for thread in threads:
+            events.append({"name": "thread_name", "ph": "M", "pid": process, "tid": thread,
+                           "args": {"name": thread_names.get(thread, f"thread {thread}")}})
+        return events
+
+
+#function to turn a summary() into text
+def format_profile(summary):
+    lines = [f"GUI profile: {summary['seconds']:.1f} s, {len(summary['stalls'])} stalls over {STALL_MS} ms"
+             + (f" (longest {summary['stalls'][0]['ms']:.0f} ms)" if summary["stalls"] else "")]
+    lag = summary["lag"]
+    if lag is not None:
+        lines.append(f"event loop lag ({HEARTBEAT_MS} ms heartbeat): p50 {lag['p50'] * 1000:.1f} ms  "
+                     f"p99 {lag['p99'] * 1000:.1f} ms  max {lag['max'] * 1000:.1f} ms")
+    lines.append("")
+    lines.append(f"{'slot/ call':<40}{'calls':>8}{'total':>11}{'mean':>10}{'p99':>10}{'max':>10}")
+    for name, slot in summary["slots"].items():
+        lines.append(f"{name:<40}{slot['calls']:>8}{slot['total_ms']:>9.1f}ms{slot['mean_ms']:>8.3f}ms"
+                     f"{slot['p99_ms']:>8.3f}ms{slot['max_ms']:>8.1f}ms")
+    if summary["signals"]:
+        lines.append("")
+        lines.append(f"{'signals delivered to the GUI thread':<40}{'total':>8}{'mean/s':>11}{'peak/s':>10}")
+        for name, signal in summary["signals"].items():
+            lines.append(f"{name:<40}{signal['total']:>8}{signal['per_second']:>11.1f}{signal['peak_per_second']:>10}")
+    for stall in summary["stalls"][:STALLS_SHOWN]:
+        lines.append("")
+        lines.append(f"stall of {stall['ms']:.0f} ms at {stall['at_s']:.1f} s, the GUI thread was in:")
+        lines.append((stall["stack"] or "  (no stack, the stall ended before the watchdog looked)\n").rstrip())
+    if summary["trace_dropped"]:
+        lines.append("")
+        lines.append(f"(the trace kept the newest {MAX_TRACE_EVENTS} of {summary['trace_events']} events)")
+    return "\n".join(lines)
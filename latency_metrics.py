@@ -0,0 +1,190 @@
+
+#*****************LATENCY METRICS*****************
+# this file measures how long the arduino takes to answer, so we can see where the time goes
+# (the 9600 baud link, the serial reader or the GUI thread)
+#
+# what is measured (all on the PC, with time.perf_counter_ns()):
+#   - SET -> confirmed:   configuration sent -> "Received: SET ..." (text) or "ACK SET" (binary,
+#                         not the "ACK PATTERN"s of a custom pattern's table sent before it)
+#   - SET -> flashing:    configuration sent -> "Flashing Pattern ..." (manual mode)
+#   - SET -> DONE:        configuration sent -> "DONE" (manual mode)
+#   - armed -> button:    "Trigger Mode: Waiting for button press..." (or the ACK of a trigger
+#                         mode SET) -> "BUTTON PRESSED" (how long the trigger took to come)
+#   - button -> flashing: "BUTTON PRESSED" -> "Flashing Pattern ..."
+#   - reader -> GUI:      line read in the reader thread -> handled in the GUI thread
+#
+# every metric keeps the last ROLLING_SAMPLES values, summary() gives p50/ p95/ p99/ max
+#
+# note: this file does not use PyQt6, the ledcontroller feeds it from the reader thread
+import collections #deque for the rolling samples
+import csv #export
+import threading #the samples are added from the reader thread and read from the GUI thread
+
+#how many samples each metric keeps
+ROLLING_SAMPLES = 1000
+
+#the metrics (key -> name shown to the user), in the order they are shown
+METRIC_NAMES = {
+    "send_to_confirm": "SET -> confirmed",
+    "send_to_flashing": "SET -> flashing",
+    "send_to_done": "SET -> DONE",
+    "armed_to_button": "armed -> button",
+    "button_to_flashing": "button -> flashing",
+    "reader_to_gui": "reader -> GUI",
+}
+
+#the answers that confirm a configuration (text, binary)
+CONFIRM_PREFIXES = ("Received: SET", "Received: NEXT", "ACK SET", "ACK NEXT")
+#the lines (start of the line) that the tracker looks at
+TRACKED_PREFIXES = CONFIRM_PREFIXES + ("Trigger Mode: Waiting", "BUTTON PRESSED", "Flashing Pattern", "DONE")
+
+
+#function to get a percentile from a sorted list (nearest rank)
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+# 'rollingstats' class that keeps the newest samples of one metric
+class rollingstats:
+
+    def __init__(self, size=ROLLING_SAMPLES):
+        self.samples = collections.deque(maxlen=size)
+        self.count = 0 #all samples ever added (not just the ones kept)
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+        self.count += 1
+
+    #returns: dict with count, p50, p95, p99, max and mean (seconds), or None if there are no samples
+    def summary(self):
+        values = sorted(self.samples)
+        if not values:
+            return None
+        return {
+            "count": self.count,
+            "p50": percentile(values, 0.50),
+            "p95": percentile(values, 0.95),
+            "p99": percentile(values, 0.99),
+            "max": values[-1],
+            "mean": sum(values) / len(values),
+        }
+
+
+# 'latencytracker' class that matches the packets we send to the arduino's answers
+#   - sent(mode, timestamp_ns): call when a configuration was sent ("Manual Mode"/ "Trigger Mode")
+#   - line(line, timestamp_ns): call for every line (and ACK/ NAK) from the arduino
+#   - add(metric, seconds): add a sample measured somewhere else (like "reader_to_gui")
+class latencytracker:
+
+    #constructor that creates a latencytracker object
+    def __init__(self, size=ROLLING_SAMPLES):
+        self.size = size
+        self.lock = threading.Lock()
+        self.stats = {metric: rollingstats(size) for metric in METRIC_NAMES}
+        #when the last configuration was sent, and which answers we are still waiting for
+        self.sent_at = None
+        self.sent_mode = None
+        self.waiting_for = set()
+        #when the arduino started waiting for the trigger/ when the button was pressed
+        self.armed_at = None
+        self.button_at = None
+
+    #METHOD #1: sent
+    def sent(self, mode, timestamp_ns):
+        with self.lock:
+            self.sent_at = timestamp_ns
+            self.sent_mode = mode
+            self.armed_at = None
+            self.button_at = None
+            self.waiting_for = {"send_to_confirm"}
+            if mode == "Manual Mode":
+                self.waiting_for |= {"send_to_flashing", "send_to_done"}
+
+    #METHOD #2: line
+    #   returns: True if the line was one of the answers we measure
+    def line(self, line, timestamp_ns):
+        with self.lock:
+            if line.startswith(CONFIRM_PREFIXES):
+                measured = self.answered("send_to_confirm", self.sent_at, timestamp_ns)
+                #binary trigger mode: the ACK is the only sign that the arduino is armed
+                if measured and self.sent_mode == "Trigger Mode" and line.startswith("ACK"):
+                    self.armed_at = timestamp_ns
+                return measured
+            if line.startswith("Trigger Mode: Waiting"):
+                self.armed_at = timestamp_ns
+                return True
+            if line.startswith("BUTTON PRESSED"):
+                if self.armed_at is not None:
+                    self.stats["armed_to_button"].add((timestamp_ns - self.armed_at) / 1e9)
+                    self.armed_at = None
+                self.button_at = timestamp_ns
+                return True
+            if line.startswith("Flashing Pattern"):
+                if self.button_at is not None:
+                    self.stats["button_to_flashing"].add((timestamp_ns - self.button_at) / 1e9)
+                    self.button_at = None
+                self.answered("send_to_flashing", self.sent_at, timestamp_ns)
+                return True
+            if line.startswith("DONE"):
+                return self.answered("send_to_done", self.sent_at, timestamp_ns)
+            return False
+
+    #adds a sample if we were waiting for this answer (the caller holds the lock)
+    def answered(self, metric, start_ns, timestamp_ns):
+        if metric not in self.waiting_for:
+            return False
+        self.waiting_for.discard(metric)
+        self.stats[metric].add((timestamp_ns - start_ns) / 1e9)
+        return True
+
+    #METHOD #3: add
+    def add(self, metric, seconds):
+        with self.lock:
+            self.stats[metric].add(seconds)
+
+    #METHOD #4: summary
+    #   returns: dict metric -> summary dict (or None if that metric has no samples yet)
+    def summary(self):
+        with self.lock:
+            return {metric: stats.summary() for metric, stats in self.stats.items()}
+
+    #METHOD #5: reset
+    def reset(self):
+        with self.lock:
+            self.stats = {metric: rollingstats(self.size) for metric in METRIC_NAMES}
+            self.waiting_for = set()
+            self.armed_at = None
+            self.button_at = None
+
+    #METHOD #6: export_csv
+    #   writes every sample that is kept (metric, seconds) and then the summary rows
+    def export_csv(self, path):
+        with self.lock:
+            samples = {metric: list(stats.samples) for metric, stats in self.stats.items()}
+        summary = self.summary()
+        with open(path, "w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(["metric", "sample_seconds"])
+            for metric, values in samples.items():
+                for value in values:
+                    writer.writerow([metric, f"{value:.9f}"])
+            writer.writerow([])
+            writer.writerow(["metric", "count", "p50", "p95", "p99", "max", "mean"])
+            for metric, result in summary.items():
+                if result is not None:
+                    writer.writerow([metric] + [result["count"]] +
+                                    [f"{result[key]:.9f}" for key in ("p50", "p95", "p99", "max", "mean")])
+
+
+#function to turn a summary into a text table (milliseconds)
+def format_summary(summary):
+    lines = [f"{'':<20}{'count':>7}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}"]
+    for metric, name in METRIC_NAMES.items():
+        result = summary.get(metric)
+        if result is None:
+            lines.append(f"{name:<20}{0:>7}{'-':>10}{'-':>10}{'-':>10}{'-':>10}")
+            continue
+        lines.append(f"{name:<20}{result['count']:>7}" +
+                     "".join(f"{result[key] * 1000:>8.1f}ms" for key in ("p50", "p95", "p99", "max")))
+    return "\n".join(lines)
@@ -0,0 +1,821 @@
+
+#*****************LED CONTROLLER LIBRARY*****************
+# this file holds the 'ledcontroller' class: everything needed to drive the LED system,
+# WITHOUT PyQt6
+#
+# why:
+#   - all of this used to live inside 'systemGUI' (and in global variables), so a script
+#     had to import PyQt6 and create a QApplication just to send one configuration,
+#     which is slow and does not work on headless acquisition PCs
+#   - now the GUI ('GUI Test 1.py') and the command line tool (ledctl.py) are both thin
+#     clients of this class, and the settings live in the object instead of in globals
+#
+# what it does:
+#   - keeps the selected COM port/ mode/ pattern/ flash rate/ duration
+#   - checks the settings and turns them into the text packet or the binary frame
+#   - compiles custom patterns (like "L1+L2@5ms/20ms", see pattern_compiler.py) and uploads
+#     their table before the configuration that uses them
+#   - connects to the arduino (through 'connectionmanager') and sends the configuration
+#   - binary protocol: tracks the ACKs and falls back to the text packet for old firmware
+#   - wait_for("DONE") lets scripts wait for the arduino to finish
+#   - stop() ends a run early, send_configuration(queued=True) queues the next run (NEXT)
+#     and flash_progress() tells how far the current run is (for the GUI's progress bar)
+#   - every line is parsed into a typed event (see device_events.py), and self.device keeps
+#     what the arduino has confirmed (its configuration, armed/ flashing ...)
+#   - sync_clock() works out the arduino's clock and schedule_trigger() starts an armed trigger
+#     at a time on the PC's clock instead of the button (see clock_sync.py)
+#
+# example:
+#     controller = ledcontroller(on_line=print)
+#     controller.connect("/dev/ttyACM0")
+#     controller.set_mode("Trigger Mode"); controller.set_pattern("L1:L2")
+#     controller.set_flash_rate(4); controller.set_flash_duration(30)
+#     controller.send_configuration()
+#     controller.wait_for("DONE", timeout=60)
+import collections #deque of the lines received from the arduino
+import threading #locks/ the ACK timeout timer
+import time #perf_counter
+
+import serial #pyserial (only for the default serial_factory)
+
+from binary_protocol import (
+    commandtracker, decode_status_payload, decode_sync_payload, decode_trigger_report, encode_frame,
+    encode_pattern_payloads, encode_set_payload, encode_trigger_payload, micros_difference, protocolerror,
+    FRAME_ACK, FRAME_NAK, FRAME_NAMES, FRAME_NEXT, FRAME_PATTERN, FRAME_SET, FRAME_STATUS, FRAME_STOP, FRAME_SYNC,
+    FRAME_TRIGGER, MAX_SET_VALUE, MICROS_WRAP, MIN_FRAME_SIZE, PATTERN_CUSTOM, SYNC_PAYLOAD,
+)
+from clock_sync import clocksync, wire_time_ns
+from connection_manager import connectionmanager, READY_TIMEOUT
+from device_events import (
+    configappliedevent, deviceparser, devicestate, finishedevent, flashstartedevent, triggerreportevent,
+)
+from latency_metrics import latencytracker
+from pattern_compiler import compile_pattern, patternerror
+from session_recorder import RECORD_MESSAGE, RECORD_RECEIVED, RECORD_SENT
+
+#the modes and the number sent for each one in the configuration packet
+MODES = {
+    "Manual Mode": 1,
+    "Trigger Mode": 2,
+}
+
+#the patterns and the number sent for each one in the configuration packet
+#Note: L1 is LED1 and L2 is LED2 in an LED bank of 2 LED's
+#any other pattern is compiled into a table, uploaded and sent as pattern 0 (PATTERN_CUSTOM)
+PATTERNS = {
+    "L1": 1,
+    "L1:L2": 2,
+    "L1:L1:L2": 3,
+    "L1:L1:L1:L2": 4,
+}
+
+#how the configuration is sent
+PROTOCOL_BINARY = "binary" #binary frame, answered by an ACK (falls back to text for old firmware)
+PROTOCOL_TEXT = "text" #the "SET 1 4 30 2" line
+
+#how long to wait for the arduino to ACK/ NAK a binary frame (seconds)
+ACK_TIMEOUT = 0.5
+
+#how many received lines are kept for wait_for()
+LINE_HISTORY = 1000
+
+#the software trigger (see sync_clock()/ schedule_trigger())
+SYNC_ROUNDS = 8 #SYNC round trips per sync_clock()
+SYNC_TIMEOUT = 0.5 #how long to wait for each SYNC reply (seconds)
+SYNC_MAX_AGE = 10 #schedule_trigger() syncs again if the last sync is older than this (seconds)
+TRIGGER_DELAY = 0.5 #how far ahead schedule_trigger() starts the run if no time is given (seconds)
+
+#the finishedevent reasons that end a run (finished = the whole duration, stopped = STOP/ a
+#new SET, the "DONE" after "Flashing finished" changes nothing)
+FLASH_END_REASONS = ("finished", "stopped")
+
+
+# 'configurationerror' is raised when a setting is invalid (the message is shown to the user)
+class configurationerror(ValueError):
+    pass
+
+
+# 'ledcontroller' class that holds the settings and talks to the arduino
+#   - on_line(line): called (from the reader thread) for every line from the arduino
+#   - on_message(text): called for status messages (connected, ACK received, errors ...),
+#     may be called from a background thread
+#   - on_ready(seconds, banner_seen): called when the arduino is ready after connecting
+#   - on_frame(frame): called for binary frames that are not answers to our own frames
+#   - on_event(event): called (from the reader thread) with the typed event of every line,
+#     and a configappliedevent for the ACK of a binary SET (see device_events.py)
+#   - serial_factory: passed on to the connectionmanager
+class ledcontroller:
+
+    #constructor that creates a ledcontroller object
+    def __init__(self, on_line=None, on_message=None, on_ready=None, on_frame=None, on_event=None,
+                 serial_factory=serial.Serial):
+        self.on_line = on_line
+        self.on_message = on_message
+        self.on_ready = on_ready
+        self.on_frame = on_frame
+        self.on_event = on_event
+
+        #the selected settings (these used to be the GUI's global variables)
+        self.port_name = "None" #no COM port originally selected
+        self.mode = "Manual Mode" #defaulted mode is manual
+        self.pattern = "L1" #default pattern is L1
+        self.flash_rate = 1 #default flash rate is 1 Hz
+        self.flash_duration = 1 #default duration is 1s
+        self.protocol = PROTOCOL_BINARY
+
+        #the connection to the arduino (one port, one reader thread)
+        self.connection = connectionmanager(
+            on_line=self.line_received,
+            on_message=self.message,
+            on_ready=self.connection_ready,
+            on_frame=self.frame_received,
+            serial_factory=serial_factory,
+        )
+
+        #binary frames waiting for their ACK, and the text packets to resend if they never get one
+        self.command_tracker = commandtracker()
+        self.text_fallback_packets = {}
+        #the configuration_values() of the binary SETs waiting for their ACK (sequence -> values)
+        self.sent_values = {}
+        #None = we don't know yet if the arduino understands binary frames, True/ False once we do
+        self.binary_protocol_supported = None
+        #the custom pattern table the arduino has (None = none, or we don't know)
+        self.uploaded_table = None
+        #the tracker is used from the reader thread (ACKs) and the caller's thread (sending)
+        self.tracker_lock = threading.Lock()
+
+        #the lines received from the arduino, for wait_for()
+        #received_count is the total number of lines ever received, so a line's 'index' is
+        #received_count at the time it arrived
+        self.received_lines = collections.deque(maxlen=LINE_HISTORY)
+        self.received_count = 0
+        self.received_condition = threading.Condition()
+        #received_count when the last configuration was sent (wait_for() looks after this)
+        self.last_send_index = 0
+        #extra functions called (from the reader thread) with every line, see add_line_listener()
+        self.line_listeners = []
+        #the sessionrecorder that saves every line/ packet with a timestamp (None = not recording)
+        self.recorder = None
+        #measures SET -> answer latencies (see latency_metrics.py)
+        self.latency = latencytracker()
+        #the run the arduino is flashing now: perf_counter() when it started and its length
+        #in seconds (None = not flashing), see flash_progress()
+        self.flash_started_at = None
+        self.flash_length = 0
+        #the last STATUS reply (a dict from decode_status_payload(), None = none yet)
+        self.device_status = None
+        #turns the lines into events, and what the arduino confirmed (see device_events.py)
+        self.parser = deviceparser()
+        self.device = devicestate()
+        #the software trigger: the arduino's clock, the SYNC reply being waited for
+        #((received perf_counter_ns(), micros()), None = not here yet), the TRIGGERs waiting for
+        #their report (sequence -> perf_counter_ns() they were asked for) and the last report
+        self.clock = clocksync()
+        self.sync_sequence = None
+        self.sync_reply = None
+        self.scheduled_triggers = {}
+        self.trigger_report = None
+
+
+    #*****************SETTINGS*****************
+
+    #METHOD #1: set_mode
+    #   args: mode ("Manual Mode" or "Trigger Mode")
+    def set_mode(self, mode):
+        if mode not in MODES:
+            raise configurationerror(f"Unknown mode '{mode}'! Choose one of: {', '.join(MODES)}")
+        self.mode = mode
+
+    #METHOD #2: set_pattern
+    #   args: pattern ("L1", "L1:L2", "L1:L1:L2", "L1:L1:L1:L2" or a custom pattern like "L1+L2@5ms")
+    def set_pattern(self, pattern):
+        pattern = str(pattern).strip()
+        if pattern not in PATTERNS:
+            self.compile_custom_pattern(pattern, self.flash_rate)
+        self.pattern = pattern
+
+    #METHOD #3: set_flash_rate
+    #   args: flash_rate (Hz, a number or the text typed by the user)
+    def set_flash_rate(self, flash_rate):
+        self.flash_rate = self.setting_value(flash_rate)
+
+    #METHOD #4: set_flash_duration
+    #   args: flash_duration (seconds, a number or the text typed by the user)
+    def set_flash_duration(self, flash_duration):
+        self.flash_duration = self.setting_value(flash_duration)
+
+    #METHOD #5: set_protocol
+    #   args: protocol (PROTOCOL_BINARY or PROTOCOL_TEXT)
+    def set_protocol(self, protocol):
+        if protocol not in (PROTOCOL_BINARY, PROTOCOL_TEXT):
+            raise configurationerror(f"Unknown protocol '{protocol}'!")
+        self.protocol = protocol
+
+    #METHOD #5b: set_max_baudrate
+    #   args: max_baudrate (the fastest link speed to negotiate when connecting,
+    #         DEFAULT_BAUDRATE = stay at 9600, see connection_manager.py)
+    def set_max_baudrate(self, max_baudrate):
+        self.connection.max_baudrate = self.positive_integer(max_baudrate)
+
+    #turns user input into a positive integer, or raises configurationerror
+    def positive_integer(self, value):
+        try:
+            number = int(value)
+        except (TypeError, ValueError):
+            raise configurationerror("Invalid Input!") from None
+        #cannot use non-positive flash rate/ duration values
+        if number <= 0:
+            raise configurationerror("Enter valid values (that are greater or equal to zero) for the flash rate/ duration!")
+        return number
+
+    #a flash rate/ duration: the arduino keeps them in an int (16 bits), a bigger value turns
+    #negative there and the configuration is rejected
+    def setting_value(self, value):
+        number = self.positive_integer(value)
+        if number > MAX_SET_VALUE:
+            raise configurationerror(f"The flash rate/ duration can be at most {MAX_SET_VALUE}!")
+        return number
+
+    #compiles a custom pattern, or raises configurationerror
+    def compile_custom_pattern(self, pattern, flash_rate):
+        try:
+            return compile_pattern(pattern, flash_rate)
+        except patternerror as error:
+            raise configurationerror(f"Invalid pattern '{pattern}': {error}") from None
+
+    #METHOD #6: configuration_values
+    #   returns: the numbers sent to the arduino (mode, flash rate, duration, pattern)
+    def configuration_values(self):
+        return MODES[self.mode], self.flash_rate, self.flash_duration, PATTERNS.get(self.pattern, PATTERN_CUSTOM)
+
+    #METHOD #7: pattern_table
+    #   returns: the compiled table of a custom pattern, or None for the built-in patterns
+    def pattern_table(self):
+        if self.pattern in PATTERNS:
+            return None
+        return self.compile_custom_pattern(self.pattern, self.flash_rate)
+
+    #METHOD #8: configuration_packet
+    #   returns: the text packet "SET {mode} {flash rate} {flash duration} {pattern}\n"
+    #            (command="NEXT" for a configuration that waits for the current run)
+    #   ex: SET 2 4 30 2
+    #    - Mode: 1 (Manual Mode), 2 (Triggering Mode)
+    #    - Flash Rate: Positive Number (> 0)    [Hz]
+    #    - Flash Duration: Positive Number (> 0)    [s]
+    #    - Pattern: "L1" = 1, "L1:L2" = 2, "L1:L1:L2" = 3, "L1:L1:L1:L2" = 4, custom = 0
+    def configuration_packet(self, command="SET"):
+        mode_index, flash_rate, flash_duration, pattern_index = self.configuration_values()
+        return f"{command} {mode_index} {flash_rate} {flash_duration} {pattern_index}\n"
+
+
+    #*****************CONNECTION*****************
+
+    #METHOD #9: connect
+    #   connects to 'port_name'
+    #   background=True: returns straight away, the port is opened in the reader thread
+    #                    (errors go to on_message), used by the GUI
+    #   background=False: opens the port now (raises serial.SerialException if it can't),
+    #                     use wait_until_ready() afterwards
+    def connect(self, port_name, background=False):
+        self.port_name = port_name
+        self.forget_board()
+        self.parser.reset()
+        self.device.reset()
+        if background:
+            self.connection.connect_in_background(port_name)
+        else:
+            self.connection.connect(port_name)
+
+    #METHOD #10: wait_until_ready
+    #   waits for the arduino to finish resetting, returns False on a timeout
+    def wait_until_ready(self, timeout=READY_TIMEOUT + 1):
+        return self.connection.wait_until_ready(timeout)
+
+    #METHOD #11: disconnect
+    def disconnect(self):
+        self.connection.disconnect()
+
+    #METHOD #12: add_line_listener/ remove_line_listener
+    #   listener(line) is called from the reader thread for every line from the arduino,
+    #   and for every ACK/ NAK of our own frames (as "ACK SET #3"), on top of on_line
+    #   (used by the sequence scheduler, which needs the lines without taking over on_line)
+    def add_line_listener(self, listener):
+        self.line_listeners.append(listener)
+
+    def remove_line_listener(self, listener):
+        if listener in self.line_listeners:
+            self.line_listeners.remove(listener)
+
+    #METHOD #13: set_recorder
+    #   args: recorder (a started sessionrecorder, see session_recorder.py, or None to stop recording)
+    #   every line from the arduino, every packet sent and every status message is recorded
+    def set_recorder(self, recorder):
+        self.recorder = recorder
+
+
+    #*****************SENDING*****************
+
+    #METHOD #14: send_configuration
+    #   sends the current settings to the arduino
+    #   args: protocol (None = self.protocol, or PROTOCOL_TEXT/ PROTOCOL_BINARY for this send only)
+    #         queued (False = SET: replaces whatever the arduino is doing now,
+    #                 True = NEXT: starts when the current run is over, see binary_protocol.py)
+    #   returns: the message to show the user ("Successfully sent: ...")
+    #   raises: configurationerror if the settings can not be sent (not connected, value too big ...)
+    #   note: this is prepare_configuration() + write_prepared() + finish_prepared(), the rig
+    #         registry (rig_registry.py) calls them one by one to send to many arduinos at once
+    def send_configuration(self, protocol=None, queued=False):
+        prepared = self.prepare_configuration(protocol, queued)
+        self.write_prepared(prepared)
+        return self.finish_prepared(prepared)
+
+    #METHOD #14b: prepare_configuration
+    #   does everything of send_configuration() except writing the SET: checks the settings,
+    #   uploads a custom pattern's table, builds the frame/ packet and starts tracking its ACK
+    #   returns: the 'prepared' dict for write_prepared()/ finish_prepared()/ cancel_prepared()
+    def prepare_configuration(self, protocol=None, queued=False):
+        configuration_packet = self.configuration_packet("NEXT" if queued else "SET")
+        protocol = protocol or self.protocol
+        table = self.pattern_table()
+        if table is not None and (protocol != PROTOCOL_BINARY or self.binary_protocol_supported is False):
+            raise configurationerror("Custom patterns are uploaded as a table, which needs the binary protocol (and the new firmware)!")
+        #uploading a table stops a custom pattern that is flashing, so a queued one must already be there
+        if queued and table is not None and table != self.uploaded_table:
+            raise configurationerror("A custom pattern can only be queued once its table is on the arduino, send it without queuing first!")
+        #lines after this point count for wait_for()
+        with self.received_condition:
+            self.last_send_index = self.received_count
+        prepared = {"packet": configuration_packet.strip(), "queued": queued, "sequence": None, "uploaded": "", "sent_at": None}
+
+        #binary protocol (unless we already know this arduino does not understand it)
+        if protocol == PROTOCOL_BINARY and self.binary_protocol_supported is not False:
+            #upload the custom pattern's table first (only if the arduino doesn't have it yet)
+            if table is not None and table != self.uploaded_table:
+                prepared["uploaded"] = f", {self.upload_pattern_table(table)}"
+            with self.tracker_lock:
+                sequence = self.command_tracker.next_sequence()
+            frame_type = FRAME_NEXT if queued else FRAME_SET
+            try:
+                prepared["data"] = encode_frame(frame_type, sequence, encode_set_payload(*self.configuration_values()))
+            except ValueError:
+                raise configurationerror("Invalid Input!") from None
+            #remember the frame BEFORE writing it: the ACK is handled in the reader thread
+            #and can arrive before write() has even returned
+            with self.tracker_lock:
+                self.command_tracker.sent(frame_type, sequence, time.perf_counter())
+                #(an old firmware has no pattern tables and no NEXT, so those have no text fallback)
+                if table is None and not queued:
+                    self.text_fallback_packets[sequence] = configuration_packet
+                #the ACK confirms these values (a queued NEXT only starts later)
+                if not queued:
+                    self.sent_values[sequence] = self.configuration_values()
+            prepared["sequence"] = sequence
+            return prepared
+
+        #text protocol
+        #.encode converts the string to bytes
+        prepared["data"] = configuration_packet.encode()
+        return prepared
+
+    #METHOD #14c: write_prepared
+    #   writes a prepared SET (as little as possible happens here, so several arduinos can
+    #   be sent to one right after the other)
+    #   returns: time.perf_counter_ns() just before the write
+    #   raises: configurationerror if the write failed (the prepared SET is cancelled)
+    def write_prepared(self, prepared):
+        sent_at = time.perf_counter_ns()
+        #a queued configuration is answered now but only starts later, so it is not timed
+        if not prepared["queued"]:
+            self.latency.sent(self.mode, sent_at)
+        if not self.connection.write(prepared["data"]):
+            self.cancel_prepared(prepared)
+            raise configurationerror("Error sending configuration data to the arduino!")
+        prepared["sent_at"] = sent_at
+        return sent_at
+
+    #METHOD #14d: finish_prepared
+    #   records the SET that was written and starts the ACK check
+    #   returns: the message to show the user ("Successfully sent: ...")
+    def finish_prepared(self, prepared):
+        sequence = prepared["sequence"]
+        if sequence is None:
+            self.record(RECORD_SENT, prepared["packet"], prepared["sent_at"])
+            return f"Successfully sent: {prepared['packet']} to the arduino"
+        self.record(RECORD_SENT, f"{prepared['packet']} (binary frame #{sequence})", prepared["sent_at"])
+        #check for the ACK once the timeout has passed
+        self.start_ack_timer()
+        return (f"Successfully sent: {prepared['packet']} to the arduino (binary frame #{sequence}, "
+                f"{len(prepared['data'])} bytes{prepared['uploaded']})")
+
+    #METHOD #14e: cancel_prepared
+    #   forgets a prepared SET that will not be written (so it is never resent as text)
+    def cancel_prepared(self, prepared):
+        if prepared["sequence"] is not None:
+            with self.tracker_lock:
+                self.command_tracker.pending.pop(prepared["sequence"], None)
+                self.text_fallback_packets.pop(prepared["sequence"], None)
+                self.sent_values.pop(prepared["sequence"], None)
+
+    #METHOD #15: upload_pattern_table
+    #   sends a compiled pattern table in PATTERN frames (the ACKs are tracked like SET's)
+    #   the frames are sent one after the other without waiting: the arduino reads them as
+    #   they come in, and the SET sent after them is only accepted once the whole table arrived
+    #   returns: a description for the "Successfully sent" message
+    def upload_pattern_table(self, table):
+        payloads = encode_pattern_payloads(table)
+        for number, payload in enumerate(payloads, start=1):
+            with self.tracker_lock:
+                sequence = self.command_tracker.next_sequence()
+                self.command_tracker.sent(FRAME_PATTERN, sequence, time.perf_counter())
+            sent_at = time.perf_counter_ns()
+            if not self.connection.write(encode_frame(FRAME_PATTERN, sequence, payload)):
+                with self.tracker_lock:
+                    self.command_tracker.pending.pop(sequence, None)
+                raise configurationerror("Error sending configuration data to the arduino!")
+            self.record(RECORD_SENT, f"PATTERN {number}/{len(payloads)} (binary frame #{sequence})", sent_at)
+        with self.tracker_lock:
+            self.uploaded_table = table
+        return f"pattern table of {len(table)} steps uploaded in {len(payloads)} frame(s)"
+
+    #METHOD #16: stop
+    #   stops the run that is flashing now, disarms the trigger and forgets a queued configuration
+    #   returns: the message to show the user
+    def stop(self, protocol=None):
+        protocol = protocol or self.protocol
+        if protocol == PROTOCOL_BINARY and self.binary_protocol_supported is not False:
+            sequence = self.send_tracked_frame(FRAME_STOP, fallback_packet="STOP\n")
+            return f"Sent STOP to the arduino (binary frame #{sequence})"
+        sent_at = time.perf_counter_ns()
+        if not self.connection.write(b"STOP\n"):
+            raise configurationerror("Error sending STOP to the arduino!")
+        self.record(RECORD_SENT, "STOP", sent_at)
+        return "Sent STOP to the arduino"
+
+    #METHOD #17: request_status
+    #   asks the arduino what it is doing
+    #   binary: the reply is a STATUS frame, stored in self.device_status (and returned if
+    #           'timeout' seconds are given to wait for it)
+    #   text: the reply is a "Status: ..." line
+    #   returns: the status dict, or None (text protocol/ no reply in time/ timeout=None)
+    def request_status(self, timeout=None, protocol=None):
+        protocol = protocol or self.protocol
+        if protocol != PROTOCOL_BINARY or self.binary_protocol_supported is False:
+            sent_at = time.perf_counter_ns()
+            if not self.connection.write(b"STATUS\n"):
+                raise configurationerror("Error sending STATUS to the arduino!")
+            self.record(RECORD_SENT, "STATUS", sent_at)
+            return None
+        with self.received_condition:
+            self.device_status = None
+        #(the reply is a STATUS frame, not an ACK, so it is not tracked)
+        with self.tracker_lock:
+            sequence = self.command_tracker.next_sequence()
+        sent_at = time.perf_counter_ns()
+        if not self.connection.write(encode_frame(FRAME_STATUS, sequence)):
+            raise configurationerror("Error sending STATUS to the arduino!")
+        self.record(RECORD_SENT, f"STATUS (binary frame #{sequence})", sent_at)
+        if timeout is None:
+            return None
+        with self.received_condition:
+            self.received_condition.wait_for(lambda: self.device_status is not None, timeout)
+            return self.device_status
+
+    #METHOD #17b: sync_clock
+    #   works out the arduino's clock from 'rounds' SYNC round trips, one after the other
+    #   (see clock_sync.py), the samples add up over calls, so syncing again a few seconds
+    #   later also measures how fast/ slow the arduino's crystal is
+    #   returns: the estimate (a dict, see clocksync.estimate())
+    #   raises: configurationerror (old firmware/ no reply)
+    #   note: this waits for the replies, so it can not run on the thread that reads them (the
+    #         event loop of the asyncledcontroller)
+    def sync_clock(self, rounds=SYNC_ROUNDS, timeout=SYNC_TIMEOUT):
+        if self.binary_protocol_supported is False:
+            raise configurationerror("The software trigger needs the binary protocol (and the new firmware)!")
+        link_rate = self.connection.link_rate
+        request_wire_ns = wire_time_ns(MIN_FRAME_SIZE, link_rate)
+        reply_wire_ns = wire_time_ns(MIN_FRAME_SIZE + SYNC_PAYLOAD.size, link_rate)
+        answered = 0
+        self.clock.new_batch()
+        for _ in range(rounds):
+            with self.tracker_lock:
+                sequence = self.command_tracker.next_sequence()
+            with self.received_condition:
+                self.sync_sequence = sequence
+                self.sync_reply = None
+            sent_at = time.perf_counter_ns()
+            if not self.connection.write(encode_frame(FRAME_SYNC, sequence)):
+                raise configurationerror("Error sending SYNC to the arduino!")
+            with self.received_condition:
+                self.received_condition.wait_for(lambda: self.sync_reply is not None, timeout)
+                reply = self.sync_reply
+                self.sync_sequence = None
+            self.record(RECORD_SENT, f"SYNC (binary frame #{sequence})", sent_at)
+            if reply is None:
+                continue
+            received_at, device_us = reply
+            self.clock.add_sample(sent_at, received_at, device_us, request_wire_ns, reply_wire_ns)
+            answered += 1
+        if not answered:
+            raise configurationerror("No SYNC reply from the arduino (old firmware?)")
+        return self.clock.estimate()
+
+    #METHOD #17c: schedule_trigger
+    #   starts the armed trigger (a trigger mode configuration the arduino has ACKed) at a time
+    #   on the PC's clock instead of the button: the arduino starts the run at the matching
+    #   micros() and reports when it really started (see wait_for_trigger())
+    #   the clock is synced first if it never was, or the last sync is older than SYNC_MAX_AGE
+    #   args: at_ns (time.perf_counter_ns() to start at, None = 'delay' seconds from now)
+    #   returns: the message to show the user
+    #   raises: configurationerror (old firmware/ no SYNC reply/ write failed), the arduino NAKs
+    #           a TRIGGER if the trigger is not armed
+    def schedule_trigger(self, at_ns=None, delay=TRIGGER_DELAY):
+        if self.binary_protocol_supported is False:
+            raise configurationerror("The software trigger needs the binary protocol (and the new firmware)!")
+        if not self.clock.is_synced(time.perf_counter_ns(), SYNC_MAX_AGE * 1000000000):
+            self.sync_clock()
+        if at_ns is None:
+            at_ns = time.perf_counter_ns() + int(delay * 1e9)
+        start_us = round(self.clock.to_device_us(at_ns)) % MICROS_WRAP
+        with self.received_condition:
+            self.trigger_report = None
+        with self.tracker_lock:
+            sequence = self.command_tracker.next_sequence()
+            self.command_tracker.sent(FRAME_TRIGGER, sequence, time.perf_counter())
+            #the arduino keeps one TRIGGER (a new one replaces it, STOP/ SET/ the button cancel it)
+            self.scheduled_triggers.clear()
+            self.scheduled_triggers[sequence] = at_ns
+        sent_at = time.perf_counter_ns()
+        if not self.connection.write(encode_frame(FRAME_TRIGGER, sequence, encode_trigger_payload(start_us))):
+            with self.tracker_lock:
+                self.command_tracker.pending.pop(sequence, None)
+                self.scheduled_triggers.pop(sequence, None)
+            raise configurationerror("Error sending TRIGGER to the arduino!")
+        self.record(RECORD_SENT, f"TRIGGER at {start_us}us (binary frame #{sequence})", sent_at)
+        self.start_ack_timer()
+        return (f"Sent TRIGGER to the arduino (binary frame #{sequence}), starts in "
+                f"{(at_ns - sent_at) / 1e6:.1f} ms at micros() = {start_us}")
+
+    #METHOD #17d: wait_for_trigger
+    #   waits for the report of the last schedule_trigger()
+    #   returns: the report (a dict, see trigger_reported()), or None on a timeout
+    def wait_for_trigger(self, timeout=None):
+        with self.received_condition:
+            self.received_condition.wait_for(lambda: self.trigger_report is not None, timeout)
+            return self.trigger_report
+
+    #METHOD #18: flash_progress
+    #   returns: (seconds flashed, run length in seconds) of the current run, or None if the
+    #            arduino is not flashing (measured on the PC from the "Flashing Pattern" line)
+    def flash_progress(self):
+        started_at = self.flash_started_at
+        if started_at is None:
+            return None
+        return min(time.perf_counter() - started_at, self.flash_length), self.flash_length
+
+    #sends an empty frame whose ACK is tracked like SET's, returns its sequence number
+    def send_tracked_frame(self, frame_type, fallback_packet=None):
+        with self.tracker_lock:
+            sequence = self.command_tracker.next_sequence()
+            self.command_tracker.sent(frame_type, sequence, time.perf_counter())
+            if fallback_packet is not None:
+                self.text_fallback_packets[sequence] = fallback_packet
+        sent_at = time.perf_counter_ns()
+        if not self.connection.write(encode_frame(frame_type, sequence)):
+            with self.tracker_lock:
+                self.command_tracker.pending.pop(sequence, None)
+                self.text_fallback_packets.pop(sequence, None)
+            raise configurationerror(f"Error sending {FRAME_NAMES[frame_type]} to the arduino!")
+        self.record(RECORD_SENT, f"{FRAME_NAMES[frame_type]} (binary frame #{sequence})", sent_at)
+        self.start_ack_timer()
+        return sequence
+
+    #calls check_for_missing_acks() once ACK_TIMEOUT has passed (in a timer thread,
+    #the asyncio controller in async_transport.py uses its event loop instead)
+    def start_ack_timer(self):
+        timer = threading.Timer(ACK_TIMEOUT, self.check_for_missing_acks)
+        timer.daemon = True
+        timer.start()
+
+    #METHOD #19: wait_for
+    #   waits for a line from the arduino that starts with 'prefix' (like "DONE")
+    #   only lines received after the last send_configuration() count, so a line that
+    #   arrived before wait_for() was called is still found
+    #   args: prefix, timeout (seconds, None = forever), after (line index to start from)
+    #   returns: the line, or None on a timeout
+    def wait_for(self, prefix, timeout=None, after=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        start = self.last_send_index if after is None else after
+        with self.received_condition:
+            while True:
+                #the oldest line still in the history has index received_count - len(received_lines)
+                first_index = self.received_count - len(self.received_lines)
+                for offset, line in enumerate(self.received_lines):
+                    if first_index + offset >= start and line.startswith(prefix):
+                        return line
+                start = self.received_count
+                left = None if deadline is None else deadline - time.monotonic()
+                if left is not None and left <= 0:
+                    return None
+                self.received_condition.wait(left)
+
+    #METHOD #20: check_for_missing_acks
+    #   called ACK_TIMEOUT after a binary frame was sent
+    #   if we have never had an ACK from this arduino, it probably has the old text-only
+    #   firmware, so the configuration is resent as a text packet
+    def check_for_missing_acks(self):
+        with self.tracker_lock:
+            expired = self.command_tracker.expired(time.perf_counter(), ACK_TIMEOUT)
+        for sequence, frame_type in expired:
+            with self.tracker_lock:
+                configuration_packet = self.text_fallback_packets.pop(sequence, None)
+                self.sent_values.pop(sequence, None)
+                #we don't know if the arduino got the table, so it is uploaded again next time
+                if frame_type == FRAME_PATTERN:
+                    self.uploaded_table = None
+                supported = self.binary_protocol_supported
+                if not supported and configuration_packet is not None:
+                    self.binary_protocol_supported = False
+            if supported or configuration_packet is None:
+                self.message(f"No ACK from the arduino for frame #{sequence}!")
+                continue
+            #the '\n' ends the unreadable binary 'line' the old firmware is waiting on
+            sent_at = time.perf_counter_ns()
+            self.connection.write(b"\n" + configuration_packet.encode())
+            self.record(RECORD_SENT, configuration_packet.strip(), sent_at)
+            self.message(f"No ACK from the arduino (text-only firmware?), resent as text: {configuration_packet.strip()}")
+
+
+    #*****************CALLBACKS FROM THE CONNECTION (reader thread)*****************
+
+    #every line from the arduino
+    def line_received(self, line):
+        #timestamp first, before anything else (like the GUI's signal) can delay it
+        received_at = time.perf_counter_ns()
+        self.record(RECORD_RECEIVED, line, received_at)
+        self.latency.line(line, received_at)
+        #(None: a "Mode:"/ "Flash Rate:"/ "Duration:" line, part of the next event)
+        event = self.parser.parse(line, received_at)
+        if event is not None:
+            self.device_event(event)
+        self.add_received_line(line)
+        if self.on_line:
+            self.on_line(line)
+        for listener in list(self.line_listeners):
+            listener(line)
+
+    #updates the device state and the run (for flash_progress()) from an event
+    def device_event(self, event):
+        self.device.apply(event)
+        self.track_flash(event)
+        if self.on_event:
+            self.on_event(event)
+
+    #adds a line to the history wait_for() looks at and wakes up whoever is waiting
+    def add_received_line(self, line):
+        with self.received_condition:
+            self.received_lines.append(line)
+            self.received_count += 1
+            self.received_condition.notify_all()
+
+    #follows the run the arduino is flashing (for flash_progress())
+    def track_flash(self, event):
+        if type(event) is flashstartedevent:
+            self.flash_length = event.flash_duration
+            self.flash_started_at = time.perf_counter()
+        elif type(event) is finishedevent and event.reason in FLASH_END_REASONS:
+            self.flash_started_at = None
+
+    #every binary frame from the arduino
+    def frame_received(self, frame):
+        received_at = time.perf_counter_ns()
+        self.record(RECORD_RECEIVED, frame.describe(), received_at)
+        if frame.frame_type == FRAME_STATUS:
+            try:
+                status = decode_status_payload(frame.payload)
+            except protocolerror:
+                status = None
+            with self.received_condition:
+                self.device_status = status
+                self.received_condition.notify_all()
+        #a SYNC reply is only for sync_clock() (it is not shown, there are many of them)
+        elif frame.frame_type == FRAME_SYNC:
+            try:
+                device_us = decode_sync_payload(frame.payload)
+            except protocolerror:
+                return
+            with self.received_condition:
+                if frame.sequence == self.sync_sequence:
+                    self.sync_reply = (received_at, device_us)
+                    self.received_condition.notify_all()
+            return
+        elif frame.frame_type == FRAME_TRIGGER:
+            self.trigger_reported(frame, received_at)
+            return
+        with self.tracker_lock:
+            answered = self.command_tracker.resolve(frame, time.perf_counter())
+            applied = None
+            if answered is not None:
+                #the arduino answered a frame we sent, so it understands the binary protocol
+                self.binary_protocol_supported = True
+                self.text_fallback_packets.pop(frame.sequence, None)
+                applied = self.sent_values.pop(frame.sequence, None)
+                #a rejected table has to be uploaded again next time, and so does the table of a
+                #rejected custom pattern SET/ NEXT (the arduino may not have it, e.g. it was reset)
+                if answered[0] == FRAME_PATTERN and frame.frame_type == FRAME_NAK:
+                    self.uploaded_table = None
+                if (answered[0] in (FRAME_SET, FRAME_NEXT) and frame.frame_type == FRAME_NAK
+                        and applied is not None and applied[3] == PATTERN_CUSTOM):
+                    self.uploaded_table = None
+                #a rejected TRIGGER will not be reported
+                if answered[0] == FRAME_TRIGGER and frame.frame_type == FRAME_NAK:
+                    self.scheduled_triggers.pop(frame.sequence, None)
+        if answered is None:
+            if self.on_frame:
+                self.on_frame(frame)
+            else:
+                self.message(f"Arduino: {frame.describe()}")
+            return
+        _, round_trip = answered
+        self.latency.line(frame.describe(), received_at)
+        self.message(f"Arduino: {frame.describe()} ({round_trip * 1000:.1f} ms)")
+        #the ACK of a SET: the arduino applied the values we sent
+        if applied is not None and frame.frame_type == FRAME_ACK:
+            self.device_event(configappliedevent(frame.describe(), received_at, *applied, source="ack"))
+        #ACK/ NAK also count as 'lines' for wait_for("ACK") and the line listeners
+        self.add_received_line(frame.describe())
+        for listener in list(self.line_listeners):
+            listener(frame.describe())
+
+    #the TRIGGER report: the software trigger started the run
+    #the report (self.trigger_report) is a dict of:
+    #   sequence, scheduled_us/ started_us (the arduino's micros()), late_us (started - scheduled,
+    #   how long loop() took to get there), started_ns (when the PC's clock showed started_us,
+    #   from the clock estimate), requested_ns (the time schedule_trigger() was asked for, None if
+    #   it was not ours), error_us (started_ns - requested_ns: how far off the start was on the
+    #   PC's clock, as far as the clock estimate can tell) and received_ns
+    def trigger_reported(self, frame, received_at):
+        try:
+            scheduled_us, started_us = decode_trigger_report(frame.payload)
+        except protocolerror:
+            self.message(f"Arduino: {frame.describe()}")
+            return
+        with self.tracker_lock:
+            requested_ns = self.scheduled_triggers.pop(frame.sequence, None)
+        late_us = micros_difference(started_us, scheduled_us)
+        started_ns = self.clock.to_host_ns(started_us) if self.clock.host_mean is not None else None
+        error_us = None
+        if requested_ns is not None and started_ns is not None:
+            error_us = (started_ns - requested_ns) / 1000
+        report = {
+            "sequence": frame.sequence,
+            "scheduled_us": scheduled_us,
+            "started_us": started_us,
+            "late_us": late_us,
+            "started_ns": started_ns,
+            "requested_ns": requested_ns,
+            "error_us": error_us,
+            "received_ns": received_at,
+        }
+        self.device_event(triggerreportevent(frame.describe(), received_at, scheduled_us, started_us, late_us))
+        with self.received_condition:
+            self.trigger_report = report
+            self.received_condition.notify_all()
+        text = f"Arduino: software trigger started {late_us}us after its micros()"
+        if error_us is not None:
+            text += f", {error_us:+.0f}us from the time asked for (clock estimate)"
+        self.message(text)
+        self.add_received_line(frame.describe())
+        for listener in list(self.line_listeners):
+            listener(frame.describe())
+
+    #the arduino is ready after a connect() or an automatic reconnect (reader thread, before
+    #wait_until_ready() returns): a reconnect reset the board too
+    def connection_ready(self, seconds, banner_seen):
+        self.forget_board()
+        if self.on_ready:
+            self.on_ready(seconds, banner_seen)
+
+    #forgets what we knew about the arduino, opening the port resets it
+    def forget_board(self):
+        #a different arduino may have different firmware, so find out again if it understands binary frames
+        with self.tracker_lock:
+            self.binary_protocol_supported = None
+            #the reset empties the pattern table
+            self.uploaded_table = None
+        self.flash_started_at = None
+        self.device_status = None
+        #the reset also starts the arduino's micros() again from 0 (old SYNC samples are wrong now)
+        self.clock.reset()
+        self.scheduled_triggers.clear()
+        self.trigger_report = None
+
+    def message(self, text):
+        self.record(RECORD_MESSAGE, text)
+        if self.on_message:
+            self.on_message(text)
+
+    #passes a record to the session recorder (if we are recording)
+    def record(self, direction, text, timestamp_ns=None):
+        recorder = self.recorder
+        if recorder is not None:
+            recorder.record(direction, text, timestamp_ns)
@@ -0,0 +1,435 @@
+
+#*****************LEDCTL: COMMAND LINE CONTROL OF THE LED SYSTEM*****************
+# sends a configuration to the arduino without the GUI (no PyQt6 needed), so experiment
+# runs can be scripted (bash, a lab PC's scheduler, ssh on a headless machine ...)
+#
+# examples:
+#   python ledctl.py ports
+#   python ledctl.py run --port COM3 --mode manual --rate 4 --duration 30 --pattern L1:L2 --wait-done
+#   python ledctl.py run --port /dev/ttyACM0 --mode trigger --rate 10 --duration 5 --pattern 1 --protocol text
+#   python ledctl.py run --emulator --rate 4 --duration 2 --wait-done      (no arduino needed, linux/ mac)
+#   python ledctl.py run --port COM3 --rate 4 --duration 30 --pattern "L1+L2@5ms/20ms:OFF@100ms"
+#   python ledctl.py sequence trials.csv --port COM3 --prestage --record sessions
+#   python ledctl.py broadcast --rig A=COM3@left --rig B=COM4@left --rig C=COM5 --group left --rate 4 --duration 30
+#   python ledctl.py broadcast --emulators 16 --rate 4 --duration 2 --wait-done --logs 5
+#   python ledctl.py serve --port COM3        (other programs drive the arduino, see control_server.py)
+#   python ledctl.py serve --emulator --unix /tmp/ledctl.sock
+#   python ledctl.py trigger --port COM3 --rate 10 --duration 5 --delay-ms 500 --count 20
+#       (trigger mode started from the PC instead of the button, prints how late each start was)
+#
+# every line from the arduino is printed as "Arduino: ..."
+# exit code: 0 = done, 1 = could not connect/ send (or no ACK/ a NAK), 2 = bad arguments, 3 = timed out waiting for DONE
+#            4 = aborted with Ctrl+C (the arduino is sent STOP), sequence: 1 = a trial failed,
+#            trigger: 3 = no report/ DONE from the arduino
+import argparse #command line arguments
+import sys #exit codes/ stderr
+import time #sleep while serving
+
+from connection_manager import DEFAULT_BAUDRATE, LINK_RATES, READY_TIMEOUT
+from led_controller import ledcontroller, configurationerror, ACK_TIMEOUT, PATTERNS, PROTOCOL_BINARY, PROTOCOL_TEXT
+from port_discovery import list_COM_ports
+from rig_registry import rigregistry, format_broadcast, format_status
+from sequence_scheduler import sequencescheduler, load_sequence, format_report, SEQUENCE_FINISHED
+from session_recorder import sessionrecorder
+from latency_metrics import format_summary
+from clock_sync import error_summary
+
+#the short names accepted on the command line
+MODE_NAMES = {"manual": "Manual Mode", "1": "Manual Mode", "trigger": "Trigger Mode", "2": "Trigger Mode"}
+PATTERN_NAMES = dict(zip(PATTERNS, PATTERNS))
+PATTERN_NAMES.update({str(number): pattern for pattern, number in PATTERNS.items()})
+
+EXIT_OK = 0
+EXIT_ERROR = 1
+EXIT_TIMEOUT = 3
+EXIT_ABORTED = 4
+
+
+#prints a line from the arduino/ a status message straight away (flush: so it shows up when piped)
+#one write() per line, so lines printed from the reader and scheduler threads do not get mixed up
+def print_line(text):
+    sys.stdout.write(text + "\n")
+    sys.stdout.flush()
+
+
+#builds the argument parser
+def build_parser():
+    parser = argparse.ArgumentParser(prog="ledctl", description="Control the LED flashing system from the command line.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("ports", help="list the COM ports")
+
+    run = commands.add_parser("run", help="connect, send a configuration and (optionally) wait for DONE")
+    add_port_arguments(run)
+    add_configuration_arguments(run)
+
+    sequence = commands.add_parser("sequence", help="run every trial in a CSV/ YAML sequence file")
+    sequence.add_argument("file", help="sequence file (see sequence_scheduler.py for the format)")
+    add_port_arguments(sequence)
+    sequence.add_argument("--protocol", choices=(PROTOCOL_BINARY, PROTOCOL_TEXT), default=PROTOCOL_BINARY)
+    sequence.add_argument("--prestage", action="store_true", help="send the next trial while the current one is flashing")
+
+    broadcast = commands.add_parser("broadcast", help="send one configuration to several rigs (arduinos) at once")
+    where = broadcast.add_mutually_exclusive_group(required=True)
+    where.add_argument("--rig", action="append", metavar="NAME=PORT[@GROUP]",
+                       help="a rig to connect to, like A=COM3 or A=/dev/ttyACM0@left (repeat for every rig)")
+    where.add_argument("--emulators", type=int, metavar="N", help="use N python copies of the firmware (linux/ mac)")
+    broadcast.add_argument("--group", help="only send to the rigs of this group")
+    broadcast.add_argument("--baud", type=int, default=LINK_RATES[0],
+                           help=f"fastest link speed to negotiate (default {LINK_RATES[0]}, {DEFAULT_BAUDRATE} = no negotiation)")
+    broadcast.add_argument("--logs", type=int, default=0, metavar="LINES", help="print the last LINES lines of every rig's log at the end")
+    add_configuration_arguments(broadcast)
+
+    trigger = commands.add_parser("trigger", help="arm trigger mode and start it from the PC (no button), COUNT times")
+    add_port_arguments(trigger)
+    trigger.add_argument("--rate", required=True, help="flash rate in Hz")
+    trigger.add_argument("--duration", required=True, help="flash duration in seconds")
+    trigger.add_argument("--pattern", default="L1", help="like run's --pattern")
+    trigger.add_argument("--delay-ms", type=float, default=500, help="start this long after the TRIGGER is sent (default 500)")
+    trigger.add_argument("--count", type=int, default=1, help="how many runs to trigger, one after the other (default 1)")
+
+    serve = commands.add_parser("serve", help="let other programs drive the arduino through the control server (until Ctrl+C)")
+    add_port_arguments(serve)
+    listen = serve.add_mutually_exclusive_group()
+    listen.add_argument("--listen", metavar="HOST:PORT", help="where to listen (default 127.0.0.1:47800, see control_server.py)")
+    listen.add_argument("--unix", metavar="PATH", help="listen on a unix socket instead (linux/ mac)")
+    return parser
+
+
+#--mode, --rate, --duration, --pattern, --protocol, --wait-done and --timeout
+def add_configuration_arguments(parser):
+    parser.add_argument("--mode", choices=sorted(MODE_NAMES), default="manual", help="manual (1) or trigger (2)")
+    parser.add_argument("--rate", required=True, help="flash rate in Hz")
+    parser.add_argument("--duration", required=True, help="flash duration in seconds")
+    parser.add_argument("--pattern", default="L1",
+                        help="L1, L1:L2, L1:L1:L2, L1:L1:L1:L2 (or 1-4), or a custom pattern like L1+L2@5ms/20ms "
+                             "(see pattern_compiler.py, needs the binary protocol)")
+    parser.add_argument("--protocol", choices=(PROTOCOL_BINARY, PROTOCOL_TEXT), default=PROTOCOL_BINARY)
+    parser.add_argument("--wait-done", action="store_true", help="wait until the arduino prints DONE")
+    parser.add_argument("--timeout", type=float, default=None,
+                        help="seconds to wait for DONE (default: duration + 10, trigger mode waits forever)")
+
+
+#turns --mode/ --rate/ --duration/ --pattern/ --protocol into the settings dict of rigregistry.configure()
+def configuration_settings(arguments):
+    return {
+        "mode": MODE_NAMES[arguments.mode],
+        "flash_rate": arguments.rate,
+        "flash_duration": arguments.duration,
+        "pattern": PATTERN_NAMES.get(arguments.pattern, arguments.pattern),
+        "protocol": arguments.protocol,
+    }
+
+
+#the --timeout for DONE (duration + 10 in manual mode, forever in trigger mode)
+def done_timeout(arguments, mode, flash_duration):
+    if arguments.timeout is None and mode == "Manual Mode":
+        return flash_duration + 10
+    return arguments.timeout
+
+
+#--port/ --emulator (one of them is needed), --baud, --record and --metrics
+def add_port_arguments(parser):
+    where = parser.add_mutually_exclusive_group(required=True)
+    where.add_argument("--port", help="COM port, like COM3 or /dev/ttyACM0")
+    where.add_argument("--emulator", action="store_true", help="use the python copy of the firmware (arduino_emulator.py)")
+    parser.add_argument("--baud", type=int, default=LINK_RATES[0],
+                        help=f"fastest link speed to negotiate (default {LINK_RATES[0]}, {DEFAULT_BAUDRATE} = no negotiation)")
+    parser.add_argument("--record", metavar="FOLDER", help="record the session (timestamped lines) to a log file in FOLDER")
+    parser.add_argument("--metrics", action="store_true", help="print the SET -> answer latencies (p50/ p95/ p99/ max) at the end")
+
+
+#connects to --port (or starts the emulator for --emulator) and waits for the arduino
+#starts recording first if --record was given
+#returns: the emulator (None for a real port), raises OSError if the port can not be opened
+def connect(controller, arguments):
+    if arguments.record:
+        recorder = sessionrecorder(arguments.record)
+        print_line(f"Recording the session to {recorder.start()}")
+        controller.set_recorder(recorder)
+    controller.set_max_baudrate(arguments.baud)
+    port_name = arguments.port
+    emulator = None
+    if arguments.emulator:
+        #only imported when asked for (it needs a pty, so linux/ mac)
+        from arduino_emulator import arduinoemulator
+        emulator = arduinoemulator()
+        port_name = emulator.start()
+    try:
+        controller.connect(port_name)
+    except OSError:
+        if emulator is not None:
+            emulator.stop()
+        raise
+    controller.wait_until_ready()
+    return emulator
+
+
+#prints the metrics (--metrics), disconnects, stops the emulator and the recorder
+def finish(controller, emulator, arguments):
+    if arguments.metrics:
+        print_line(format_summary(controller.latency.summary()))
+    controller.disconnect()
+    if emulator is not None:
+        emulator.stop()
+    if controller.recorder is not None:
+        controller.recorder.stop()
+        controller.set_recorder(None)
+
+
+#'run' command
+def run(arguments):
+    controller = ledcontroller(on_line=lambda line: print_line(f"Arduino: {line}"), on_message=print_line)
+    emulator = None
+    try:
+        #check the settings before touching the port
+        controller.set_mode(MODE_NAMES[arguments.mode])
+        controller.set_flash_rate(arguments.rate)
+        controller.set_flash_duration(arguments.duration)
+        #(the flash rate is set first, a custom pattern is checked with it)
+        controller.set_pattern(PATTERN_NAMES.get(arguments.pattern, arguments.pattern))
+        controller.set_protocol(arguments.protocol)
+
+        emulator = connect(controller, arguments)
+        print_line(controller.send_configuration())
+
+        #wait for the arduino to take the configuration before disconnecting (old text-only
+        #firmware only answers after the text resend, ACK_TIMEOUT after the binary frame)
+        answer = controller.wait_for(("ACK SET", "Received: SET", "NAK"), timeout=ACK_TIMEOUT * 2)
+        if answer is None:
+            print("ledctl: the arduino did not answer the configuration", file=sys.stderr)
+            return EXIT_ERROR
+        if answer.startswith("NAK"):
+            print(f"ledctl: the arduino rejected the configuration: {answer}", file=sys.stderr)
+            return EXIT_ERROR
+        if not arguments.wait_done:
+            return EXIT_OK
+        timeout = done_timeout(arguments, controller.mode, controller.flash_duration)
+        try:
+            if controller.wait_for("DONE", timeout=timeout) is None:
+                print(f"ledctl: no DONE from the arduino after {timeout} s", file=sys.stderr)
+                return EXIT_TIMEOUT
+        except KeyboardInterrupt:
+            #Ctrl+C: stop the LEDs too, not just this script
+            print_line(controller.stop())
+            controller.wait_for("ACK STOP", timeout=ACK_TIMEOUT)
+            return EXIT_ABORTED
+        return EXIT_OK
+
+    except configurationerror as error:
+        print(f"ledctl: {error}", file=sys.stderr)
+        return EXIT_ERROR
+    except OSError as error:
+        #serial.SerialException is an OSError
+        print(f"ledctl: could not connect to {arguments.port}: {error}", file=sys.stderr)
+        return EXIT_ERROR
+    finally:
+        finish(controller, emulator, arguments)
+
+
+#'sequence' command
+def sequence(arguments):
+    try:
+        trials = load_sequence(arguments.file)
+    except (configurationerror, OSError) as error:
+        print(f"ledctl: {error}", file=sys.stderr)
+        return EXIT_ERROR
+    print_line(f"{len(trials)} trials loaded from {arguments.file}")
+
+    controller = ledcontroller(on_line=lambda line: print_line(f"Arduino: {line}"), on_message=print_line)
+    controller.set_protocol(arguments.protocol)
+    emulator = None
+    try:
+        emulator = connect(controller, arguments)
+        scheduler = sequencescheduler(
+            controller, trials, prestage=arguments.prestage,
+            on_progress=lambda completed, total, state: print_line(f"[{completed}/{total}] {state}"),
+        )
+        scheduler.start()
+        try:
+            #wait in short steps so Ctrl+C still works
+            while scheduler.wait(0.2) is None:
+                pass
+        except KeyboardInterrupt:
+            scheduler.abort()
+            scheduler.wait()
+            print_line(format_report(scheduler.report()))
+            return EXIT_ABORTED
+        report = scheduler.report()
+        print_line(format_report(report))
+        return EXIT_OK if report["state"] == SEQUENCE_FINISHED else EXIT_ERROR
+    except OSError as error:
+        print(f"ledctl: could not connect to {arguments.port}: {error}", file=sys.stderr)
+        return EXIT_ERROR
+    finally:
+        finish(controller, emulator, arguments)
+
+
+#'serve' command
+def serve(arguments):
+    #only imported when asked for (asyncio would slow down every other command's start)
+    from control_server import controlserver, DEFAULT_HOST, DEFAULT_PORT
+    host, _, port = (arguments.listen or f"{DEFAULT_HOST}:{DEFAULT_PORT}").rpartition(":")
+    try:
+        port = int(port)
+    except ValueError:
+        print(f"ledctl: '{arguments.listen}' is not HOST:PORT", file=sys.stderr)
+        return EXIT_ERROR
+    controller = ledcontroller(on_line=lambda line: print_line(f"Arduino: {line}"), on_message=print_line)
+    server = controlserver(controller, host=host or DEFAULT_HOST, port=port, unix_path=arguments.unix,
+                           on_command=lambda method, text: print_line(text))
+    emulator = None
+    try:
+        emulator = connect(controller, arguments)
+        print_line(f"Control server listening on {server.start()} (Ctrl+C to stop)")
+        try:
+            #the server thread does the work, wait in short steps so Ctrl+C still works
+            while True:
+                time.sleep(0.2)
+        except KeyboardInterrupt:
+            return EXIT_OK
+    except OSError as error:
+        print(f"ledctl: {error}", file=sys.stderr)
+        return EXIT_ERROR
+    finally:
+        server.stop()
+        finish(controller, emulator, arguments)
+
+
+#'trigger' command: every run is armed (trigger mode SET), scheduled --delay-ms ahead and
+#waited for (DONE), then the errors of all runs are printed
+def trigger(arguments):
+    controller = ledcontroller(on_message=print_line)
+    emulator = None
+    late = []
+    errors = []
+    try:
+        controller.set_mode("Trigger Mode")
+        controller.set_flash_rate(arguments.rate)
+        controller.set_flash_duration(arguments.duration)
+        controller.set_pattern(PATTERN_NAMES.get(arguments.pattern, arguments.pattern))
+        emulator = connect(controller, arguments)
+        estimate = controller.sync_clock()
+        print_line(f"Clock sync: round trip {estimate['round_trip_us']:.0f}us, jitter {estimate['jitter_us']:.1f}us, "
+                   f"bound {estimate['bound_us']:.1f}us")
+        for _ in range(arguments.count):
+            print_line(controller.send_configuration())
+            if controller.wait_for("ACK SET", timeout=ACK_TIMEOUT * 4) is None:
+                print("ledctl: the arduino did not ACK the trigger mode SET", file=sys.stderr)
+                return EXIT_ERROR
+            print_line(controller.schedule_trigger(delay=arguments.delay_ms / 1000))
+            report = controller.wait_for_trigger(timeout=arguments.delay_ms / 1000 + 2)
+            if report is None or controller.wait_for("DONE", timeout=controller.flash_duration + 10) is None:
+                print("ledctl: no trigger report/ DONE from the arduino", file=sys.stderr)
+                return EXIT_TIMEOUT
+            late.append(report["late_us"])
+            if report["error_us"] is not None:
+                errors.append(report["error_us"])
+        for name, values in (("late (arduino clock)", late), ("error (PC clock estimate)", errors)):
+            summary = error_summary(values)
+            if summary is not None:
+                print_line(f"{name}: p50 {summary['p50']:.1f}us  p99 {summary['p99']:.1f}us  "
+                           f"max {summary['max']:.1f}us  mean {summary['mean']:+.1f}us  ({summary['count']} runs)")
+        return EXIT_OK
+    except configurationerror as error:
+        print(f"ledctl: {error}", file=sys.stderr)
+        return EXIT_ERROR
+    except OSError as error:
+        print(f"ledctl: could not connect to {arguments.port}: {error}", file=sys.stderr)
+        return EXIT_ERROR
+    except KeyboardInterrupt:
+        print_line(controller.stop())
+        controller.wait_for("ACK STOP", timeout=ACK_TIMEOUT)
+        return EXIT_ABORTED
+    finally:
+        finish(controller, emulator, arguments)
+
+
+#turns "NAME=PORT" or "NAME=PORT@GROUP" into (name, port, group), raises configurationerror
+def parse_rig(text):
+    name, equals, port_name = text.partition("=")
+    port_name, _, group = port_name.partition("@")
+    if not equals or not name.strip() or not port_name.strip():
+        raise configurationerror(f"'{text}' is not a rig, use NAME=PORT or NAME=PORT@GROUP")
+    return name.strip(), port_name.strip(), group.strip() or None
+
+
+#'broadcast' command
+def broadcast(arguments):
+    registry = rigregistry(
+        on_line=lambda name, line: print_line(f"[{name}] Arduino: {line}"),
+        on_message=lambda name, text: print_line(f"[{name}] {text}"),
+    )
+    emulators = []
+    try:
+        rigs = [parse_rig(text) for text in arguments.rig or []]
+        if arguments.emulators:
+            from arduino_emulator import arduinoemulator
+            for number in range(1, arguments.emulators + 1):
+                emulators.append(arduinoemulator())
+                rigs.append((f"emu{number}", emulators[-1].start(), None))
+        for name, port_name, group in rigs:
+            registry.add_rig(name, port_name, group).controller.set_max_baudrate(arguments.baud)
+        #check the settings before touching the ports
+        settings = configuration_settings(arguments)
+        registry.configure(settings)
+        if not registry.select(arguments.group):
+            raise configurationerror(f"No rig is in group '{arguments.group}'")
+
+        for name, result in registry.connect_all(arguments.group, timeout=READY_TIMEOUT + 1).items():
+            if result is not True:
+                print(f"ledctl: rig {name} is not ready ({result or 'no answer'})", file=sys.stderr)
+        report = registry.broadcast(arguments.group, confirm_timeout=2 * ACK_TIMEOUT)
+        print_line(format_broadcast(report))
+
+        exit_code = EXIT_ERROR if report["failed"] else EXIT_OK
+        if arguments.wait_done and report["rigs"]:
+            timeout = done_timeout(arguments, settings["mode"], registry.rigs[report["rigs"][0]].controller.flash_duration)
+            try:
+                done = registry.wait_for_all("DONE", arguments.group, timeout=timeout)
+            except KeyboardInterrupt:
+                registry.stop(arguments.group)
+                registry.wait_for_all("ACK STOP", arguments.group, timeout=ACK_TIMEOUT)
+                return EXIT_ABORTED
+            #(a rig that NAKed the SET is already in report["failed"], it will not flash)
+            missing = [name for name in report["rigs"] if name not in report["failed"] and done.get(name) is None]
+            if missing:
+                print(f"ledctl: no DONE from {', '.join(missing)} after {timeout} s", file=sys.stderr)
+                exit_code = EXIT_TIMEOUT
+
+        print_line(format_status(registry.status(arguments.group)))
+        if arguments.logs:
+            for each in registry.select(arguments.group):
+                print_line(f"--- {each.name} ---")
+                for text in registry.log(each.name, arguments.logs):
+                    print_line(text)
+        return exit_code
+
+    except configurationerror as error:
+        print(f"ledctl: {error}", file=sys.stderr)
+        return EXIT_ERROR
+    finally:
+        registry.disconnect_all()
+        for emulator in emulators:
+            emulator.stop()
+
+
+def main(argv=None):
+    arguments = build_parser().parse_args(argv)
+    if arguments.command == "ports":
+        for port_name in list_COM_ports():
+            print(port_name)
+        return EXIT_OK
+    if arguments.command == "sequence":
+        return sequence(arguments)
+    if arguments.command == "broadcast":
+        return broadcast(arguments)
+    if arguments.command == "serve":
+        return serve(arguments)
+    if arguments.command == "trigger":
+        return trigger(arguments)
+    return run(arguments)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
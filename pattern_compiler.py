@@ -0,0 +1,180 @@
+#*****************PATTERN COMPILER*****************
+# this file turns a flash pattern written as text (like "L1:L1:L2" or "L1+L2@5ms/20ms")
+# into a table of (LED mask, microseconds) steps that the arduino replays with micros()
+#
+# why:
+#   - the patterns used to be hard-coded twice (the pattern numbers in the GUI and the
+#     if/ else chain in controller_code.ino), so a new pattern meant new firmware
+#   - every step lasted 1000 / (flash_rate * 2) whole milliseconds, which truncates:
+#     3 Hz became 166ms steps (3.01 Hz) and anything above 500 Hz became 0ms (no flashing)
+#   - now the host compiles the pattern into a table, uploads it once (binary frames, see
+#     binary_protocol.py) and the arduino replays it, scheduling every step from the time
+#     the previous one was due (not from when it finished), so the error does not add up
+#     (flash_engine.py has a python copy of the replay, to check the timing on a PC)
+#
+# the pattern language (steps separated by ':'):
+#   L1          flash LED1: on for one 'slot', then off for one slot
+#   L2          flash LED2
+#   L1+L2       flash both LEDs together
+#   OFF         both LEDs off for one slot (a pause)
+#   ...@ON      on time of the step, like L1@5ms, L2@250us, L1+L2@0.5s (no unit = ms)
+#   .../OFF     off time after the step, like L1@5ms/20ms, or L1/0 for no gap at all
+# a slot is half a period of the flash rate: 1 / (flash_rate * 2) seconds
+#   ex: "L1:L1:L2" at 4 Hz  -> L1 125ms, off 125ms, L1 125ms, off 125ms, L2 125ms, off 125ms
+#       "L1@10ms/40ms:L1+L2@10ms/40ms:OFF@200ms" -> 10ms flashes 50ms apart (LED1, then both),
+#       then a 200ms pause
+#
+# note: the four original patterns keep their firmware numbers and the arduino builds their
+# tables itself (BUILTIN_PATTERNS below is what it builds), so they are never uploaded.
+# Pattern 2 ("L1:L2") alternates the LEDs without a gap, which is "L1/0:L2/0" in the language
+#
+# run 'python pattern_compiler.py PATTERN RATE [DURATION]' to print a table and its timing
+# error on a simulated arduino (see simulate() in flash_engine.py)
+import fractions #exact step times (no rounding until the very end)
+import functools #lru_cache for compile_pattern()
+import sys #command line
+
+from binary_protocol import PATTERN_MAX_STEPS
+
+#the bits of the LED mask in a table step
+MASK_LED1 = 0x01
+MASK_LED2 = 0x02
+
+#the words of the language and the LEDs they switch on
+LED_NAMES = {
+    "L1": MASK_LED1,
+    "L2": MASK_LED2,
+    "L1+L2": MASK_LED1 | MASK_LED2,
+    "L2+L1": MASK_LED1 | MASK_LED2,
+    "OFF": 0,
+}
+
+#time units (microseconds per unit), a number without a unit is milliseconds
+TIME_UNITS = {"us": 1, "ms": 1000, "s": 1000000}
+
+#the arduino stores each step's time in an unsigned long (32 bits)
+MAX_STEP_US = 0xFFFFFFFF
+
+#the patterns built into the firmware (pattern number -> the same pattern in the language)
+BUILTIN_PATTERNS = {
+    1: "L1",
+    2: "L1/0:L2/0",
+    3: "L1:L1:L2",
+    4: "L1:L1:L1:L2",
+}
+
+
+# 'patternerror' is raised when a pattern can not be compiled (the message is shown to the user)
+class patternerror(ValueError):
+    pass
+
+
+#*****************COMPILING*****************
+
+#function to read a time like "5ms", "250us", "0.5s" or "20" (ms)
+#returns: microseconds (a Fraction, so "0.1ms" stays exact)
+def parse_time(text):
+    text = text.strip().lower()
+    unit = "ms"
+    for name in ("us", "ms", "s"):
+        if text.endswith(name):
+            text, unit = text[:-len(name)], name
+            break
+    try:
+        value = fractions.Fraction(text.strip())
+    except (ValueError, ZeroDivisionError):
+        raise patternerror(f"'{text}{unit}' is not a time (use a number with us, ms or s)") from None
+    if value < 0:
+        raise patternerror(f"Times can not be negative ({text}{unit})")
+    return value * TIME_UNITS[unit]
+
+
+#function to split a pattern into its steps
+#returns: list of (mask, on time, off time), the times are microseconds or None (= one slot)
+def parse_pattern(pattern):
+    steps = []
+    for word in str(pattern).split(":"):
+        word = word.strip().upper().replace(" ", "")
+        if not word:
+            raise patternerror(f"Empty step in pattern '{pattern}'")
+        word, _, off = word.partition("/")
+        leds, _, on = word.partition("@")
+        if leds not in LED_NAMES:
+            raise patternerror(f"Unknown step '{leds}' (use L1, L2, L1+L2 or OFF)")
+        steps.append((LED_NAMES[leds],
+                      parse_time(on) if on else None,
+                      parse_time(off) if off else None))
+    return steps
+
+
+#function to compile a pattern into the table the arduino replays
+#args: pattern (text, see the top of this file), flash_rate (Hz, sets the length of a slot)
+#returns: tuple of (mask, microseconds) steps, at most PATTERN_MAX_STEPS long
+#raises: patternerror
+#the step times are rounded by rounding the time each step starts at (not each length),
+#so one cycle of the table is never more than 1us away from the exact pattern
+@functools.lru_cache(maxsize=64)
+def compile_pattern(pattern, flash_rate):
+    if flash_rate <= 0:
+        raise patternerror("The flash rate must be greater than zero")
+    slot = fractions.Fraction(1000000, 2 * flash_rate)
+
+    #the exact (mask, length) pieces, a flash is 'on' then 'off'
+    pieces = []
+    for mask, on, off in parse_pattern(pattern):
+        pieces.append((mask, slot if on is None else on))
+        if mask:
+            pieces.append((0, slot if off is None else off))
+
+    #round the start of every piece to a whole microsecond, merge pieces that look the same
+    table = []
+    elapsed = fractions.Fraction(0)
+    for mask, length in pieces:
+        start = int(elapsed)
+        elapsed += length
+        microseconds = int(elapsed) - start
+        if microseconds == 0:
+            continue
+        if table and table[-1][0] == mask:
+            table[-1][1] += microseconds
+        else:
+            table.append([mask, microseconds])
+
+    if not table or all(mask == 0 for mask, _ in table):
+        raise patternerror(f"Pattern '{pattern}' never switches an LED on")
+    if len(table) > PATTERN_MAX_STEPS:
+        raise patternerror(f"Pattern '{pattern}' needs {len(table)} steps, the arduino holds {PATTERN_MAX_STEPS}")
+    if any(microseconds > MAX_STEP_US for _, microseconds in table):
+        raise patternerror(f"A step of pattern '{pattern}' is longer than the arduino can time ({MAX_STEP_US}us)")
+    return tuple((mask, microseconds) for mask, microseconds in table)
+
+
+#function to get the table the firmware builds for one of its own patterns (1-4)
+def builtin_table(pattern_number, flash_rate):
+    return compile_pattern(BUILTIN_PATTERNS[pattern_number], flash_rate)
+
+
+#function to describe a table for printing, like "L1 125000us, off 125000us"
+def describe_table(table):
+    names = {}
+    for name, mask in LED_NAMES.items():
+        names.setdefault(mask, name)
+    return ", ".join(f"{names[mask].lower() if mask == 0 else names[mask]} {microseconds}us"
+                     for mask, microseconds in table)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("usage: python pattern_compiler.py PATTERN RATE [DURATION]")
+        sys.exit(1)
+    duration = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+    try:
+        compiled = compile_pattern(sys.argv[1], int(sys.argv[2]))
+    except (patternerror, ValueError) as error:
+        print(error)
+        sys.exit(1)
+    print(f"{len(compiled)} steps: {describe_table(compiled)}")
+    from flash_engine import ideal_changes, simulate, timing_error
+    result = timing_error(simulate(compiled, duration), ideal_changes(compiled, duration))
+    print(f"simulated arduino, {result['changes']} LED changes in {duration}s: "
+          f"mean error {result['mean']:.1f}us, max {result['max']}us, last change {result['last']:+}us")
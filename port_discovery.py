@@ -0,0 +1,90 @@
+
+#*****************COM PORT DISCOVERY*****************
+# this file holds the 'portwatcher' class which finds the COM ports in the background
+#
+# the problem this solves:
+#   - serial.tools.list_ports.comports() can take a while (especially on windows),
+#     and the GUI used to call it in systemGUI.__init__, so the window took longer to appear
+#   - the list was only read once, so plugging in the arduino after starting the app
+#     meant restarting the app
+#
+# how it works:
+#   - a background thread calls comports() straight away and then every SCAN_INTERVAL seconds
+#   - it compares the new list with the last one and only reports what changed
+#     (on_change(added, removed)), so the GUI can update the dropdown without rebuilding it
+#
+# note: pyserial does not have a 'device plugged in' event that works on every OS,
+#       so re-scanning every second is the simplest way to notice hotplugged boards
+import threading #the background scanning thread
+
+import serial.tools.list_ports #lists available serial ports on the computer
+
+#how often to re-scan the COM ports (seconds)
+SCAN_INTERVAL = 1.0
+
+
+#function to get the COM ports right now (blocks while pyserial scans)
+#returns: sorted list of port names (like "COM3" or "/dev/ttyACM0")
+def list_COM_ports():
+    return sorted(port.device for port in serial.tools.list_ports.comports())
+
+
+# 'portwatcher' class that scans for COM ports in a background thread
+#   - on_change(added, removed): called from the background thread with two lists of
+#     port names whenever the available ports change (the first scan reports every port as added)
+#   - interval: seconds between scans
+#   - list_ports: function that returns the current port names (list_COM_ports by default)
+class portwatcher:
+
+    #constructor that creates a portwatcher object
+    def __init__(self, on_change, interval=SCAN_INTERVAL, list_ports=list_COM_ports):
+        self.on_change = on_change
+        self.interval = interval
+        self.list_ports = list_ports
+
+        #the ports found by the last scan
+        self.known_ports = set()
+
+        self.stop_event = threading.Event()
+        self.scan_thread = None
+
+    #METHOD #1: start
+    #   starts scanning in the background (does nothing if it is already running)
+    def start(self):
+        if self.scan_thread is not None and self.scan_thread.is_alive():
+            return
+        self.stop_event = threading.Event()
+        self.scan_thread = threading.Thread(
+            target=self.scan_loop, args=(self.stop_event,), name="port-watcher", daemon=True)
+        self.scan_thread.start()
+
+    #METHOD #2: stop
+    #   stops scanning and waits for the thread to finish
+    def stop(self):
+        self.stop_event.set()
+        if self.scan_thread is not None:
+            self.scan_thread.join()
+            self.scan_thread = None
+
+    #METHOD #3: scan_once
+    #   scans the ports once and reports any changes
+    #   returns: (added, removed) lists of port names
+    def scan_once(self):
+        try:
+            ports = set(self.list_ports())
+        except OSError:
+            #the OS can fail to list ports while a device is being plugged in, try again next time
+            return [], []
+
+        added = sorted(ports - self.known_ports)
+        removed = sorted(self.known_ports - ports)
+        self.known_ports = ports
+        if added or removed:
+            self.on_change(added, removed)
+        return added, removed
+
+    #the body of the scanning thread: scan now, then every 'interval' seconds
+    def scan_loop(self, stop_event):
+        while not stop_event.is_set():
+            self.scan_once()
+            stop_event.wait(self.interval)
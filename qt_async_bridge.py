@@ -0,0 +1,79 @@
+
+#*****************QT <-> ASYNCIO BRIDGE*****************
+# this file runs an asyncio event loop inside the Qt event loop (like the qasync package
+# does, without the extra dependency), so the asyncio transport (async_transport.py)
+# can read the arduino in the GUI thread:
+#   - the asyncio loop gets its own selector (epoll on linux, kqueue on mac), and the
+#     selector's file descriptor becomes readable whenever one of the loop's file
+#     descriptors (the serial port, the loop's wake-up pipe) is readable
+#   - a QSocketNotifier watches that one descriptor, so Qt wakes us up as soon as the
+#     arduino sends something, and we run the asyncio loop until it has nothing left to do
+#   - a QTimer runs the loop every TIMER_MS as well, for the asyncio timers (the timeouts
+#     of wait_for()/ the ACK check), which do not make any descriptor readable
+#
+# usage (before the window is created):
+#     bridge = qtasynciobridge()
+#     controller = asyncledcontroller(loop=bridge.loop)
+#     ... pyQtapp.exec() runs both loops
+#
+# note: linux/ mac only (on windows the selector has no descriptor Qt can watch)
+import asyncio #the event loop that is run by Qt
+import selectors #the loop's selector, its descriptor is what Qt watches
+
+from PyQt6.QtCore import QObject, QSocketNotifier, QTimer
+
+#how often the asyncio timers are checked (ms), a timeout can be up to this much late
+TIMER_MS = 10
+#the most passes of the asyncio loop one wake-up runs (a line that completes a future
+#wakes the waiting coroutine in the NEXT pass, so we keep going while callbacks are ready)
+MAX_LOOP_PASSES = 100
+
+
+# 'qtasynciobridge' class that runs an asyncio loop from the Qt event loop
+#   - loop: the asyncio loop (also set as the current loop of this thread)
+#   - close(): stops watching and closes the loop (call it when the window closes)
+class qtasynciobridge(QObject):
+
+    #constructor that creates a qtasynciobridge object
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.selector = selectors.DefaultSelector()
+        if not hasattr(self.selector, "fileno"):
+            raise RuntimeError("The asyncio transport needs linux or mac (epoll/ kqueue)")
+        self.loop = asyncio.SelectorEventLoop(self.selector)
+        asyncio.set_event_loop(self.loop)
+
+        #wakes us up when the serial port (or anything else the loop watches) has data
+        self.notifier = QSocketNotifier(self.selector.fileno(), QSocketNotifier.Type.Read, self)
+        self.notifier.activated.connect(self.run_once)
+
+        #the asyncio timers (call_later, timeouts)
+        self.timer = QTimer(self)
+        self.timer.setInterval(TIMER_MS)
+        self.timer.timeout.connect(self.run_once)
+        self.timer.start()
+
+    #METHOD #1: run_once
+    #   runs everything the asyncio loop has ready now (it never waits)
+    def run_once(self):
+        if self.loop.is_closed() or self.loop.is_running():
+            return
+        for _ in range(MAX_LOOP_PASSES):
+            #stop() is handled at the end of the pass, and a pass with a callback ready
+            #does not wait for the selector
+            self.loop.call_soon(self.loop.stop)
+            self.loop.run_forever()
+            #(_ready: the callbacks waiting for the next pass, asyncio has no public way to ask)
+            if not self.loop._ready:
+                break
+
+    #METHOD #2: close
+    def close(self):
+        self.timer.stop()
+        self.notifier.setEnabled(False)
+        if not self.loop.is_closed():
+            #let cancelled tasks finish before the loop goes away
+            for task in asyncio.all_tasks(self.loop):
+                task.cancel()
+            self.run_once()
+            self.loop.close()
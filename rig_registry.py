@@ -0,0 +1,341 @@
+
+#*****************RIG REGISTRY*****************
+# this file holds the 'rigregistry' class: drives several LED rigs (one arduino + LED bank
+# each) from one program
+#
+# why:
+#   - the lab has several LED banks, each with its own board, and the GUI/ ledctl only ever
+#     talk to one of them
+#   - sending the same configuration to every rig one after the other with
+#     send_configuration() spreads the SETs out (each one checks the settings, builds the
+#     frame, records it and starts an ACK timer before the next rig gets its SET)
+#
+# how it works:
+#   - every rig is a normal ledcontroller (its own port, its own reader thread, its own
+#     settings), so everything that works for one arduino works for each rig
+#   - broadcast() sends to all rigs (or one group of them) in three steps:
+#       1) prepare every rig's SET (checks, table uploads, frames, ACK tracking)
+#       2) write all of them right after each other (only the write() calls)
+#       3) record them and start the ACK checks
+#     and reports the 'send skew': the time between the first and the last SET leaving the PC
+#   - every rig keeps a log of its lines and messages, status() gives one row per rig
+#
+# example:
+#     registry = rigregistry(on_line=lambda name, line: print(f"[{name}] {line}"))
+#     registry.add_rig("bank A", "/dev/ttyACM0", group="left")
+#     registry.add_rig("bank B", "/dev/ttyACM1", group="left")
+#     registry.connect_all()
+#     registry.configure({"mode": "Manual Mode", "flash_rate": 4, "flash_duration": 30})
+#     report = registry.broadcast(group="left", confirm_timeout=1)
+#     print(format_broadcast(report)); print(format_status(registry.status()))
+#
+# note: this file does not use PyQt6
+import collections #deque for each rig's log
+import threading #the log is written from the reader threads
+import time #perf_counter_ns
+
+from led_controller import ledcontroller, configurationerror
+from latency_metrics import CONFIRM_PREFIXES
+
+#how many lines each rig's log keeps
+RIG_LOG_LINES = 1000
+
+#the answers that reject a configuration (the NAK of the SET/ NEXT or of its pattern table),
+#CONFIRM_PREFIXES (latency_metrics.py) are the ones that confirm it
+REJECT_PREFIXES = ("NAK SET", "NAK NEXT", "NAK PATTERN")
+
+#the settings configure() accepts (key -> ledcontroller method), the rate before the
+#pattern: a custom pattern is compiled for the rate
+SETTINGS = (
+    ("mode", "set_mode"),
+    ("flash_rate", "set_flash_rate"),
+    ("flash_duration", "set_flash_duration"),
+    ("pattern", "set_pattern"),
+    ("protocol", "set_protocol"),
+)
+
+
+# 'rig' class: one arduino + LED bank
+#   - name: shown to the user, group: for broadcasting to some of the rigs (None = no group)
+#   - controller: the rig's ledcontroller
+#   - log: deque of (time.perf_counter_ns(), text), the newest RIG_LOG_LINES lines and messages
+class rig:
+
+    def __init__(self, name, port_name, group, controller):
+        self.name = name
+        self.port_name = port_name
+        self.group = group
+        self.controller = controller
+        self.log = collections.deque(maxlen=RIG_LOG_LINES)
+        self.log_lock = threading.Lock()
+        self.last_line = ""
+        #time.perf_counter_ns() the last "ACK SET"/ "Received: SET" arrived (for the confirmation skew)
+        self.confirmed_at = 0
+
+    def add_to_log(self, text):
+        with self.log_lock:
+            self.log.append((time.perf_counter_ns(), text))
+
+    #line listener of the controller: every line, ACKs and NAKs included (reader thread)
+    def heard(self, line):
+        if line.startswith(CONFIRM_PREFIXES):
+            self.confirmed_at = time.perf_counter_ns()
+
+
+# 'rigregistry' class that holds the rigs
+#   - on_line(name, line): called (from the rig's reader thread) for every line from a rig
+#   - on_message(name, text): called for every status message of a rig
+#   - controller_factory: makes each rig's controller (ledcontroller, or a function
+#     returning something like it, the benchmarks pass their own)
+class rigregistry:
+
+    #constructor that creates a rigregistry object
+    def __init__(self, on_line=None, on_message=None, controller_factory=ledcontroller):
+        self.on_line = on_line
+        self.on_message = on_message
+        self.controller_factory = controller_factory
+        #name -> rig, in the order they were added
+        self.rigs = {}
+
+    #METHOD #1: add_rig
+    #   args: name, port_name (like COM3 or /dev/ttyACM0), group (None = no group)
+    #   returns: the new rig (not connected yet)
+    #   raises: configurationerror if the name or the port is already used
+    def add_rig(self, name, port_name, group=None):
+        if name in self.rigs:
+            raise configurationerror(f"There is already a rig called '{name}'!")
+        for other in self.rigs.values():
+            if other.port_name == port_name:
+                raise configurationerror(f"{port_name} is already used by rig '{other.name}'!")
+        new_rig = rig(name, port_name, group, None)
+        new_rig.controller = self.controller_factory(
+            on_line=lambda line: self.rig_line(new_rig, line),
+            on_message=lambda text: self.rig_message(new_rig, text),
+        )
+        new_rig.controller.add_line_listener(new_rig.heard)
+        self.rigs[name] = new_rig
+        return new_rig
+
+    #METHOD #2: remove_rig
+    #   disconnects the rig and forgets it
+    def remove_rig(self, name):
+        old_rig = self.rigs.pop(name, None)
+        if old_rig is not None:
+            old_rig.controller.disconnect()
+
+    #METHOD #3: select
+    #   returns: the rigs of 'group' (None = all of them), in the order they were added
+    def select(self, group=None):
+        return [each for each in self.rigs.values() if group is None or each.group == group]
+
+    #METHOD #4: connect_all
+    #   opens every port (one after the other, opening does not wait for the arduino), then
+    #   waits for all of them to be ready (they reset and negotiate at the same time)
+    #   returns: dict name -> True (ready)/ False (timed out)/ the error if the port did not open
+    def connect_all(self, group=None, timeout=None):
+        results = {}
+        for each in self.select(group):
+            try:
+                each.controller.connect(each.port_name)
+            except OSError as error:
+                #serial.SerialException is an OSError
+                results[each.name] = error
+                each.add_to_log(f"Could not connect to {each.port_name}: {error}")
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for each in self.select(group):
+            if each.name in results:
+                continue
+            if deadline is None:
+                results[each.name] = each.controller.wait_until_ready()
+            else:
+                results[each.name] = each.controller.wait_until_ready(max(0.0, deadline - time.monotonic()))
+        return results
+
+    #METHOD #5: disconnect_all
+    def disconnect_all(self, group=None):
+        for each in self.select(group):
+            each.controller.disconnect()
+
+    #METHOD #6: configure
+    #   changes the settings of every rig in 'group' (a dict with any of "mode", "pattern",
+    #   "flash_rate", "flash_duration", "protocol")
+    #   raises: configurationerror (nothing is changed if a value is invalid for any rig)
+    def configure(self, settings, group=None):
+        unknown = set(settings) - {key for key, _ in SETTINGS}
+        if unknown:
+            raise configurationerror(f"Unknown setting(s): {', '.join(sorted(unknown))}")
+        #check the values on a spare controller first, so the rigs are never half changed
+        checker = ledcontroller()
+        for key, method in SETTINGS:
+            if key in settings:
+                getattr(checker, method)(settings[key])
+        for each in self.select(group):
+            for key, method in SETTINGS:
+                if key in settings:
+                    getattr(each.controller, method)(settings[key])
+
+    #METHOD #7: broadcast
+    #   sends each rig's settings to the rigs of 'group' (None = all connected rigs) with the
+    #   SETs as close together as possible
+    #   args: protocol/ queued (like send_configuration()), confirm_timeout (seconds to wait
+    #         for every rig to confirm, None = do not wait)
+    #   returns: report dict:
+    #       "rigs": the names the SET was written to, in order
+    #       "sent_us": name -> when its SET was written (us after the first one)
+    #       "skew_us": first to last SET written
+    #       "failed": name -> error message (settings rejected/ not connected/ write failed/
+    #                 NAKed by the arduino, the last one only with confirm_timeout)
+    #       "confirmed_us": name -> SET written to confirmation received (us), only with confirm_timeout
+    #       "confirm_skew_us": first to last confirmation (None if not all of them came)
+    def broadcast(self, group=None, protocol=None, queued=False, confirm_timeout=None):
+        failed = {}
+        prepared = []
+        #1) prepare (everything that takes time happens here)
+        for each in self.select(group):
+            if not each.controller.connection.is_connected():
+                failed[each.name] = "not connected"
+                continue
+            try:
+                prepared.append((each, each.controller.prepare_configuration(protocol, queued)))
+            except configurationerror as error:
+                failed[each.name] = str(error)
+
+        #2) write, nothing else in this loop
+        written = []
+        for each, one in prepared:
+            try:
+                each.controller.write_prepared(one)
+                written.append((each, one))
+            except configurationerror as error:
+                failed[each.name] = str(error)
+
+        #3) record the SETs and start the ACK checks
+        for each, one in written:
+            each.add_to_log(each.controller.finish_prepared(one))
+
+        first = written[0][1]["sent_at"] if written else 0
+        report = {
+            "rigs": [each.name for each, _ in written],
+            "sent_us": {each.name: (one["sent_at"] - first) / 1000 for each, one in written},
+            "skew_us": (written[-1][1]["sent_at"] - first) / 1000 if written else 0.0,
+            "failed": failed,
+        }
+        if confirm_timeout is not None:
+            self.wait_for_confirmations(report, written, confirm_timeout)
+        return report
+
+    #METHOD #8: stop
+    #   sends STOP to every connected rig of 'group' (ends the runs, disarms the triggers)
+    #   returns: dict name -> the message (or the error)
+    def stop(self, group=None):
+        results = {}
+        for each in self.select(group):
+            if not each.controller.connection.is_connected():
+                continue
+            try:
+                results[each.name] = each.controller.stop()
+            except configurationerror as error:
+                results[each.name] = str(error)
+            each.add_to_log(results[each.name])
+        return results
+
+    #METHOD #9: wait_for_all
+    #   waits for a line starting with 'prefix' from every rig of 'group' (since its last SET)
+    #   returns: dict name -> the line (None if it did not come within 'timeout' seconds)
+    def wait_for_all(self, prefix, group=None, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        results = {}
+        for each in self.select(group):
+            left = None if deadline is None else max(0.0, deadline - time.monotonic())
+            results[each.name] = each.controller.wait_for(prefix, timeout=left)
+        return results
+
+    #METHOD #10: status
+    #   returns: one dict per rig (name, group, port, state, link rate, flashing progress,
+    #            lines received, last line)
+    def status(self, group=None):
+        rows = []
+        for each in self.select(group):
+            controller = each.controller
+            connection = controller.connection
+            progress = controller.flash_progress()
+            rows.append({
+                "name": each.name,
+                "group": each.group,
+                "port": each.port_name,
+                "state": connection.state,
+                "link_rate": getattr(connection, "link_rate", None),
+                "flashing": None if progress is None else f"{progress[0]:.1f}/{progress[1]} s",
+                "lines": controller.received_count,
+                "last_line": each.last_line,
+            })
+        return rows
+
+    #METHOD #11: log
+    #   returns: the newest 'count' lines of a rig's log as text (None = all that are kept)
+    def log(self, name, count=None):
+        each = self.rigs[name]
+        with each.log_lock:
+            entries = list(each.log)
+        if count is not None:
+            entries = entries[-count:]
+        return [text for _, text in entries]
+
+
+    #*****************INTERNAL HELPERS*****************
+
+    #a line from a rig (reader thread)
+    def rig_line(self, each, line):
+        each.last_line = line
+        each.add_to_log(f"Arduino: {line}")
+        if self.on_line:
+            self.on_line(each.name, line)
+
+    #a status message from a rig
+    def rig_message(self, each, text):
+        each.add_to_log(text)
+        if self.on_message:
+            self.on_message(each.name, text)
+
+    #fills in "confirmed_us"/ "confirm_skew_us" of a broadcast report (a NAKed rig goes to "failed")
+    def wait_for_confirmations(self, report, written, timeout):
+        deadline = time.monotonic() + timeout
+        arrivals = {}
+        report["confirmed_us"] = {}
+        for each, one in written:
+            answer = each.controller.wait_for(CONFIRM_PREFIXES + REJECT_PREFIXES,
+                                              timeout=max(0.0, deadline - time.monotonic()))
+            if answer is None:
+                continue
+            if answer.startswith(REJECT_PREFIXES):
+                #"NAK SET #3 (bad value)" -> "bad value"
+                reason = answer[answer.find("(") + 1:].rstrip(")") if "(" in answer else answer
+                report["failed"][each.name] = f"rejected by the arduino: {reason}"
+                continue
+            if each.confirmed_at >= one["sent_at"]:
+                arrivals[each.name] = each.confirmed_at
+                report["confirmed_us"][each.name] = (each.confirmed_at - one["sent_at"]) / 1000
+        report["confirm_skew_us"] = ((max(arrivals.values()) - min(arrivals.values())) / 1000
+                                     if written and len(arrivals) == len(written) else None)
+
+
+#function to turn a broadcast report into text
+def format_broadcast(report):
+    lines = [f"SET sent to {len(report['rigs'])} rig(s), send skew {report['skew_us']:.0f} us"]
+    if "confirmed_us" in report:
+        confirmed = report["confirmed_us"]
+        skew = report["confirm_skew_us"]
+        lines.append(f"confirmed by {len(confirmed)} rig(s)" +
+                     (f", confirmation skew {skew:.0f} us" if skew is not None else ", some confirmations MISSING"))
+    for name, error in report["failed"].items():
+        lines.append(f"  {name}: FAILED ({error})")
+    return "\n".join(lines)
+
+
+#function to turn status() into a text table
+def format_status(rows):
+    lines = [f"{'rig':<12}{'group':<10}{'port':<16}{'state':<14}{'baud':>9}{'flashing':>12}{'lines':>7}  last line"]
+    for row in rows:
+        lines.append(f"{row['name']:<12}{row['group'] or '-':<10}{row['port']:<16}{row['state']:<14}"
+                     f"{row['link_rate'] or '-':>9}{row['flashing'] or '-':>12}{row['lines']:>7}  {row['last_line']}")
+    return "\n".join(lines)
@@ -0,0 +1,350 @@
+
+#*****************SEQUENCE SCHEDULER*****************
+# this file runs a whole experiment (a list of trials) without anyone clicking "Start Flashing"
+#
+# the problem this solves:
+#   - every trial needed a person to type the rate/ duration and click start, and nothing
+#     waited for the arduino's "DONE", so between trials the LEDs sat idle until someone
+#     noticed the last run had finished
+#
+# how it works:
+#   - load_sequence() reads a sequence file (CSV or YAML) into a list of 'trial' objects
+#   - 'sequencescheduler' runs them in a background thread through a ledcontroller:
+#       send trial 1 -> wait for "DONE" -> wait the trial's gap -> send trial 2 -> ...
+#   - prestage=True: while a trial is flashing, the next one (if its gap is 0) is already
+#     sent as NEXT. The arduino queues it and starts it straight after "DONE" (no round
+#     trip to the PC)
+#   - pause()/ resume(): a pause takes effect between trials, a trial that was already
+#     prestaged still runs
+#   - abort(): no more trials are sent and the arduino is sent STOP, which ends the trial
+#     that is flashing now and forgets a prestaged one
+#   - the report has the idle time between trials: from "DONE" of one trial to the arduino's
+#     first answer to the next one
+#
+# sequence file format (CSV, one trial per row, 'gap' is optional and in seconds):
+#     mode,rate,duration,pattern,gap
+#     manual,4,30,L1:L2,0
+#     trigger,10,5,2,1.5
+# or YAML (a list of trials, or 'defaults' + 'trials'):
+#     defaults: {mode: manual, pattern: L1:L2, gap: 0}
+#     trials:
+#       - {rate: 4, duration: 30}
+#       - {rate: 10, duration: 5, mode: trigger}
+#
+# note: this file does not use PyQt6, the GUI turns the callbacks into Qt signals
+import csv #CSV sequence files
+import os #file extensions
+import threading #the scheduler thread/ pause/ abort
+import time #perf_counter
+
+from led_controller import configurationerror, PATTERNS
+from pattern_compiler import compile_pattern, patternerror
+
+#the names allowed for the mode/ pattern in a sequence file
+MODE_NAMES = {"manual": "Manual Mode", "1": "Manual Mode", "manual mode": "Manual Mode",
+              "trigger": "Trigger Mode", "2": "Trigger Mode", "trigger mode": "Trigger Mode"}
+PATTERN_NAMES = dict(zip(PATTERNS, PATTERNS))
+PATTERN_NAMES.update({str(number): pattern for pattern, number in PATTERNS.items()})
+
+#how long after the end of a manual trial to wait for "DONE" before giving up (seconds)
+DONE_MARGIN = 10.0
+
+#the scheduler states
+SEQUENCE_IDLE = "idle"
+SEQUENCE_RUNNING = "running"
+SEQUENCE_PAUSED = "paused"
+SEQUENCE_FINISHED = "finished"
+SEQUENCE_ABORTED = "aborted"
+SEQUENCE_FAILED = "failed"
+
+
+# 'trial' class: the settings for one run of the LEDs
+class trial:
+    __slots__ = ("mode", "flash_rate", "flash_duration", "pattern", "gap")
+
+    def __init__(self, mode, flash_rate, flash_duration, pattern, gap=0.0):
+        self.mode = mode #"Manual Mode" or "Trigger Mode"
+        self.flash_rate = flash_rate #Hz
+        self.flash_duration = flash_duration #seconds
+        self.pattern = pattern #"L1", "L1:L2" ...
+        self.gap = gap #seconds to wait after the previous trial's "DONE"
+
+    def describe(self):
+        return f"{self.mode}, {self.pattern} at {self.flash_rate} Hz for {self.flash_duration} s"
+
+
+#turns one row/ entry of a sequence file into a trial (raises configurationerror)
+#args: values (dict), row_number (for the error message)
+def make_trial(values, row_number):
+    values = {str(key).strip().lower(): value for key, value in values.items() if key is not None}
+    try:
+        mode = MODE_NAMES[str(values.get("mode", "manual")).strip().lower()]
+        pattern = str(values.get("pattern", "L1")).strip()
+        pattern = PATTERN_NAMES.get(pattern, pattern)
+        flash_rate = int(values["rate"])
+        flash_duration = int(values["duration"])
+        gap = float(values.get("gap") or 0)
+    except KeyError as error:
+        raise configurationerror(f"Trial {row_number}: missing or unknown value {error}") from None
+    except (TypeError, ValueError):
+        raise configurationerror(f"Trial {row_number}: Invalid Input!") from None
+    if flash_rate <= 0 or flash_duration <= 0 or gap < 0:
+        raise configurationerror(f"Trial {row_number}: the flash rate/ duration must be greater than zero and the gap can not be negative!")
+    #a custom pattern (like "L1+L2@5ms") is checked now, not when the trial is reached
+    if pattern not in PATTERNS:
+        try:
+            compile_pattern(pattern, flash_rate)
+        except patternerror as error:
+            raise configurationerror(f"Trial {row_number}: invalid pattern '{pattern}': {error}") from None
+    return trial(mode, flash_rate, flash_duration, pattern, gap)
+
+
+#function to read a sequence file
+#args: path (.csv, .yaml or .yml)
+#returns: list of trials
+#raises: configurationerror if the file can not be used, OSError if it can not be read
+def load_sequence(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".csv":
+        with open(path, newline="") as file:
+            entries = list(csv.DictReader(file))
+        defaults = {}
+    elif extension in (".yaml", ".yml"):
+        #PyYAML is only needed for YAML sequence files
+        try:
+            import yaml
+        except ImportError:
+            raise configurationerror("Reading YAML sequence files needs PyYAML (pip install pyyaml), or use a CSV file") from None
+        with open(path) as file:
+            document = yaml.safe_load(file)
+        if isinstance(document, dict):
+            defaults = document.get("defaults") or {}
+            entries = document.get("trials") or []
+        else:
+            defaults = {}
+            entries = document or []
+    else:
+        raise configurationerror(f"Unknown sequence file type '{extension}' (use .csv, .yaml or .yml)")
+
+    trials = []
+    for row_number, entry in enumerate(entries, start=1):
+        if not isinstance(entry, dict):
+            raise configurationerror(f"Trial {row_number}: expected mode/ rate/ duration/ pattern/ gap values")
+        trials.append(make_trial({**defaults, **entry}, row_number))
+    if not trials:
+        raise configurationerror(f"No trials in {path}!")
+    return trials
+
+
+#function to turn a report from the scheduler into text
+def format_report(report):
+    lines = [f"Sequence {report['state']}: {report['completed']}/{report['total']} trials in {report['elapsed']:.1f} s"]
+    gaps = report["idle_gaps"]
+    if gaps:
+        lines.append(f"Idle between trials: total {sum(gaps):.3f} s, mean {sum(gaps) / len(gaps) * 1000:.1f} ms, "
+                     f"max {max(gaps) * 1000:.1f} ms (of which {report['planned_gap']:.3f} s were planned gaps)")
+    if report["error"]:
+        lines.append(f"Error: {report['error']}")
+    return "\n".join(lines)
+
+
+# 'sequencescheduler' class that sends the trials one after the other
+#   - controller: a connected ledcontroller (see led_controller.py)
+#   - trials: list of trials (from load_sequence())
+#   - on_progress(completed, total, state): called when a trial starts/ ends or the state changes
+#   - on_finished(report): called once at the end (see report())
+#   - prestage: send the next trial while the current one is flashing (see the top of the file)
+#   the callbacks are called from the scheduler/ reader threads
+class sequencescheduler:
+
+    #constructor that creates a sequencescheduler object
+    def __init__(self, controller, trials, on_progress=None, on_finished=None, prestage=False):
+        self.controller = controller
+        self.trials = list(trials)
+        self.on_progress = on_progress
+        self.on_finished = on_finished
+        self.prestage = prestage
+
+        self.state = SEQUENCE_IDLE
+        self.error = None
+        self.thread = None
+        #set = running, cleared = paused (the scheduler waits on it between trials)
+        self.resume_event = threading.Event()
+        self.resume_event.set()
+        self.abort_event = threading.Event()
+
+        #what the arduino has said so far (filled in by line_received() in the reader thread)
+        self.condition = threading.Condition()
+        self.done_times = [] #arrival time of every "DONE" since the start
+        self.started_count = 0 #how many "Flashing Pattern ..." lines since the start
+        self.answer_times = [] #arrival time of the first line after each "DONE"
+        self.failure = None #"NAK ..." or "Error parsing command!" from the arduino
+
+        self.start_time = None
+        self.end_time = None
+
+
+    #*****************CONTROL (any thread)*****************
+
+    #METHOD #1: start
+    #   starts the scheduler thread (the controller must already be connected)
+    def start(self):
+        if self.thread is not None:
+            raise RuntimeError("the sequence was already started")
+        self.controller.add_line_listener(self.line_received)
+        self.start_time = time.perf_counter()
+        self.set_state(SEQUENCE_RUNNING)
+        self.thread = threading.Thread(target=self.run, name="sequence-scheduler", daemon=True)
+        self.thread.start()
+
+    #METHOD #2: pause (takes effect before the next trial is sent)
+    def pause(self):
+        if self.state == SEQUENCE_RUNNING:
+            self.resume_event.clear()
+            self.set_state(SEQUENCE_PAUSED)
+
+    #METHOD #3: resume
+    def resume(self):
+        if self.state == SEQUENCE_PAUSED:
+            self.set_state(SEQUENCE_RUNNING)
+            self.resume_event.set()
+
+    #METHOD #4: abort (no more trials are sent, the one flashing now is stopped)
+    def abort(self):
+        self.abort_event.set()
+        try:
+            self.controller.message(self.controller.stop())
+        except configurationerror as error:
+            self.controller.message(str(error))
+        #wake the scheduler if it is paused or waiting for "DONE"
+        self.resume_event.set()
+        with self.condition:
+            self.condition.notify_all()
+
+    #METHOD #5: wait
+    #   waits for the scheduler thread to end, returns the report (None on a timeout)
+    def wait(self, timeout=None):
+        if self.thread is not None:
+            self.thread.join(timeout)
+            if self.thread.is_alive():
+                return None
+        return self.report()
+
+    #METHOD #6: report
+    #   returns: dict with the state, completed/ total trials, elapsed seconds, the idle
+    #            gaps between trials (seconds), the planned part of them and any error
+    def report(self):
+        with self.condition:
+            idle_gaps = [answer - done for done, answer in zip(self.done_times, self.answer_times)]
+        completed = min(len(self.done_times), len(self.trials))
+        end_time = self.end_time or time.perf_counter()
+        return {
+            "state": self.state,
+            "completed": completed,
+            "total": len(self.trials),
+            "elapsed": end_time - (self.start_time or end_time),
+            "idle_gaps": idle_gaps,
+            "planned_gap": sum(trial.gap for trial in self.trials[1:len(idle_gaps) + 1]),
+            "error": self.error,
+        }
+
+
+    #*****************SCHEDULER THREAD*****************
+
+    def run(self):
+        prestaged = False #was the current trial already sent while the last one flashed?
+        try:
+            for number, current in enumerate(self.trials):
+                if not prestaged:
+                    #between trials: honour pause/ abort, then the planned gap
+                    if not self.wait_to_continue(current.gap if number else 0):
+                        break
+                    self.send(current)
+                self.progress(number)
+
+                #wait for this trial's "DONE" (and prestage the next one once this one flashes)
+                prestaged = False
+                following = self.trials[number + 1] if number + 1 < len(self.trials) else None
+                #(a custom pattern's table upload would stop the trial flashing now, so it is never prestaged)
+                can_prestage = (self.prestage and following is not None and following.gap == 0
+                                and following.pattern in PATTERNS)
+                deadline = None
+                if current.mode == "Manual Mode":
+                    deadline = time.perf_counter() + current.flash_duration + DONE_MARGIN
+                with self.condition:
+                    while len(self.done_times) <= number and self.failure is None:
+                        if self.abort_event.is_set():
+                            break
+                        #prestage once the arduino has started flashing this trial (unless paused)
+                        if (can_prestage and not prestaged and self.started_count > number
+                                and self.resume_event.is_set() and not self.abort_event.is_set()):
+                            self.condition.release()
+                            try:
+                                self.send(following, queued=True)
+                            finally:
+                                self.condition.acquire()
+                            prestaged = True
+                            continue
+                        left = None if deadline is None else deadline - time.perf_counter()
+                        if left is not None and left <= 0:
+                            raise configurationerror(f"No DONE from the arduino for trial {number + 1}!")
+                        self.condition.wait(left if left is None else min(left, 0.5))
+                    if self.failure is not None:
+                        raise configurationerror(f"Trial {number + 1} was not accepted: {self.failure}")
+                    done = len(self.done_times) > number
+                if not done:
+                    break
+                self.progress(number + 1)
+            if self.abort_event.is_set():
+                self.set_state(SEQUENCE_ABORTED)
+            else:
+                self.set_state(SEQUENCE_FINISHED)
+        except configurationerror as error:
+            self.error = str(error)
+            self.set_state(SEQUENCE_FAILED)
+        finally:
+            self.controller.remove_line_listener(self.line_received)
+            self.end_time = time.perf_counter()
+            if self.on_finished:
+                self.on_finished(self.report())
+
+    #waits while paused and then for 'gap' seconds, returns False if aborted
+    def wait_to_continue(self, gap):
+        self.resume_event.wait()
+        if self.abort_event.is_set():
+            return False
+        return not self.abort_event.wait(gap) if gap > 0 else True
+
+    #sends one trial through the controller (raises configurationerror)
+    def send(self, current, queued=False):
+        self.controller.set_mode(current.mode)
+        self.controller.set_flash_rate(current.flash_rate)
+        self.controller.set_flash_duration(current.flash_duration)
+        self.controller.set_pattern(current.pattern)
+        self.controller.message(self.controller.send_configuration(queued=queued))
+
+    def progress(self, completed):
+        if self.on_progress:
+            self.on_progress(completed, len(self.trials), self.state)
+
+    def set_state(self, state):
+        self.state = state
+        if self.on_progress:
+            self.on_progress(min(len(self.done_times), len(self.trials)), len(self.trials), state)
+
+
+    #*****************LINES FROM THE ARDUINO (reader thread)*****************
+
+    def line_received(self, line):
+        now = time.perf_counter()
+        with self.condition:
+            #the first line after a "DONE" is the arduino's answer to the next trial
+            if len(self.answer_times) < len(self.done_times) and len(self.done_times) < len(self.trials):
+                self.answer_times.append(now)
+            if line.startswith("DONE"):
+                self.done_times.append(now)
+            elif line.startswith("Flashing Pattern"):
+                self.started_count += 1
+            elif line.startswith("NAK") or line.startswith("Error parsing command"):
+                self.failure = line
+            self.condition.notify_all()
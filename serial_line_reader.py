@@ -0,0 +1,93 @@
+
+#*****************SERIAL LINE READER*****************
+# this file holds the code that turns the raw bytes coming from the arduino
+# into lines of text for the GUI
+#
+# why this is in its own file (and not in 'GUI Test 1.py'):
+#   - it does not need PyQt6, so the benchmarks can import it without opening a window
+#   - the GUI's 'serialclass' just calls it from its background thread
+#
+# how it works:
+#   - instead of calling readline() and then sleeping 0.1s (which limited us to
+#     about 10 lines per second and made every message up to 100ms late), we do a
+#     blocking read that returns as soon as ANY bytes arrive from the arduino
+#   - the port timeout (READ_TIMEOUT) only matters when the arduino is quiet, it
+#     lets the thread wake up every now and then to check if it should stop
+#   - the bytes are fed through an incremental utf-8 decoder, so a character or a
+#     line that is split across two reads is put back together correctly
+#   - if an 'on_frame' function is given, binary protocol frames (binary_protocol.py)
+#     are taken out of the stream first and passed to it, the rest is treated as text
+import codecs #incremental decoder for turning bytes into text
+
+from binary_protocol import framedecoder
+
+#how long (seconds) a read waits for the first byte before giving up
+#note: this does NOT delay messages, the read returns as soon as data arrives
+READ_TIMEOUT = 0.2
+
+
+# 'seriallinereader' class that reads whole lines from an open serial port
+#   - port: an open pyserial 'serial.Serial' object (or anything with read()/ in_waiting)
+#   - encoding: the text encoding the arduino uses (utf-8 by default)
+#   - on_frame(frame): called for every binary protocol frame (None = no frames expected,
+#     everything is text)
+class seriallinereader:
+
+    #constructor that creates a seriallinereader object
+    def __init__(self, port, encoding="utf-8", on_frame=None):
+        self.port = port
+        self.on_frame = on_frame
+        #separates binary frames from the text (only needed if someone wants the frames)
+        self.frame_decoder = framedecoder() if on_frame else None
+
+        #the incremental decoder remembers half-received characters between reads
+        #errors="replace" means garbage bytes (e.g. during the arduino reset) become '?'
+        #instead of raising an exception and killing the thread
+        self.decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+
+        #text that was received but does not end with a newline yet
+        self.partial_line = ""
+
+    #METHOD #1: read_lines
+    #   blocks until bytes arrive (or READ_TIMEOUT/ the port timeout passes)
+    #   returns: list of complete lines (stripped, empty lines removed)
+    #   note: returns an empty list on a timeout, which is normal when the arduino is quiet
+    def read_lines(self):
+        #read(1) blocks until the first byte arrives, if more bytes are already
+        #waiting we grab all of them in one go (one system call instead of one per byte)
+        chunk = self.port.read(max(1, self.port.in_waiting))
+
+        #nothing arrived before the timeout
+        if not chunk:
+            return []
+
+        return self.feed(chunk)
+
+    #METHOD #2: feed
+    #   splits a chunk of bytes into lines
+    #   args: chunk (bytes read from the port)
+    #   returns: list of complete lines (stripped, empty lines removed)
+    def feed(self, chunk):
+        #take any binary frames out of the chunk first
+        if self.frame_decoder is not None:
+            chunk, frames = self.frame_decoder.feed(chunk)
+            for frame in frames:
+                self.on_frame(frame)
+
+        #add the newly decoded text to whatever was left over from last time
+        text = self.partial_line + self.decoder.decode(chunk)
+
+        #everything before the last '\n' is a complete line, the rest is kept for later
+        pieces = text.split("\n")
+        self.partial_line = pieces.pop()
+
+        #the arduino uses println() which ends lines with "\r\n", so strip() removes the '\r'
+        return [line for line in (piece.strip() for piece in pieces) if line]
+
+    #METHOD #3: reset
+    #   forgets any half-received line (used after reset_input_buffer() on a new connection)
+    def reset(self):
+        self.decoder.reset()
+        self.partial_line = ""
+        if self.frame_decoder is not None:
+            self.frame_decoder.reset()
@@ -0,0 +1,315 @@
+
+#*****************SESSION RECORDER*****************
+# this file saves everything sent to/ received from the arduino to disk, with a high
+# resolution timestamp, so LED flashes and "BUTTON PRESSED" triggers can be lined up with
+# the camera frames after the experiment
+#
+# the problem this solves:
+#   - the serial output only lived in the serial monitor widget (as "Arduino: ..." strings)
+#     and was gone when the app closed, and it had no timestamps at all
+#
+# how it works:
+#   - the ledcontroller stamps every line with time.perf_counter_ns() in the reader thread,
+#     the moment it is read (before it is queued to Qt), and every packet it sends
+#   - record() only appends the record to a bounded queue (it never waits for the disk or a
+#     lock, if the queue is full the record is dropped and counted), a writer thread wakes up
+#     every WRITE_INTERVAL seconds and writes out everything that is waiting in one batch
+#   - the log is an append-only binary file, flushed to the OS every FLUSH_INTERVAL seconds
+#     but never fsync'd per line (only when the recorder stops), and a new file is started
+#     when one reaches max_file_bytes (rotation)
+#   - load_session() reads all the files of a session back into NumPy arrays (columns),
+#     export_parquet() writes them to a Parquet file (needs pyarrow)
+#
+# file format (all numbers little-endian):
+#   file header:  b"LEDLOG1\n", perf_counter_ns (int64), time_ns (int64) at the time the file was started
+#                 (the pair turns perf_counter_ns stamps into wall clock times)
+#   each record:  perf_counter_ns (int64), direction (uint8), text length (uint16), utf-8 text
+import collections #deque: the bounded queue between record() and the writer thread
+import os #folders/ file sizes
+import struct #packing the records
+import threading #the writer thread
+import time #perf_counter_ns/ time_ns
+
+FILE_MAGIC = b"LEDLOG1\n"
+FILE_HEADER = struct.Struct("<8sqq") #magic, perf_counter_ns, time_ns
+RECORD_HEADER = struct.Struct("<qBH") #perf_counter_ns, direction, text length
+FILE_EXTENSION = ".ledlog"
+
+#record directions
+RECORD_RECEIVED = 0 #a line (or ACK/ NAK) from the arduino
+RECORD_SENT = 1 #a packet sent to the arduino
+RECORD_MESSAGE = 2 #a status message from the host (connected, lost connection ...)
+DIRECTION_NAMES = {RECORD_RECEIVED: "received", RECORD_SENT: "sent", RECORD_MESSAGE: "message"}
+
+#event kinds filled in by load_session() so the analysis does not have to compare strings
+#(a received line is given the kind of the first prefix it starts with, otherwise KIND_OTHER)
+KIND_OTHER = 0
+KINDS = (
+    ("Arduino Ready", 1),
+    ("Received:", 2),
+    ("ACK", 3),
+    ("NAK", 4),
+    ("Flashing Pattern", 5),
+    ("BUTTON PRESSED", 6),
+    ("Flashing finished", 7),
+    ("DONE", 8),
+)
+KIND_NAMES = {KIND_OTHER: "other", **{kind: prefix for prefix, kind in KINDS}}
+
+#defaults
+MAX_FILE_BYTES = 64 * 1024 * 1024 #start a new file after 64MB
+QUEUE_SIZE = 100000 #records waiting for the writer thread (~10MB at most)
+WRITE_INTERVAL = 0.05 #seconds between the writer thread's batches
+FLUSH_INTERVAL = 1.0 #seconds between flushes to the OS
+WRITE_BUFFER = 256 * 1024 #bytes buffered by python before a write() system call
+MAX_TEXT_BYTES = 0xFFFF #longer texts are cut (the length is a uint16)
+
+
+# 'sessionrecorder' class that writes the records to rotating log files
+#   - folder: where the log files go (created if needed)
+#   - name: the start of the file names (default "session-<date>-<time>"),
+#     the files are <name>-0001.ledlog, <name>-0002.ledlog ...
+#   - max_file_bytes/ queue_size/ flush_interval: see the defaults above
+class sessionrecorder:
+
+    #constructor that creates a sessionrecorder object
+    def __init__(self, folder, name=None, max_file_bytes=MAX_FILE_BYTES, queue_size=QUEUE_SIZE,
+                 flush_interval=FLUSH_INTERVAL):
+        self.folder = folder
+        self.name = name or time.strftime("session-%Y%m%d-%H%M%S")
+        self.max_file_bytes = max_file_bytes
+        self.flush_interval = flush_interval
+        #deque append/ popleft are thread safe, so record() needs no lock
+        #(the size is checked by hand, a deque with maxlen would silently drop the OLDEST record)
+        self.records = collections.deque()
+        self.queue_size = queue_size
+
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.file = None
+        self.file_bytes = 0
+        self.paths = [] #every file written so far
+
+        #counters (written by the writer thread, read by status())
+        self.written = 0
+        self.dropped = 0
+        self.bytes_written = 0
+
+    #METHOD #1: start
+    #   opens the first file and starts the writer thread
+    #   returns: the path of the first file
+    def start(self):
+        os.makedirs(self.folder, exist_ok=True)
+        #two sessions started in the same second get "-2", "-3" ... added to the name
+        name, number = self.name, 2
+        while os.path.exists(self.file_path(1)):
+            self.name = f"{name}-{number}"
+            number += 1
+        self.open_next_file()
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.writer_loop, name="session-recorder", daemon=True)
+        self.thread.start()
+        return self.paths[0]
+
+    #METHOD #2: record
+    #   queues one record, never blocks (safe to call from the reader thread)
+    #   args: direction (RECORD_*), text, timestamp_ns (default: now)
+    def record(self, direction, text, timestamp_ns=None):
+        if timestamp_ns is None:
+            timestamp_ns = time.perf_counter_ns()
+        if len(self.records) >= self.queue_size:
+            self.dropped += 1
+            return
+        self.records.append((timestamp_ns, direction, text))
+
+    #METHOD #3: stop
+    #   writes everything still queued, fsyncs and closes the file
+    def stop(self):
+        if self.thread is None:
+            return
+        self.stop_event.set()
+        self.thread.join()
+        self.thread = None
+
+    #METHOD #4: status
+    #   returns: dict with the records written/ dropped, bytes written and the files
+    def status(self):
+        return {
+            "written": self.written,
+            "dropped": self.dropped,
+            "queued": len(self.records),
+            "bytes": self.bytes_written,
+            "files": list(self.paths),
+        }
+
+
+    #*****************WRITER THREAD*****************
+
+    def writer_loop(self):
+        last_flush = time.monotonic()
+        finished = False
+        while not finished:
+            #stop() sets the event, then one last batch is written
+            finished = self.stop_event.wait(WRITE_INTERVAL)
+            #write everything that is waiting now (record() may keep appending meanwhile,
+            #those records are left for the next batch so a flood can not keep us here)
+            records = self.records
+            for _ in range(len(records)):
+                self.write_record(*records.popleft())
+            if time.monotonic() - last_flush >= self.flush_interval:
+                #hand the data to the OS (it survives the app crashing, no fsync needed for that)
+                self.file.flush()
+                last_flush = time.monotonic()
+        self.close_file()
+
+    def write_record(self, timestamp_ns, direction, text):
+        data = text.encode("utf-8", errors="replace")[:MAX_TEXT_BYTES]
+        if self.file_bytes + RECORD_HEADER.size + len(data) > self.max_file_bytes:
+            self.close_file()
+            self.open_next_file()
+        self.file.write(RECORD_HEADER.pack(timestamp_ns, direction, len(data)))
+        self.file.write(data)
+        size = RECORD_HEADER.size + len(data)
+        self.file_bytes += size
+        self.bytes_written += size
+        self.written += 1
+
+    def file_path(self, part):
+        return os.path.join(self.folder, f"{self.name}-{part:04d}{FILE_EXTENSION}")
+
+    def open_next_file(self):
+        path = self.file_path(len(self.paths) + 1)
+        #"xb": never overwrite an old session
+        self.file = open(path, "xb", buffering=WRITE_BUFFER)
+        self.file.write(FILE_HEADER.pack(FILE_MAGIC, time.perf_counter_ns(), time.time_ns()))
+        self.file_bytes = FILE_HEADER.size
+        self.bytes_written += FILE_HEADER.size
+        self.paths.append(path)
+
+    def close_file(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+
+
+#*****************READING A SESSION BACK*****************
+
+#function to find the files of a session
+#args: path (one of the .ledlog files, or the session name without "-0001.ledlog")
+#returns: the files in order
+def session_files(path):
+    if path.endswith(FILE_EXTENSION):
+        path = path[:-len(FILE_EXTENSION)].rsplit("-", 1)[0]
+    folder, name = os.path.split(path)
+    folder = folder or "."
+    #<name>-<4 digit part number>.ledlog
+    files = sorted(entry for entry in os.listdir(folder)
+                   if entry.startswith(name + "-") and entry.endswith(FILE_EXTENSION)
+                   and entry[len(name) + 1:-len(FILE_EXTENSION)].isdigit())
+    if not files:
+        raise FileNotFoundError(f"no {FILE_EXTENSION} files for {path}")
+    return [os.path.join(folder, entry) for entry in files]
+
+
+#function to read one log file
+#returns: (anchor (perf_counter_ns, time_ns), list of timestamps, directions, texts)
+#note: a record cut short at the end of the file (the app crashed mid-write) is ignored
+def read_log_file(path):
+    with open(path, "rb") as file:
+        data = file.read()
+    magic, anchor_perf, anchor_wall = FILE_HEADER.unpack_from(data)
+    if magic != FILE_MAGIC:
+        raise ValueError(f"{path} is not a session log")
+    timestamps, directions, texts = [], [], []
+    offset = FILE_HEADER.size
+    end = len(data)
+    unpack = RECORD_HEADER.unpack_from
+    while offset + RECORD_HEADER.size <= end:
+        timestamp_ns, direction, length = unpack(data, offset)
+        offset += RECORD_HEADER.size
+        if offset + length > end:
+            break
+        timestamps.append(timestamp_ns)
+        directions.append(direction)
+        texts.append(data[offset:offset + length].decode("utf-8", errors="replace"))
+        offset += length
+    return (anchor_perf, anchor_wall), timestamps, directions, texts
+
+
+#function to load a whole session into NumPy arrays (one array per column)
+#args: path (see session_files())
+#returns: dict of columns (all the same length, one entry per record):
+#   "timestamp_ns" (int64, perf_counter_ns), "wall_time_ns" (int64, time_ns of the host clock),
+#   "direction" (uint8, RECORD_*), "kind" (uint8, see KINDS), "text" (object array of str)
+def load_session(path):
+    #numpy is only needed for the analysis, not for recording
+    import numpy
+
+    timestamps, wall_times, directions, texts = [], [], [], []
+    for file_path in session_files(path):
+        (anchor_perf, anchor_wall), file_timestamps, file_directions, file_texts = read_log_file(file_path)
+        timestamps.extend(file_timestamps)
+        #perf_counter has no fixed start, the anchor in each file header turns it into wall time
+        wall_times.extend(timestamp - anchor_perf + anchor_wall for timestamp in file_timestamps)
+        directions.extend(file_directions)
+        texts.extend(file_texts)
+
+    kinds = []
+    for direction, text in zip(directions, texts):
+        kind = KIND_OTHER
+        if direction == RECORD_RECEIVED:
+            for prefix, prefix_kind in KINDS:
+                if text.startswith(prefix):
+                    kind = prefix_kind
+                    break
+        kinds.append(kind)
+
+    text_column = numpy.empty(len(texts), dtype=object)
+    text_column[:] = texts
+    session = {
+        "timestamp_ns": numpy.array(timestamps, dtype=numpy.int64),
+        "wall_time_ns": numpy.array(wall_times, dtype=numpy.int64),
+        "direction": numpy.array(directions, dtype=numpy.uint8),
+        "kind": numpy.array(kinds, dtype=numpy.uint8),
+        "text": text_column,
+    }
+    #records from different threads (a sent packet and the reply to it) can reach the file
+    #slightly out of order, so sort them by their timestamp
+    order = numpy.argsort(session["timestamp_ns"], kind="stable")
+    return {name: column[order] for name, column in session.items()}
+
+
+#function to write a session to a Parquet file (columns as in load_session())
+#needs pyarrow (pip install pyarrow)
+def export_parquet(session, path):
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("Exporting to Parquet needs pyarrow (pip install pyarrow)") from None
+    table = pyarrow.table({name: (list(column) if name == "text" else column) for name, column in session.items()})
+    pyarrow.parquet.write_table(table, path)
+
+
+#command line:   python session_recorder.py sessions/session-20250101-120000 [--parquet out.parquet]
+#prints a summary of the session (and optionally writes the Parquet file)
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Summarise/ export a recorded session.")
+    parser.add_argument("session", help="a .ledlog file or the session name")
+    parser.add_argument("--parquet", help="write the session to this Parquet file")
+    arguments = parser.parse_args()
+
+    session = load_session(arguments.session)
+    count = len(session["timestamp_ns"])
+    print(f"{count} records in {len(session_files(arguments.session))} file(s)")
+    if count:
+        print(f"  {(session['timestamp_ns'][-1] - session['timestamp_ns'][0]) / 1e9:.3f} s from the first to the last record")
+    for kind, name in KIND_NAMES.items():
+        found = int((session["kind"] == kind).sum()) if kind != KIND_OTHER else None
+        if found:
+            print(f"  {name:<18} {found}")
+    if arguments.parquet:
+        export_parquet(session, arguments.parquet)
+        print(f"written to {arguments.parquet}")
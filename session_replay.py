@@ -0,0 +1,405 @@
+#*****************SESSION REPLAY*****************
+# this file plays a recorded session (or a made up one) back into the GUI, as if the lines
+# came from the arduino, to stress the GUI with real output without an arduino (and in CI)
+#
+# why:
+#   - there was no way to repeat what the GUI went through in an experiment (a burst of
+#     triggers, hours of DONE cycles ...): the only test was plugging a board in and waiting
+#   - the emulator (arduino_emulator.py) answers our own commands, but it can not play back
+#     the exact timing of a real session
+#
+# how it works:
+#   - load_replay() reads the lines/ messages of a session recorded by session_recorder.py,
+#     the synthetic sources (SYNTHETIC_SOURCES) make up the same kind of records
+#   - 'sessionreplayer' is a thread that hands every record to on_line/ on_message (the
+#     ledcontroller's line_received()/ message(), the same functions the reader thread calls),
+#     so the lines go through the parser, the serialclass and its signals like real ones
+#   - speed: 1 = the recorded timing, N = N times faster (every gap is divided by N, so the
+#     gaps keep their ratios), None = as fast as possible
+#     every record is due at start + (its time - the first time)/ speed, so a late record does
+#     not make all the following ones late (the replayer catches up)
+#   - run_gui_replay() opens the GUI (QT_QPA_PLATFORM=offscreen: no screen needed), replays
+#     into it and reports the event loop lag, the dropped/ coalesced updates and the memory
+#
+# command line (headless, exits with 1 if the lag goes over --max-lag-ms):
+#     python session_replay.py sessions/session-20250101-120000 --speed 10
+#     python session_replay.py synthetic:done-cycles --count 3600 --speed max
+#     python session_replay.py synthetic:trigger-burst --speed 1 --max-lag-ms 50
+#     python session_replay.py synthetic:trigger-burst --speed max --profile   (which slots are slow)
+#
+# note: the replayer does not use PyQt6, only run_gui_replay() does (imported when it runs)
+import os #QT_QPA_PLATFORM, the path of the GUI file
+import sys #argv for the QApplication
+import threading #the replay thread
+import time #perf_counter_ns
+
+from binary_protocol import FRAME_NAMES
+from latency_metrics import percentile
+from session_recorder import read_log_file, session_files, RECORD_MESSAGE, RECORD_RECEIVED
+
+#records closer to their due time than this are sent straight away instead of sleeping
+#(a sleep can not be shorter than ~0.1ms, the following records catch up anyway)
+MIN_SLEEP_NS = 200000
+
+#how often run_gui_replay() checks the GUI thread (a QTimer, how late it fires is the lag)
+HEARTBEAT_MS = 10
+
+#where the GUI is (the file name has a space, so it is loaded by path)
+GUI_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "GUI Test 1.py")
+
+
+#*****************SOURCES*****************
+# a source is a list (or generator) of (timestamp_ns, direction, text) records,
+# direction is RECORD_RECEIVED (a line from the arduino) or RECORD_MESSAGE (a status message)
+
+#function to read the records of a recorded session that can be replayed
+#args: path (a .ledlog file or the session name, see session_recorder.session_files())
+#returns: the records in time order
+#note: the packets we sent are left out (the replay does not send anything), and so are the
+#      binary frames (ACK/ NAK/ STATUS): the GUI showed those through the message records
+def load_replay(path):
+    frame_names = set(FRAME_NAMES.values())
+    records = []
+    for file_path in session_files(path):
+        _, timestamps, directions, texts = read_log_file(file_path)
+        for record in zip(timestamps, directions, texts):
+            if record[1] == RECORD_MESSAGE:
+                records.append(record)
+            elif record[1] == RECORD_RECEIVED and record[2].split(" ", 1)[0] not in frame_names:
+                records.append(record)
+    #records from different threads can reach the file slightly out of order
+    records.sort(key=lambda record: record[0])
+    return records
+
+
+#function to make up a long experiment: 'count' manual runs of 'run_seconds', one after the
+#other with 'gap_ms' between them (the default is an hour of 1 second runs)
+#yields: records (one run at a time, so hours of them do not use any memory)
+def done_cycles(count=3600, run_seconds=1, gap_ms=50):
+    now = 0
+    for _ in range(count):
+        lines = ["Received: SET 1 100 1 2", "Mode: 1", "Flash Rate: 100", "Duration: 1", "Pattern: 2",
+                 "Manual Mode: Flashing started", "Flashing Pattern 2 at 100 Hz for 1 seconds."]
+        #the firmware prints a line about every millisecond
+        for line in lines:
+            yield now, RECORD_RECEIVED, line
+            now += 1000000
+        now += run_seconds * 1000000000
+        yield now, RECORD_RECEIVED, "Flashing finished"
+        yield now + 100000, RECORD_RECEIVED, "DONE"
+        now += gap_ms * 1000000
+
+
+#function to make up a burst of triggers: the camera firing 'count' times, 'interval_ms' apart
+#(every trigger re-arms it straight away and each run is cut short by the next trigger)
+#yields: records
+def trigger_burst(count=2000, interval_ms=2):
+    yield 0, RECORD_RECEIVED, "Received: SET 2 100 1 1"
+    for line in ("Mode: 2", "Flash Rate: 100", "Duration: 1", "Pattern: 1"):
+        yield 0, RECORD_RECEIVED, line
+    now = 1000000
+    for _ in range(count):
+        yield now, RECORD_RECEIVED, "Trigger Mode: Waiting for button press..."
+        yield now + 100000, RECORD_RECEIVED, "BUTTON PRESSED - TRIGGERING LED"
+        yield now + 200000, RECORD_RECEIVED, "Flashing Pattern 1 at 100 Hz for 1 seconds."
+        now += interval_ms * 1000000
+        yield now - 100000, RECORD_RECEIVED, "Flashing stopped"
+
+
+#the made up sources: "synthetic:<name>" (count = how many runs/ triggers)
+SYNTHETIC_SOURCES = {
+    "done-cycles": done_cycles,
+    "trigger-burst": trigger_burst,
+}
+
+
+#function to open a source by name
+#args: source ("synthetic:<name>" or the path of a recorded session),
+#      count (runs/ triggers of a synthetic source, None = its default)
+#returns: the records
+def open_replay_source(source, count=None):
+    if source.startswith("synthetic:"):
+        name = source[len("synthetic:"):]
+        if name not in SYNTHETIC_SOURCES:
+            raise ValueError(f"Unknown synthetic source '{name}' (choose from {', '.join(SYNTHETIC_SOURCES)})")
+        return SYNTHETIC_SOURCES[name]() if count is None else SYNTHETIC_SOURCES[name](count)
+    return load_replay(source)
+
+
+#*****************THE REPLAYER*****************
+
+# 'sessionreplayer' class that plays records back in its own thread
+#   - records: a source (see above)
+#   - on_line(line): called (from the replay thread) for every received line
+#   - on_message(text): called for every message record (None = they are skipped)
+#   - speed: 1 = the recorded timing, N = N times faster, None = as fast as possible
+#   - on_finished(): called (from the replay thread) once the last record was played
+class sessionreplayer:
+
+    #constructor that creates a sessionreplayer object
+    def __init__(self, records, on_line, on_message=None, speed=1.0, on_finished=None):
+        if speed is not None and speed <= 0:
+            raise ValueError("The replay speed must be a positive number (or None for as fast as possible)")
+        self.records = records
+        self.on_line = on_line
+        self.on_message = on_message
+        self.speed = speed
+        self.on_finished = on_finished
+
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.finished = threading.Event()
+
+        #counters (written by the replay thread, read by status())
+        self.lines = 0
+        self.messages = 0
+        self.behind_ns = 0 #the most a record was played after its due time
+        self.started_ns = None
+        self.ended_ns = None
+
+    #METHOD #1: start
+    #   starts the replay thread
+    def start(self):
+        self.stop_event.clear()
+        self.finished.clear()
+        self.thread = threading.Thread(target=self.replay_loop, name="session-replay", daemon=True)
+        self.thread.start()
+
+    #METHOD #2: stop
+    #   stops the replay (the records not played yet are skipped)
+    def stop(self):
+        if self.thread is None:
+            return
+        self.stop_event.set()
+        self.thread.join()
+        self.thread = None
+
+    #METHOD #3: wait
+    #   args: timeout (seconds, None = forever)
+    #   returns: True once every record was played (or the replay was stopped)
+    def wait(self, timeout=None):
+        return self.finished.wait(timeout)
+
+    #METHOD #4: status
+    #   returns: dict with the lines/ messages played, the seconds it took, the lines per
+    #   second and the most a record was behind its due time (ms)
+    def status(self):
+        end = self.ended_ns or time.perf_counter_ns()
+        seconds = (end - self.started_ns) / 1e9 if self.started_ns is not None else 0.0
+        return {
+            "lines": self.lines,
+            "messages": self.messages,
+            "seconds": seconds,
+            "lines_per_second": self.lines / seconds if seconds else 0.0,
+            "behind_ms": self.behind_ns / 1e6,
+            "finished": self.finished.is_set(),
+        }
+
+
+    #*****************REPLAY THREAD*****************
+
+    def replay_loop(self):
+        speed = self.speed
+        first = None
+        self.started_ns = started = time.perf_counter_ns()
+        for timestamp_ns, direction, text in self.records:
+            if self.stop_event.is_set():
+                break
+            if speed is not None:
+                if first is None:
+                    first = timestamp_ns
+                #the gaps divided by the speed, counted from the start (not from the last record)
+                wait = started + (timestamp_ns - first) / speed - time.perf_counter_ns()
+                if wait > MIN_SLEEP_NS:
+                    if self.stop_event.wait(wait / 1e9):
+                        break
+                elif wait < 0 and -wait > self.behind_ns:
+                    self.behind_ns = -wait
+            if direction == RECORD_RECEIVED:
+                self.on_line(text)
+                self.lines += 1
+            elif direction == RECORD_MESSAGE and self.on_message is not None:
+                self.on_message(text)
+                self.messages += 1
+        self.ended_ns = time.perf_counter_ns()
+        self.finished.set()
+        if self.on_finished:
+            self.on_finished()
+
+
+#*****************RUNNING IT AGAINST THE GUI (headless)*****************
+
+#function to get how much memory this process uses
+#returns: bytes (the resident set size on linux, the peak on mac), None if we can not tell (windows)
+def memory_in_use():
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    #ru_maxrss is in bytes on mac
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+#function to replay a source into the GUI and measure how the GUI copes
+#args: records (a source), speed (see sessionreplayer), timeout (seconds to wait for the GUI
+#      to catch up after the last record, None = forever), profile (True = run the GUI with
+#      the profiler (gui_profiler.py) and write its summary/ trace to profile_folder, None =
+#      the GUI's 'profiles' folder)
+#returns: the report dict (see format_replay_report())
+#note: set QT_QPA_PLATFORM=offscreen (done here if it is not set) to run it without a screen
+def run_gui_replay(records, speed=1.0, timeout=60, profile=False, profile_folder=None):
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    import importlib.util
+    from PyQt6.QtCore import QEventLoop, QTimer
+    from PyQt6.QtWidgets import QApplication
+
+    spec = importlib.util.spec_from_file_location("gui", GUI_FILE)
+    gui = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(gui)
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    profiler = None
+    if profile:
+        from gui_profiler import guiprofiler
+        profiler = guiprofiler()
+        profiler.start()
+    window = gui.systemGUI(session_folder=None, profiler=profiler)
+    window.show()
+
+    #every line/ message the GUI thread got (the data_received_signal is emitted once for each)
+    delivered = [0]
+
+    def count_delivered(_):
+        delivered[0] += 1
+
+    window.serialthreadhandler.data_received_signal.connect(count_delivered)
+
+    lateness = []
+    memory = [memory_in_use()]
+    last_tick = [time.perf_counter_ns()]
+    caught_up = []
+    waiting = QEventLoop()
+
+    #the heartbeat: how late the timer fires is how long the GUI thread was busy
+    def tick():
+        now = time.perf_counter_ns()
+        lateness.append(max(0.0, (now - last_tick[0]) / 1e6 - HEARTBEAT_MS))
+        last_tick[0] = now
+        memory.append(memory_in_use())
+        status = replayer.status()
+        if not status["finished"]:
+            return
+        if delivered[0] >= status["lines"] + status["messages"] and not window.serial_monitor_pending:
+            caught_up.append(now)
+            waiting.quit()
+        #the replay itself has no time limit, the GUI gets 'timeout' seconds after it to catch up
+        elif timeout is not None and now - replayer.ended_ns > timeout * 1e9:
+            waiting.quit()
+
+    memory_before = memory[0]
+    heartbeat = QTimer()
+    heartbeat.setInterval(HEARTBEAT_MS)
+    heartbeat.timeout.connect(tick)
+    replayer = window.start_replay(records, speed)
+    heartbeat.start()
+    waiting.exec()
+    heartbeat.stop()
+    replayed = replayer.status()
+    batch = window.serialthreadhandler.event_batch
+    reader_to_gui = window.controller.latency.summary().get("reader_to_gui")
+    report = {
+        "speed": speed,
+        "lines": replayed["lines"],
+        "messages": replayed["messages"],
+        "replay_seconds": replayed["seconds"],
+        "lines_per_second": replayed["lines_per_second"],
+        "behind_ms": replayed["behind_ms"],
+        "caught_up": bool(caught_up),
+        "drain_ms": (caught_up[0] - replayer.ended_ns) / 1e6 if caught_up else None,
+        "lag_ms": sorted(lateness),
+        "reader_to_gui_p99_ms": reader_to_gui["p99"] * 1000 if reader_to_gui else None,
+        "monitor_dropped": window.serial_monitor_dropped,
+        "monitor_frames": window.serial_monitor_frames,
+        "events": batch.added,
+        "event_signals": batch.batches,
+        "memory_before": memory_before,
+        "memory_peak": max((value for value in memory if value is not None), default=None),
+        "memory_after": memory[-1],
+        "profile_paths": None,
+    }
+    window.close()
+    if profiler is not None:
+        profiler.stop()
+        report["profile_paths"] = profiler.write(profile_folder or gui.PROFILE_FOLDER)
+    return report
+
+
+#function to turn the report of run_gui_replay() into text
+def format_replay_report(report):
+    speed = "as fast as possible" if report["speed"] is None else f"{report['speed']:g}x"
+    lag = report["lag_ms"]
+    lines = [
+        f"replayed {report['lines']} lines + {report['messages']} messages at {speed} in "
+        f"{report['replay_seconds']:.2f} s ({report['lines_per_second']:.0f} lines/s, at most "
+        f"{report['behind_ms']:.1f} ms behind the recorded timing)",
+    ]
+    if report["caught_up"]:
+        lines.append(f"  GUI caught up {report['drain_ms']:.0f} ms after the last line")
+    else:
+        lines.append("  GUI did NOT catch up before the timeout")
+    if lag:
+        lines.append(f"  event loop lag     p50 {percentile(lag, 0.5):6.1f} ms  p99 {percentile(lag, 0.99):6.1f} ms  "
+                     f"max {lag[-1]:6.1f} ms  ({len(lag)} heartbeats of {HEARTBEAT_MS} ms)")
+    if report["reader_to_gui_p99_ms"] is not None:
+        lines.append(f"  reader -> GUI      p99 {report['reader_to_gui_p99_ms']:6.1f} ms")
+    shown = report["lines"] + report["messages"] - report["monitor_dropped"]
+    lines.append(f"  serial monitor     {report['monitor_dropped']} lines dropped before they were shown, "
+                 f"{shown} shown in {report['monitor_frames']} frames ({shown / max(1, report['monitor_frames']):.1f} per frame)")
+    lines.append(f"  device events      {report['events']} events in {report['event_signals']} signals "
+                 f"({report['events'] - report['event_signals']} coalesced)")
+    if report["memory_before"] is not None:
+        megabyte = 1024 * 1024
+        lines.append(f"  memory             {report['memory_before'] / megabyte:.1f} MB before, peak "
+                     f"{report['memory_peak'] / megabyte:.1f} MB, {report['memory_after'] / megabyte:.1f} MB after "
+                     f"({(report['memory_after'] - report['memory_before']) / megabyte:+.1f} MB)")
+    if report["profile_paths"] is not None:
+        lines.append(f"  profile            {report['profile_paths'][0]} (summary), {report['profile_paths'][1]} (trace)")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    #"max" or a positive number
+    def replay_speed(text):
+        if text == "max":
+            return None
+        speed = float(text)
+        if speed <= 0:
+            raise argparse.ArgumentTypeError("the speed must be a positive number or 'max'")
+        return speed
+
+    parser = argparse.ArgumentParser(description="Replay a recorded (or synthetic) session into the GUI, headless.")
+    parser.add_argument("source", help="a .ledlog file/ session name, or synthetic:" + "|synthetic:".join(SYNTHETIC_SOURCES))
+    parser.add_argument("--speed", type=replay_speed, default=1.0, help="1 = recorded timing, N = N times faster, max = no waiting")
+    parser.add_argument("--count", type=int, help="runs/ triggers of a synthetic source")
+    parser.add_argument("--timeout", type=float, default=60, help="seconds the GUI gets to catch up after the last line")
+    parser.add_argument("--max-lag-ms", type=float, help="exit with 1 if the event loop lag (max) goes over this")
+    parser.add_argument("--profile", action="store_true", help="time the GUI's slots (see gui_profiler.py)")
+    arguments = parser.parse_args()
+
+    try:
+        records = open_replay_source(arguments.source, arguments.count)
+    except (OSError, ValueError) as error:
+        parser.error(str(error))
+    report = run_gui_replay(records, arguments.speed, arguments.timeout, arguments.profile)
+    print(format_replay_report(report))
+    failed = not report["caught_up"]
+    if arguments.max_lag_ms is not None and report["lag_ms"] and report["lag_ms"][-1] > arguments.max_lag_ms:
+        print(f"FAILED: the event loop lag went over {arguments.max_lag_ms:g} ms")
+        failed = True
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,74 @@
+
+#*****************TESTS: THE CONTROLLER AGAINST THE EMULATED ARDUINO*****************
+# a run from the PC to "DONE" without an arduino plugged in (see the fixture at the bottom of
+# arduino_emulator.py, it runs the firmware's copy in instant virtual time)
+import time #waiting for the reconnect
+
+from led_controller import ledcontroller
+
+#seconds to wait for a line (virtual time is instant, this is only for a slow PC)
+TIMEOUT = 5
+
+
+#connects a controller to the emulator and sets up a 10 Hz run for 1 s in 'mode'
+def connect(emulated_arduino, mode):
+    controller = ledcontroller()
+    controller.connect(emulated_arduino.port_name)
+    assert controller.wait_until_ready()
+    controller.set_mode(mode)
+    controller.set_flash_rate(10)
+    controller.set_flash_duration(1)
+    return controller
+
+
+def test_manual_run_finishes(emulated_arduino):
+    controller = connect(emulated_arduino, "Manual Mode")
+    try:
+        controller.send_configuration()
+        assert controller.wait_for("ACK SET", timeout=TIMEOUT) is not None
+        assert controller.wait_for("DONE", timeout=TIMEOUT) is not None
+        #10 Hz for 1 s: every LED turned on was turned off again
+        assert emulated_arduino.led_events
+        assert emulated_arduino.led_events[-1][1:] == (False, False)
+    finally:
+        controller.disconnect()
+
+
+def test_trigger_press_starts_the_run(emulated_arduino):
+    controller = connect(emulated_arduino, "Trigger Mode")
+    try:
+        controller.send_configuration()
+        assert controller.wait_for("ACK SET", timeout=TIMEOUT) is not None
+        #nothing flashes until the button is pressed
+        assert not emulated_arduino.led_events
+        #(a press in the first 200ms after the board starts is ignored, like the firmware)
+        emulated_arduino.advance(300)
+        emulated_arduino.press_button()
+        assert controller.wait_for("BUTTON PRESSED", timeout=TIMEOUT) is not None
+        assert controller.wait_for("DONE", timeout=TIMEOUT) is not None
+        assert emulated_arduino.led_events
+    finally:
+        controller.disconnect()
+
+
+def test_reconnect_forgets_the_pattern_table(emulated_arduino):
+    controller = connect(emulated_arduino, "Manual Mode")
+    try:
+        controller.set_pattern("L1@5ms/20ms:L2")
+        controller.send_configuration()
+        assert controller.wait_for("ACK SET", timeout=TIMEOUT) is not None
+        assert controller.uploaded_table is not None
+        #the port dies under the reader, the manager reopens it, which resets the arduino
+        controller.connection.port.close()
+        #(the controller forgets the board once the reset arduino is ready again)
+        deadline = time.monotonic() + TIMEOUT
+        while controller.uploaded_table is not None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert controller.uploaded_table is None
+        assert controller.wait_until_ready(TIMEOUT)
+        assert emulated_arduino.boot_count == 2
+        #so the table is uploaded again and the custom pattern SET is not NAKed
+        controller.send_configuration()
+        assert controller.wait_for(("ACK SET", "NAK SET"), timeout=TIMEOUT).startswith("ACK SET")
+    finally:
+        controller.disconnect()
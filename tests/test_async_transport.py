@@ -0,0 +1,29 @@
+#*****************TESTS: THE ASYNCIO CONTROLLER AGAINST THE EMULATED ARDUINO*****************
+# send() has to return the answer to the SET itself, not the "ACK PATTERN" of the custom
+# pattern table that is sent just before it (see the fixture at the bottom of arduino_emulator.py)
+import asyncio #runs the coroutines
+
+from async_transport import asyncledcontroller
+
+#seconds to wait for a line (virtual time is instant, this is only for a slow PC)
+TIMEOUT = 5
+
+
+#connects, sends each configuration in turn and returns the answers
+async def send_all(port_name, configurations):
+    controller = asyncledcontroller()
+    controller.connect(port_name)
+    try:
+        assert await controller.wait_until_ready()
+        return [await controller.send(configuration, timeout=TIMEOUT) for configuration in configurations]
+    finally:
+        controller.disconnect()
+
+
+def test_send_returns_the_set_answer(emulated_arduino):
+    answers = asyncio.run(send_all(emulated_arduino.port_name, [
+        {"mode": "Manual Mode", "flash_rate": 10, "flash_duration": 1},
+        {"flash_rate": 10, "pattern": "L1@5ms/20ms:L2"},
+        {"pattern": "L1"},
+    ]))
+    assert [answer.split(" #")[0] for answer in answers] == ["ACK SET"] * 3
@@ -0,0 +1,60 @@
+
+#*****************TESTS: BINARY PROTOCOL*****************
+# round trips of the codec in binary_protocol.py: SET values, every payload length, frames in
+# a stream of text split at every byte, damaged frames
+import random #random values/ payloads
+
+import pytest
+
+from binary_protocol import (
+    framedecoder, decode_frame, decode_set_payload, encode_frame, encode_set_frame, encode_set_payload,
+    protocolerror, FRAME_SET, FRAME_STATUS, MAX_PAYLOAD, MAX_SET_VALUE,
+)
+
+
+def test_set_values_survive_encode_decode():
+    generator = random.Random(1)
+    for _ in range(5000):
+        values = (generator.choice((1, 2)), generator.randint(1, MAX_SET_VALUE),
+                  generator.randint(1, MAX_SET_VALUE), generator.randint(1, 4))
+        sequence = generator.randint(0, 255)
+        frame = decode_frame(encode_set_frame(sequence, *values))
+        assert frame.frame_type == FRAME_SET and frame.sequence == sequence
+        assert decode_set_payload(frame.payload) == values
+
+
+@pytest.mark.parametrize("values", [(1, MAX_SET_VALUE + 1, 30, 2), (1, 4, MAX_SET_VALUE + 1, 2), (1, 4, 65535, 2)])
+def test_set_values_the_arduino_can_not_hold_are_refused(values):
+    #the uno keeps the rate/ duration in a signed 16 bit int
+    with pytest.raises(protocolerror):
+        encode_set_payload(*values)
+
+
+def test_every_payload_length():
+    generator = random.Random(2)
+    for length in range(MAX_PAYLOAD + 1):
+        payload = bytes(generator.randrange(256) for _ in range(length))
+        assert bytes(decode_frame(encode_frame(FRAME_STATUS, length, payload)).payload) == payload
+
+
+def test_frames_in_text_split_at_every_byte():
+    frames = [encode_set_frame(number, 1, number + 1, 30, 2) for number in range(3)]
+    stream = (b"Received: SET 1 4 30 2\r\n" + frames[0] + b"DONE\r\n" + frames[1] + frames[2]
+              + b"Flashing finished\r\n")
+    expected_text = b"Received: SET 1 4 30 2\r\nDONE\r\nFlashing finished\r\n"
+    for split in range(len(stream) + 1):
+        decoder = framedecoder()
+        text_a, frames_a = decoder.feed(stream[:split])
+        text_b, frames_b = decoder.feed(stream[split:])
+        assert text_a + text_b == expected_text, split
+        assert [frame.sequence for frame in frames_a + frames_b] == [0, 1, 2], split
+
+
+def test_damaged_frame_is_skipped():
+    frames = [encode_set_frame(number, 1, 4, 30, 2) for number in range(2)]
+    damaged = bytearray(frames[0])
+    damaged[6] ^= 0xFF
+    decoder = framedecoder()
+    _, found = decoder.feed(bytes(damaged) + frames[1])
+    assert [frame.sequence for frame in found] == [1]
+    assert decoder.error_count >= 1
@@ -0,0 +1,118 @@
+
+#*****************TESTS: CONNECTION MANAGER*****************
+# the reader thread checks of benchmarks/stress_connection_manager.py on pty pairs: exactly one
+# reader thread, nothing leaked over 1000 connect/ switch/ disconnect cycles, a lost device
+# and a listener that raises (linux/ mac: ptys)
+import os #closing the pty
+import threading #counting threads
+import time #waiting for the reader thread
+
+import pytest
+
+from benchmarks.pty_pair import open_pty_pair, write_all
+from connection_manager import connectionmanager, DEFAULT_BAUDRATE, READY_BANNER, STATE_CONNECTED, STATE_RECONNECTING
+
+CYCLES = 1000
+
+
+#the reader threads that are running (other tests' threads, like an ACK timer, may still be ending)
+def reader_threads():
+    return [thread for thread in threading.enumerate() if thread.name == "serial-reader"]
+
+
+#waits up to 'timeout' seconds for check() to return True
+def wait_until(check, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if check():
+            return True
+        time.sleep(0.001)
+    return check()
+
+
+#two pty pairs: (master fd, port name) each, closed afterwards
+@pytest.fixture
+def ports():
+    pairs = [open_pty_pair(), open_pty_pair()]
+    yield pairs
+    for master_fd, _ in pairs:
+        try:
+            os.close(master_fd)
+        except OSError:
+            #the test closed it (the 'arduino' went away)
+            pass
+
+
+def new_manager(**callbacks):
+    return connectionmanager(reconnect_delays=(0.05,), max_baudrate=DEFAULT_BAUDRATE, **callbacks)
+
+
+def test_connect_switch_disconnect_cycles_leak_nothing(ports):
+    (_, name_a), (_, name_b) = ports
+    manager = new_manager()
+    for cycle in range(CYCLES):
+        manager.connect(name_a if cycle % 2 == 0 else name_b)
+        assert manager.reader_thread_count() == 1, manager.status()
+        #a second connect without a disconnect is a 'port switch'
+        manager.connect(name_b if cycle % 2 == 0 else name_a)
+        assert manager.reader_thread_count() == 1, manager.status()
+        manager.disconnect()
+        assert manager.reader_thread_count() == 0, manager.status()
+        assert not reader_threads(), threading.enumerate()
+
+
+def test_every_line_arrives_once_after_reconnects(ports):
+    (master_a, name_a), (_, name_b) = ports
+    received = []
+    manager = new_manager(on_line=received.append)
+    try:
+        for name in (name_a, name_b, name_a):
+            manager.connect(name)
+        write_all(master_a, b"".join(f"LINE {number}\r\n".encode() for number in range(1000)))
+        assert wait_until(lambda: len(received) >= 1000)
+        time.sleep(0.1)
+        assert received == [f"LINE {number}" for number in range(1000)]
+    finally:
+        manager.disconnect()
+
+
+def test_lost_device_reconnects_and_shuts_down(ports):
+    (master_a, name_a), _ = ports
+    manager = new_manager()
+    manager.connect(name_a)
+    #the 'arduino' goes away (pty closed), the manager tries to reconnect
+    os.close(master_a)
+    assert wait_until(lambda: manager.state == STATE_RECONNECTING), manager.status()
+    assert manager.reader_thread_count() == 1
+    manager.disconnect()
+    assert manager.reader_thread_count() == 0
+    assert not reader_threads()
+
+
+def test_listener_that_raises_does_not_stop_the_reader(ports):
+    (master_a, name_a), _ = ports
+    received = []
+    messages = []
+
+    def on_line(line):
+        received.append(line)
+        if line == "BAD KEY":
+            raise KeyError(line)
+        if line == "BAD ATTRIBUTE":
+            #a TypeError/ AttributeError from a listener is not a lost port either
+            raise AttributeError(line)
+
+    manager = new_manager(on_line=on_line, on_message=messages.append)
+    try:
+        manager.connect(name_a)
+        write_all(master_a, f"{READY_BANNER}\r\n".encode())
+        assert manager.wait_until_ready(5)
+        received.clear()
+        write_all(master_a, b"BAD KEY\r\nBAD ATTRIBUTE\r\nSTILL HERE\r\n")
+        assert wait_until(lambda: "STILL HERE" in received)
+        assert received == ["BAD KEY", "BAD ATTRIBUTE", "STILL HERE"]
+        assert manager.reader_thread_count() == 1
+        assert manager.state == STATE_CONNECTED
+        assert sum("KeyError" in text or "AttributeError" in text for text in messages) == 2
+    finally:
+        manager.disconnect()
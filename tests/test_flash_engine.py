@@ -0,0 +1,81 @@
+
+#*****************TESTS: FLASH ENGINE TIMING*****************
+# the timing of the flash engine's reference model (flash_engine.py) on a simulated arduino
+# uno, with the built-in patterns compiled by pattern_compiler.py:
+#   - every LED change is within TIMING_BOUND_US of the exact time, at 3 Hz (where the old
+#     whole-millisecond delay() steps drifted) and above 500 Hz (where they became 0ms)
+#   - a run ends exactly at flash_duration, and nothing flashes after it
+import pytest
+
+from flash_engine import (
+    flashengine, ideal_changes, simulate, timing_error,
+    FLASH_DONE, UNO_DIGITAL_WRITE_US, UNO_LOOP_US, UNO_MICROS_RESOLUTION_US,
+)
+from pattern_compiler import builtin_table, compile_pattern, BUILTIN_PATTERNS
+
+#the latest a change can be: a whole pass of loop(), micros() one step behind and both
+#digitalWrite()s (LED1 then LED2)
+TIMING_BOUND_US = UNO_LOOP_US + UNO_MICROS_RESOLUTION_US + 2 * UNO_DIGITAL_WRITE_US
+
+#(flash rate Hz, duration s): 3 Hz for 30 s shows that nothing drifts over a long run
+RATES = [(3, 30), (501, 2), (600, 2), (1000, 2), (2000, 2)]
+
+
+#the exact changes, without the ones in the last TIMING_BOUND_US of the run (a step that is
+#due that close to the end is cut off by the end of the run on the board)
+def expected_changes(table, flash_duration):
+    end_us = flash_duration * 1000000
+    return [change for change in ideal_changes(table, flash_duration) if change[0] < end_us - TIMING_BOUND_US]
+
+
+def check_timing(table, flash_duration):
+    result = timing_error(simulate(table, flash_duration), expected_changes(table, flash_duration))
+    assert result["missing"] == 0, result
+    assert result["max"] <= TIMING_BOUND_US, result
+    assert abs(result["last"]) <= TIMING_BOUND_US, result
+
+
+@pytest.mark.parametrize("pattern_number", sorted(BUILTIN_PATTERNS))
+@pytest.mark.parametrize("flash_rate, flash_duration", RATES)
+def test_builtin_pattern_timing(pattern_number, flash_rate, flash_duration):
+    check_timing(builtin_table(pattern_number, flash_rate), flash_duration)
+
+
+def test_custom_pattern_timing():
+    check_timing(compile_pattern("L1+L2@5ms/20ms:OFF@100ms", 4), 5)
+
+
+@pytest.mark.parametrize("flash_rate, flash_duration", RATES)
+def test_nothing_flashes_after_the_duration(flash_rate, flash_duration):
+    end_us = flash_duration * 1000000
+    for pattern_number in BUILTIN_PATTERNS:
+        changes = simulate(builtin_table(pattern_number, flash_rate), flash_duration)
+        assert all(time_us <= end_us for time_us, mask in changes if mask)
+        #the LEDs go off once the run is over (within one pass of loop())
+        assert changes[-1][1] == 0
+        assert changes[-1][0] <= end_us + TIMING_BOUND_US
+
+
+#the engine itself (no loop() passes in between): ends at start + flash_duration, in millis()
+#like the firmware, whatever micros() it started at
+@pytest.mark.parametrize("start_us", [0, 123456, 999999])
+@pytest.mark.parametrize("table", [builtin_table(4, 3), builtin_table(1, 1000), None], ids=["3Hz", "1000Hz", "no table"])
+def test_engine_ends_exactly_at_the_duration(start_us, table):
+    flash_duration = 2
+    end_us = (start_us // 1000 + flash_duration * 1000) * 1000
+    engine = flashengine()
+    engine.start(table, flash_duration, start_us)
+    now = start_us
+    while True:
+        due = engine.next_event_us()
+        assert due <= end_us
+        now = max(now, due)
+        mask = engine.update(now)
+        if mask == FLASH_DONE:
+            break
+        assert now < end_us
+    assert now == end_us
+    assert not engine.running
+    #one microsecond earlier it was still running
+    engine.start(table, flash_duration, start_us)
+    assert engine.update(end_us - 1) != FLASH_DONE